@@ -1,4 +1,5 @@
 import os
+import click
 from flask import Flask, redirect, url_for, render_template
 from flask_login import LoginManager, current_user
 from werkzeug.middleware.proxy_fix import ProxyFix
@@ -18,9 +19,12 @@ def create_app():
     # ------------------------
     # CONFIGURATION
     # ------------------------
-    app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite:///site.db"
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', "sqlite:///site.db")
     app.config['SECRET_KEY'] = "your-secret-key"
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # 'stream' holds an /events stream open per dashboard (needs gthread/gevent workers or asgi.py)
+    app.config['LIVE_UPDATES'] = os.environ.get('LIVE_UPDATES', 'poll')
+    app.config['LIVE_POLL_SECONDS'] = 15    # how often dashboards poll /events/poll otherwise
 
     # ------------------------
     # INITIALIZE EXTENSIONS
@@ -28,6 +32,23 @@ def create_app():
     db.init_app(app)
     login_manager.init_app(app)
 
+    import services.change_feed   # registers the change-log session listener
+    import services.anomaly_detection   # scores transactions as they are recorded
+    import services.budget_alerts       # keeps budget period counters and alerts current
+    import services.period_reports      # keeps the monthly totals behind period comparisons current
+
+    from services.events import init_events
+    init_events(app)                     # live-update broker (EVENT_BROKER_URL)
+
+    from services.fragment_cache import init_fragment_cache
+    init_fragment_cache(app)             # {% cache %} template tag (FRAGMENT_CACHE_URL)
+
+    from services.currency import init_currency
+    init_currency(app)                   # `money` filter and currency choices for templates
+
+    from services.static_assets import init_static_assets
+    init_static_assets(app)              # fingerprinted, precompressed static files
+
     # ------------------------
     # REGISTER BLUEPRINTS
     # ------------------------
@@ -35,11 +56,19 @@ def create_app():
     from routes.dashboard import dashboard_bp
     from routes.budgets import budgets_bp
     from routes.reports import reports_bp   # ★ ADD REPORTS BLUEPRINT
+    from routes.api import api_bp
+    from routes.events import events_bp
+    from routes.rules import rules_bp
+    from routes.recurring import recurring_bp
 
     app.register_blueprint(auth_bp)
     app.register_blueprint(dashboard_bp)
     app.register_blueprint(budgets_bp)
     app.register_blueprint(reports_bp)       # ★ REGISTER REPORTS BLUEPRINT
+    app.register_blueprint(api_bp)
+    app.register_blueprint(events_bp)
+    app.register_blueprint(rules_bp)
+    app.register_blueprint(recurring_bp)
 
     # ------------------------
     # HOME ROUTE
@@ -50,27 +79,149 @@ def create_app():
             return redirect(url_for('dashboard.index'))
         return render_template('landing.html')
 
+    # ------------------------
+    # CLI COMMANDS
+    # ------------------------
+    @app.cli.command('deliver-alerts')
+    def deliver_alerts():
+        """Deliver pending budget alerts from the outbox."""
+        from services.budget_alerts import deliver_pending_alerts
+        print(f'Delivered {deliver_pending_alerts()} budget alerts')
+
+    @app.cli.command('build-assets')
+    def build_static_assets():
+        """Fingerprint and precompress the static files."""
+        from services.static_assets import build_assets, load_manifest
+        manifest = build_assets(app.static_folder)
+        load_manifest(app)
+        print(f'Built {len(manifest)} static assets')
+
+    @app.cli.command('purge-user')
+    @click.argument('username')
+    def purge_user_command(username):
+        """Delete a user and all of their data."""
+        from models.user import User
+        from services.bulk_deletes import purge_user
+        user = User.query.filter_by(username=username).first()
+        if user is None:
+            raise click.ClickException(f'No user named {username}')
+        counts = purge_user(user.id, progress=lambda table, deleted: print(f'  {table}: {deleted}'))
+        print(f'Purged {username} ({sum(counts.values())} rows)')
+
+    @app.cli.command('archive-transactions')
+    @click.option('--years', default=None, type=int, help='Keep this many past years live (default 2).')
+    def archive_transactions_command(years):
+        """Move old transactions to the compressed yearly archive."""
+        from services.archive import ARCHIVE_AFTER_YEARS, archive_cutoff, archive_transactions
+        cutoff = archive_cutoff(years=ARCHIVE_AFTER_YEARS if years is None else years)
+        moved = archive_transactions(cutoff, progress=lambda user_id, count: print(f'  user {user_id}: {count}'))
+        print(f'Archived {moved} transactions dated before {cutoff}')
+
+    @app.cli.command('precompute-insights')
+    @click.option('--workers', default=None, type=int, help='Worker processes (default: one per CPU, 0 inline).')
+    @click.option('--batch-size', default=None, type=int, help='Users per job (default 500).')
+    @click.option('--summaries', is_flag=True, help='Also store AI summaries, through the rate-limited scheduler.')
+    def precompute_insights_command(workers, batch_size, summaries):
+        """Compute every user's dashboard insights ahead of the morning rush."""
+        from services.insight_batch import (
+            INSIGHT_BATCH_SIZE, INSIGHT_BATCH_WORKERS, precompute_insights, summarize_snapshots
+        )
+        done = precompute_insights(
+            INSIGHT_BATCH_WORKERS if workers is None else workers,
+            batch_size or INSIGHT_BATCH_SIZE,
+            progress=lambda first_id, end_id, count: print(f'  users {first_id}-{end_id - 1}: {count}')
+        )
+        print(f'Precomputed insights for {done} users')
+        if summaries:
+            from services.llm import get_scheduler
+            stored = summarize_snapshots(progress=lambda done, total: print(f'  summaries: {done}/{total}'))
+            print(f'Stored {stored} AI summaries; scheduler: {get_scheduler().metrics()}')
+
+    @app.cli.command('apply-rules')
+    @click.argument('username')
+    def apply_rules_command(username):
+        """Re-apply a user's categorization rules to their transaction history."""
+        from models.user import User
+        from services.categorization_rules import reapply_rules
+        user = User.query.filter_by(username=username).first()
+        if user is None:
+            raise click.ClickException(f'No user named {username}')
+        counts = reapply_rules(user.id, progress=lambda counts: print(f"  checked {counts['checked']}"))
+        print(f"{counts['matched']} of {counts['checked']} transactions matched a rule, "
+              f"{counts['recategorized']} recategorized")
+
+    @app.cli.command('upgrade-db')
+    def upgrade_db_command():
+        """Add columns that tables created by earlier versions lack (also run at startup)."""
+        from services.schema_upgrade import upgrade_schema
+        added = upgrade_schema(db.engine)
+        for table, column in added:
+            print(f'  added {table}.{column}')
+        print(f'Schema up to date ({len(added)} columns added)')
+
+    @app.cli.command('load-rates')
+    @click.argument('rates_file', type=click.File('rb'))
+    def load_rates_command(rates_file):
+        """Load dated exchange rates from a CSV file (date,currency,rate)."""
+        from services.currency import CurrencyError, REFERENCE_CURRENCY, load_rates
+        try:
+            count = load_rates(rates_file)
+        except CurrencyError as e:
+            raise click.ClickException(str(e))
+        print(f'Loaded {count} exchange rates (in {REFERENCE_CURRENCY} per unit)')
+
     # ------------------------
     # CREATE DATABASE TABLES
     # ------------------------
     with app.app_context():
+        from services.bulk_deletes import enable_sqlite_foreign_keys
+        enable_sqlite_foreign_keys(db.engine)   # before the first connection opens
+
         from models.user import User
         from models.transaction import Transaction
         from models.budget import Budget     # ★ INCLUDE BUDGET MODEL
+        from models.idempotency_key import IdempotencyKey
+        from models.recurring_transaction import RecurringTransaction
+        from models.change_log import ChangeLog
+        from models.category_stat import CategoryStat
+        from models.known_merchant import KnownMerchant
+        from models.transaction_flag import TransactionFlag
+        from models.budget_period_total import BudgetPeriodTotal
+        from models.budget_alert import BudgetAlert
+        from models.import_batch import ImportBatch
+        from models.imported_transaction import ImportedTransaction
+        from models.transaction_archive import TransactionArchive
+        from models.transaction_rollup import TransactionRollup
+        from models.exchange_rate import ExchangeRate
+        from models.monthly_rate import MonthlyRate
+        from models.insight_snapshot import InsightSnapshot
+        from models.monthly_total import MonthlyTotal
+        from models.tag import Tag
+        from models.transaction_tag import TransactionTag
+        from models.category_rule import CategoryRule
 
         db.create_all()
 
+        from services.schema_upgrade import upgrade_schema
+        upgrade_schema(db.engine)       # columns added since a database was created
+
+        from services.currency import ensure_monthly_rates
+        ensure_monthly_rates()
+
+        from services.search import init_search
+        init_search(db.engine)
+
     return app
 
 
 # ------------------------
 # USER LOADER FOR LOGIN
 # ------------------------
-from models.user import User
+from services.user_cache import load_session_principal
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return load_session_principal(int(user_id))
 
 
 # ------------------------
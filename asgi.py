@@ -0,0 +1,6 @@
+from app import app as flask_app
+import routes.async_views   # registers the async variants of the read-heavy endpoints
+from services.async_serving import create_asgi_app
+
+# uvicorn --host 0.0.0.0 --port 5000 --proxy-headers asgi:app
+app = create_asgi_app(flask_app)
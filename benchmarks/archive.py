@@ -0,0 +1,127 @@
+"""
+The cold archive tier on ten years of synthetic history: hot-table size
+and the cost of the read paths before and after moving everything older
+than two calendar years into compressed yearly archives.
+
+  dashboard totals   all-time grouped totals (transactions + rollups)
+  insights queries   every statement behind the insights panel
+  reports (recent)   /reports for the last 90 days, archive untouched
+  reports (all)      /reports with no filter, archive merged in
+  export (all)       NDJSON export of everything, archive merged in
+
+The fragment cache is off so every request renders. Every run checks
+that totals, the insights figures, the reports page and the full export
+are identical before and after archiving.
+
+    python -m benchmarks.archive [users]
+"""
+import gzip
+import json
+import os
+import sys
+from datetime import date, timedelta
+
+from sqlalchemy import func, select
+
+from benchmarks.common import best_of, disable_ai_summary, login_client, make_app, timed
+from benchmarks.synthetic_data import DEFAULT_PASSWORD, generate, usernames
+from models import db
+from models.transaction import Transaction
+from models.transaction_archive import TransactionArchive
+from models.transaction_rollup import TransactionRollup
+from models.user import User
+from services import exporters
+from services.ai_insights import _insight_statements
+from services.archive import archive_transactions, archived_transactions, archived_years
+from services.dashboard_summary import get_dashboard_totals
+
+YEARS = 10
+
+
+def database_bytes():
+    db.session.commit()
+    db.session.execute(db.text('VACUUM'))
+    return os.path.getsize(db.engine.url.database)
+
+
+def insight_figures(user_id):
+    return {name: [tuple(row) for row in db.session.execute(statement)]
+            for name, statement in _insight_statements(user_id).items() if name != 'flags'}
+
+
+def full_export(user_id):
+    statement = exporters.export_statement(user_id, [])
+    years = archived_years(user_id)
+    archived = archived_transactions(user_id, years=years) if years else None
+    data = b''.join(exporters.export_chunks('ndjson', statement, archived=archived))
+    return sorted(gzip.decompress(data).splitlines())
+
+
+def measure(client, user_id):
+    recent = (date.today() - timedelta(days=90)).isoformat()
+    return {
+        'dashboard totals': best_of(5, get_dashboard_totals, user_id),
+        'insights queries': best_of(5, insight_figures, user_id),
+        'reports (recent)': best_of(3, client.get, f'/reports?start_date={recent}'),
+        'reports (all)': best_of(3, client.get, '/reports'),
+        'export (all)': best_of(3, full_export, user_id),
+    }
+
+
+def rounded(value):
+    """A result with floats to the paisa, since rollups change the summation order."""
+    if isinstance(value, float):
+        return round(value, 2)
+    if isinstance(value, dict):
+        return {key: rounded(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [rounded(item) for item in value]
+    return value
+
+
+def run(users=5):
+    os.environ['FRAGMENT_CACHE_URL'] = 'none'
+    app = make_app()
+    disable_ai_summary()
+    generate(app, users=users, months=YEARS * 12)
+    client = login_client(app, usernames(1)[0], DEFAULT_PASSWORD)
+
+    with app.app_context():
+        user_id = User.query.filter_by(username=usernames(1)[0]).first().id
+        rows_before = db.session.execute(select(func.count()).select_from(Transaction)).scalar()
+        bytes_before = database_bytes()
+        before = measure(client, user_id)
+
+        archive_time, moved = timed(archive_transactions)
+        db.session.expunge_all()
+
+        rows_after = db.session.execute(select(func.count()).select_from(Transaction)).scalar()
+        rollups = db.session.execute(select(func.count()).select_from(TransactionRollup)).scalar()
+        payload = db.session.execute(select(func.sum(func.length(TransactionArchive.payload)))).scalar()
+        bytes_after = database_bytes()
+        after = measure(client, user_id)
+
+    print(f"  {users} users x {YEARS} years: archived {moved} rows in {archive_time:.1f}s "
+          f"({moved / archive_time:.0f} rows/s)")
+    print(f"  transactions table: {rows_before} -> {rows_after} rows "
+          f"({100 * (1 - rows_after / rows_before):.0f}% smaller), {rollups} rollup rows")
+    print(f"  archive payload: {payload / 1e6:.2f} MB ({payload / moved:.1f} bytes/row); "
+          f"database file {bytes_before / 1e6:.1f} -> {bytes_after / 1e6:.1f} MB")
+
+    print(f"  {'read path (one user)':<22} {'before ms':>10} {'after ms':>10} {'speedup':>8}")
+    for name, (seconds, _) in before.items():
+        print(f"  {name:<22} {seconds * 1000:10.1f} {after[name][0] * 1000:10.1f} "
+              f"{seconds / after[name][0]:7.1f}x")
+
+    def same(name):
+        return rounded(before[name][1]) == rounded(after[name][1])
+
+    print(f"  dashboard totals identical: {same('dashboard totals')}")
+    print(f"  insights figures identical: {same('insights queries')}")
+    print(f"  full export identical: {before['export (all)'][1] == after['export (all)'][1]} "
+          f"({len(after['export (all)'][1])} rows)")
+    print(f"  reports page identical: {before['reports (all)'][1].data == after['reports (all)'][1].data}")
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
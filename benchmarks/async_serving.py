@@ -0,0 +1,139 @@
+"""
+Throughput and latency of the read-heavy endpoints (/dashboard,
+/api/v1/insights, /api/v1/transactions) under concurrent clients: sync
+Flask on gunicorn gthread workers against the ASGI entry point on uvicorn,
+each as a single process with the same number of threads.
+
+The Gemini call is replaced by a fixed delay (AI_LATENCY_MS, default 300)
+so the comparison covers the external call without depending on the
+network: time.sleep in the sync app, asyncio.sleep in the async views.
+The fragment cache is disabled so every request does its full work.
+
+    python -m benchmarks.async_serving [seconds] [transactions]
+"""
+import http.client
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.common import percentile
+from benchmarks.bulk_transactions import make_items
+
+
+PORT = 5078
+THREADS = 8
+CONCURRENCY = (8, 32, 64)
+PATHS = ['/dashboard', '/api/v1/insights', '/api/v1/transactions?per_page=50&q=food', '/api/v1/transactions']
+
+
+SERVERS = {
+    'sync (gthread)': ['gunicorn', '-k', 'gthread', '-w', '1', '--threads', str(THREADS), '--timeout', '120',
+                       '-b', f'127.0.0.1:{PORT}', 'benchmarks.common:wsgi_app()'],
+    'async (uvicorn)': ['uvicorn', '--factory', '--port', str(PORT), '--log-level', 'warning',
+                        'benchmarks.common:asgi_app'],
+}
+
+
+# ---------------------------------------------
+# CLIENT
+# ---------------------------------------------
+def request(method, path, body=None, headers=None):
+    connection = http.client.HTTPConnection('127.0.0.1', PORT, timeout=120)
+    connection.request(method, path, body=body, headers=headers or {})
+    response = connection.getresponse()
+    data = response.read()
+    connection.close()
+    return response, data
+
+
+def wait_for_server():
+    for _ in range(150):
+        try:
+            request('GET', '/')
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError('server did not start')
+
+
+def rss_kb(pid):
+    """Resident memory of a process and its children, in KiB."""
+    total = 0
+    pids = [pid]
+    while pids:
+        current = pids.pop()
+        try:
+            with open(f'/proc/{current}/status') as f:
+                total += next(int(line.split()[1]) for line in f if line.startswith('VmRSS:'))
+            with open(f'/proc/{current}/task/{current}/children') as f:
+                pids.extend(int(child) for child in f.read().split())
+        except (FileNotFoundError, StopIteration):
+            continue
+    return total
+
+
+def login(transactions):
+    headers = {'Content-Type': 'application/json'}
+    credentials = {'username': 'bench', 'email': 'bench@example.com', 'password': 'bench-password'}
+    request('POST', '/api/v1/auth/register', json.dumps(credentials), headers)
+    response, _ = request('POST', '/api/v1/auth/login', json.dumps(credentials), headers)
+    cookie = {'Cookie': response.getheader('Set-Cookie').split(';')[0]}
+    if transactions:
+        request('POST', '/api/v1/transactions/bulk', json.dumps(make_items(transactions)), dict(headers, **cookie))
+    return cookie
+
+
+def load(cookie, clients, seconds):
+    stop = time.monotonic() + seconds
+    samples = []
+    errors = []
+
+    def client(offset):
+        i = offset
+        while time.monotonic() < stop:
+            start = time.perf_counter()
+            try:
+                response, _ = request('GET', PATHS[i % len(PATHS)], headers=cookie)
+                if response.status != 200:
+                    errors.append(response.status)
+            except OSError as e:
+                errors.append(type(e).__name__)
+            samples.append((time.perf_counter() - start) * 1000)
+            i += 1
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, errors
+
+
+def run(seconds=10, transactions=2000):
+    print(f"{transactions} transactions, {seconds}s per run, {THREADS} server threads, "
+          f"Gemini simulated at {os.environ.get('AI_LATENCY_MS', 300)} ms")
+    print(f"  {'server':<16} {'clients':>7} {'req/s':>7} {'p50 ms':>8} {'p99 ms':>8} {'errors':>6} {'RSS MiB':>8}")
+
+    for label, command in SERVERS.items():
+        db_path = os.path.join(tempfile.mkdtemp(prefix='smartfinance-bench-'), 'bench.db')
+        env = dict(os.environ, DATABASE_URL=f'sqlite:///{db_path}', RATE_LIMIT_ENABLED='0',
+                   FRAGMENT_CACHE_URL='none', WSGI_THREADS=str(THREADS))
+        server = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_for_server()
+            cookie = login(transactions)
+            for clients in CONCURRENCY:
+                samples, errors = load(cookie, clients, seconds)
+                print(f"  {label:<16} {clients:>7} {len(samples) / seconds:7.1f} {percentile(samples, 50):8.1f}"
+                      f" {percentile(samples, 99):8.1f} {len(errors):>6} {rss_kb(server.pid) / 1024:8.1f}")
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    run(*(int(arg) for arg in sys.argv[1:3]))
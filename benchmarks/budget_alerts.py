@@ -0,0 +1,51 @@
+"""
+Budget status from maintained period counters versus re-summing every
+budget's transactions, and the cost the alert engine adds to a bulk
+import that touches every budget.
+
+    python -m benchmarks.budget_alerts [transactions]
+"""
+import sys
+from datetime import date
+
+from benchmarks.bulk_transactions import CATEGORIES, make_items
+from benchmarks.common import make_app, login_client, best_of
+from models import db
+from models.budget_period_total import BudgetPeriodTotal
+from services import budget_alerts, budget_status
+from services.change_feed import changes_recorded
+
+
+def run(count=100000):
+    app = make_app()
+    client = login_client(app)
+    items = make_items(count)
+    for start in range(0, count, 10000):
+        client.post('/api/v1/transactions/bulk', json=items[start:start + 10000])
+    for category in CATEGORIES:
+        client.post('/budgets/add', data={'category': category, 'amount': '100000', 'period': 'monthly'})
+
+    with app.app_context():
+        user_id = 1
+
+        counters, _ = best_of(5, budget_status.get_budget_data, user_id)
+        saved = BudgetPeriodTotal.query.count()
+        BudgetPeriodTotal.query.delete()
+        db.session.commit()
+        summed, _ = best_of(5, budget_status.get_budget_data, user_id)
+
+    today = date.today().isoformat()
+    batch = [dict(item, date=today) for item in make_items(5000, seed=7)]
+    with_engine, _ = best_of(3, client.post, '/api/v1/transactions/bulk', json=batch)
+    changes_recorded.disconnect(budget_alerts._on_changes_recorded)
+    without_engine, _ = best_of(3, client.post, '/api/v1/transactions/bulk', json=batch)
+
+    print(f"{count} transactions, {len(CATEGORIES)} monthly budgets ({saved} period counters)")
+    print(f"  budget status from counters   {counters * 1000:8.2f} ms")
+    print(f"  budget status by summing      {summed * 1000:8.2f} ms")
+    print(f"  5000-row bulk import          {without_engine * 1000:8.1f} ms without the alert engine, "
+          f"{with_engine * 1000:.1f} ms with it")
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
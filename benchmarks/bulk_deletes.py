@@ -0,0 +1,130 @@
+"""
+Bulk deletion on accounts of generated transactions (with budgets, anomaly
+flags, idempotency keys and a statement import):
+
+  ORM cascade       what deleting a User used to do: load every transaction
+                    and DELETE it one row at a time
+  purge_user        services.bulk_deletes, chunked set-based DELETEs
+  delete by filter  one category of an account, with change-log tombstones
+  undo import       the transactions of one statement import
+
+Every run checks that nothing owned by a purged account is left behind and
+that budget counters still match the transactions table afterwards.
+
+    python -m benchmarks.bulk_deletes [rows per account]
+"""
+import io
+import sys
+
+from sqlalchemy import func, select
+
+from benchmarks.bulk_transactions import make_items
+from benchmarks.common import disable_ai_summary, make_app, timed
+from benchmarks.importers import make_csv, statement_rows
+from models import db
+from models.budget import Budget
+from models.transaction import Transaction
+from models.user import User
+from services import bulk_deletes
+from services.budget_status import get_budget_data, get_period_bounds
+from services.bulk_transactions import bulk_create_transactions
+from services.importers import import_statement
+
+
+def make_account(name, rows):
+    """A user with `rows` transactions (half through the bulk API, with keys), budgets and an import."""
+    user = User(username=name, email=f'{name}@example.com', password_hash='x')
+    db.session.add(user)
+    db.session.commit()
+
+    for category in ('Food & Dining', 'Shopping', 'Utilities'):
+        db.session.add(Budget(user_id=user.id, category=category, amount=50000, period='monthly'))
+    db.session.commit()
+
+    items = make_items(rows // 2, seed=user.id)
+    bulk_create_transactions(user.id, items, request_key=f'{name}-offline')
+    batch = import_statement(user.id, io.BytesIO(make_csv(statement_rows(rows - rows // 2, seed=user.id))),
+                             'statement.csv')
+    return user.id, batch.id
+
+
+def leftovers(user_id):
+    """Rows still referencing a user in any table that has a user_id column."""
+    found = {}
+    for table in db.metadata.sorted_tables:
+        if 'user_id' in table.c:
+            count = db.session.execute(select(func.count()).select_from(table).where(table.c.user_id == user_id)).scalar()
+            if count:
+                found[table.name] = count
+    return found
+
+
+def counters_consistent(user_id):
+    """Budget spending as reported (counters) against a fresh SUM over transactions."""
+    for data in get_budget_data(user_id):
+        budget = data['budget']
+        start_date, end_date = get_period_bounds(budget.period)
+        expected = db.session.execute(
+            select(func.coalesce(func.sum(Transaction.amount), 0.0)).where(
+                Transaction.user_id == user_id,
+                Transaction.category == budget.category,
+                Transaction.transaction_type == 'expense',
+                Transaction.date >= start_date,
+                Transaction.date <= end_date
+            )
+        ).scalar()
+        if abs(expected - data['spent']) > 0.01:
+            return False
+    return True
+
+
+def orm_cascade(user_id):
+    user = db.session.get(User, user_id)
+    for transaction in user.transactions:
+        db.session.delete(transaction)
+    db.session.delete(user)
+    db.session.commit()
+
+
+def run(rows=20000):
+    app = make_app()
+    disable_ai_summary()
+
+    with app.app_context():
+        print(f"  foreign_keys pragma: {db.session.execute(db.text('PRAGMA foreign_keys')).scalar()}")
+        accounts = {name: make_account(name, rows) for name in ('orm', 'purge', 'filter', 'undo')}
+
+        orm_id = accounts['orm'][0]
+        orm_time, _ = timed(orm_cascade, orm_id)
+        db.session.expunge_all()
+
+        purge_id = accounts['purge'][0]
+        purge_time, counts = timed(bulk_deletes.purge_user, purge_id)
+
+        filter_id = accounts['filter'][0]
+        get_budget_data(filter_id)
+        condition = Transaction.category == 'Shopping'
+        expected = bulk_deletes.count_transactions(filter_id, [condition])
+        filter_time, deleted = timed(bulk_deletes.delete_transactions, filter_id, [condition])
+        assert deleted == expected, (deleted, expected)
+
+        undo_id, batch_id = accounts['undo']
+        undo_time, (batch, undone) = timed(bulk_deletes.undo_import, undo_id, batch_id)
+
+        print(f"  {'operation':<28} {'rows':>8} {'seconds':>9} {'rows/s':>9}")
+        for label, count, seconds in (
+            ('ORM cascade (user)', rows, orm_time),
+            ('purge_user', sum(counts.values()), purge_time),
+            ('delete by filter', deleted, filter_time),
+            ('undo import', undone, undo_time),
+        ):
+            print(f"  {label:<28} {count:>8} {seconds:9.2f} {count / seconds:9.0f}")
+
+        print(f"  purged account leftovers: {leftovers(purge_id) or 'none'}")
+        print(f"  ORM-deleted account leftovers: {leftovers(orm_id) or 'none'}")
+        print(f"  budget counters consistent after filter delete: {counters_consistent(filter_id)}")
+        print(f"  budget counters consistent after undo: {counters_consistent(undo_id)} (batch {batch.status})")
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
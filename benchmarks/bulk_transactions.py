@@ -0,0 +1,69 @@
+"""
+Throughput of /api/v1/transactions/bulk compared with one
+/api/v1/transactions/create call per transaction.
+
+    python -m benchmarks.bulk_transactions [count]
+"""
+import json
+import random
+import sys
+from datetime import date, timedelta
+
+from benchmarks.common import make_app, login_client, timed
+
+
+CATEGORIES = ['Food & Dining', 'Transportation', 'Shopping', 'Utilities', 'Groceries']
+
+
+def make_items(count, seed=42):
+    rng = random.Random(seed)
+    start = date.today() - timedelta(days=365)
+    return [{
+        'transaction_type': 'expense' if rng.random() < 0.85 else 'income',
+        'category': rng.choice(CATEGORIES),
+        'amount': round(rng.uniform(10, 5000), 2),
+        'date': (start + timedelta(days=rng.randrange(365))).isoformat(),
+        'description': f'Offline item {i}'
+    } for i in range(count)]
+
+
+def run(count=2000):
+    app = make_app()
+    client = login_client(app)
+    items = make_items(count)
+
+    def single():
+        for item in items:
+            client.post('/api/v1/transactions/create', json=item)
+
+    def bulk_json():
+        return client.post('/api/v1/transactions/bulk', json={'transactions': items},
+                           headers={'Idempotency-Key': 'bench-json'})
+
+    def bulk_ndjson():
+        body = '\n'.join(json.dumps(item) for item in items)
+        return client.post('/api/v1/transactions/bulk', data=body,
+                           content_type='application/x-ndjson',
+                           headers={'Idempotency-Key': 'bench-ndjson'})
+
+    single_time, _ = timed(single)
+    json_time, response = timed(bulk_json)
+    assert response.get_json()['created'] == count
+    ndjson_time, response = timed(bulk_ndjson)
+    assert response.get_json()['created'] == count
+    retry_time, response = timed(bulk_json)
+    assert response.get_json()['duplicates'] == count
+
+    print(f"Transactions per run: {count}")
+    for label, elapsed in [
+        ('single /create calls', single_time),
+        ('bulk (JSON)', json_time),
+        ('bulk (NDJSON)', ndjson_time),
+        ('bulk retry (all duplicates)', retry_time),
+    ]:
+        print(f"  {label:<30} {elapsed * 1000:9.1f} ms  {count / elapsed:10.0f} tx/s")
+    print(f"  speedup (JSON bulk vs single): {single_time / json_time:.1f}x")
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,182 @@
+"""
+Categorization rules with a user's rule list grown to 1,000 rules: a
+few dozen on the merchants they actually use (with amount ranges and
+types), the rest on payees they rarely or never see.
+
+  compiled           CompiledRules: one Aho-Corasick pass over the
+                     description, amount and type masks, rules read off
+                     the set bits in priority order
+  naive              every rule tested in turn (type, amount bounds, each
+                     keyword as a substring)
+
+Matching is timed over the user's whole history, then on the create
+paths (one transaction, and a 2,000-row bulk request with and without
+rules), and re-applying the rules to history is timed set-based
+(reapply_rules, grouped UPDATEs per chunk) against row by row through
+the ORM on a second user. Every run checks that both matchers agree on
+every transaction, that both re-applies leave exactly what the rules
+say, and that the monthly totals dropped by the re-apply are seeded
+again to match the table.
+
+    python -m benchmarks.categorization_rules [rules] [months] [per_month]
+"""
+import random
+import sys
+from datetime import date
+
+from benchmarks.common import best_of, make_app, timed
+from benchmarks.synthetic_data import EXPENSE_PROFILE, generate, usernames
+from models import db
+from models.category_rule import CategoryRule
+from models.monthly_total import MonthlyTotal
+from models.transaction import Transaction
+from models.user import User
+from services.bulk_transactions import bulk_create_transactions
+from services.categorization_rules import (
+    apply_rules, apply_rules_to_transaction, compile_rules, compiled_rules, reapply_rules
+)
+from services.period_reports import _history_buckets, ensure_monthly_totals
+
+
+def make_rules(count, seed=11):
+    """Rule column values: rules on known merchants first, then rare payees."""
+    rng = random.Random(seed)
+    merchants = [(category, merchant.lower()) for category, profile in EXPENSE_PROFILE.items()
+                 for merchant in profile[3]]
+    rules = []
+    for category, merchant in merchants:
+        low = rng.choice([None, None, 100, 500])
+        rules.append({'keywords': merchant, 'match_type': 'expense', 'min_amount': low,
+                      'max_amount': rng.choice([None, 2000, 5000]), 'category': f'{category} (rule)',
+                      'tag': rng.choice([None, merchant.replace(' ', '-')])})
+    rules.append({'keywords': 'salary, bonus', 'match_type': 'income', 'category': 'Salary (rule)', 'tag': 'pay'})
+    rules.append({'match_type': 'expense', 'min_amount': 20000, 'tag': 'large'})
+    while len(rules) < count:
+        words = [f'payee{rng.randrange(100000):05d}' for _ in range(rng.randint(1, 3))]
+        low = rng.choice([None, rng.randint(0, 3000)])
+        rules.append({'keywords': ', '.join(words), 'match_type': rng.choice([None, 'expense', 'income']),
+                      'min_amount': low, 'max_amount': rng.choice([None, (low or 0) + rng.randint(100, 5000)]),
+                      'category': f'Payee {len(rules)}', 'transaction_type': rng.choice([None, None, 'income'])})
+    rng.shuffle(rules)
+    return rules[:count]
+
+
+def add_rules(user_id, rules):
+    for position, values in enumerate(rules, start=1):
+        db.session.add(CategoryRule(user_id=user_id, position=position, **values))
+    db.session.commit()
+
+
+def naive_match(rules, description, amount, transaction_type):
+    description = (description or '').lower()
+    return tuple(rule.id for rule in rules
+                 if (not rule.match_type or rule.match_type == transaction_type)
+                 and (rule.min_amount is None or amount >= rule.min_amount)
+                 and (rule.max_amount is None or amount <= rule.max_amount)
+                 and (not rule.keywords or any(keyword in description for keyword in rule.keywords)))
+
+
+def expected_outcome(rules, row):
+    """(category, type) a row ends up with under the rules, from naive matching."""
+    by_id = {rule.id: rule for rule in rules}
+    matched = [by_id[rule_id] for rule_id in naive_match(rules, row.description, row.amount, row.transaction_type)]
+    category = next((rule.category for rule in matched if rule.category), row.category)
+    transaction_type = next((rule.transaction_type for rule in matched if rule.transaction_type),
+                            row.transaction_type)
+    return category, transaction_type
+
+
+def history(user_id):
+    return db.session.execute(db.select(
+        Transaction.id, Transaction.description, Transaction.amount, Transaction.transaction_type,
+        Transaction.category
+    ).where(Transaction.user_id == user_id).order_by(Transaction.id)).all()
+
+
+def outcomes(user_id):
+    return {row.id: (row.category, row.transaction_type) for row in history(user_id)}
+
+
+def orm_reapply(user_id, rules):
+    """The straightforward version: every transaction loaded, tested against every rule, saved."""
+    for transaction in Transaction.query.filter_by(user_id=user_id).order_by(Transaction.id):
+        transaction.category, transaction.transaction_type = expected_outcome(rules, transaction)
+    db.session.commit()
+
+
+def bulk_items(count, seed=5):
+    rng = random.Random(seed)
+    merchants = [merchant for profile in EXPENSE_PROFILE.values() for merchant in profile[3]]
+    return [{'transaction_type': 'expense', 'category': 'Other Expense', 'amount': round(rng.uniform(50, 3000), 2),
+             'date': date.today().isoformat(), 'description': f'UPI/{rng.choice(merchants)} {index}'}
+            for index in range(count)]
+
+
+def run(rule_count=1000, months=36, per_month=150):
+    app = make_app()
+    generate(app, users=3, months=months, per_month=per_month)
+
+    with app.app_context():
+        user_id, other_id, plain_id = (User.query.filter_by(username=name).first().id for name in usernames(3))
+        rules = make_rules(rule_count)
+        add_rules(user_id, rules)
+        add_rules(other_id, rules)
+
+        compile_time, compiled = timed(compile_rules, CategoryRule.query.filter_by(user_id=user_id).all())
+        rows = history(user_id)
+        compiled_time, found = best_of(3, lambda: [compiled.match(row.description, row.amount, row.transaction_type)
+                                                   for row in rows])
+        naive_time, expected = best_of(1, lambda: [naive_match(compiled.rules, row.description, row.amount,
+                                                               row.transaction_type) for row in rows])
+        identical = [match.rule_ids if match else () for match in found] == expected
+        matched = sum(1 for match in found if match)
+
+        # Create paths: one transaction (version check, cache hit) and a bulk request
+        compiled_rules(user_id)
+        single = Transaction(user_id=user_id, amount=420, currency='INR', category='Food & Dining',
+                             transaction_type='expense', date=date.today(), description='POS Starbucks')
+        single_time, _ = best_of(50, apply_rules_to_transaction, single)
+        db.session.rollback()
+        rows_2k = bulk_items(2000)
+        apply_time, _ = best_of(3, lambda: apply_rules(user_id, [dict(item, date=date.today()) for item in rows_2k]))
+        bulk_time, _ = timed(bulk_create_transactions, user_id, rows_2k)
+        plain_time, _ = timed(bulk_create_transactions, plain_id, bulk_items(2000, seed=6))
+
+        # Re-apply to history: set-based for user 1, row by row for user 2
+        ensure_monthly_totals(user_id)
+        rules_in_order = compiled.rules
+        before = {row.id: expected_outcome(rules_in_order, row) for row in history(user_id)}
+        reapply_time, counts = timed(reapply_rules, user_id)
+        reapplied = outcomes(user_id) == before
+
+        other_rules = compiled_rules(other_id).rules
+        other_before = {row.id: expected_outcome(other_rules, row) for row in history(other_id)}
+        orm_rows = len(other_before)
+        orm_time, _ = timed(orm_reapply, other_id, other_rules)
+        orm_correct = outcomes(other_id) == other_before
+
+        dropped = not MonthlyTotal.query.filter_by(user_id=user_id).count()
+        ensure_monthly_totals(user_id)
+        stored = {(row.month, row.transaction_type, row.category, row.currency): (round(row.amount, 2), row.count)
+                  for row in MonthlyTotal.query.filter_by(user_id=user_id)}
+        rebuilt = {key: (round(amount, 2), count)
+                   for key, (amount, count) in _history_buckets(db.session.connection(), user_id).items()}
+        totals_ok = stored == rebuilt
+
+    print(f"  {len(compiled)} rules compiled in {compile_time * 1000:.0f} ms; "
+          f"{len(rows)} transactions, {matched} matched by a rule")
+    print(f"  {'matching':<28} {'ms':>9} {'rows/s':>10}")
+    for label, seconds in (('compiled', compiled_time), ('naive', naive_time)):
+        print(f"  {label:<28} {seconds * 1000:9.1f} {len(rows) / seconds:10.0f}")
+    print(f"  compiled and naive matches identical: {identical}")
+    print(f"  one new transaction: {single_time * 1e6:.0f} us; 2000-row bulk request: rules {apply_time * 1000:.0f} ms "
+          f"of {bulk_time * 1000:.0f} ms (no rules: {plain_time * 1000:.0f} ms)")
+    print(f"  re-apply set-based: {counts['checked']} rows in {reapply_time * 1000:.0f} ms "
+          f"({counts['checked'] / reapply_time:.0f} rows/s, {counts['recategorized']} recategorized); "
+          f"row by row through the ORM: {orm_rows} rows in {orm_time * 1000:.0f} ms ({orm_rows / orm_time:.0f} rows/s)")
+    print(f"  both re-applies leave what the rules say: {reapplied and orm_correct}; "
+          f"monthly totals dropped: {dropped}, reseeded to match: {totals_ok}")
+
+
+if __name__ == '__main__':
+    run(*(int(arg) for arg in sys.argv[1:4]))
@@ -0,0 +1,147 @@
+"""
+Shared helpers for the benchmark scripts.
+
+Each benchmark runs against a throwaway SQLite database so it never
+touches the development database. Run them from the project root, e.g.:
+
+    python -m benchmarks.bulk_transactions
+"""
+import asyncio
+import io
+import os
+import tempfile
+import time
+
+
+def make_app(database_url=None):
+    """Create an app bound to a fresh database (a temp SQLite file by default)."""
+    if database_url is None:
+        db_dir = tempfile.mkdtemp(prefix='smartfinance-bench-')
+        database_url = f"sqlite:///{os.path.join(db_dir, 'bench.db')}"
+    os.environ['DATABASE_URL'] = database_url
+
+    from app import create_app
+    app = create_app()
+    app.config['TESTING'] = True
+    return app
+
+
+def login_client(app, username='bench', password='bench-password'):
+    """Register (if needed) and log in a user, returning an authenticated test client."""
+    client = app.test_client()
+    client.post('/api/v1/auth/register', json={
+        'username': username,
+        'email': f'{username}@example.com',
+        'password': password
+    })
+    response = client.post('/api/v1/auth/login', json={'username': username, 'password': password})
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return client
+
+
+def timed(func, *args, **kwargs):
+    """Run func once and return (elapsed_seconds, result)."""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def best_of(repeat, func, *args, **kwargs):
+    """Run func `repeat` times and return (fastest_elapsed_seconds, last_result)."""
+    best, result = None, None
+    for _ in range(repeat):
+        elapsed, result = timed(func, *args, **kwargs)
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def pdf_document(pages, font_size=8, producer='SmartFinanceAI benchmarks'):
+    """
+    A minimal A4 PDF in Helvetica, from pages given as lists of (x, y, text)
+    fragments, so benchmarks can build statements without a PDF library.
+    """
+    def escape(text):
+        return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+    objects = ['<< /Type /Catalog /Pages 2 0 R >>', None,
+               '<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+               f'<< /Producer ({escape(producer)}) >>']
+    kids = []
+    for fragments in pages:
+        stream = ''.join(f"BT /F1 {font_size} Tf 1 0 0 1 {x:.1f} {y:.1f} Tm ({escape(text)}) Tj ET\n"
+                         for x, y, text in fragments)
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    out = io.BytesIO()
+    out.write(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(f"{number} 0 obj\n{body}\nendobj\n".encode('latin-1'))
+    xref = out.tell()
+    out.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+    out.write(''.join(f"{offset:010d} 00000 n \n" for offset in offsets).encode())
+    out.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R /Info 4 0 R >>\n"
+              f"startxref\n{xref}\n%%EOF\n".encode())
+    return out.getvalue()
+
+def disable_ai_summary():
+    """
+    Skip the Gemini call inside get_ai_insights so page timings measure the
+    app itself rather than the network (or the credential lookup timeout).
+    """
+    import services.ai_insights as ai_insights
+
+    async def disabled(prompt):
+        return 'AI Error: disabled for benchmark'
+
+    ai_insights.generate_gemini_summary = lambda prompt: 'AI Error: disabled for benchmark'
+    ai_insights.generate_gemini_summary_async = disabled
+
+
+def simulate_ai_summary():
+    """
+    Replace the Gemini call with a fixed delay (AI_LATENCY_MS, default 300):
+    time.sleep for the sync app, asyncio.sleep for the async views.
+    """
+    import services.ai_insights as ai_insights
+    delay = int(os.environ.get('AI_LATENCY_MS', 300)) / 1000
+
+    def summary(prompt):
+        time.sleep(delay)
+        return 'Keep it up.'
+
+    async def summary_async(prompt):
+        await asyncio.sleep(delay)
+        return 'Keep it up.'
+
+    ai_insights.generate_gemini_summary = summary
+    ai_insights.generate_gemini_summary_async = summary_async
+
+
+# Server targets for benchmarks that run the app under gunicorn or uvicorn:
+#   gunicorn 'benchmarks.common:wsgi_app()'
+#   uvicorn --factory benchmarks.common:asgi_app
+def wsgi_app():
+    simulate_ai_summary()
+    from app import app
+    return app
+
+
+def asgi_app():
+    simulate_ai_summary()
+    from asgi import app
+    return app
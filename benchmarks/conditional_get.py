@@ -0,0 +1,71 @@
+"""
+Cost of a conditional GET that ends in 304 Not Modified compared with a
+full 200 response, for every route that supports ETags.
+
+"304 view" is the time spent inside the view stack (conditional check,
+version lookup, headers) with the WSGI and session-loading overhead of
+the test client excluded; "304 p50/p99" are full test-client round trips.
+
+    python -m benchmarks.conditional_get [transactions] [requests]
+"""
+import sys
+import time
+
+from flask_login import login_user
+
+from benchmarks.common import make_app, login_client, disable_ai_summary, percentile
+from benchmarks.bulk_transactions import make_items
+
+
+ROUTES = ['/dashboard', '/reports', '/budgets', '/api/v1/transactions', '/api/v1/insights']
+
+
+def measure(client, path, headers, requests):
+    samples = []
+    status = None
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = client.get(path, headers=headers)
+        samples.append((time.perf_counter() - start) * 1000)
+        status = response.status_code
+    return status, samples
+
+
+def measure_view(app, path, etag, requests):
+    from models.user import User
+
+    endpoint, _ = app.url_map.bind('localhost').match(path)
+    view = app.view_functions[endpoint]
+    samples = []
+    with app.app_context():
+        user = User.query.filter_by(username='bench').first()
+        for _ in range(requests):
+            with app.test_request_context(path, headers={'If-None-Match': etag}):
+                login_user(user)
+                start = time.perf_counter()
+                response = view()
+                samples.append((time.perf_counter() - start) * 1000)
+                assert response.status_code == 304
+    return samples
+
+
+def run(transactions=5000, requests=200):
+    disable_ai_summary()
+    app = make_app()
+    client = login_client(app)
+    client.post('/api/v1/transactions/bulk', json=make_items(transactions))
+
+    print(f"{transactions} transactions, {requests} requests per route (ms)")
+    print(f"  {'route':<24} {'200 p50':>9} {'304 p50':>9} {'304 p99':>9} {'304 view p50':>13} {'p99':>7}")
+    for path in ROUTES:
+        full_status, full = measure(client, path, {}, max(10, requests // 10))
+        etag = client.get(path).headers['ETag']
+        not_modified_status, cached = measure(client, path, {'If-None-Match': etag}, requests)
+        assert (full_status, not_modified_status) == (200, 304), (path, full_status, not_modified_status)
+        view = measure_view(app, path, etag, requests)
+        print(f"  {path:<24} {percentile(full, 50):9.2f} {percentile(cached, 50):9.3f} {percentile(cached, 99):9.3f}"
+              f" {percentile(view, 50):13.3f} {percentile(view, 99):7.3f}")
+
+
+if __name__ == '__main__':
+    run(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,124 @@
+"""
+Dashboard totals over mixed-currency history: amounts converted to the
+base currency inside the grouped aggregate (one rate lookup per foreign
+row, on the exchange_rates primary key) against fetching every row and
+converting it in Python from the cached rate series.
+
+  single currency    totals before any row is moved to another currency
+  SQL conversion     get_dashboard_totals, base currency = rate reference
+  Python per row     rows fetched, converted with convert(), then grouped
+  SQL (USD base)     SQL conversion to a base other than the rate reference,
+                     so rows in the reference currency need a lookup too
+
+Every run checks that the SQL and Python paths give the same totals.
+
+    python -m benchmarks.currency [users] [months]
+"""
+import io
+import random
+import sys
+from datetime import date, timedelta
+
+from sqlalchemy import extract, select, update
+
+from benchmarks.common import best_of, disable_ai_summary, make_app, timed
+from benchmarks.synthetic_data import generate, usernames
+from models import db
+from models.transaction import Transaction
+from models.user import User
+from services.currency import convert, load_rates
+from services.dashboard_summary import _totals_from_rows, get_dashboard_totals
+from services.user_cache import invalidate_user
+
+# currency -> (starting rate, share of transactions)
+FOREIGN = {'USD': (83.0, 0.15), 'EUR': (90.0, 0.10), 'GBP': (105.0, 0.05)}
+
+
+def rates_csv(first, last, seed=7):
+    """Daily rates as a random walk, weekdays only, as a rates file."""
+    rng = random.Random(seed)
+    lines = ['date,currency,rate']
+    for currency, (rate, _) in FOREIGN.items():
+        day = first
+        while day <= last:
+            if day.weekday() < 5:
+                rate *= 1 + rng.gauss(0, 0.004)
+                lines.append(f'{day.isoformat()},{currency},{rate:.4f}')
+            day += timedelta(days=1)
+    return io.BytesIO('\n'.join(lines).encode())
+
+
+def mix_currencies():
+    """Re-denominate a share of all transactions, keeping their rough value."""
+    bucket = 0
+    for currency, (rate, share) in FOREIGN.items():
+        low, bucket = bucket, bucket + int(share * 100)
+        db.session.execute(update(Transaction).where(
+            Transaction.id % 100 >= low, Transaction.id % 100 < bucket
+        ).values(currency=currency, amount=Transaction.amount / rate))
+    db.session.commit()
+
+
+def python_totals(user_id, currency):
+    rows = db.session.execute(
+        select(Transaction.transaction_type, Transaction.category, extract('month', Transaction.date),
+               Transaction.date, Transaction.amount, Transaction.currency)
+        .where(Transaction.user_id == user_id, Transaction.transaction_type.in_(('income', 'expense')))
+    ).all()
+    grouped = {}
+    for transaction_type, category, month, day, amount, row_currency in rows:
+        key = (transaction_type, category, month)
+        grouped[key] = grouped.get(key, 0.0) + convert(amount, row_currency, currency, day)
+    return _totals_from_rows([key + (total,) for key, total in grouped.items()], currency)
+
+
+def set_base(user_id, currency):
+    db.session.get(User, user_id).base_currency = currency
+    db.session.commit()
+    invalidate_user(user_id)
+
+
+def rounded(value):
+    """Totals to the paisa, since the two paths add in a different order."""
+    if isinstance(value, float):
+        return round(value, 2)
+    if isinstance(value, dict):
+        return {key: rounded(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [rounded(item) for item in value]
+    return value
+
+
+def run(users=3, months=36):
+    app = make_app()
+    disable_ai_summary()
+    generate(app, users=users, months=months)
+
+    with app.app_context():
+        user_id = User.query.filter_by(username=usernames(1)[0]).first().id
+        rows = Transaction.query.filter_by(user_id=user_id).count()
+        single, _ = best_of(5, get_dashboard_totals, user_id)
+
+        mix_currencies()
+        load_time, loaded = timed(load_rates, rates_csv(date.today() - timedelta(days=months * 31), date.today()))
+
+        results = {'single currency': single}
+        results['SQL conversion'], sql = best_of(5, get_dashboard_totals, user_id)
+        results['Python per row'], python = best_of(5, python_totals, user_id, sql['currency'])
+
+        set_base(user_id, 'USD')
+        results['SQL (USD base)'], sql_usd = best_of(5, get_dashboard_totals, user_id)
+        python_usd = python_totals(user_id, 'USD')
+
+    print(f"  {users} users x {months} months; user 1 has {rows} transactions, "
+          f"{sum(share for _, share in FOREIGN.values()):.0%} in {', '.join(FOREIGN)}")
+    print(f"  loaded {loaded} daily rates in {load_time * 1000:.0f} ms")
+    print(f"  {'dashboard totals':<18} {'ms':>8}")
+    for name, seconds in results.items():
+        print(f"  {name:<18} {seconds * 1000:8.1f}")
+    print(f"  SQL and Python totals identical: {rounded(sql) == rounded(python)} ({sql['currency']}), "
+          f"{rounded(sql_usd) == rounded(python_usd)} (USD)")
+
+
+if __name__ == '__main__':
+    run(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,58 @@
+"""
+Write throughput and output size of each report export format.
+
+CSV goes through the existing /reports/export route; the other formats
+are streamed by services.exporters in BATCH_ROWS-sized batches, so their
+memory use stays bounded regardless of row count.
+
+    python -m benchmarks.exports [rows]
+"""
+import sys
+import time
+
+from benchmarks.common import make_app, login_client
+from benchmarks.bulk_transactions import make_items
+from models import db
+from models.user import User
+from services.bulk_transactions import validate_transactions, insert_transaction_rows
+from services import exporters
+
+
+def seed(user_id, count, chunk=50000):
+    for start in range(0, count, chunk):
+        rows, _ = validate_transactions(make_items(min(chunk, count - start), seed=start))
+        insert_transaction_rows(user_id, [row for _, row in rows], chunk_size=5000)
+        db.session.commit()
+
+
+def run(count=1000000):
+    app = make_app()
+    client = login_client(app)
+
+    with app.app_context():
+        user_id = User.query.filter_by(username='bench').first().id
+        start = time.perf_counter()
+        seed(user_id, count)
+        print(f"Seeded {count} transactions in {time.perf_counter() - start:.1f} s")
+
+    start = time.perf_counter()
+    size = len(client.get('/reports/export').data)
+    report = [('csv (existing route)', time.perf_counter() - start, size)]
+
+    with app.app_context(), app.test_request_context():
+        statement = exporters.export_statement(user_id, [])
+        for fmt in exporters.EXPORT_FORMATS:
+            if not exporters.format_available(fmt):
+                print(f"  {fmt}: skipped (pyarrow not installed)")
+                continue
+            start = time.perf_counter()
+            size = sum(len(chunk) for chunk in exporters.export_chunks(fmt, statement))
+            report.append((fmt, time.perf_counter() - start, size))
+
+    print(f"  {'format':<22} {'seconds':>8} {'rows/s':>10} {'MB':>8}")
+    for fmt, elapsed, size in report:
+        print(f"  {fmt:<22} {elapsed:8.2f} {count / elapsed:10.0f} {size / 1e6:8.1f}")
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
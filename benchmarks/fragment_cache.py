@@ -0,0 +1,60 @@
+"""
+Render time of /transactions for a user with 5k transactions with the
+fragment cache disabled, on a cache hit, and on the first request after a
+write (a miss that re-renders and stores the fragment).
+
+    python -m benchmarks.fragment_cache [transactions] [requests]
+"""
+import sys
+import time
+
+from benchmarks.bulk_transactions import make_items
+from benchmarks.common import make_app, login_client, percentile
+import services.fragment_cache as fragment_cache
+
+
+def sample(client, path, requests, before=None):
+    samples = []
+    for _ in range(requests):
+        if before:
+            before()
+        start = time.perf_counter()
+        response = client.get(path)
+        samples.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200
+    return samples
+
+
+def run(count=5000, requests=30):
+    app = make_app()
+    client = login_client(app)
+    client.post('/api/v1/transactions/bulk', json=make_items(count))
+
+    memory = fragment_cache._backend
+    fragment_cache._backend = fragment_cache.NullFragmentBackend()
+    uncached = sample(client, '/transactions', requests)
+
+    fragment_cache._backend = memory
+    client.get('/transactions')
+    hits = sample(client, '/transactions', requests)
+
+    counter = iter(range(10 ** 6))
+
+    def write():
+        client.post('/api/v1/transactions/create', json={
+            'transaction_type': 'expense', 'category': 'Food', 'amount': 10,
+            'date': '2025-01-01', 'description': f'Cache buster {next(counter)}'
+        })
+
+    misses = sample(client, '/transactions', requests // 3 or 1, before=write)
+
+    print(f"/transactions with {count} transactions, {requests} requests")
+    print(f"  {'':<22} {'p50':>9} {'p99':>9}")
+    for label, samples in (('fragment cache off', uncached), ('cache hit', hits), ('miss after a write', misses)):
+        print(f"  {label:<22} {percentile(samples, 50):8.1f}ms {percentile(samples, 99):8.1f}ms")
+    print(f"  speedup on hit: {percentile(uncached, 50) / percentile(hits, 50):.1f}x")
+
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:3]]
+    run(*args)
@@ -0,0 +1,140 @@
+"""
+Statement import throughput per format on generated files: parsing alone
+(records/s and peak traced memory, which should not grow with the file),
+a full import through services.importers into an empty account, and a
+re-import of the same file, where every row is recognised as a duplicate.
+
+PDF is measured on fewer rows by default, because text extraction is
+orders of magnitude slower than reading the other formats.
+
+    python -m benchmarks.importers [rows] [pdf_rows]
+"""
+import io
+import sys
+import time
+import tracemalloc
+from datetime import date
+
+from benchmarks.common import disable_ai_summary, make_app, pdf_document
+from benchmarks.bulk_transactions import make_items
+from models import db
+from models.user import User
+from services import importers
+
+
+LINES_PER_PDF_PAGE = 50
+
+
+# ---------------------------------------------
+# FILE GENERATORS
+# ---------------------------------------------
+def statement_rows(count, seed=42):
+    items = make_items(count, seed)
+    items.sort(key=lambda item: item['date'])
+    return items
+
+
+def make_csv(items):
+    lines = ['Date,Narration,Chq./Ref.No.,Withdrawal Amt.,Deposit Amt.']
+    for n, item in enumerate(items):
+        day = date.fromisoformat(item['date']).strftime('%d/%m/%y')
+        amount = f"\"{item['amount']:,.2f}\""
+        debit, credit = (amount, '') if item['transaction_type'] == 'expense' else ('', amount)
+        lines.append(f"{day},UPI-{item['description'].upper()},{n:012d},{debit},{credit}")
+    return '\n'.join(lines).encode()
+
+
+def make_ofx(items):
+    parts = ['OFXHEADER:100\nDATA:OFXSGML\nVERSION:102\n\n<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS>'
+             '<BANKACCTFROM><ACCTID>1234567890</BANKACCTFROM><BANKTRANLIST>\n']
+    for n, item in enumerate(items):
+        sign = '-' if item['transaction_type'] == 'expense' else ''
+        parts.append(f"<STMTTRN><TRNTYPE>{'DEBIT' if sign else 'CREDIT'}<DTPOSTED>{item['date'].replace('-', '')}"
+                     f"<TRNAMT>{sign}{item['amount']:.2f}<FITID>{n}<NAME>{item['description']}</STMTTRN>\n")
+    parts.append('</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>\n')
+    return ''.join(parts).encode()
+
+
+def make_qif(items):
+    parts = ['!Type:Bank\n']
+    for item in items:
+        day = date.fromisoformat(item['date']).strftime('%m/%d/%Y')
+        sign = '-' if item['transaction_type'] == 'expense' else ''
+        parts.append(f"D{day}\nT{sign}{item['amount']:,.2f}\nP{item['description']}\n^\n")
+    return ''.join(parts).encode()
+
+
+def make_pdf(items):
+    """A text-only PDF, one statement line per transaction."""
+    lines = [f"{date.fromisoformat(item['date']).strftime('%d-%m-%Y')} UPI {item['description']} {item['amount']:.2f}"
+             for item in items]
+    pages = [[(40, 800 - 12 * n, line) for n, line in enumerate(lines[start:start + LINES_PER_PDF_PAGE])]
+             for start in range(0, len(lines), LINES_PER_PDF_PAGE)]
+    return pdf_document(pages, font_size=9)
+
+
+GENERATORS = {'csv': make_csv, 'ofx': make_ofx, 'qif': make_qif, 'pdf': make_pdf}
+
+
+# ---------------------------------------------
+# MEASUREMENTS
+# ---------------------------------------------
+def parse_only(fmt, data):
+    """Records read and normalised, without touching the database."""
+    records, _, _ = importers._IMPORTERS[fmt]
+    dates = importers.DateParser()
+    count = 0
+    for record in records(io.BytesIO(data)):
+        if importers.normalize(record, dates) is not None:
+            count += 1
+    return count
+
+
+def peak_memory(fmt, data):
+    tracemalloc.start()
+    parse_only(fmt, data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def run(rows=100000, pdf_rows=10000):
+    app = make_app()
+    disable_ai_summary()
+
+    print(f"  {'format':<6} {'rows':>7} {'file MiB':>9} {'parse rec/s':>12} {'peak KiB (1/10 file)':>21}"
+          f" {'import rows/s':>14} {'re-import rows/s':>17}")
+    for fmt, generate in GENERATORS.items():
+        count = pdf_rows if fmt == 'pdf' else rows
+        items = statement_rows(count)
+        data = generate(items)
+        small = generate(items[:count // 10])
+
+        start = time.perf_counter()
+        parsed = parse_only(fmt, data)
+        parse_seconds = time.perf_counter() - start
+        assert parsed == count, (fmt, parsed, count)
+
+        peaks = f"{peak_memory(fmt, data) // 1024} ({peak_memory(fmt, small) // 1024})"
+
+        with app.app_context():
+            user = User(username=f'import-{fmt}', email=f'import-{fmt}@example.com', password_hash='x')
+            db.session.add(user)
+            db.session.commit()
+
+            start = time.perf_counter()
+            batch = importers.import_statement(user.id, io.BytesIO(data), f'statement.{fmt}')
+            import_seconds = time.perf_counter() - start
+            assert batch.rows_imported == count, batch.to_dict()
+
+            start = time.perf_counter()
+            batch = importers.import_statement(user.id, io.BytesIO(data), f'statement.{fmt}')
+            reimport_seconds = time.perf_counter() - start
+            assert batch.rows_duplicate == count, batch.to_dict()
+
+        print(f"  {fmt:<6} {count:>7} {len(data) / 2**20:9.1f} {count / parse_seconds:12.0f} {peaks:>21}"
+              f" {count / import_seconds:14.0f} {count / reimport_seconds:17.0f}")
+
+
+if __name__ == '__main__':
+    run(*(int(arg) for arg in sys.argv[1:3]))
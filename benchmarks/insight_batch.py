@@ -0,0 +1,73 @@
+"""
+The nightly insights batch against computing insights per user on the
+first page view of the day.
+
+  per user (live)    every user's insight queries run one user at a time,
+                     as the dashboards would the morning after a deploy
+  batch, inline      `precompute_insights(workers=0)`: each range of users
+                     answered by one set of grouped queries
+  batch, N workers   the same ranges spread over a process pool
+
+Then the insights panel for one user, reading a current snapshot and
+falling back to live computation once a write makes it stale. Every run
+checks that each user's snapshot matches the live insights exactly.
+
+    python -m benchmarks.insight_batch [users] [months] [workers]
+"""
+import os
+import sys
+
+from benchmarks.common import best_of, disable_ai_summary, make_app, timed
+from benchmarks.synthetic_data import generate
+from models import db
+from models.transaction import Transaction
+from models.user import User
+from services.ai_insights import _build_insights, _insight_statements, get_ai_insights, precomputed_insights
+from services.insight_batch import INSIGHT_BATCH_SIZE, precompute_insights
+
+
+def live_insights(user_ids):
+    return {user_id: _build_insights(user_id, {name: db.session.execute(statement).all()
+                                               for name, statement in _insight_statements(user_id).items()})[0]
+            for user_id in user_ids}
+
+
+def run(users=200, months=24, workers=None):
+    workers = workers or os.cpu_count() or 1
+    size = min(INSIGHT_BATCH_SIZE, max(users // (2 * workers), 1))
+    app = make_app()
+    disable_ai_summary()
+    generate(app, users=users, months=months)
+
+    with app.app_context():
+        user_ids = db.session.execute(db.select(User.id).order_by(User.id)).scalars().all()
+        rows = db.session.execute(db.select(db.func.count()).select_from(Transaction)).scalar()
+        live_time, live = timed(live_insights, user_ids)
+
+        inline_time, _ = timed(precompute_insights, workers=0, size=size)
+        pool_time, done = timed(precompute_insights, workers=workers, size=size)
+        snapshots = {user_id: precomputed_insights(user_id) for user_id in user_ids}
+        mismatched = [user_id for user_id in user_ids
+                      if snapshots[user_id] is None or snapshots[user_id][0] != live[user_id]]
+
+        user_id = user_ids[0]
+        fresh, _ = best_of(5, get_ai_insights, user_id)
+        transaction = Transaction.query.filter_by(user_id=user_id).first()
+        transaction.description = (transaction.description or '') + ' (edited)'
+        db.session.commit()
+        stale_snapshot = precomputed_insights(user_id)
+        stale, _ = best_of(5, get_ai_insights, user_id)
+
+    print(f"  {users} users x {months} months ({rows} transactions), ranges of {size} users")
+    print(f"  {'all users':<20} {'seconds':>8} {'users/s':>8}")
+    for name, seconds in (('per user (live)', live_time), ('batch, inline', inline_time),
+                          (f'batch, {workers} workers', pool_time)):
+        print(f"  {name:<20} {seconds:8.2f} {users / seconds:8.0f}")
+    print(f"  insights panel, one user: {fresh * 1000:.1f} ms from the snapshot, "
+          f"{stale * 1000:.1f} ms live after a write (snapshot stale: {stale_snapshot is None})")
+    print(f"  snapshots written: {done}; identical to live insights: {not mismatched}"
+          + (f" (differ for users {mismatched[:5]})" if mismatched else ''))
+
+
+if __name__ == '__main__':
+    run(*(int(arg) for arg in sys.argv[1:4]))
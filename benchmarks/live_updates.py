@@ -0,0 +1,62 @@
+"""
+Cost of keeping an open dashboard current after a write: a full page
+reload (every aggregate plus insights) versus the coalesced delta the
+/events stream sends for the same write.
+
+    python -m benchmarks.live_updates
+"""
+from datetime import date
+
+from benchmarks.bulk_transactions import make_items
+from benchmarks.common import make_app, login_client, best_of, disable_ai_summary
+from routes.events import _budget_statuses, _updates
+
+
+def run(count=20000, writes=50):
+    disable_ai_summary()
+    app = make_app()
+    client = login_client(app)
+    client.post('/api/v1/transactions/bulk', json=make_items(count))
+    for category in ('Food', 'Travel', 'Shopping'):
+        client.post('/budgets/add', data={'category': category, 'amount': '50000', 'period': 'monthly'})
+
+    with app.app_context():
+        from models.user import User
+        user_id = User.query.filter_by(username='bench').first().id
+        budgets = _budget_statuses(user_id)
+
+    def write(i):
+        return client.post('/api/v1/transactions/create', json={
+            'transaction_type': 'expense', 'category': 'Food', 'amount': 120 + i,
+            'date': date.today().isoformat(), 'description': f'Live item {i}'
+        })
+
+    def reload_after_writes():
+        for i in range(writes):
+            write(i)
+            assert client.get('/dashboard').status_code == 200
+
+    def deltas_after_writes():
+        for i in range(writes):
+            response = write(i)
+            with app.app_context():
+                _updates(user_id, [{'type': 'changes', 'changes': [['transaction', response.get_json()['transaction']['id'], 'insert']]}], budgets)
+
+    def writes_only():
+        for i in range(writes):
+            write(i)
+
+    base, _ = best_of(3, writes_only)
+    reload, _ = best_of(3, reload_after_writes)
+    delta, _ = best_of(3, deltas_after_writes)
+
+    reload_ms = (reload - base) / writes * 1000
+    delta_ms = (delta - base) / writes * 1000
+    print(f"{count} transactions, {writes} writes per run (write cost subtracted)")
+    print(f"  full dashboard reload     {reload_ms:8.2f} ms per write")
+    print(f"  SSE delta                 {delta_ms:8.2f} ms per write")
+    print(f"  speedup: {reload_ms / delta_ms:.1f}x")
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,212 @@
+"""
+AI summaries for many users through the LLM scheduler, against a local
+fake model server (services.llm.HTTPClient protocol) that enforces its own
+rate limit with 429s, fails a small share of requests with 500s and can
+be switched into an outage.
+
+  naive              one direct client call per page view from a pool of
+                     threads: no rate limit, no deduplication, no retries
+  scheduler          the same page views through LLMScheduler: identical
+                     prompts share a request, calls stay under the quota,
+                     failures are retried with jittered backoff
+  outage             the server answers 503 to everything; the circuit
+                     breaker stops calling it after a few failures, then
+                     closes again on the first success after the cooldown
+
+Prompts are the real insight prompts of synthetic users (plus some new
+users without data, who all share one), each viewed several times. The
+size of the trimmed prompt is compared with the previous untrimmed one.
+
+    python -m benchmarks.llm_scheduler [users] [views]
+"""
+import json
+import logging
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.common import make_app, timed
+from benchmarks.synthetic_data import generate
+from models import db
+from models.insight_snapshot import InsightSnapshot
+from models.user import User
+from services.ai_insights import _insight_statements
+from services.currency import format_money
+from services.insight_batch import precompute_insights
+from services.llm import CircuitBreaker, HTTPClient, LLMError, LLMScheduler, estimate_tokens
+from services.rate_limit import TokenBucket
+
+SERVER_REQUESTS_PER_SECOND = 40
+SERVER_LATENCY = 0.05
+SERVER_ERROR_RATE = 0.02
+NEW_USERS = 40
+
+
+class Server(ThreadingHTTPServer):
+    request_queue_size = 128   # the naive phase connects from many threads at once
+
+
+class FakeModelServer:
+    def __init__(self):
+        self.bucket = TokenBucket(SERVER_REQUESTS_PER_SECOND // 4, SERVER_REQUESTS_PER_SECOND)
+        self.lock = threading.Lock()
+        self.outage = False
+        self.rng = random.Random(1)
+        self.counts = {'requests': 0, '200': 0, '429': 0, '500': 0, '503': 0, 'tokens': 0}
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                prompt = json.loads(self.rfile.read(int(self.headers['Content-Length'])))['prompt']
+                status, body = server.answer(prompt)
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.end_headers()
+                self.wfile.write(json.dumps(body).encode())
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = Server(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.httpd.server_port}/generate'
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def answer(self, prompt):
+        with self.lock:
+            self.counts['requests'] += 1
+            if self.outage:
+                status = 503
+            elif not self.bucket.consume()[0]:
+                status = 429
+            elif self.rng.random() < SERVER_ERROR_RATE:
+                status = 500
+            else:
+                status = 200
+            self.counts[str(status)] += 1
+        if status != 200:
+            return status, {'error': status}
+        time.sleep(SERVER_LATENCY)
+        text = 'Keep an eye on your top category and keep saving.'
+        tokens = estimate_tokens(prompt) + estimate_tokens(text)
+        with self.lock:
+            self.counts['tokens'] += tokens
+        return 200, {'text': text, 'tokens': tokens}
+
+    def reset(self):
+        with self.lock:
+            self.counts = dict.fromkeys(self.counts, 0)
+
+
+def untrimmed_prompt(user_id, insights):
+    """The prompt as it was before trimming: every category row, verbatim."""
+    results = {name: db.session.execute(statement).all()
+               for name, statement in _insight_statements(user_id).items() if name in ('total_income',
+                                                                                        'total_expense',
+                                                                                        'categories')}
+    return f"""
+You are SmartFinanceAI, an expert financial assistant.
+
+Based on this user's monthly data:
+
+Income: {format_money(results['total_income'][0][0] or 0.0)}
+Expenses: {format_money(results['total_expense'][0][0] or 0.0)}
+Top categories: {results['categories']}
+User insights: {', '.join([i['message'] for i in insights])}
+
+Create a short, helpful financial advice summary in 2–3 sentences.
+"""
+
+
+def naive(server, page_views):
+    client = HTTPClient(server.url)
+
+    def call(prompt):
+        try:
+            return client.generate(prompt)[0]
+        except LLMError:
+            return None
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        return list(pool.map(call, page_views))
+
+
+def scheduled(scheduler, page_views):
+    futures = [scheduler.submit(prompt) for prompt in page_views]
+    results = []
+    for future in futures:
+        try:
+            results.append(future.result())
+        except LLMError:
+            results.append(None)
+    return results
+
+
+def report(name, seconds, results, server, metrics=None):
+    ok = sum(1 for result in results if result is not None)
+    counts = server.counts
+    print(f"  {name:<10} {seconds:7.2f}s  answered {ok}/{len(results)}  upstream calls {counts['requests']} "
+          f"(429: {counts['429']}, 5xx: {counts['500'] + counts['503']})  tokens {counts['tokens']}")
+    if metrics:
+        print(f"  {'':<10} deduplicated {metrics['deduplicated']}, retries {metrics['retries']}, "
+              f"rejected by breaker {metrics['rejected']}, queue wait p50 {metrics['queue_wait_p50'] * 1000:.0f} ms "
+              f"/ p95 {metrics['queue_wait_p95'] * 1000:.0f} ms")
+
+
+def run(users=100, views=3):
+    logging.getLogger('services.llm').setLevel(logging.ERROR)   # the outage phase fails on purpose
+    app = make_app()
+    generate(app, users=users, months=12)
+    with app.app_context():
+        for number in range(NEW_USERS):
+            db.session.add(User(username=f'new{number}', email=f'new{number}@example.com', password_hash='x'))
+        db.session.commit()
+        precompute_insights(workers=0)
+        snapshots = db.session.execute(
+            db.select(InsightSnapshot.user_id, InsightSnapshot.prompt, InsightSnapshot.insights)
+        ).all()
+        sample = snapshots[:20]
+        trimmed = sum(estimate_tokens(prompt) for _, prompt, _ in sample)
+        untrimmed = sum(estimate_tokens(untrimmed_prompt(user_id, json.loads(insights)))
+                        for user_id, _, insights in sample)
+
+    prompts = [prompt for _, prompt, _ in snapshots]
+    page_views = prompts * views
+    random.Random(2).shuffle(page_views)
+    server = FakeModelServer()
+
+    print(f"  {len(snapshots)} users ({NEW_USERS} without data), {views} page views each: "
+          f"{len(page_views)} summaries, {len(set(prompts))} distinct prompts")
+    print(f"  prompt size: {untrimmed / len(sample):.0f} -> {trimmed / len(sample):.0f} estimated tokens")
+    print(f"  fake server: {SERVER_REQUESTS_PER_SECOND} req/s, {SERVER_LATENCY * 1000:.0f} ms, "
+          f"{SERVER_ERROR_RATE:.0%} errors")
+
+    seconds, results = timed(naive, server, page_views)
+    report('naive', seconds, results, server)
+
+    server.reset()
+    scheduler = LLMScheduler(HTTPClient(server.url), requests_per_minute=SERVER_REQUESTS_PER_SECOND * 60,
+                             concurrency=4)
+    seconds, results = timed(scheduled, scheduler, page_views)
+    report('scheduler', seconds, results, server, scheduler.metrics())
+
+    server.reset()
+    server.outage = True
+    scheduler = LLMScheduler(HTTPClient(server.url), requests_per_minute=SERVER_REQUESTS_PER_SECOND * 60,
+                             concurrency=4, breaker=CircuitBreaker(failures=5, cooldown=1))
+    outage_prompts = [f'{prompt}\n(outage {i})' for i, prompt in enumerate(prompts)]
+    seconds, results = timed(scheduled, scheduler, outage_prompts)
+    report('outage', seconds, results, server, scheduler.metrics())
+
+    server.outage = False
+    time.sleep(1)
+    recovered = scheduler.generate(prompts[0] + '\n(recovered)')
+    print(f"  after the cooldown: answered {bool(recovered)}, circuit open {scheduler.metrics()['circuit_open']}")
+    server.httpd.shutdown()
+
+
+if __name__ == '__main__':
+    run(*(int(arg) for arg in sys.argv[1:3]))
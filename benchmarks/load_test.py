@@ -0,0 +1,530 @@
+"""
+End-to-end load test: concurrent clients, each logged in as one of the
+synthetic users (benchmarks/synthetic_data.py), drive the routes of every
+blueprint with a weighted mix of page views, searches, exports, API reads,
+form posts and API writes. Reports requests, errors, throughput and
+p50/p95/p99 latency per endpoint, and saves them as JSON so runs can be
+compared across commits.
+
+By default a temporary SQLite database is seeded and served with gunicorn
+(gthread) or uvicorn (--server asgi), with Gemini replaced by a fixed
+delay (AI_LATENCY_MS, default 300) and login rate limiting off. Clients
+revalidate pages with If-None-Match like a browser does, so 304s count
+as successes.
+
+Not covered: /events (a long-lived stream, see benchmarks.live_updates),
+/upload-pdf (needs statement files), static files
+(benchmarks.static_assets) and /recurring, whose blueprint the app does
+not register.
+
+    python -m benchmarks.load_test                                  # 20 users, 16 clients, 30s
+    python -m benchmarks.load_test --server asgi --clients 32
+    python -m benchmarks.load_test --database-url sqlite:////tmp/big.db --users 700
+    python -m benchmarks.load_test --url http://127.0.0.1:5000 --users 50
+    python -m benchmarks.load_test --compare load_test_results/<commit>-gthread.json
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+from urllib.parse import urlencode, urlsplit
+
+from benchmarks.common import percentile
+from benchmarks.synthetic_data import DEFAULT_PASSWORD, EXPENSE_PROFILE, usernames
+
+
+PORT = 5079
+RESULTS_DIR = 'load_test_results'
+
+# A run is flagged when it loses this much throughput, or an endpoint gains this much p95 latency (%)
+DEFAULT_THRESHOLD = 10.0
+
+# Fewer requests than this to an endpoint (in either run) and its p95 is too noisy to judge
+MIN_SAMPLES = 100
+
+FORM = {'Content-Type': 'application/x-www-form-urlencoded'}
+JSON = {'Content-Type': 'application/json'}
+
+
+# ---------------------------------------------
+# CLIENT SESSION
+# ---------------------------------------------
+class Session:
+    """One simulated user: a keep-alive connection, a session cookie and the ids of its data."""
+
+    def __init__(self, base_url, username, rng):
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.username = username
+        self.rng = rng
+        self.connection = None
+        self.cookie = None
+        self.etags = {}
+        self.transaction_ids = []
+        self.created_ids = []
+        self.budget_ids = []
+        self.sync_token = None
+
+    def request(self, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        if method == 'GET' and path in self.etags:
+            headers['If-None-Match'] = self.etags[path]
+
+        for attempt in range(2):
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(self.host, self.port, timeout=120)
+            try:
+                self.connection.request(method, path, body=body, headers=headers)
+                response = self.connection.getresponse()
+                data = response.read()
+                break
+            except (http.client.HTTPException, OSError):
+                self.connection.close()
+                self.connection = None
+                if attempt:
+                    raise
+
+        cookie = response.getheader('Set-Cookie')
+        if cookie:
+            self.cookie = cookie.split(';')[0]
+        if method == 'GET' and response.getheader('ETag'):
+            self.etags[path] = response.getheader('ETag')
+        return response, data
+
+    def login(self):
+        """Log in through the API, retrying while the password hashing pool sheds load."""
+        body = json.dumps({'username': self.username, 'password': DEFAULT_PASSWORD})
+        for _ in range(50):
+            response, data = self.request('POST', '/api/v1/auth/login', body, JSON)
+            if response.status != 503:
+                break
+            time.sleep(0.2)
+        if response.status != 200:
+            raise RuntimeError(f'login as {self.username} failed: {response.status} {data[:200]!r}')
+
+    def load_ids(self):
+        response, data = self.request('GET', '/api/v1/sync')
+        snapshot = json.loads(data)
+        changes = snapshot['changes']
+        self.transaction_ids = [row['id'] for row in changes['transactions']['upserted']]
+        self.budget_ids = [row['id'] for row in changes['budgets']['upserted']]
+        self.sync_token = snapshot['next_token']
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+
+
+# ---------------------------------------------
+# REQUEST MIX
+# ---------------------------------------------
+def _expense(rng):
+    category = rng.choice(list(EXPENSE_PROFILE))
+    merchants = EXPENSE_PROFILE[category][3]
+    return {
+        'transaction_type': 'expense',
+        'category': category,
+        'amount': f'{rng.uniform(50, 3000):.2f}',
+        'description': rng.choice(merchants),
+        'date': (date.today() - timedelta(days=rng.randrange(30))).isoformat()
+    }
+
+
+def _search_term(rng):
+    return rng.choice(EXPENSE_PROFILE[rng.choice(list(EXPENSE_PROFILE))][3]).split()[0].lower()
+
+
+def _recent_range():
+    return {'start_date': (date.today() - timedelta(days=90)).isoformat(), 'end_date': date.today().isoformat()}
+
+
+def dashboard(s):
+    return s.request('GET', '/dashboard')
+
+
+def transactions_page(s):
+    return s.request('GET', f"/transactions?page={s.rng.randrange(1, 4)}")
+
+
+def transactions_search(s):
+    return s.request('GET', f"/transactions?q={_search_term(s.rng)}")
+
+
+def add_transaction_form(s):
+    return s.request('GET', '/add-transaction')
+
+
+def add_transaction(s):
+    return s.request('POST', '/add-transaction', urlencode(_expense(s.rng)), FORM)
+
+
+def edit_transaction(s):
+    transaction_id = s.rng.choice(s.created_ids or s.transaction_ids)
+    return s.request('POST', f'/edit-transaction/{transaction_id}', urlencode(_expense(s.rng)), FORM)
+
+
+def delete_transaction(s):
+    # Only rows this client created, so the seeded history stays the same size
+    if not s.created_ids:
+        return add_transaction(s)
+    return s.request('POST', f'/delete-transaction/{s.created_ids.pop()}')
+
+
+def budgets(s):
+    return s.request('GET', '/budgets')
+
+
+def edit_budget(s):
+    if not s.budget_ids:
+        return budgets(s)
+    return s.request('GET', f'/budgets/edit/{s.rng.choice(s.budget_ids)}')
+
+
+def reports(s):
+    return s.request('GET', '/reports')
+
+
+def reports_export(s):
+    return s.request('GET', f'/reports/export?{urlencode(_recent_range())}')
+
+
+def api_transactions(s):
+    return s.request('GET', '/api/v1/transactions?fields=id,date,amount,category')
+
+
+def api_search(s):
+    return s.request('GET', f"/api/v1/transactions?q={_search_term(s.rng)}&per_page=20")
+
+
+def api_insights(s):
+    return s.request('GET', '/api/v1/insights')
+
+
+def api_sync(s):
+    response, data = s.request('GET', f'/api/v1/sync?since={s.sync_token}')
+    if response.status == 200:
+        s.sync_token = json.loads(data)['next_token']
+    return response, data
+
+
+def api_alerts(s):
+    return s.request('GET', '/api/v1/alerts')
+
+
+def api_create(s):
+    response, data = s.request('POST', '/api/v1/transactions/create', json.dumps(_expense(s.rng)), JSON)
+    if response.status == 201:
+        s.created_ids.append(json.loads(data)['transaction']['id'])
+    return response, data
+
+
+def api_bulk(s):
+    items = [_expense(s.rng) for _ in range(50)]
+    return s.request('POST', '/api/v1/transactions/bulk', json.dumps(items), JSON)
+
+
+def login_page(s):
+    return s.request('GET', '/login')
+
+
+def api_login(s):
+    body = json.dumps({'username': s.username, 'password': DEFAULT_PASSWORD})
+    return s.request('POST', '/api/v1/auth/login', body, JSON)
+
+
+# name -> (weight, action); roughly what the web and mobile clients send
+MIX = {
+    'dashboard': (16, dashboard),
+    'transactions': (7, transactions_page),
+    'transactions_search': (5, transactions_search),
+    'add_transaction_form': (2, add_transaction_form),
+    'add_transaction': (4, add_transaction),
+    'edit_transaction': (2, edit_transaction),
+    'delete_transaction': (2, delete_transaction),
+    'budgets': (8, budgets),
+    'edit_budget_form': (2, edit_budget),
+    'reports': (7, reports),
+    'reports_export': (2, reports_export),
+    'api_transactions': (5, api_transactions),
+    'api_search': (6, api_search),
+    'api_insights': (6, api_insights),
+    'api_sync': (7, api_sync),
+    'api_alerts': (3, api_alerts),
+    'api_create': (6, api_create),
+    'api_bulk': (1, api_bulk),
+    'login_page': (1, login_page),
+    'api_login': (1, api_login),
+}
+
+
+def _failed(name, response):
+    if response.status >= 400:
+        return True
+    # A redirect to the login page means the session was lost
+    return name not in ('login_page', 'api_login') and '/login' in (response.getheader('Location') or '')
+
+
+# ---------------------------------------------
+# LOAD
+# ---------------------------------------------
+def run_load(sessions, seconds, seed):
+    """Run every session in its own thread for `seconds`; returns {name: [(ms, status, failed)]}."""
+    names = list(MIX)
+    weights = [MIX[name][0] for name in names]
+    samples = {name: [] for name in names}
+    stop = time.monotonic() + seconds
+
+    def client(session):
+        rng = random.Random(f'{seed}:{session.username}:load')
+        while time.monotonic() < stop:
+            name = rng.choices(names, weights)[0]
+            start = time.perf_counter()
+            try:
+                response, _ = MIX[name][1](session)
+                status, failed = response.status, _failed(name, response)
+            except (http.client.HTTPException, OSError) as e:
+                status, failed = type(e).__name__, True
+            samples[name].append(((time.perf_counter() - start) * 1000, status, failed))
+
+    threads = [threading.Thread(target=client, args=(session,)) for session in sessions]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples
+
+
+def summarize(samples, seconds):
+    endpoints = {}
+    everything = []
+    for name, entries in samples.items():
+        if not entries:
+            continue
+        latencies = [ms for ms, _, _ in entries]
+        statuses = {}
+        for _, status, _ in entries:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        endpoints[name] = _stats(latencies, sum(failed for _, _, failed in entries), seconds)
+        endpoints[name]['statuses'] = statuses
+        everything.extend(entries)
+
+    total = _stats([ms for ms, _, _ in everything], sum(failed for _, _, failed in everything), seconds)
+    return total, endpoints
+
+
+def _stats(latencies, errors, seconds):
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': round(len(latencies) / seconds, 2),
+        'mean_ms': round(sum(latencies) / len(latencies), 2) if latencies else 0.0,
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+    }
+
+
+# ---------------------------------------------
+# SERVER
+# ---------------------------------------------
+def server_command(server, workers, threads):
+    if server == 'asgi':
+        return ['uvicorn', '--factory', '--port', str(PORT), '--log-level', 'warning', '--workers', str(workers),
+                'benchmarks.common:asgi_app']
+    return ['gunicorn', '-k', 'gthread', '-w', str(workers), '--threads', str(threads), '--timeout', '120',
+            '-b', f'127.0.0.1:{PORT}', 'benchmarks.common:wsgi_app()']
+
+
+def wait_for_server(base_url):
+    parts = urlsplit(base_url)
+    for _ in range(300):
+        try:
+            connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=5)
+            connection.request('GET', '/login')
+            connection.getresponse().read()
+            connection.close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError('server did not start')
+
+
+def seed_database(users, months, per_month, seed):
+    from benchmarks.common import disable_ai_summary, make_app
+    from benchmarks.synthetic_data import generate
+
+    database_url = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='smartfinance-load-'), 'load.db')}"
+    disable_ai_summary()
+    dataset = generate(make_app(database_url), users, months, per_month, seed)
+    return database_url, dataset
+
+
+# ---------------------------------------------
+# RESULTS
+# ---------------------------------------------
+def git_revision():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short=12', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                    capture_output=True, text=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown', False
+    return commit, dirty
+
+
+def print_results(results):
+    meta = results['meta']
+    print(f"\n{meta['server']}, {meta['clients']} clients, {meta['seconds']}s, commit {meta['commit']}"
+          f"{' (dirty)' if meta['dirty'] else ''}")
+    print(f"  {'endpoint':<22} {'requests':>8} {'errors':>6} {'req/s':>7} {'mean ms':>8} {'p50 ms':>8}"
+          f" {'p95 ms':>8} {'p99 ms':>8}")
+    rows = sorted(results['endpoints'].items()) + [('TOTAL', results['total'])]
+    for name, stats in rows:
+        print(f"  {name:<22} {stats['requests']:>8} {stats['errors']:>6} {stats['rps']:7.1f} {stats['mean_ms']:8.1f}"
+              f" {stats['p50_ms']:8.1f} {stats['p95_ms']:8.1f} {stats['p99_ms']:8.1f}")
+
+
+def _change(old, new):
+    return (new - old) / old * 100 if old else 0.0
+
+
+def _regressed(old, new, threshold, total=False):
+    if new['errors'] > old['errors']:
+        return True
+    if total:
+        return _change(old['rps'], new['rps']) < -threshold or _change(old['p95_ms'], new['p95_ms']) > threshold
+    # An endpoint's throughput follows its share of the mix, so only its latency is judged,
+    # and only once both runs have enough samples for a stable p95.
+    return (min(old['requests'], new['requests']) >= MIN_SAMPLES
+            and _change(old['p95_ms'], new['p95_ms']) > threshold)
+
+
+def compare(baseline, results, threshold=DEFAULT_THRESHOLD):
+    """Print per-endpoint deltas against a baseline run; returns the names of regressed endpoints."""
+    print(f"\nAgainst {baseline['meta']['commit']} ({baseline['meta']['timestamp']}), threshold {threshold:g}%")
+    for key in ('server', 'clients', 'seconds', 'workers', 'threads'):
+        if baseline['meta'].get(key) != results['meta'].get(key):
+            print(f"  warning: {key} differs ({baseline['meta'].get(key)} -> {results['meta'].get(key)})")
+    if baseline.get('dataset', {}).get('transactions') != results.get('dataset', {}).get('transactions'):
+        print('  warning: the datasets differ')
+
+    print(f"  {'endpoint':<22} {'req/s':>18} {'change':>8} {'p95 ms':>20} {'change':>8} {'errors':>11}")
+    regressions = []
+    rows = [(name, baseline['endpoints'][name], results['endpoints'][name])
+            for name in sorted(set(baseline['endpoints']) & set(results['endpoints']))]
+    for name, old, new in rows + [('TOTAL', baseline['total'], results['total'])]:
+        regressed = _regressed(old, new, threshold, total=name == 'TOTAL')
+        if regressed:
+            regressions.append(name)
+        print(f"  {name:<22} {old['rps']:8.1f} -> {new['rps']:7.1f} {_change(old['rps'], new['rps']):+7.1f}%"
+              f" {old['p95_ms']:9.1f} -> {new['p95_ms']:8.1f} {_change(old['p95_ms'], new['p95_ms']):+7.1f}%"
+              f" {old['errors']:>4} -> {new['errors']:<4}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--server', choices=('gthread', 'asgi'), default='gthread')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--threads', type=int, default=8, help='gthread threads, or WSGI_THREADS for asgi')
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--seconds', type=int, default=30)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--months', type=int, default=12)
+    parser.add_argument('--per-month', type=int, default=60)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--database-url', help='serve a database already filled by benchmarks.synthetic_data')
+    parser.add_argument('--url', help='load an already-running server (with --users synthetic users) instead')
+    parser.add_argument('--output', help=f'results file (default {RESULTS_DIR}/<commit>-<server>.json)')
+    parser.add_argument('--compare', help='baseline results file to compare against')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args()
+
+    server = None
+    base_url = args.url or f'http://127.0.0.1:{PORT}'
+    if args.url:
+        dataset = {'url': args.url, 'users': args.users}
+    else:
+        if args.database_url:
+            database_url, dataset = args.database_url, {'database_url': args.database_url, 'users': args.users}
+        else:
+            print(f"Seeding {args.users} synthetic users ({args.months} months)...", flush=True)
+            database_url, dataset = seed_database(args.users, args.months, args.per_month, args.seed)
+            print(f"  {dataset['transactions']} transactions in {dataset['seconds']}s")
+
+        env = dict(os.environ, DATABASE_URL=database_url, RATE_LIMIT_ENABLED='0', WSGI_THREADS=str(args.threads))
+        server = subprocess.Popen(server_command(args.server, args.workers, args.threads), env=env,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    try:
+        wait_for_server(base_url)
+        sessions = []
+        names = usernames(args.users)
+        for n in range(args.clients):
+            session = Session(base_url, names[n % len(names)], random.Random(f'{args.seed}:{n}'))
+            session.login()
+            session.load_ids()
+            sessions.append(session)
+
+        if args.warmup:
+            run_load(sessions, args.warmup, args.seed)
+        started = time.perf_counter()
+        samples = run_load(sessions, args.seconds, args.seed)
+        elapsed = time.perf_counter() - started
+        for session in sessions:
+            session.close()
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    commit, dirty = git_revision()
+    total, endpoints = summarize(samples, elapsed)
+    results = {
+        'meta': {
+            'commit': commit,
+            'dirty': dirty,
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'server': 'external' if args.url else args.server,
+            'workers': args.workers,
+            'threads': args.threads,
+            'clients': args.clients,
+            'seconds': args.seconds,
+            'seed': args.seed,
+            'ai_latency_ms': int(os.environ.get('AI_LATENCY_MS', 300)),
+            'python': platform.python_version(),
+            'cpus': os.cpu_count(),
+        },
+        'dataset': dataset,
+        'total': total,
+        'endpoints': endpoints,
+    }
+    print_results(results)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{commit}{'-dirty' if dirty else ''}-{results['meta']['server']}.json")
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nSaved {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(baseline, results, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
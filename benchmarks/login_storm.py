@@ -0,0 +1,108 @@
+"""
+Login throughput, and the latency of ordinary requests while a storm of
+logins is in progress, with password hashing inline (the old behaviour)
+and offloaded to the bounded hashing pool.
+
+Starts gunicorn (gthread workers) against a throwaway SQLite database,
+with rate limiting disabled so the storm reaches the hashing code.
+
+    python -m benchmarks.login_storm [storm_clients] [seconds]
+"""
+import http.client
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.common import percentile
+
+
+PORT = 5077
+
+
+def request(method, path, body=None, headers=None):
+    connection = http.client.HTTPConnection('127.0.0.1', PORT, timeout=30)
+    connection.request(method, path, body=body, headers=headers or {})
+    response = connection.getresponse()
+    data = response.read()
+    connection.close()
+    return response, data
+
+
+def wait_for_server():
+    for _ in range(100):
+        try:
+            request('GET', '/')
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError('gunicorn did not start')
+
+
+def start_server(env):
+    return subprocess.Popen(
+        ['gunicorn', '-k', 'gthread', '-w', '2', '--threads', '4', '-b', f'127.0.0.1:{PORT}', 'main:app'],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+
+def run_storm(storm_clients, seconds):
+    credentials = json.dumps({'username': 'storm', 'password': 'storm-password'})
+    headers = {'Content-Type': 'application/json'}
+
+    response, _ = request('POST', '/api/v1/auth/login', credentials, headers)
+    cookie = response.getheader('Set-Cookie').split(';')[0]
+
+    stop = time.monotonic() + seconds
+    statuses = []
+    probe_samples = []
+
+    def storm():
+        while time.monotonic() < stop:
+            response, _ = request('POST', '/api/v1/auth/login', credentials, headers)
+            statuses.append(response.status)
+
+    def probe():
+        while time.monotonic() < stop:
+            start = time.perf_counter()
+            request('GET', '/api/v1/sync?since=0', headers={'Cookie': cookie})
+            probe_samples.append((time.perf_counter() - start) * 1000)
+            time.sleep(0.02)
+
+    threads = [threading.Thread(target=storm) for _ in range(storm_clients)] + [threading.Thread(target=probe)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return statuses, probe_samples
+
+
+def run(storm_clients=16, seconds=10):
+    db_path = os.path.join(tempfile.mkdtemp(prefix='smartfinance-bench-'), 'bench.db')
+    base_env = dict(os.environ, DATABASE_URL=f'sqlite:///{db_path}', RATE_LIMIT_ENABLED='0')
+
+    print(f"{storm_clients} login clients for {seconds}s, probing /api/v1/sync every 20 ms")
+    for label, workers in [('inline hashing', '0'), ('hashing pool', '1')]:
+        server = start_server(dict(base_env, PASSWORD_HASH_WORKERS=workers))
+        try:
+            wait_for_server()
+            request('POST', '/api/v1/auth/register', json.dumps({
+                'username': 'storm', 'email': 'storm@example.com', 'password': 'storm-password'
+            }), {'Content-Type': 'application/json'})
+            statuses, probes = run_storm(storm_clients, seconds)
+        finally:
+            server.terminate()
+            server.wait()
+
+        ok = statuses.count(200)
+        busy = statuses.count(503)
+        print(f"  {label:<15} logins {ok / seconds:6.1f}/s ok, {busy / seconds:6.1f}/s busy(503)"
+              f" | other requests p50 {percentile(probes, 50):7.1f} ms  p99 {percentile(probes, 99):7.1f} ms")
+
+
+if __name__ == '__main__':
+    run(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,143 @@
+"""
+Period comparisons from the monthly totals against summing the
+transactions of both periods on every request, over years of history
+with the oldest years in the cold archive.
+
+  buckets            compare_periods: whole months from monthly_totals,
+                     only leftover days from transactions (or the archive)
+  transactions       both periods grouped straight from the transactions
+                     table, archived years decoded and converted in Python
+
+Comparisons cover a month, a quarter and a year against a year earlier,
+a week against the previous one and a range that starts and ends mid-month
+in an archived year. Every run checks that both paths give the same
+totals, that totals kept current through ORM inserts, edits and deletes
+match a rebuild from scratch, and that a bulk delete drops them to be
+seeded again correctly.
+
+    python -m benchmarks.period_reports [users] [months]
+"""
+import sys
+from datetime import date, timedelta
+
+from sqlalchemy import func, select
+
+from benchmarks.common import best_of, make_app, timed
+from benchmarks.synthetic_data import generate, usernames
+from models import db
+from models.monthly_total import MonthlyTotal
+from models.transaction import Transaction
+from models.user import User
+from services.archive import archive_transactions, archived_transactions, archived_years
+from services.bulk_deletes import delete_transactions
+from services.currency import Conversion, base_currency, convert
+from services.period_reports import _history_buckets, compare_periods, ensure_monthly_totals, period_totals
+from services.periods import date_range, parse_period, period_of
+
+
+def scanned_totals(user_id, period, currency):
+    """{(type, category): amount} of a period, from every row in it."""
+    conversion = Conversion(Transaction.amount, Transaction.currency, Transaction.date, currency)
+    totals = dict(((row[0], row[1]), row[2]) for row in db.session.execute(
+        conversion.join(select(Transaction.transaction_type, Transaction.category,
+                               func.sum(conversion.amount)).select_from(Transaction)).where(
+            Transaction.user_id == user_id, Transaction.date >= period.start, Transaction.date < period.end
+        ).group_by(Transaction.transaction_type, Transaction.category)
+    ))
+    filters = {'start_date': period.start, 'end_date': period.last_day}
+    years = archived_years(user_id, filters)
+    if years:
+        for row in archived_transactions(user_id, filters, years):
+            key = (row.transaction_type, row.category)
+            totals[key] = totals.get(key, 0.0) + convert(row.amount, row.currency, currency, row.date)
+    return totals
+
+
+def scanned_comparison(user_id, current, baseline):
+    currency = base_currency(user_id)
+    return [scanned_totals(user_id, current, currency), scanned_totals(user_id, baseline, currency)]
+
+
+def rounded(totals):
+    return {key: round(amount, 2) for key, amount in totals.items() if round(amount, 2)}
+
+
+def stored_buckets(user_id):
+    return {(row.month, row.transaction_type, row.category, row.currency): (round(row.amount, 2), row.count)
+            for row in MonthlyTotal.query.filter_by(user_id=user_id)}
+
+
+def rebuilt_buckets(user_id):
+    return {key: (round(amount, 2), count)
+            for key, (amount, count) in _history_buckets(db.session.connection(), user_id).items()}
+
+
+def churn(user_id, today):
+    """ORM inserts, edits of every bucket key and a delete, folded in as deltas."""
+    for day in range(20):
+        db.session.add(Transaction(user_id=user_id, amount=100 + day, category='Food', transaction_type='expense',
+                                   date=today - timedelta(days=day * 3), description='churn'))
+    db.session.commit()
+    rows = Transaction.query.filter_by(user_id=user_id, description='churn').all()
+    rows[0].amount += 50
+    rows[1].category = 'Travel'
+    rows[2].date = rows[2].date - timedelta(days=40)
+    rows[3].transaction_type = 'income'
+    db.session.delete(rows[4])
+    db.session.commit()
+
+
+def run(users=5, months=60):
+    app = make_app()
+    generate(app, users=users, months=months, per_month=150)
+    today = date.today()
+
+    with app.app_context():
+        archived = archive_transactions()
+        user_id = User.query.filter_by(username=usernames(1)[0]).first().id
+        rows = Transaction.query.filter_by(user_id=user_id).count()
+        seed_time, _ = timed(ensure_monthly_totals, user_id)
+        buckets = MonthlyTotal.query.filter_by(user_id=user_id).count()
+
+        month = period_of('month', today)
+        old = today.replace(year=today.year - 3)
+        pairs = {
+            'month vs last year': (month.previous(), month.previous().year_earlier()),
+            'quarter vs last year': (period_of('quarter', today).previous(),
+                                     period_of('quarter', today).previous().year_earlier()),
+            'year vs last year': (parse_period(str(today.year - 1)), parse_period(str(today.year - 2))),
+            'week vs previous': (period_of('week', today).previous(), period_of('week', today).shift(-2)),
+            'archived range': (date_range(old.replace(day=10), old.replace(day=10) + timedelta(days=75)),
+                               date_range(old.replace(day=10), old.replace(day=10) + timedelta(days=75)).previous()),
+        }
+
+        results = {}
+        identical = True
+        for name, (current, baseline) in pairs.items():
+            bucket_time, _ = best_of(5, compare_periods, user_id, current, baseline)
+            scan_time, scanned = best_of(5, scanned_comparison, user_id, current, baseline)
+            bucketed = period_totals(user_id, [current, baseline])
+            identical = identical and [rounded(t) for t in bucketed] == [rounded(t) for t in scanned]
+            results[name] = (current.label, baseline.label, bucket_time, scan_time)
+
+        churn(user_id, today)
+        maintained = stored_buckets(user_id) == rebuilt_buckets(user_id)
+
+        # Set-based deletes drop the user's totals, seeded again on the next report
+        delete_transactions(user_id, [Transaction.description == 'churn', Transaction.amount > 115])
+        dropped = not stored_buckets(user_id)
+        period_totals(user_id, [month])
+        reseeded = stored_buckets(user_id) == rebuilt_buckets(user_id)
+
+    print(f"  {users} users x {months} months; user 1 has {rows} live transactions "
+          f"({archived} archived for all users), {buckets} monthly buckets seeded in {seed_time * 1000:.0f} ms")
+    print(f"  {'comparison':<22} {'periods':<50} {'buckets ms':>10} {'scan ms':>8}")
+    for name, (current, baseline, bucket_time, scan_time) in results.items():
+        print(f"  {name:<22} {current + ' vs ' + baseline:<50} {bucket_time * 1000:10.1f} {scan_time * 1000:8.1f}")
+    print(f"  bucketed and scanned totals identical: {identical}")
+    print(f"  totals kept current through ORM writes match a rebuild: {maintained}; "
+          f"dropped by a bulk delete: {dropped}, then reseeded correctly: {reseeded}")
+
+
+if __name__ == '__main__':
+    run(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,78 @@
+"""
+Search latency over 1M transactions: the FTS index (services.search)
+against a naive LIKE '%term%' scan, for one page of ranked results.
+
+    python -m benchmarks.search [rows]
+"""
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import and_, or_, select
+
+from benchmarks.common import make_app, percentile
+from models import db
+from models.user import User
+from models.transaction import Transaction
+from services import search
+from services.bulk_transactions import insert_transaction_rows
+
+
+MERCHANTS = ['Swiggy', 'Zomato', 'Uber', 'Ola', 'Amazon', 'Flipkart', 'Netflix', 'Starbucks Coffee',
+             'Dmart', 'Reliance Fresh', 'Indian Oil', 'Airtel', 'Apollo Pharmacy', 'BookMyShow']
+WORDS = ['order', 'payment', 'refund', 'ride', 'upi', 'card', 'online', 'store', 'monthly', 'bill']
+QUERIES = ['coffee', 'swiggy order', 'pharm', 'uber ride upi', 'netflix monthly bill']
+
+
+def seed(user_id, count, chunk=50000):
+    rng = random.Random(7)
+    start = date.today() - timedelta(days=3650)
+    for offset in range(0, count, chunk):
+        rows = [{
+            'transaction_type': 'expense',
+            'category': 'Others',
+            'amount': round(rng.uniform(10, 5000), 2),
+            'date': start + timedelta(days=rng.randrange(3650)),
+            'description': f"{rng.choice(MERCHANTS)} {rng.choice(WORDS)} {rng.choice(WORDS)} #{rng.randrange(10 ** 6)}"
+        } for _ in range(min(chunk, count - offset))]
+        insert_transaction_rows(user_id, rows, chunk_size=5000)
+        db.session.commit()
+
+
+def like_statement(user_id, q):
+    terms = search.search_terms(q)
+    return select(Transaction.id, Transaction.description).where(
+        Transaction.user_id == user_id,
+        and_(*[or_(Transaction.description.ilike(f'%{t}%'), Transaction.category.ilike(f'%{t}%')) for t in terms])
+    ).order_by(Transaction.date.desc())
+
+
+def measure(statement, repeat=5):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows, total = search.paginate(statement, 1, 50)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples, total
+
+
+def run(count=1000000):
+    app = make_app()
+    with app.app_context():
+        user = User(username='search', email='search@example.com', password_hash='x')
+        db.session.add(user)
+        db.session.commit()
+        start = time.perf_counter()
+        seed(user.id, count)
+        print(f"Seeded {count} transactions in {time.perf_counter() - start:.1f} s (search backend: {search._backend})")
+
+        print(f"  {'query':<24} {'matches':>8} {'index p50':>10} {'index max':>10} {'LIKE p50':>10}")
+        for q in QUERIES:
+            indexed, total = measure(search.search_statement(user.id, q, [Transaction.id, Transaction.description]))
+            naive, _ = measure(like_statement(user.id, q), repeat=2)
+            print(f"  {q:<24} {total:8d} {percentile(indexed, 50):9.1f}ms {max(indexed):9.1f}ms {percentile(naive, 50):9.1f}ms")
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
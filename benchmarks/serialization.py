@@ -0,0 +1,62 @@
+"""
+Serializing a user's transactions for GET /api/v1/transactions: the old
+ORM + to_dict + jsonify path against the column-tuple path with each
+available JSON backend, at 10k and 100k rows (best of three runs each).
+
+    python -m benchmarks.serialization [rows ...]
+"""
+import sys
+
+from flask import jsonify
+
+from benchmarks.common import make_app, best_of
+from benchmarks.bulk_transactions import make_items
+from models import db
+from models.user import User
+from models.transaction import Transaction
+from services.bulk_transactions import validate_transactions, insert_transaction_rows
+from services import serialization
+
+
+def seed(count):
+    user = User(username=f'serialize{count}', email=f'serialize{count}@example.com')
+    user.set_password('bench-password')
+    db.session.add(user)
+    db.session.commit()
+    rows, _ = validate_transactions(make_items(count))
+    insert_transaction_rows(user.id, [row for _, row in rows], chunk_size=2000)
+    db.session.commit()
+    return user.id
+
+
+def orm_path(user_id):
+    transactions = Transaction.query.filter_by(user_id=user_id).order_by(Transaction.date.desc()).all()
+    return jsonify({'transactions': [t.to_dict() for t in transactions]}).get_data()
+
+
+def run(sizes=(10000, 100000)):
+    app = make_app()
+    fields = tuple(serialization.TRANSACTION_FIELDS)
+    backends = [name for name in serialization._PREFERRED_BACKENDS if name in serialization._JSON_BACKENDS]
+
+    with app.app_context(), app.test_request_context():
+        for size in sizes:
+            user_id = seed(size)
+            orm_time, body = best_of(3, lambda: (db.session.expunge_all(), orm_path(user_id))[1])
+            db.session.expunge_all()
+            print(f"{size} rows ({len(body) / 1e6:.1f} MB)")
+            print(f"  {'ORM + to_dict + jsonify':<32} {orm_time * 1000:9.1f} ms")
+
+            for name in backends:
+                app.config['JSON_BACKEND'] = name
+                elapsed, _ = best_of(3, serialization.serialize_transactions, user_id, fields)
+                print(f"  {'tuples + ' + name:<32} {elapsed * 1000:9.1f} ms  ({orm_time / elapsed:.1f}x)")
+
+            app.config['JSON_BACKEND'] = backends[0]
+            elapsed, _ = best_of(3, serialization.serialize_transactions, user_id, ('date', 'amount'))
+            label = f'tuples + {backends[0]}, date,amount'
+            print(f"  {label:<32} {elapsed * 1000:9.1f} ms  ({orm_time / elapsed:.1f}x)")
+
+
+if __name__ == '__main__':
+    run(tuple(int(arg) for arg in sys.argv[1:]) or (10000, 100000))
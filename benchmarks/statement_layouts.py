@@ -0,0 +1,323 @@
+"""
+Bank statement PDF parsing, per layout, on a generated corpus: statements
+in each profiled bank layout (plus one unknown bank) with page headers and
+footers, wrapped narrations, separate debit/credit or amount + Dr/Cr
+columns and a closing summary, each with its known transactions.
+
+Both the line heuristic every PDF used to go through and the current
+parser (services.pdf_parser.iter_pdf_transactions, which reads profiled
+layouts by column) are scored on:
+
+  recall    rows found with the right date, amount and type
+  desc      of those, rows whose description holds the full narration
+            (ignoring whitespace: statements hard-wrap narrations mid-word)
+  spurious  rows that match no transaction in the statement
+  pages/s   parsing throughput
+
+followed by what detection costs on a first page: extracting it in layout
+mode, matching every profile, and checking only the profile cached for
+the document's fingerprint.
+
+    python -m benchmarks.statement_layouts [statements per bank] [rows per statement]
+"""
+import io
+import random
+import sys
+import textwrap
+import time
+from collections import Counter
+from datetime import date, timedelta
+
+from pypdf import PdfReader
+
+from benchmarks.common import pdf_document
+from services import statement_layouts
+from services.pdf_parser import iter_pdf_transactions, parse_transaction_line
+
+
+FONT_SIZE = 7
+ROW_HEIGHT = 9
+ROWS_TOP = 690
+ROWS_BOTTOM = 80
+DETECT_REPEAT = 200
+
+# (field, header label, x, alignment); right-aligned columns end at x
+BANKS = {
+    'hdfc': {
+        'title': ('HDFC BANK Ltd.', 'Account Branch : MG ROAD BANGALORE', 'Account No : 50100123456789'),
+        'columns': (('date', 'Date', 30, 'left'), ('description', 'Narration', 70, 'left'),
+                    ('ref', 'Chq./Ref.No.', 235, 'left'), ('value_date', 'Value Dt', 300, 'left'),
+                    ('debit', 'Withdrawal Amt.', 405, 'right'), ('credit', 'Deposit Amt.', 480, 'right'),
+                    ('balance', 'Closing Balance', 565, 'right')),
+        'date_format': '%d/%m/%y', 'wrap': 38, 'header_every_page': True,
+        'footer': ('HDFC BANK LIMITED',
+                   '*Closing balance includes funds earmarked for hold and uncleared funds'),
+        'page_line': 'Page No .: {page}',
+        'end': ('STATEMENT SUMMARY :-', 'Opening Balance  Dr Count  Cr Count  Debits  Credits  Closing Bal'),
+    },
+    'sbi': {
+        'title': ('State Bank of India', 'Account Statement from 1 Jan 2024 to 31 Mar 2024', 'Branch : KORAMANGALA'),
+        'columns': (('date', 'Txn Date', 30, 'left'), ('value_date', 'Value Date', 85, 'left'),
+                    ('description', 'Description', 140, 'left'), ('ref', 'Ref No./Cheque No.', 300, 'left'),
+                    ('debit', 'Debit', 445, 'right'), ('credit', 'Credit', 505, 'right'),
+                    ('balance', 'Balance', 565, 'right')),
+        'date_format': '%d %b %Y', 'wrap': 36, 'header_every_page': True,
+        'footer': ('Please do not share your ATM, Debit Card or OTP with anyone',),
+        'page_line': 'Page {page} of {pages}',
+        'end': ('**This is a computer generated statement and does not require a signature',),
+    },
+    'icici': {
+        'title': ('ICICI Bank Limited', 'Detailed Statement', 'Account Number : 000401234567 - MR A KUMAR'),
+        'columns': (('serial', 'S No.', 25, 'left'), ('value_date', 'Value Date', 50, 'left'),
+                    ('date', 'Transaction Date', 100, 'left'), ('ref', 'Cheque Number', 165, 'left'),
+                    ('description', 'Transaction Remarks', 220, 'left'),
+                    ('debit', 'Withdrawal Amount (INR )', 420, 'right'),
+                    ('credit', 'Deposit Amount (INR )', 500, 'right'), ('balance', 'Balance (INR )', 570, 'right')),
+        'date_format': '%d/%m/%Y', 'wrap': 30, 'header_every_page': True,
+        'footer': (),
+        'page_line': 'Page {page}',
+        'end': ('Legends Used in Account Statement', 'INF - Internet Fund Transfer  UPI - Unified Payments'),
+    },
+    'axis': {
+        'title': ('AXIS BANK', 'Statement of Account No : 912010012345678 for the period', 'Customer ID : 812345678'),
+        'columns': (('date', 'Tran Date', 30, 'left'), ('ref', 'Chq No', 80, 'left'),
+                    ('description', 'Particulars', 120, 'left'), ('debit', 'Debit', 375, 'right'),
+                    ('credit', 'Credit', 440, 'right'), ('balance', 'Balance', 510, 'right'),
+                    ('branch', 'Init.Br', 530, 'left')),
+        'date_format': '%d-%m-%Y', 'wrap': 44, 'header_every_page': False,
+        'footer': (),
+        'page_line': None,
+        'opening': 'OPENING BALANCE',
+        'end': ('TRANSACTION TOTAL', 'CLOSING BALANCE', '++++ End of Statement ++++'),
+    },
+    'kotak': {
+        'title': ('Kotak Mahindra Bank', 'Account Statement', 'Account No. 1234567890  Savings  MG ROAD'),
+        'columns': (('serial', '#', 25, 'left'), ('date', 'Date', 50, 'left'),
+                    ('description', 'Description', 95, 'left'), ('ref', 'Chq/Ref No', 285, 'left'),
+                    ('amount', 'Amount', 430, 'right'), ('type', 'Dr / Cr', 450, 'left'),
+                    ('balance', 'Balance', 550, 'right')),
+        'date_format': '%d-%m-%Y', 'wrap': 40, 'header_every_page': True,
+        'footer': ('Statement Summary is available on net banking',),
+        'page_line': 'Page {page} of {pages}',
+        'end': ('End of Statement',),
+    },
+    # No profile: read by the line heuristic either way
+    'generic': {
+        'title': ('Union Co-operative Bank', 'Passbook Statement'),
+        'columns': (('date', 'Date', 30, 'left'), ('description', 'Particulars', 90, 'left'),
+                    ('amount', 'Amount', 420, 'right'), ('balance', 'Balance', 520, 'right')),
+        'date_format': '%d-%m-%Y', 'wrap': 200, 'header_every_page': True,
+        'footer': (),
+        'page_line': 'Page {page}',
+        'end': ('End of statement',),
+    },
+}
+
+MERCHANTS = ('SWIGGY', 'ZOMATO', 'AMAZON PAY', 'FLIPKART', 'UBER INDIA', 'BIG BAZAAR', 'DMART', 'NETFLIX',
+             'APOLLO PHARMACY', 'BESCOM ELECTRICITY', 'AIRTEL BROADBAND', 'INDIAN OIL PETROL', 'MYNTRA')
+
+
+# ---------------------------------------------
+# CORPUS
+# ---------------------------------------------
+def _text_width(text):
+    """Approximate Helvetica advance width at FONT_SIZE, for right alignment."""
+    units = sum(0.556 if char.isdigit() else 0.278 if char in ' .,/-:()' else 0.667 if char.isupper() else 0.5
+                for char in text)
+    return units * FONT_SIZE
+
+
+def _narration(rng, transaction_type):
+    ref = rng.randrange(10**11, 10**12)
+    if transaction_type == 'income':
+        return rng.choice((f'NEFT CR-ACME TECHNOLOGIES PVT LTD-SALARY FOR THE MONTH-{ref}',
+                           f'IMPS-{ref}-REFUND FROM {rng.choice(MERCHANTS)}',
+                           'CREDIT INTEREST CAPITALISED'))
+    merchant = rng.choice(MERCHANTS)
+    return rng.choice((f'UPI-{merchant}-{merchant.split()[0].lower()}@okaxis-{ref}-PAYMENT FROM PHONE',
+                       f'POS {rng.randrange(1000, 9999)}XXXXXX{rng.randrange(1000, 9999)} {merchant}',
+                       f'ACH D- {merchant} AUTOPAY {ref}',
+                       f'ATW-{rng.randrange(100000, 999999)} CASH WITHDRAWAL'))
+
+
+def statement_transactions(rows, rng):
+    day = date(2024, 1, 1)
+    balance = rng.uniform(20000, 90000)
+    transactions = []
+    for _ in range(rows):
+        day += timedelta(days=rng.choice((0, 0, 1, 1, 2)))
+        transaction_type = 'income' if rng.random() < 0.12 else 'expense'
+        amount = round(rng.lognormvariate(6.5, 1.3), 2) + 1
+        balance += amount if transaction_type == 'income' else -amount
+        transactions.append({'date': day, 'description': _narration(rng, transaction_type),
+                             'amount': amount, 'transaction_type': transaction_type, 'balance': balance})
+    return transactions
+
+
+def _cell_values(bank, spec, n, transaction):
+    amount = f"{transaction['amount']:,.2f}"
+    expense = transaction['transaction_type'] == 'expense'
+    day = transaction['date'].strftime(spec['date_format'])
+    return {
+        'date': day, 'value_date': day, 'serial': str(n + 1), 'branch': '1234',
+        'ref': f"{n:010d}" if bank != 'axis' else '',
+        'debit': amount if expense else '', 'credit': '' if expense else amount,
+        'amount': amount, 'type': 'DR' if expense else 'CR',
+        'balance': f"{transaction['balance']:,.2f}",
+    }
+
+
+def _place(fragments, x, y, text, align):
+    if text:
+        fragments.append((x - _text_width(text) if align == 'right' else x, y, text))
+
+
+def statement_pdf(bank, transactions):
+    """A statement PDF in a bank's layout, one row per transaction, narrations wrapped."""
+    spec = BANKS[bank]
+    pages = []
+    fragments, y = None, None
+
+    def new_page():
+        nonlocal fragments, y
+        fragments = []
+        pages.append(fragments)
+        y = 800
+        if len(pages) == 1:
+            for line in spec['title']:
+                _place(fragments, 30, y, line, 'left')
+                y -= 14
+        if len(pages) == 1 or spec['header_every_page']:
+            y = ROWS_TOP + ROW_HEIGHT * 2
+            for _, label, x, align in spec['columns']:
+                _place(fragments, x, y, label, align)
+            y -= ROW_HEIGHT * 2
+        else:
+            y = 800
+        if len(pages) == 1 and spec.get('opening'):
+            _place(fragments, 120, y, spec['opening'], 'left')
+            y -= ROW_HEIGHT
+
+    new_page()
+    for n, transaction in enumerate(transactions):
+        lines = textwrap.wrap(transaction['description'], spec['wrap'], break_on_hyphens=False)
+        if y - ROW_HEIGHT * len(lines) < ROWS_BOTTOM:
+            new_page()
+        values = _cell_values(bank, spec, n, transaction)
+        for field, _, x, align in spec['columns']:
+            _place(fragments, x, y, lines[0] if field == 'description' else values[field], align)
+        description_x = next(x for field, _, x, _ in spec['columns'] if field == 'description')
+        for line in lines[1:]:
+            y -= ROW_HEIGHT
+            _place(fragments, description_x, y, line, 'left')
+        y -= ROW_HEIGHT
+
+    y -= ROW_HEIGHT
+    for line in spec['end']:
+        if y < ROWS_BOTTOM:
+            new_page()
+        _place(fragments, 30, y, line, 'left')
+        y -= ROW_HEIGHT
+
+    for number, fragments in enumerate(pages, start=1):
+        for offset, line in enumerate(spec['footer']):
+            _place(fragments, 30, 50 - offset * 10, line, 'left')
+        if spec['page_line']:
+            _place(fragments, 270, 30, spec['page_line'].format(page=number, pages=len(pages)), 'left')
+
+    return pdf_document(pages, font_size=FONT_SIZE, producer=f'{bank.upper()} e-Statement Server')
+
+
+def corpus(statements=4, rows=300, seed=7):
+    """bank -> [(pdf bytes, transactions)]"""
+    rng = random.Random(seed)
+    return {bank: [(statement_pdf(bank, transactions), transactions)
+                   for transactions in (statement_transactions(rows, rng) for _ in range(statements))]
+            for bank in BANKS}
+
+
+# ---------------------------------------------
+# SCORING
+# ---------------------------------------------
+def line_heuristic(data):
+    """How every PDF was read before layout profiles: plain text, line by line."""
+    for page in PdfReader(io.BytesIO(data)).pages:
+        for line in page.extract_text().split('\n'):
+            transaction = parse_transaction_line(line.strip()) if line.strip() else None
+            if transaction:
+                yield transaction
+
+
+def layout_parser(data):
+    return iter_pdf_transactions(io.BytesIO(data))
+
+
+PARSERS = {'line heuristic': line_heuristic, 'layout profiles': layout_parser}
+
+
+def _key(transaction):
+    return transaction['date'], round(transaction['amount'], 2)
+
+
+def score(found, transactions):
+    expected = Counter(_key(t) + (t['transaction_type'],) for t in transactions)
+    narrations = {}
+    for transaction in transactions:
+        narrations.setdefault(_key(transaction), set()).add(''.join(transaction['description'].split()))
+
+    recalled = described = spurious = 0
+    for transaction in found:
+        key = _key(transaction) + (transaction['transaction_type'],)
+        if expected[key] > 0:
+            expected[key] -= 1
+            recalled += 1
+            described += ''.join(transaction['description'].split()) in narrations[_key(transaction)]
+        elif _key(transaction) not in narrations:
+            spurious += 1
+    return recalled, described, spurious
+
+
+def run(statements=4, rows=300):
+    documents = corpus(statements, rows)
+
+    print(f"  {'bank':<8} {'parser':<16} {'pages':>6} {'rows':>6} {'recall':>8} {'desc':>8}"
+          f" {'spurious':>9} {'pages/s':>8}")
+    for bank, pdfs in documents.items():
+        pages = sum(len(PdfReader(io.BytesIO(data)).pages) for data, _ in pdfs)
+        expected = sum(len(transactions) for _, transactions in pdfs)
+        for label, parser in PARSERS.items():
+            statement_layouts._layout_cache.clear()
+            recalled = described = spurious = 0
+            start = time.perf_counter()
+            for data, transactions in pdfs:
+                found = list(parser(data))
+                counts = score(found, transactions)
+                recalled, described, spurious = (a + b for a, b in zip((recalled, described, spurious), counts))
+            seconds = time.perf_counter() - start
+            print(f"  {bank:<8} {label:<16} {pages:>6} {expected:>6} {recalled / expected:8.1%}"
+                  f" {described / max(recalled, 1):8.1%} {spurious:>9} {pages / seconds:8.1f}")
+
+    print(f"\n  {'layout detection, first page':<30} {'extract ms':>11} {'detect us':>10} {'cached us':>10}")
+    for bank, pdfs in documents.items():
+        page = PdfReader(io.BytesIO(pdfs[0][0])).pages[0]
+        start = time.perf_counter()
+        text = page.extract_text(extraction_mode='layout')
+        extract = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(DETECT_REPEAT):
+            name = statement_layouts.detect_layout(text)
+        detect = (time.perf_counter() - start) / DETECT_REPEAT
+
+        # A cached fingerprint only checks its own profile's header
+        cached = 0
+        if name is not None:
+            header = statement_layouts._patterns(name)['header']
+            start = time.perf_counter()
+            for _ in range(DETECT_REPEAT):
+                header.search(text)
+            cached = (time.perf_counter() - start) / DETECT_REPEAT
+        print(f"  {bank:<8} -> {str(name):<18} {extract * 1000:11.1f} {detect * 1e6:10.1f} {cached * 1e6:10.1f}")
+
+if __name__ == '__main__':
+    run(*(int(arg) for arg in sys.argv[1:3]))
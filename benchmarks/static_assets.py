@@ -0,0 +1,89 @@
+"""
+Static asset bytes and requests per dashboard load, before and after the
+asset build (fingerprinted names, precompressed variants, immutable
+caching).
+
+A small browser cache model replays two visits: the first downloads every
+same-origin asset referenced by the page, the second reuses fresh cached
+copies and revalidates the rest (304s). CDN assets are not counted.
+
+    python -m benchmarks.static_assets
+"""
+import re
+import shutil
+import tempfile
+
+from benchmarks.common import make_app, login_client, disable_ai_summary
+
+
+BROWSER_HEADERS = {'Accept-Encoding': 'gzip, deflate, br'}
+
+_ASSET_RE = re.compile(r'(?:href|src)="(/static/[^"]+)"')
+
+
+def _fresh(response):
+    cache_control = response.cache_control
+    return bool(cache_control.max_age) and not cache_control.no_cache
+
+
+def visit(client, page, cache):
+    """Load `page` and its static assets through `cache` ({url: response}); returns (requests, bytes)."""
+    html = client.get(page).get_data(as_text=True)
+    requests, transferred = 0, 0
+    for url in _ASSET_RE.findall(html):
+        cached = cache.get(url)
+        if cached is not None and _fresh(cached):
+            continue
+        headers = dict(BROWSER_HEADERS)
+        if cached is not None and cached.headers.get('ETag'):
+            headers['If-None-Match'] = cached.headers['ETag']
+        response = client.get(url, headers=headers)
+        requests += 1
+        transferred += len(response.get_data())
+        if response.status_code == 200:
+            cache[url] = response
+    return requests, transferred
+
+
+def measure(client, page='/dashboard'):
+    cache = {}
+    first = visit(client, page, cache)
+    repeat = visit(client, page, cache)
+    return first, repeat
+
+
+def run():
+    disable_ai_summary()
+    app = make_app()
+    client = login_client(app)
+
+    from services.static_assets import build_assets, load_manifest, BUILD_DIR
+
+    # Build into a copy of the static folder so the working tree is untouched.
+    static_copy = tempfile.mkdtemp(prefix='smartfinance-static-')
+    shutil.copytree(app.static_folder, static_copy, dirs_exist_ok=True,
+                    ignore=shutil.ignore_patterns(BUILD_DIR))
+    app.static_folder = static_copy
+    load_manifest(app)
+
+    before = measure(client)
+    manifest = build_assets(app.static_folder)
+    load_manifest(app)
+    after = measure(client)
+
+    print(f"Built {len(manifest)} assets:")
+    for filename, entry in sorted(manifest.items()):
+        sizes = ', '.join(f"{encoding} {size} B" for encoding, size in sorted(entry['encodings'].items()))
+        print(f"  {filename:<20} -> {entry['file']:<36} {entry['size']} B{'; ' + sizes if sizes else ''}")
+
+    print("\nStatic assets per /dashboard load (same-origin only)")
+    print(f"  {'':<16} {'first requests':>15} {'first bytes':>12} {'repeat requests':>16} {'repeat bytes':>13}")
+    for label, ((first_requests, first_bytes), (repeat_requests, repeat_bytes)) in (
+            ('unbuilt', before), ('built', after)):
+        print(f"  {label:<16} {first_requests:>15} {first_bytes:>12} {repeat_requests:>16} {repeat_bytes:>13}")
+
+    shutil.rmtree(static_copy, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    run()
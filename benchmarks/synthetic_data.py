@@ -0,0 +1,295 @@
+"""
+Seeded synthetic users with realistic histories: a monthly salary and
+occasional other income, expenses spread over the app's categories with
+per-category amounts, merchants and seasonality (festive shopping,
+holiday travel, summer bills), recurring rules with their generated
+occurrences, and budgets sized from each user's own spending.
+
+Everything goes through the app's normal write paths (bulk inserts,
+change log, anomaly statistics, budget counters), so a generated
+database looks like one filled by real use. The same seed always gives
+the same data, and each user depends only on the seed and their number,
+so growing --users keeps the existing users identical.
+
+    python -m benchmarks.synthetic_data --users 700 --months 24   # ~1M transactions
+    python -m benchmarks.synthetic_data --database-url sqlite:////tmp/big.db --users 50
+"""
+import argparse
+import math
+import os
+import random
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import insert
+
+
+DEFAULT_PASSWORD = 'synthetic-password'
+
+# category -> (share of expenses, median amount, spread, merchants, {month: seasonal factor})
+EXPENSE_PROFILE = {
+    'Food & Dining': (0.28, 350, 0.6, ['Swiggy', 'Zomato', 'Starbucks', 'Dominos', 'Haldiram', 'Chaayos'], {}),
+    'Transportation': (0.15, 180, 0.7, ['Uber', 'Ola', 'Rapido', 'Indian Oil', 'Metro Card'], {7: 1.2, 8: 1.2}),
+    'Shopping': (0.12, 1400, 0.9, ['Amazon', 'Flipkart', 'Myntra', 'Decathlon', 'Croma'], {10: 1.8, 11: 1.5, 1: 1.2}),
+    'Entertainment': (0.07, 600, 0.6, ['BookMyShow', 'PVR', 'Steam', 'Timezone'], {12: 1.4, 1: 1.2}),
+    'Bills & Utilities': (0.08, 1500, 0.5, ['Airtel', 'BESCOM', 'Tata Power', 'Mahanagar Gas'], {4: 1.2, 5: 1.4, 6: 1.3}),
+    'Healthcare': (0.05, 800, 0.9, ['Apollo Pharmacy', 'Practo', 'Medplus', 'Max Healthcare'], {8: 1.3, 9: 1.2}),
+    'Education': (0.03, 2500, 0.8, ['Udemy', 'Coursera', 'Crossword'], {6: 1.6, 7: 1.5}),
+    'Travel': (0.05, 4500, 0.9, ['MakeMyTrip', 'IRCTC', 'IndiGo', 'OYO'], {5: 1.5, 6: 1.3, 12: 1.9}),
+    'Other Expense': (0.17, 700, 0.8, ['BigBasket', 'DMart', 'Local Store', 'Cash Withdrawal'], {10: 1.3}),
+}
+WEEKEND_HEAVY = {'Food & Dining', 'Entertainment', 'Shopping'}
+
+# (category, description, share of salary or fixed amount, frequency, day of month)
+RECURRING_RULES = [
+    ('Bills & Utilities', 'House rent', 0.25, 'monthly', 5),
+    ('Entertainment', 'Netflix subscription', 649, 'monthly', 12),
+    ('Entertainment', 'Spotify subscription', 119, 'monthly', 18),
+    ('Bills & Utilities', 'Jio recharge', 399, 'monthly', 22),
+    ('Healthcare', 'Cult.fit membership', 1500, 'monthly', 1),
+    ('Education', 'Online course instalment', 2999, 'monthly', 15),
+    ('Other Expense', 'Weekly groceries', 1800, 'weekly', None),
+]
+
+PAYMENT_PREFIXES = ['UPI/', 'POS ', '', '', 'ECOM ']
+
+# Share of expenses made a large outlier, so the anomaly detector has something to find
+OUTLIER_RATE = 0.003
+
+
+# ---------------------------------------------
+# ONE USER'S HISTORY
+# ---------------------------------------------
+def _months(start, end):
+    current = date(start.year, start.month, 1)
+    while current <= end:
+        yield current
+        current = date(current.year + (current.month == 12), current.month % 12 + 1, 1)
+
+
+def _days_in_month(month_start):
+    following = date(month_start.year + (month_start.month == 12), month_start.month % 12 + 1, 1)
+    return (following - month_start).days
+
+
+def _season(profile, month):
+    return profile[4].get(month, 1.0)
+
+
+def _amount(rng, median, spread, price_level):
+    return round(math.exp(rng.gauss(math.log(median * price_level), spread)), 2)
+
+
+def _expense_rows(rng, months, today, per_month, salary):
+    rows = []
+    categories = list(EXPENSE_PROFILE)
+    activity = math.exp(rng.gauss(0, 0.35))
+    price_level = math.sqrt(salary / 75000)
+
+    for month_start in months:
+        weights = [EXPENSE_PROFILE[c][0] * _season(EXPENSE_PROFILE[c], month_start.month) for c in categories]
+        count = round(per_month * activity * sum(weights))
+        days = min(_days_in_month(month_start), (today - month_start).days + 1)
+
+        for _ in range(count):
+            category = rng.choices(categories, weights)[0]
+            day = month_start + timedelta(days=rng.randrange(days))
+            if category in WEEKEND_HEAVY and day.weekday() < 5 and rng.random() < 0.3:
+                day = month_start + timedelta(days=rng.randrange(days))
+
+            share, median, spread, merchants, _ = EXPENSE_PROFILE[category]
+            amount = _amount(rng, median, spread, price_level)
+            if rng.random() < OUTLIER_RATE:
+                amount = round(amount * rng.uniform(6, 12), 2)
+
+            rows.append({
+                'transaction_type': 'expense',
+                'category': category,
+                'amount': amount,
+                'date': day,
+                'description': f"{rng.choice(PAYMENT_PREFIXES)}{rng.choice(merchants)}"
+            })
+    return rows
+
+
+def _income_rows(rng, months, today, salary):
+    rows = []
+    freelancer = rng.random() < 0.3
+    for month_start in months:
+        payday = month_start
+        if payday <= today:
+            rows.append({'transaction_type': 'income', 'category': 'Salary', 'amount': round(salary, 2),
+                         'date': payday, 'description': 'NEFT Salary credit'})
+        days = min(_days_in_month(month_start), (today - month_start).days + 1)
+        if freelancer:
+            for _ in range(rng.randrange(3)):
+                rows.append({'transaction_type': 'income', 'category': 'Freelance',
+                             'amount': _amount(rng, salary * 0.2, 0.5, 1.0),
+                             'date': month_start + timedelta(days=rng.randrange(days)),
+                             'description': 'Client payment'})
+        if month_start.month in (3, 6, 9, 12) and rng.random() < 0.5:
+            rows.append({'transaction_type': 'income', 'category': 'Investment',
+                         'amount': _amount(rng, salary * 0.03, 0.6, 1.0),
+                         'date': month_start + timedelta(days=rng.randrange(days)),
+                         'description': 'Dividend credit'})
+        if month_start.month in (10, 11) and rng.random() < 0.3:
+            rows.append({'transaction_type': 'income', 'category': 'Gift',
+                         'amount': _amount(rng, 3000, 0.7, 1.0),
+                         'date': month_start + timedelta(days=rng.randrange(days)),
+                         'description': 'Festival gift'})
+    return rows
+
+
+def _recurring_rules(rng, start, today, salary):
+    """(rule kwargs, occurrence dates) for a few recurring rules."""
+    from models.recurring_transaction import RecurringTransaction
+
+    rules = []
+    chosen = [RECURRING_RULES[0]] + rng.sample(RECURRING_RULES[1:], rng.randrange(1, 4))
+    for category, description, amount, frequency, day in chosen:
+        amount = round(salary * amount, 2) if amount < 1 else float(amount)
+        first = start + timedelta(days=rng.randrange(min(60, (today - start).days + 1)))
+        if day is not None:
+            first = first.replace(day=min(day, 28))
+        end = None
+        if rng.random() < 0.1:
+            end = first + timedelta(days=rng.randrange(60, 240))
+
+        rule = RecurringTransaction(
+            amount=amount, category=category, transaction_type='expense', description=description,
+            frequency=frequency, start_date=first, end_date=end, is_active=end is None
+        )
+        occurrences = []
+        current = first
+        while current <= today and (end is None or current <= end):
+            occurrences.append(current)
+            current = rule.get_next_date(current)
+        rules.append((rule, occurrences))
+    return rules
+
+
+def _budgets(rng, rows, months):
+    """Monthly budgets on the user's top categories, sized around their usual spend."""
+    spent = {}
+    for row in rows:
+        if row['transaction_type'] == 'expense':
+            spent[row['category']] = spent.get(row['category'], 0.0) + row['amount']
+    top = sorted(spent, key=spent.get, reverse=True)[:rng.randrange(2, 5)]
+
+    budgets = [('monthly', category, round(spent[category] / len(months) * rng.uniform(0.85, 1.3), -2))
+               for category in top]
+    if 'Food & Dining' in spent and rng.random() < 0.3:
+        budgets.append(('weekly', 'Food & Dining', round(spent['Food & Dining'] / len(months) / 4.3, -1)))
+    return budgets
+
+
+# ---------------------------------------------
+# GENERATION
+# ---------------------------------------------
+def generate_user(number, password_hash, months=12, per_month=60, seed=42, today=None):
+    """Create synthetic user `number` with its whole history; returns (user_id, transaction count)."""
+    from models import db
+    from models.budget import Budget
+    from models.user import User
+    from services.bulk_transactions import insert_transaction_rows
+
+    rng = random.Random(f'{seed}:{number}')
+    today = today or date.today()
+    first_month = today.year * 12 + today.month - months
+    start = date(first_month // 12, first_month % 12 + 1, 1)
+    history = list(_months(start, today))
+    salary = round(math.exp(rng.gauss(math.log(75000), 0.5)), -3)
+
+    user_id = db.session.execute(insert(User).values(
+        username=f'synth{number:05d}', email=f'synth{number:05d}@example.com', password_hash=password_hash
+    )).inserted_primary_key[0]
+
+    rows = _expense_rows(rng, history, today, per_month, salary) + _income_rows(rng, history, today, salary)
+
+    rules = _recurring_rules(rng, start, today, salary)
+    for rule, occurrences in rules:
+        rule.user_id = user_id
+        rule.last_generated = occurrences[-1] if occurrences else None
+        rows.extend({
+            'transaction_type': rule.transaction_type, 'category': rule.category, 'amount': rule.amount,
+            'date': day, 'description': f"{rule.description} (Recurring)"
+        } for day in occurrences)
+
+    # Budgets first, so their counters are kept up to date as the history is inserted.
+    db.session.add_all(Budget(user_id=user_id, category=category, amount=amount, period=period)
+                       for period, category, amount in _budgets(rng, rows, history))
+    db.session.add_all(rule for rule, _ in rules)
+    db.session.flush()
+
+    rows.sort(key=lambda row: row['date'])
+    now = datetime.utcnow()
+    insert_transaction_rows(user_id, [dict(row, created_at=now) for row in rows])
+    db.session.commit()
+    return user_id, len(rows)
+
+
+def generate(app, users=50, months=12, per_month=60, seed=42, first=0, password=DEFAULT_PASSWORD, progress=None):
+    """
+    Add `users` synthetic users (numbered from `first`) to the app's
+    database. Returns counts and timing.
+    """
+    from models import db
+    from models.budget import Budget
+    from models.recurring_transaction import RecurringTransaction
+    from services.password_hashing import hash_password
+
+    started = time.perf_counter()
+    transactions = 0
+    with app.app_context():
+        password_hash = hash_password(password)    # one hash shared by every synthetic user
+        today = date.today()
+        for number in range(first, first + users):
+            _, count = generate_user(number, password_hash, months, per_month, seed, today)
+            transactions += count
+            if progress:
+                progress(number - first + 1, transactions)
+        budgets = db.session.query(Budget).count()
+        rules = db.session.query(RecurringTransaction).count()
+
+    return {
+        'users': users,
+        'months': months,
+        'seed': seed,
+        'transactions': transactions,
+        'budgets': budgets,
+        'recurring_rules': rules,
+        'seconds': round(time.perf_counter() - started, 2)
+    }
+
+
+def usernames(users, first=0):
+    return [f'synth{number:05d}' for number in range(first, first + users)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--months', type=int, default=12)
+    parser.add_argument('--per-month', type=int, default=60, help='typical expenses per user and month')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--first', type=int, default=0, help='number of the first user (to extend a database)')
+    parser.add_argument('--database-url', default=None, help='defaults to a new temporary SQLite file')
+    args = parser.parse_args()
+
+    from benchmarks.common import make_app
+    app = make_app(args.database_url)
+
+    def progress(done, transactions):
+        if done % 10 == 0 or done == args.users:
+            print(f"  {done}/{args.users} users, {transactions} transactions", flush=True)
+
+    stats = generate(app, args.users, args.months, args.per_month, args.seed, args.first, progress=progress)
+    print(f"Database: {os.environ['DATABASE_URL']}")
+    print(f"{stats['users']} users, {stats['transactions']} transactions, {stats['budgets']} budgets, "
+          f"{stats['recurring_rules']} recurring rules in {stats['seconds']}s "
+          f"({stats['transactions'] / max(stats['seconds'], 0.001):.0f} transactions/s)")
+    print(f"Log in as {usernames(1, args.first)[0]} / {DEFAULT_PASSWORD}")
+
+
+if __name__ == '__main__':
+    main()
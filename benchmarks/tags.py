@@ -0,0 +1,162 @@
+"""
+Tag filters answered from the per-user bitmap index against the same
+filters as SQL EXISTS subqueries on transaction_tags, over a few users
+with years of history and tags of very different densities.
+
+  bitmap             TagIndex: tag and date-range bitmaps combined with
+                     AND / OR / AND NOT, kept current from the change log
+  sql                EXISTS subqueries per tag, evaluated row by row
+
+Each expression is timed on its own (the matching ids) and inside a
+report query (count and sum of the user's matching transactions). Every
+run checks that both paths find the same ids, that an index caught up
+through ORM writes, retagging and bulk deletes equals one rebuilt from
+scratch, and that archived transactions keep their tags.
+
+    python -m benchmarks.tags [users] [months] [per_month]
+"""
+import random
+import sys
+from datetime import date, timedelta
+
+from sqlalchemy import func, select
+
+from benchmarks.common import best_of, make_app, timed
+from benchmarks.synthetic_data import generate, usernames
+from models import db
+from models.transaction import Transaction
+from models.user import User
+from services.archive import archive_cutoff, archive_transactions, archived_transactions
+from services.bitmaps import bitmap_backend
+from services.bulk_deletes import delete_transactions
+from services.tags import (
+    TagIndex, drop_tag_index, parse_tag_expression, query_tags, set_transaction_tags, tag_clause, tag_condition,
+    tag_transactions
+)
+
+# tag -> share of transactions carrying it
+DENSITIES = {'work': 0.3, 'family': 0.2, 'tax': 0.1, 'trip': 0.05, 'reimbursable': 0.02}
+
+
+def expressions(today):
+    """(label, expression, start, end)"""
+    last_year = date(today.year - 1, 1, 1), date(today.year - 1, 12, 31)
+    return [
+        ('trip', 'trip', None, None),
+        ('trip & !reimbursable', 'trip & !reimbursable', None, None),
+        ('(tax | reimbursable) & !work', '(tax | reimbursable) & !work', None, None),
+        ('!work', '!work', None, None),
+        ('family work, last 90 days', 'family work', today - timedelta(days=90), today),
+        ('tax, last year', 'tax', *last_year),
+        ('!(trip | tax) & family, last year', '!(trip | tax) & family', *last_year),
+    ]
+
+
+def tag_user(user_id, seed=7):
+    rng = random.Random(seed + user_id)
+    ids = db.session.execute(select(Transaction.id).where(Transaction.user_id == user_id)).scalars().all()
+    for name, share in DENSITIES.items():
+        tag_transactions(user_id, [i for i in ids if rng.random() < share], add=[name])
+        db.session.commit()
+    return len(ids)
+
+
+def date_conditions(start, end):
+    return [condition for condition in (start and Transaction.date >= start, end and Transaction.date <= end)
+            if condition is not None]
+
+
+def bitmap_ids(user_id, node, start, end):
+    matching, _ = query_tags(user_id, node, start, end)
+    return list(matching)
+
+
+def sql_ids(user_id, node, start, end):
+    return db.session.execute(select(Transaction.id).where(
+        Transaction.user_id == user_id, tag_clause(node), *date_conditions(start, end)
+    )).scalars().all()
+
+
+def report(user_id, condition, start, end):
+    return db.session.execute(select(func.count(), func.sum(Transaction.amount)).where(
+        Transaction.user_id == user_id, condition, *date_conditions(start, end)
+    )).one()
+
+
+def churn(user_id, today):
+    """ORM inserts with tags, edits, retagging and deletes, then a bulk delete by tag."""
+    for day in range(30):
+        transaction = Transaction(user_id=user_id, amount=100 + day, category='Travel', transaction_type='expense',
+                                  date=today - timedelta(days=day * 5), description='churn')
+        db.session.add(transaction)
+        db.session.flush()
+        set_transaction_tags(user_id, transaction.id, ['trip', 'churn'] if day % 2 else ['churn'])
+    db.session.commit()
+
+    rows = Transaction.query.filter_by(user_id=user_id, description='churn').order_by(Transaction.id).all()
+    rows[0].date = rows[0].date - timedelta(days=400)
+    set_transaction_tags(user_id, rows[1].id, ['tax'])
+    db.session.delete(rows[2])
+    db.session.commit()
+    older = db.session.execute(select(Transaction.id).where(
+        Transaction.user_id == user_id, Transaction.date < today - timedelta(days=200)).limit(300)).scalars().all()
+    tag_transactions(user_id, older, add=['reimbursable'], remove=['work'])
+    db.session.commit()
+    delete_transactions(user_id, [tag_condition(user_id, parse_tag_expression('churn & trip'))])
+
+
+def run(users=3, months=60, per_month=150):
+    app = make_app()
+    generate(app, users=users, months=months, per_month=per_month)
+    today = date.today()
+
+    with app.app_context():
+        user_ids = [User.query.filter_by(username=name).first().id for name in usernames(users)]
+        tagged = [tag_user(user_id) for user_id in user_ids]
+        user_id = user_ids[0]
+
+        drop_tag_index(user_id)
+        build_time, _ = timed(query_tags, user_id, parse_tag_expression('trip'))
+
+        results = {}
+        identical = True
+        for label, text, start, end in expressions(today):
+            node = parse_tag_expression(text)
+            bitmap_time, found = best_of(5, bitmap_ids, user_id, node, start, end)
+            sql_time, expected = best_of(5, sql_ids, user_id, node, start, end)
+            report_bitmap, totals = best_of(5, lambda: report(user_id, tag_condition(user_id, node, start, end),
+                                                               start, end))
+            report_sql, expected_totals = best_of(5, report, user_id, tag_clause(node), start, end)
+            identical = identical and sorted(found) == sorted(expected) and totals[0] == expected_totals[0]
+            results[label] = (len(found), bitmap_time, sql_time, report_bitmap, report_sql)
+
+        churn(user_id, today)
+        catch_up_time, _ = timed(query_tags, user_id, parse_tag_expression('trip'))
+        fresh = TagIndex(user_id)
+        fresh.rebuild(db.session.connection())
+        node = parse_tag_expression('(trip | tax | churn) & !work | reimbursable')
+        caught_up = sorted(bitmap_ids(user_id, node, None, None))
+        maintained = caught_up == sorted(fresh.evaluate(node, fresh.all)) == sorted(sql_ids(user_id, node, None, None))
+
+        # Archived rows keep their tag names and are filtered from them
+        cutoff = archive_cutoff(today)
+        node = parse_tag_expression('trip & !reimbursable')
+        before = sorted(sql_ids(user_id, node, None, cutoff - timedelta(days=1)))
+        archived = archive_transactions(cutoff)
+        after = sorted(row.id for row in archived_transactions(user_id, {'tags': node}))
+        kept = before == after
+
+    print(f"  {users} users x {months} months ({bitmap_backend()} bitmaps); user 1 has {tagged[0]} transactions, "
+          f"index built in {build_time * 1000:.0f} ms")
+    print(f"  {'expression':<38} {'rows':>6} {'bitmap ms':>10} {'sql ms':>8} {'report bitmap':>14} {'report sql':>11}")
+    for label, (rows, bitmap_time, sql_time, report_bitmap, report_sql) in results.items():
+        print(f"  {label:<38} {rows:6d} {bitmap_time * 1000:10.2f} {sql_time * 1000:8.1f} "
+              f"{report_bitmap * 1000:14.1f} {report_sql * 1000:11.1f}")
+    print(f"  bitmap and SQL results identical: {identical}")
+    print(f"  index caught up through ORM writes, retagging and a bulk delete in {catch_up_time * 1000:.0f} ms "
+          f"matches a rebuild and SQL: {maintained}")
+    print(f"  {archived} rows archived; archived rows filtered by tags as before: {kept}")
+
+
+if __name__ == '__main__':
+    run(*(int(arg) for arg in sys.argv[1:4]))
@@ -0,0 +1,81 @@
+"""
+Per-request latency of authenticated requests with the cached
+UserPrincipal loader against the previous User.query.get loader.
+
+A threaded local server is driven by concurrent clients hitting a cheap
+authenticated endpoint (a 304 on /budgets), where loading the user is a
+large share of the work.
+
+    python -m benchmarks.user_cache [clients] [requests_per_client]
+"""
+import http.client
+import sys
+import threading
+import time
+
+from werkzeug.serving import make_server, WSGIRequestHandler
+
+from benchmarks.common import make_app, login_client, percentile
+from models.user import User
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+def load_test(port, cookie, etag, clients, requests):
+    samples = []
+    lock = threading.Lock()
+
+    def worker():
+        local = []
+        for _ in range(requests):
+            connection = http.client.HTTPConnection('127.0.0.1', port)
+            start = time.perf_counter()
+            connection.request('GET', '/budgets', headers={'Cookie': cookie, 'If-None-Match': etag})
+            response = connection.getresponse()
+            response.read()
+            local.append((time.perf_counter() - start) * 1000)
+            assert response.status == 304, response.status
+            connection.close()
+        with lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=worker) for _ in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, time.perf_counter() - start
+
+
+def run(clients=4, requests=500):
+    app = make_app()
+    client = login_client(app)
+    cookie = f"session={client.get_cookie('session').value}"
+    etag = client.get('/budgets').headers['ETag']
+
+    from app import login_manager
+    cached_loader = login_manager._user_callback
+
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    print(f"{clients} clients x {requests} requests, 304 on /budgets (ms)")
+    for label, loader in [
+        ('User.query.get', lambda user_id: User.query.get(int(user_id))),
+        ('cached principal', cached_loader),
+    ]:
+        login_manager.user_loader(loader)
+        load_test(server.port, cookie, etag, clients, 20)
+        samples, elapsed = load_test(server.port, cookie, etag, clients, requests)
+        print(f"  {label:<18} p50 {percentile(samples, 50):6.2f}  p99 {percentile(samples, 99):6.2f}"
+              f"  {len(samples) / elapsed:7.0f} req/s")
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    run(*(int(arg) for arg in sys.argv[1:3]))
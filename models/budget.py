@@ -1,4 +1,5 @@
 from models import db
+from models.exchange_rate import DEFAULT_CURRENCY
 
 from datetime import datetime
 
@@ -7,10 +8,13 @@ class Budget(db.Model):
     __tablename__ = 'budgets'
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
     category = db.Column(db.String(50), nullable=False)
     amount = db.Column(db.Float, nullable=False)
+    currency = db.Column(db.String(3), nullable=False, default=DEFAULT_CURRENCY)
     period = db.Column(db.String(20), nullable=False, default='monthly')
+    # Tag expression (services.tags) narrowing the category's spending; None counts all of it
+    tag_filter = db.Column(db.String(200))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     __table_args__ = (
@@ -23,7 +27,9 @@ class Budget(db.Model):
             'user_id': self.user_id,
             'category': self.category,
             'amount': self.amount,
+            'currency': self.currency,
             'period': self.period,
+            'tag_filter': self.tag_filter,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
     
@@ -0,0 +1,37 @@
+from models import db
+from datetime import datetime
+
+
+class BudgetAlert(db.Model):
+    __tablename__ = 'budget_alerts'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
+    budget_id = db.Column(db.Integer, db.ForeignKey('budgets.id', ondelete='CASCADE'), nullable=False)
+    period_start = db.Column(db.Date, nullable=False)
+    threshold = db.Column(db.Integer, nullable=False)
+    spent = db.Column(db.Float, nullable=False)
+    limit_amount = db.Column(db.Float, nullable=False)
+    message = db.Column(db.String(255), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    delivered_at = db.Column(db.DateTime, index=True)
+
+    __table_args__ = (
+        db.UniqueConstraint('budget_id', 'period_start', 'threshold', name='unique_budget_period_threshold'),
+    )
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'budget_id': self.budget_id,
+            'period_start': self.period_start.isoformat() if self.period_start else None,
+            'threshold': self.threshold,
+            'spent': self.spent,
+            'limit_amount': self.limit_amount,
+            'message': self.message,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'delivered_at': self.delivered_at.isoformat() if self.delivered_at else None
+        }
+
+    def __repr__(self):
+        return f'<BudgetAlert {self.budget_id} {self.period_start} {self.threshold}%>'
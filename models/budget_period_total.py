@@ -0,0 +1,14 @@
+from models import db
+from datetime import datetime
+
+
+class BudgetPeriodTotal(db.Model):
+    __tablename__ = 'budget_period_totals'
+
+    budget_id = db.Column(db.Integer, db.ForeignKey('budgets.id', ondelete='CASCADE'), primary_key=True)
+    period_start = db.Column(db.Date, primary_key=True)
+    spent = db.Column(db.Float, nullable=False, default=0.0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<BudgetPeriodTotal {self.budget_id} {self.period_start} spent={self.spent:.2f}>'
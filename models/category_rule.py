@@ -0,0 +1,49 @@
+from models import db
+from datetime import datetime
+
+
+class CategoryRule(db.Model):
+    __tablename__ = 'category_rules'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
+    # Lower positions are tried first; the first matching rule setting a field wins it
+    position = db.Column(db.Integer, nullable=False, default=0)
+
+    # Conditions (all that are set must hold): any of the comma-separated
+    # keywords in the description, the transaction's type, and amount
+    # bounds (inclusive, in the user's base currency)
+    keywords = db.Column(db.String(500))
+    match_type = db.Column(db.String(20))
+    min_amount = db.Column(db.Float)
+    max_amount = db.Column(db.Float)
+
+    # Actions
+    category = db.Column(db.String(50))
+    transaction_type = db.Column(db.String(20))
+    tag = db.Column(db.String(50))
+
+    is_active = db.Column(db.Boolean, default=True, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def keyword_list(self):
+        return [keyword.strip() for keyword in (self.keywords or '').split(',') if keyword.strip()]
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'position': self.position,
+            'keywords': self.keyword_list(),
+            'match_type': self.match_type,
+            'min_amount': self.min_amount,
+            'max_amount': self.max_amount,
+            'category': self.category,
+            'transaction_type': self.transaction_type,
+            'tag': self.tag,
+            'is_active': self.is_active,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+    def __repr__(self):
+        return f'<CategoryRule {self.id} #{self.position} -> {self.category or self.transaction_type or self.tag}>'
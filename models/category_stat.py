@@ -0,0 +1,16 @@
+from models import db
+from datetime import datetime
+
+
+class CategoryStat(db.Model):
+    __tablename__ = 'category_stats'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    category = db.Column(db.String(50), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    mean = db.Column(db.Float, nullable=False, default=0.0)
+    variance = db.Column(db.Float, nullable=False, default=0.0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<CategoryStat {self.user_id}/{self.category} n={self.count} mean={self.mean:.2f}>'
@@ -0,0 +1,21 @@
+from models import db
+from datetime import datetime
+
+
+class ChangeLog(db.Model):
+    __tablename__ = 'change_log'
+    
+    seq = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    entity = db.Column(db.String(20), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    operation = db.Column(db.String(10), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_change_log_user_seq', 'user_id', 'seq'),
+        {'sqlite_autoincrement': True},
+    )
+    
+    def __repr__(self):
+        return f'<ChangeLog {self.seq} - {self.operation} {self.entity} {self.entity_id}>'
@@ -0,0 +1,18 @@
+from models import db
+from datetime import datetime
+import os
+
+# Currency of new users and of rows that do not say
+DEFAULT_CURRENCY = os.environ.get('BASE_CURRENCY', 'INR')
+
+
+class ExchangeRate(db.Model):
+    __tablename__ = 'exchange_rates'
+
+    currency = db.Column(db.String(3), primary_key=True)
+    date = db.Column(db.Date, primary_key=True)
+    rate = db.Column(db.Float, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ExchangeRate {self.currency} {self.date} {self.rate}>'
@@ -0,0 +1,37 @@
+from models import db
+from datetime import datetime
+
+
+class ImportBatch(db.Model):
+    __tablename__ = 'import_batches'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
+    format = db.Column(db.String(16), nullable=False)
+    filename = db.Column(db.String(255))
+    status = db.Column(db.String(20), nullable=False, default='running')
+    rows_read = db.Column(db.Integer, nullable=False, default=0)
+    rows_imported = db.Column(db.Integer, nullable=False, default=0)
+    rows_duplicate = db.Column(db.Integer, nullable=False, default=0)
+    rows_invalid = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.String(500))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    completed_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'format': self.format,
+            'filename': self.filename,
+            'status': self.status,
+            'rows_read': self.rows_read,
+            'rows_imported': self.rows_imported,
+            'rows_duplicate': self.rows_duplicate,
+            'rows_invalid': self.rows_invalid,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None
+        }
+
+    def __repr__(self):
+        return f'<ImportBatch {self.id} {self.format} {self.status}>'
@@ -0,0 +1,17 @@
+from models import db
+
+
+class ImportedTransaction(db.Model):
+    __tablename__ = 'imported_transactions'
+
+    transaction_id = db.Column(db.Integer, db.ForeignKey('transactions.id', ondelete='CASCADE'), primary_key=True)
+    batch_id = db.Column(db.Integer, db.ForeignKey('import_batches.id', ondelete='CASCADE'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    fingerprint = db.Column(db.String(40), nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'fingerprint', name='unique_user_import_fingerprint'),
+    )
+
+    def __repr__(self):
+        return f'<ImportedTransaction {self.transaction_id} batch {self.batch_id}>'
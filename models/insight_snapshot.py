@@ -0,0 +1,19 @@
+from models import db
+from datetime import datetime
+
+
+class InsightSnapshot(db.Model):
+    __tablename__ = 'insight_snapshots'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    data_version = db.Column(db.Integer, nullable=False)
+    computed_on = db.Column(db.Date, nullable=False)
+    currency = db.Column(db.String(3), nullable=False)
+    rates_version = db.Column(db.String(64), nullable=False)
+    insights = db.Column(db.Text, nullable=False)
+    prompt = db.Column(db.Text, nullable=False)
+    summary = db.Column(db.Text)
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<InsightSnapshot {self.user_id} v{self.data_version} {self.computed_on}>'
@@ -0,0 +1,13 @@
+from models import db
+from datetime import datetime
+
+
+class KnownMerchant(db.Model):
+    __tablename__ = 'known_merchants'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    merchant = db.Column(db.String(100), primary_key=True)
+    first_seen = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<KnownMerchant {self.user_id} {self.merchant}>'
@@ -0,0 +1,14 @@
+from models import db
+
+
+class MonthlyRate(db.Model):
+    __tablename__ = 'monthly_rates'
+
+    currency = db.Column(db.String(3), primary_key=True)
+    # year * 12 + month - 1, so months compare and clamp as integers
+    month = db.Column(db.Integer, primary_key=True)
+    # The currency's rate in force on the 1st (see services.currency)
+    rate = db.Column(db.Float, nullable=False)
+
+    def __repr__(self):
+        return f'<MonthlyRate {self.currency} {self.month // 12}-{self.month % 12 + 1:02d} {self.rate}>'
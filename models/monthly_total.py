@@ -0,0 +1,16 @@
+from models import db
+
+
+class MonthlyTotal(db.Model):
+    __tablename__ = 'monthly_totals'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    month = db.Column(db.Date, primary_key=True)
+    transaction_type = db.Column(db.String(20), primary_key=True)
+    category = db.Column(db.String(50), primary_key=True)
+    currency = db.Column(db.String(3), primary_key=True)
+    amount = db.Column(db.Float, nullable=False, default=0.0)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<MonthlyTotal {self.user_id} {self.month} {self.transaction_type}/{self.category} {self.amount:.2f} {self.currency}>'
@@ -1,4 +1,5 @@
-from app import db
+from models import db
+from models.exchange_rate import DEFAULT_CURRENCY
 from datetime import datetime, timedelta
 from models.transaction import Transaction
 
@@ -7,8 +8,9 @@ class RecurringTransaction(db.Model):
     __tablename__ = 'recurring_transactions'
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
     amount = db.Column(db.Float, nullable=False)
+    currency = db.Column(db.String(3), nullable=False, default=DEFAULT_CURRENCY)
     category = db.Column(db.String(50), nullable=False)
     transaction_type = db.Column(db.String(20), nullable=False)
     description = db.Column(db.Text)
@@ -58,6 +60,7 @@ class RecurringTransaction(db.Model):
             transaction_type=self.transaction_type,
             category=self.category,
             amount=self.amount,
+            currency=self.currency,
             description=f"{self.description} (Recurring)",
             date=target_date
         )
@@ -69,6 +72,7 @@ class RecurringTransaction(db.Model):
             'id': self.id,
             'user_id': self.user_id,
             'amount': self.amount,
+            'currency': self.currency,
             'category': self.category,
             'transaction_type': self.transaction_type,
             'description': self.description,
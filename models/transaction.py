@@ -1,4 +1,5 @@
 from models import db
+from models.exchange_rate import DEFAULT_CURRENCY
 from datetime import datetime
 
 
@@ -6,8 +7,9 @@ class Transaction(db.Model):
     __tablename__ = 'transactions'
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
     amount = db.Column(db.Float, nullable=False)
+    currency = db.Column(db.String(3), nullable=False, default=DEFAULT_CURRENCY)
     category = db.Column(db.String(50), nullable=False)
     transaction_type = db.Column(db.String(20), nullable=False)
     date = db.Column(db.Date, nullable=False, default=datetime.utcnow().date, index=True)
@@ -19,6 +21,7 @@ class Transaction(db.Model):
             'id': self.id,
             'user_id': self.user_id,
             'amount': self.amount,
+            'currency': self.currency,
             'category': self.category,
             'transaction_type': self.transaction_type,
             'date': self.date.isoformat() if self.date else None,
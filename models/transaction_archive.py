@@ -0,0 +1,22 @@
+from models import db
+from datetime import datetime
+
+
+class TransactionArchive(db.Model):
+    __tablename__ = 'transaction_archives'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    year = db.Column(db.Integer, nullable=False)
+    row_count = db.Column(db.Integer, nullable=False, default=0)
+    first_date = db.Column(db.Date)
+    last_date = db.Column(db.Date)
+    payload = db.deferred(db.Column(db.LargeBinary, nullable=False))
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'year', name='unique_user_archive_year'),
+    )
+
+    def __repr__(self):
+        return f'<TransactionArchive {self.user_id}/{self.year} rows={self.row_count}>'
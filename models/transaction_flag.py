@@ -0,0 +1,31 @@
+from models import db
+from datetime import datetime
+
+
+class TransactionFlag(db.Model):
+    __tablename__ = 'transaction_flags'
+
+    id = db.Column(db.Integer, primary_key=True)
+    transaction_id = db.Column(db.Integer, db.ForeignKey('transactions.id', ondelete='CASCADE'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
+    kind = db.Column(db.String(30), nullable=False)
+    score = db.Column(db.Float)
+    message = db.Column(db.String(255), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('transaction_id', 'kind', name='unique_transaction_flag_kind'),
+    )
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'transaction_id': self.transaction_id,
+            'kind': self.kind,
+            'score': self.score,
+            'message': self.message,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+    def __repr__(self):
+        return f'<TransactionFlag {self.kind} on {self.transaction_id}>'
@@ -0,0 +1,16 @@
+from models import db
+
+
+class TransactionTag(db.Model):
+    __tablename__ = 'transaction_tags'
+
+    transaction_id = db.Column(db.Integer, db.ForeignKey('transactions.id', ondelete='CASCADE'), primary_key=True)
+    tag_id = db.Column(db.Integer, db.ForeignKey('tags.id', ondelete='CASCADE'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_transaction_tags_user_tag', 'user_id', 'tag_id'),
+    )
+
+    def __repr__(self):
+        return f'<TransactionTag {self.tag_id} on {self.transaction_id}>'
@@ -1,7 +1,8 @@
 from models import db
 
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from models.exchange_rate import DEFAULT_CURRENCY
+from services.password_hashing import hash_password, verify_password, needs_rehash
 
 
 class User(UserMixin, db.Model):
@@ -11,14 +12,19 @@ class User(UserMixin, db.Model):
     username = db.Column(db.String(64), unique=True, nullable=False, index=True)
     email = db.Column(db.String(120), unique=True, nullable=False, index=True)
     password_hash = db.Column(db.String(256), nullable=False)
+    base_currency = db.Column(db.String(3), nullable=False, default=DEFAULT_CURRENCY)
     
-    transactions = db.relationship('Transaction', backref='user', lazy='dynamic', cascade='all, delete-orphan')
+    transactions = db.relationship('Transaction', backref='user', lazy='dynamic', cascade='all, delete-orphan',
+                                   passive_deletes=True)
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
     
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
+    
+    def password_needs_rehash(self):
+        return needs_rehash(self.password_hash)
     
     def __repr__(self):
         return f'<User {self.username}>'
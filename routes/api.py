@@ -1,14 +1,50 @@
-from flask import Blueprint, request, jsonify
-from flask_login import login_required, current_user, login_user
+from flask import Blueprint, request, jsonify, current_app
+from flask_login import login_required, current_user, login_user, logout_user
 from models import db
 from models.user import User
 from models.transaction import Transaction
+from models.category_rule import CategoryRule
 from services.ai_insights import get_ai_insights
+from services.budget_alerts import get_recent_alerts
+from services.currency import CurrencyError, parse_currency
+from services.bulk_deletes import UndoImportError, delete_transactions, purge_user, undo_import
+from services.categorization_rules import (
+    RuleError, apply_rules_to_transaction, create_rule, get_rules, reapply_rules
+)
+from services.bulk_transactions import (
+    BulkPayloadError, MAX_BULK_ITEMS, parse_bulk_payload, bulk_create_transactions
+)
+from services.http_cache import conditional_get
+from services.importers import ImportFormatError, import_formats, import_statement
+from services.password_hashing import HashingBusy
+from services.period_reports import compare_periods, resolve_periods
+from services.periods import PeriodError, parse_fiscal_start
+from services.rate_limit import check_login_rate
+from services.serialization import (
+    FieldSelectionError, TRANSACTION_FIELDS, parse_fields, rows_to_dicts, serialize_transactions, get_json_backend
+)
+from services.search import search_statement, parse_page, paginate
+from services.tags import TagError, get_tags, parse_tag_list, set_transaction_tags, tag_counts, tag_transactions
+from services.transaction_filters import filter_conditions, get_filter_conditions, parse_filters
+from services.change_feed import get_changes, get_snapshot, DEFAULT_BATCH_SIZE, MAX_BATCH_SIZE
 from datetime import datetime
+import io
 
 api_bp = Blueprint('api', __name__, url_prefix='/api/v1')
 
 
+def _too_many_attempts(retry_after):
+    response = jsonify({'error': 'Too many attempts. Try again later.'})
+    response.headers['Retry-After'] = str(retry_after)
+    return response, 429
+
+
+def _server_busy():
+    response = jsonify({'error': 'Server busy. Try again shortly.'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+
 @api_bp.route('/auth/register', methods=['POST'])
 def api_register():
     data = request.get_json()
@@ -20,6 +56,10 @@ def api_register():
     email = data.get('email')
     password = data.get('password')
     
+    retry_after = check_login_rate(request.remote_addr)
+    if retry_after:
+        return _too_many_attempts(retry_after)
+    
     if User.query.filter_by(username=username).first():
         return jsonify({'error': 'Username already exists'}), 400
     
@@ -27,7 +67,10 @@ def api_register():
         return jsonify({'error': 'Email already registered'}), 400
     
     user = User(username=username, email=email)
-    user.set_password(password)
+    try:
+        user.set_password(password)
+    except HashingBusy:
+        return _server_busy()
     db.session.add(user)
     db.session.commit()
     
@@ -48,11 +91,27 @@ def api_login():
     if not data or not data.get('username') or not data.get('password'):
         return jsonify({'error': 'Missing username or password'}), 400
     
+    retry_after = check_login_rate(request.remote_addr, data.get('username'))
+    if retry_after:
+        return _too_many_attempts(retry_after)
+    
     user = User.query.filter_by(username=data.get('username')).first()
     
-    if user is None or not user.check_password(data.get('password')):
+    try:
+        valid = user is not None and user.check_password(data.get('password'))
+    except HashingBusy:
+        return _server_busy()
+    
+    if not valid:
         return jsonify({'error': 'Invalid credentials'}), 401
     
+    if user.password_needs_rehash():
+        try:
+            user.set_password(data.get('password'))
+            db.session.commit()
+        except HashingBusy:
+            pass
+    
     login_user(user)
     
     return jsonify({
@@ -67,12 +126,58 @@ def api_login():
 
 @api_bp.route('/transactions', methods=['GET'])
 @login_required
+@conditional_get()
 def api_get_transactions():
-    transactions = Transaction.query.filter_by(user_id=current_user.id).order_by(Transaction.date.desc()).all()
+    try:
+        fields = parse_fields(request.args.get('fields'))
+    except FieldSelectionError as e:
+        return jsonify({'error': str(e)}), 400
     
-    return jsonify({
-        'transactions': [t.to_dict() for t in transactions]
-    }), 200
+    q = request.args.get('q', '').strip()
+    if not q:
+        body = serialize_transactions(current_user.id, fields)
+    else:
+        try:
+            conditions = get_filter_conditions(request.args, current_user.id)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        page, per_page = parse_page(request.args)
+        statement = search_statement(current_user.id, q, [TRANSACTION_FIELDS[f] for f in fields], conditions)
+        rows, total = paginate(statement, page, per_page) if statement is not None else ([], 0)
+        
+        body = get_json_backend()({
+            'transactions': rows_to_dicts(fields, rows),
+            'page': page,
+            'per_page': per_page,
+            'total': total
+        })
+    
+    return current_app.response_class(body, status=200, mimetype='application/json')
+
+
+@api_bp.route('/transactions', methods=['DELETE'])
+@login_required
+def api_delete_transactions():
+    try:
+        filters = parse_filters(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    conditions = filter_conditions(filters, current_user.id)
+    
+    batch_id = request.args.get('import_id')
+    if batch_id is not None:
+        try:
+            batch_id = int(batch_id)
+        except ValueError:
+            return jsonify({'error': 'Invalid import id.'}), 400
+    
+    if not conditions and batch_id is None and request.args.get('all') != 'true':
+        return jsonify({'error': 'Give a filter (start_date, end_date, category, transaction_type, tags, '
+                                 'import_id) or all=true'}), 400
+    
+    deleted = delete_transactions(current_user.id, conditions, batch_id, filters=filters)
+    return jsonify({'deleted': deleted}), 200
 
 
 @api_bp.route('/transactions/create', methods=['POST'])
@@ -95,29 +200,292 @@ def api_create_transaction():
     except ValueError:
         return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
     
+    try:
+        currency = parse_currency(data.get('currency'), current_user.base_currency)
+    except CurrencyError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        tags = parse_tag_list(data.get('tags'))
+    except TagError as e:
+        return jsonify({'error': str(e)}), 400
+    
     transaction = Transaction(
         user_id=current_user.id,
         transaction_type=data.get('transaction_type'),
         category=data.get('category'),
         amount=amount,
+        currency=currency,
         description=data.get('description', ''),
         date=date_obj
     )
     
+    tags += [tag for tag in apply_rules_to_transaction(transaction) if tag not in tags]
+    
     db.session.add(transaction)
+    if tags:
+        db.session.flush()
+        set_transaction_tags(current_user.id, transaction.id, tags)
     db.session.commit()
     
     return jsonify({
         'message': 'Transaction created successfully',
-        'transaction': transaction.to_dict()
+        'transaction': dict(transaction.to_dict(), tags=tags)
     }), 201
 
 
+@api_bp.route('/transactions/tags', methods=['POST'])
+@login_required
+def api_tag_transactions():
+    data = request.get_json(silent=True)
+    
+    if not data or not isinstance(data.get('transaction_ids'), list):
+        return jsonify({'error': 'Give transaction_ids and tags to add and/or remove'}), 400
+    
+    if not all(isinstance(i, int) for i in data['transaction_ids']):
+        return jsonify({'error': 'Transaction ids must be integers'}), 400
+    
+    if len(data['transaction_ids']) > MAX_BULK_ITEMS:
+        return jsonify({'error': f'Too many transactions. Maximum is {MAX_BULK_ITEMS} per request'}), 413
+    
+    try:
+        add = parse_tag_list(data.get('add'))
+        remove = parse_tag_list(data.get('remove'))
+    except TagError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if not add and not remove:
+        return jsonify({'error': 'Give tags to add and/or remove'}), 400
+    
+    tagged = tag_transactions(current_user.id, data['transaction_ids'], add, remove)
+    db.session.commit()
+    
+    return jsonify({'updated': len(tagged), 'added': add, 'removed': remove}), 200
+
+
+@api_bp.route('/tags', methods=['GET'])
+@login_required
+@conditional_get()
+def api_get_tags():
+    counts = tag_counts(current_user.id)
+    
+    return jsonify({
+        'tags': [dict(tag.to_dict(), transactions=counts.get(tag.name, 0)) for tag in get_tags(current_user.id)]
+    }), 200
+
+
+@api_bp.route('/rules', methods=['GET'])
+@login_required
+def api_get_rules():
+    return jsonify({'rules': [rule.to_dict() for rule in get_rules(current_user.id)]}), 200
+
+
+@api_bp.route('/rules', methods=['POST'])
+@login_required
+def api_create_rule():
+    data = request.get_json(silent=True)
+    
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Expected a JSON object'}), 400
+    
+    try:
+        rule = create_rule(current_user.id, data)
+    except RuleError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    db.session.commit()
+    
+    return jsonify({'rule': rule.to_dict()}), 201
+
+
+@api_bp.route('/rules/<int:rule_id>', methods=['DELETE'])
+@login_required
+def api_delete_rule(rule_id):
+    rule = db.session.get(CategoryRule, rule_id)
+    
+    if rule is None or rule.user_id != current_user.id:
+        return jsonify({'error': 'Rule not found'}), 404
+    
+    db.session.delete(rule)
+    db.session.commit()
+    
+    return jsonify({'message': 'Rule deleted'}), 200
+
+
+@api_bp.route('/rules/apply', methods=['POST'])
+@login_required
+def api_reapply_rules():
+    counts = reapply_rules(current_user.id)
+    
+    return jsonify(counts), 200
+
+
+@api_bp.route('/transactions/bulk', methods=['POST'])
+@login_required
+def api_bulk_create_transactions():
+    try:
+        items = parse_bulk_payload(request)
+    except BulkPayloadError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if not items:
+        return jsonify({'error': 'No transactions provided'}), 400
+    
+    if len(items) > MAX_BULK_ITEMS:
+        return jsonify({'error': f'Too many transactions. Maximum is {MAX_BULK_ITEMS} per request'}), 413
+    
+    results = bulk_create_transactions(
+        current_user.id,
+        items,
+        request_key=request.headers.get('Idempotency-Key')
+    )
+    
+    return jsonify({
+        'created': sum(1 for r in results if r['status'] == 'created'),
+        'duplicates': sum(1 for r in results if r['status'] == 'duplicate'),
+        'errors': sum(1 for r in results if r['status'] == 'error'),
+        'results': results
+    }), 200
+
+
+@api_bp.route('/transactions/import', methods=['POST'])
+@login_required
+def api_import_transactions():
+    upload = request.files.get('file')
+    if upload is not None:
+        stream, filename = upload.stream, upload.filename
+    elif request.content_length:
+        stream, filename = io.BytesIO(request.get_data()), request.args.get('filename')
+    else:
+        return jsonify({'error': 'No statement file provided'}), 400
+    
+    fmt = request.args.get('format')
+    if fmt and fmt not in import_formats():
+        return jsonify({'error': f"Unknown format. Supported: {', '.join(import_formats())}"}), 400
+    
+    try:
+        batch = import_statement(current_user.id, stream, filename, fmt)
+    except ImportFormatError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({'import': batch.to_dict()}), 201
+
+
+@api_bp.route('/imports/<int:batch_id>/undo', methods=['POST'])
+@login_required
+def api_undo_import(batch_id):
+    try:
+        batch, deleted = undo_import(current_user.id, batch_id)
+    except UndoImportError as e:
+        return jsonify({'error': str(e)}), 409
+    
+    if batch is None:
+        return jsonify({'error': 'Import not found'}), 404
+    
+    return jsonify({'import': batch.to_dict(), 'deleted': deleted}), 200
+
+
+@api_bp.route('/account', methods=['PATCH'])
+@login_required
+def api_update_account():
+    data = request.get_json(silent=True)
+    
+    if not data or 'base_currency' not in data:
+        return jsonify({'error': 'Nothing to update'}), 400
+    
+    try:
+        currency = parse_currency(data.get('base_currency'))
+    except CurrencyError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if not currency:
+        return jsonify({'error': 'base_currency is required'}), 400
+    
+    user = db.session.get(User, current_user.id)
+    user.base_currency = currency
+    db.session.commit()
+    
+    return jsonify({'base_currency': user.base_currency}), 200
+
+
+@api_bp.route('/account', methods=['DELETE'])
+@login_required
+def api_delete_account():
+    data = request.get_json(silent=True)
+    
+    if not data or not data.get('password'):
+        return jsonify({'error': 'Confirm with your password'}), 400
+    
+    user = db.session.get(User, current_user.id)
+    
+    try:
+        valid = user is not None and user.check_password(data.get('password'))
+    except HashingBusy:
+        return _server_busy()
+    
+    if not valid:
+        return jsonify({'error': 'Invalid credentials'}), 401
+    
+    counts = purge_user(user.id)
+    logout_user()
+    
+    return jsonify({'message': 'Account deleted', 'deleted': counts}), 200
+
+
+@api_bp.route('/sync', methods=['GET'])
+@login_required
+def api_sync():
+    since = request.args.get('since')
+    
+    if not since:
+        return jsonify(get_snapshot(current_user.id)), 200
+    
+    try:
+        since = int(since)
+        limit = int(request.args.get('limit', DEFAULT_BATCH_SIZE))
+    except ValueError:
+        return jsonify({'error': 'Invalid sync token or limit'}), 400
+    
+    if since < 0 or limit <= 0:
+        return jsonify({'error': 'Invalid sync token or limit'}), 400
+    
+    return jsonify(get_changes(current_user.id, since, min(limit, MAX_BATCH_SIZE))), 200
+
+
 @api_bp.route('/insights', methods=['GET'])
 @login_required
+@conditional_get(max_age=60)
 def api_get_insights():
     insights = get_ai_insights(current_user.id)
     
     return jsonify({
         'insights': insights
     }), 200
+
+
+@api_bp.route('/reports/compare', methods=['GET'])
+@login_required
+@conditional_get()
+def api_compare_periods():
+    try:
+        current, baseline = resolve_periods(
+            request.args.get('period'),
+            request.args.get('against'),
+            request.args.get('kind', 'month'),
+            parse_fiscal_start(request.args.get('fiscal_start'))
+        )
+    except PeriodError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify(compare_periods(current_user.id, current, baseline)), 200
+
+
+@api_bp.route('/alerts', methods=['GET'])
+@login_required
+@conditional_get()
+def api_get_alerts():
+    alerts = get_recent_alerts(current_user.id)
+    
+    return jsonify({
+        'alerts': [alert.to_dict() for alert in alerts]
+    }), 200
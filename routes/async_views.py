@@ -0,0 +1,100 @@
+# Async variants of the read-heavy endpoints, used in place of the sync views
+# when the app is served through asgi.py (same templates and JSON).
+import asyncio
+
+from flask import current_app, jsonify, render_template, request
+from flask_login import current_user
+
+from services.ai_insights import get_ai_insights, get_ai_insights_async
+from services.anomaly_detection import flags_by_transaction, flags_by_transaction_async
+from services.async_serving import async_view, async_login_required
+from services.dashboard_summary import (
+    get_dashboard_totals, get_dashboard_totals_async, get_recent_transactions, get_recent_transactions_async
+)
+from services.fragment_cache import Deferred, fragment_cached_async
+from services.http_cache import async_conditional_get
+from services.search import search_statement, parse_page, paginate_async
+from services.serialization import (
+    FieldSelectionError, TRANSACTION_FIELDS, parse_fields, rows_to_dicts, serialize_transactions_async, get_json_backend
+)
+from services.transaction_filters import get_filter_conditions
+
+
+@async_view('dashboard.index')
+@async_login_required
+@async_conditional_get()
+async def dashboard_index():
+    user_id = current_user.id
+
+    async def recent():
+        transactions = await get_recent_transactions_async(user_id)
+        return transactions, await flags_by_transaction_async([t.id for t in transactions])
+
+    # Prefetch only what the fragment cache cannot serve; the sync loaders
+    # remain as a fallback should a fragment expire before it is rendered.
+    loads = {}
+    if not await fragment_cached_async('dashboard-recent'):
+        loads['recent'] = recent()
+    if not (await fragment_cached_async('dashboard-totals') and await fragment_cached_async('dashboard-chart-data')):
+        loads['totals'] = get_dashboard_totals_async(user_id)
+    if not await fragment_cached_async('dashboard-insights'):
+        loads['insights'] = get_ai_insights_async(user_id)
+    results = dict(zip(loads, await asyncio.gather(*loads.values())))
+
+    if 'recent' in results:
+        transactions = Deferred(lambda: results['recent'][0])
+        flags = Deferred(lambda: results['recent'][1])
+    else:
+        transactions = Deferred(lambda: get_recent_transactions(user_id))
+        flags = Deferred(lambda: flags_by_transaction([t.id for t in transactions]))
+    totals = Deferred(lambda: results['totals'] if 'totals' in results else get_dashboard_totals(user_id))
+    insights = Deferred(lambda: results['insights'] if 'insights' in results else get_ai_insights(user_id))
+
+    return render_template('dashboard.html',
+                           transactions=transactions,
+                           flags=flags,
+                           totals=totals,
+                           insights=insights)
+
+
+@async_view('api.api_get_transactions')
+@async_login_required
+@async_conditional_get()
+async def api_get_transactions():
+    try:
+        fields = parse_fields(request.args.get('fields'))
+    except FieldSelectionError as e:
+        return jsonify({'error': str(e)}), 400
+
+    q = request.args.get('q', '').strip()
+    if not q:
+        body = await serialize_transactions_async(current_user.id, fields)
+    else:
+        try:
+            conditions = get_filter_conditions(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        page, per_page = parse_page(request.args)
+        statement = search_statement(current_user.id, q, [TRANSACTION_FIELDS[f] for f in fields], conditions)
+        rows, total = await paginate_async(statement, page, per_page) if statement is not None else ([], 0)
+
+        body = get_json_backend()({
+            'transactions': rows_to_dicts(fields, rows),
+            'page': page,
+            'per_page': per_page,
+            'total': total
+        })
+
+    return current_app.response_class(body, status=200, mimetype='application/json')
+
+
+@async_view('api.api_get_insights')
+@async_login_required
+@async_conditional_get(max_age=60)
+async def api_get_insights():
+    insights = await get_ai_insights_async(current_user.id)
+
+    return jsonify({
+        'insights': insights
+    }), 200
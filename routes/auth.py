@@ -2,6 +2,8 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import login_user, logout_user, login_required, current_user
 from models import db
 from models.user import User
+from services.password_hashing import HashingBusy
+from services.rate_limit import check_login_rate
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -22,6 +24,10 @@ def register():
             flash('All fields are required.', 'danger')
             return render_template('register.html')
 
+        if check_login_rate(request.remote_addr):
+            flash('Too many attempts. Please wait a minute and try again.', 'danger')
+            return render_template('register.html'), 429
+
         # Username already exists?
         if User.query.filter_by(username=username).first():
             flash('Username already exists.', 'danger')
@@ -34,7 +40,11 @@ def register():
 
         # Create new user
         user = User(username=username, email=email)
-        user.set_password(password)
+        try:
+            user.set_password(password)
+        except HashingBusy:
+            flash('The server is busy. Please try again in a moment.', 'danger')
+            return render_template('register.html'), 503
 
         db.session.add(user)
         db.session.commit()
@@ -62,13 +72,31 @@ def login():
             flash('Please provide both username and password.', 'danger')
             return render_template('login.html')
 
+        if check_login_rate(request.remote_addr, username):
+            flash('Too many login attempts. Please wait a minute and try again.', 'danger')
+            return render_template('login.html'), 429
+
         # Fetch user
         user = User.query.filter_by(username=username).first()
 
-        if user is None or not user.check_password(password):
+        try:
+            valid = user is not None and user.check_password(password)
+        except HashingBusy:
+            flash('The server is busy. Please try again in a moment.', 'danger')
+            return render_template('login.html'), 503
+
+        if not valid:
             flash('Invalid username or password.', 'danger')
             return render_template('login.html')
 
+        # Upgrade hashes made with older parameters while we have the password
+        if user.password_needs_rehash():
+            try:
+                user.set_password(password)
+                db.session.commit()
+            except HashingBusy:
+                pass
+
         # Login success
         login_user(user)
         flash(f'Welcome back, {user.username}!', 'success')
@@ -2,57 +2,26 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import login_required, current_user
 from models import db
 from models.budget import Budget
-from models.transaction import Transaction
-from sqlalchemy import func, extract
-from datetime import datetime, date, timedelta
-from calendar import monthrange
+from services.http_cache import conditional_get
+from services.budget_status import get_budget_data
+from services.currency import CurrencyError, parse_currency
+from services.tags import TagError, format_tag_expression, parse_tag_expression
 
 budgets_bp = Blueprint('budgets', __name__)
 
 
-def get_budget_spending(user_id, category, period='monthly'):
-    today = date.today()
-    
-    if period == 'monthly':
-        start_date = date(today.year, today.month, 1)
-        _, last_day = monthrange(today.year, today.month)
-        end_date = date(today.year, today.month, last_day)
-    elif period == 'weekly':
-        start_date = today - timedelta(days=today.weekday())
-        end_date = start_date + timedelta(days=6)
-    else:
-        start_date = date(today.year, 1, 1)
-        end_date = date(today.year, 12, 31)
-    
-    spent = db.session.query(func.sum(Transaction.amount)).filter(
-        Transaction.user_id == user_id,
-        Transaction.category == category,
-        Transaction.transaction_type == 'expense',
-        Transaction.date >= start_date,
-        Transaction.date <= end_date
-    ).scalar() or 0.0
-    
-    return spent
+def _tag_filter(value):
+    """A budget's tag filter in canonical form, or None. Raises TagError."""
+    if not value or not value.strip():
+        return None
+    return format_tag_expression(parse_tag_expression(value))
 
 
 @budgets_bp.route('/budgets')
 @login_required
+@conditional_get()
 def index():
-    budgets = Budget.query.filter_by(user_id=current_user.id).all()
-    
-    budget_data = []
-    for budget in budgets:
-        spent = get_budget_spending(current_user.id, budget.category, budget.period)
-        percentage = (spent / budget.amount * 100) if budget.amount > 0 else 0
-        status = 'danger' if spent > budget.amount else 'warning' if percentage > 80 else 'success'
-        
-        budget_data.append({
-            'budget': budget,
-            'spent': spent,
-            'remaining': budget.amount - spent,
-            'percentage': percentage,
-            'status': status
-        })
+    budget_data = get_budget_data(current_user.id)
     
     return render_template('budgets.html', budget_data=budget_data)
 
@@ -78,6 +47,18 @@ def add_budget():
             flash('Invalid amount format.', 'danger')
             return render_template('add_budget.html')
         
+        try:
+            currency = parse_currency(request.form.get('currency'), current_user.base_currency)
+        except CurrencyError as e:
+            flash(str(e), 'danger')
+            return render_template('add_budget.html')
+        
+        try:
+            tag_filter = _tag_filter(request.form.get('tag_filter'))
+        except TagError as e:
+            flash(str(e), 'danger')
+            return render_template('add_budget.html')
+        
         existing = Budget.query.filter_by(
             user_id=current_user.id,
             category=category,
@@ -92,7 +73,9 @@ def add_budget():
             user_id=current_user.id,
             category=category,
             amount=amount,
-            period=period
+            currency=currency,
+            period=period,
+            tag_filter=tag_filter
         )
         
         db.session.add(budget)
@@ -130,8 +113,22 @@ def edit_budget(budget_id):
             flash('Invalid amount format.', 'danger')
             return render_template('edit_budget.html', budget=budget)
         
+        try:
+            currency = parse_currency(request.form.get('currency'), budget.currency)
+        except CurrencyError as e:
+            flash(str(e), 'danger')
+            return render_template('edit_budget.html', budget=budget)
+        
+        try:
+            tag_filter = _tag_filter(request.form.get('tag_filter'))
+        except TagError as e:
+            flash(str(e), 'danger')
+            return render_template('edit_budget.html', budget=budget)
+        
         budget.amount = amount
+        budget.currency = currency
         budget.period = period
+        budget.tag_filter = tag_filter
         
         db.session.commit()
         
@@ -2,10 +2,21 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import login_required, current_user
 from models import db
 from models.transaction import Transaction
+from models.user import User
+from models.idempotency_key import IdempotencyKey
 from services.ai_insights import get_ai_insights
-from services.pdf_parser import parse_transaction_pdf
+from services.anomaly_detection import flags_by_transaction
+from services.dashboard_summary import get_dashboard_totals, get_recent_transactions
+from services.fragment_cache import Deferred
+from services.http_cache import conditional_get
+from services.currency import CurrencyError, parse_currency
+from services.bulk_deletes import UndoImportError, undo_import
+from services.categorization_rules import apply_rules_to_transaction
+from services.importers import ImportFormatError, import_extensions, import_statement, recent_imports
+from services.search import search_statement, parse_page, paginate
+from services.tags import TagError, parse_tag_list, set_transaction_tags, tags_by_transaction
+from services.transaction_filters import get_filter_conditions
 from datetime import datetime
-from sqlalchemy import func, extract
 import os
 from werkzeug.utils import secure_filename
 
@@ -14,54 +25,20 @@ dashboard_bp = Blueprint('dashboard', __name__)
 
 @dashboard_bp.route('/dashboard')
 @login_required
+@conditional_get()
 def index():
-    transactions = Transaction.query.filter_by(user_id=current_user.id).order_by(Transaction.date.desc()).limit(10).all()
+    user_id = current_user.id
     
-    total_income = db.session.query(func.sum(Transaction.amount)).filter(
-        Transaction.user_id == current_user.id,
-        Transaction.transaction_type == 'income'
-    ).scalar() or 0.0
-    
-    total_expense = db.session.query(func.sum(Transaction.amount)).filter(
-        Transaction.user_id == current_user.id,
-        Transaction.transaction_type == 'expense'
-    ).scalar() or 0.0
-    
-    balance = total_income - total_expense
-    
-    category_data = db.session.query(
-        Transaction.category,
-        func.sum(Transaction.amount).label('total')
-    ).filter(
-        Transaction.user_id == current_user.id,
-        Transaction.transaction_type == 'expense'
-    ).group_by(Transaction.category).all()
-    
-    categories = [cat[0] for cat in category_data]
-    amounts = [float(cat[1]) for cat in category_data]
-    
-    monthly_data = db.session.query(
-        extract('month', Transaction.date).label('month'),
-        func.sum(Transaction.amount).label('total')
-    ).filter(
-        Transaction.user_id == current_user.id,
-        Transaction.transaction_type == 'expense'
-    ).group_by(extract('month', Transaction.date)).order_by('month').all()
-    
-    months = [f"Month {int(m[0])}" for m in monthly_data]
-    monthly_amounts = [float(m[1]) for m in monthly_data]
-    
-    insights = get_ai_insights(current_user.id)
+    # Deferred: sections served from the fragment cache skip their queries.
+    transactions = Deferred(lambda: get_recent_transactions(user_id))
+    flags = Deferred(lambda: flags_by_transaction([t.id for t in transactions]))
+    totals = Deferred(lambda: get_dashboard_totals(user_id))
+    insights = Deferred(lambda: get_ai_insights(user_id))
     
     return render_template('dashboard.html',
                          transactions=transactions,
-                         total_income=total_income,
-                         total_expense=total_expense,
-                         balance=balance,
-                         categories=categories,
-                         amounts=amounts,
-                         months=months,
-                         monthly_amounts=monthly_amounts,
+                         flags=flags,
+                         totals=totals,
                          insights=insights)
 
 
@@ -88,22 +65,40 @@ def add_transaction():
             flash('Invalid amount format.', 'danger')
             return render_template('add_transaction.html')
         
+        try:
+            currency = parse_currency(request.form.get('currency'), current_user.base_currency)
+        except CurrencyError as e:
+            flash(str(e), 'danger')
+            return render_template('add_transaction.html')
+        
         try:
             date_obj = datetime.strptime(date_str, '%Y-%m-%d').date()
         except ValueError:
             flash('Invalid date format.', 'danger')
             return render_template('add_transaction.html')
         
+        try:
+            tags = parse_tag_list(request.form.get('tags'))
+        except TagError as e:
+            flash(str(e), 'danger')
+            return render_template('add_transaction.html')
+        
         transaction = Transaction(
             user_id=current_user.id,
             transaction_type=transaction_type,
             category=category,
             amount=amount,
+            currency=currency,
             description=description,
             date=date_obj
         )
         
+        tags += [tag for tag in apply_rules_to_transaction(transaction) if tag not in tags]
+        
         db.session.add(transaction)
+        if tags:
+            db.session.flush()
+            set_transaction_tags(current_user.id, transaction.id, tags)
         db.session.commit()
         
         flash('Transaction added successfully!', 'success')
@@ -112,61 +107,101 @@ def add_transaction():
     return render_template('add_transaction.html')
 
 
+@dashboard_bp.route('/settings/currency', methods=['POST'])
+@login_required
+def set_base_currency():
+    try:
+        currency = parse_currency(request.form.get('currency'))
+    except CurrencyError as e:
+        flash(str(e), 'danger')
+        return redirect(request.referrer or url_for('dashboard.index'))
+    
+    if currency:
+        db.session.get(User, current_user.id).base_currency = currency
+        db.session.commit()
+        flash(f'Totals are now shown in {currency}.', 'success')
+    
+    return redirect(request.referrer or url_for('dashboard.index'))
+
+
 @dashboard_bp.route('/upload-pdf', methods=['GET', 'POST'])
 @login_required
 def upload_pdf():
     if request.method == 'POST':
-        if 'pdf_file' not in request.files:
-            flash('No file selected.', 'danger')
-            return redirect(request.url)
-        
-        file = request.files['pdf_file']
+        file = request.files.get('statement_file')
         
-        if file.filename == '':
+        if file is None or file.filename == '':
             flash('No file selected.', 'danger')
             return redirect(request.url)
         
-        if not file.filename.lower().endswith('.pdf'):
-            flash('Only PDF files are allowed.', 'danger')
+        try:
+            batch = import_statement(current_user.id, file.stream, file.filename)
+        except ImportFormatError as e:
+            flash(f'Error processing {file.filename}: {str(e)}', 'danger')
             return redirect(request.url)
         
-        try:
-            transactions = parse_transaction_pdf(file)
-            
-            if not transactions:
-                flash('No transactions found in the PDF. Please check the file format.', 'warning')
-                return redirect(request.url)
-            
-            added_count = 0
-            for trans_data in transactions:
-                transaction = Transaction(
-                    user_id=current_user.id,
-                    transaction_type=trans_data['transaction_type'],
-                    category=trans_data['category'],
-                    amount=trans_data['amount'],
-                    description=trans_data['description'],
-                    date=trans_data['date']
-                )
-                db.session.add(transaction)
-                added_count += 1
-            
-            db.session.commit()
-            
-            flash(f'Successfully imported {added_count} transactions from PDF!', 'success')
-            return redirect(url_for('dashboard.index'))
-        
-        except Exception as e:
-            flash(f'Error processing PDF: {str(e)}', 'danger')
+        if not batch.rows_imported and not batch.rows_duplicate:
+            flash('No transactions found in the file. Please check the file format.', 'warning')
             return redirect(request.url)
+        
+        message = f'Successfully imported {batch.rows_imported} transactions from {batch.format.upper()}!'
+        if batch.rows_duplicate:
+            message += f' {batch.rows_duplicate} already imported were skipped.'
+        flash(message, 'success')
+        return redirect(url_for('dashboard.index'))
     
-    return render_template('upload_pdf.html')
+    return render_template('upload_pdf.html', extensions=import_extensions(), imports=recent_imports(current_user.id))
+
+
+@dashboard_bp.route('/imports/<int:batch_id>/undo', methods=['POST'])
+@login_required
+def undo_statement_import(batch_id):
+    try:
+        batch, deleted = undo_import(current_user.id, batch_id)
+    except UndoImportError as e:
+        flash(str(e), 'warning')
+        return redirect(url_for('dashboard.upload_pdf'))
+    
+    if batch is None:
+        flash('Import not found.', 'danger')
+    else:
+        flash(f'Undid the import of {batch.filename or batch.format.upper()}: {deleted} transactions removed.', 'success')
+    return redirect(url_for('dashboard.upload_pdf'))
 
 
 @dashboard_bp.route('/transactions')
 @login_required
 def all_transactions():
-    transactions = Transaction.query.filter_by(user_id=current_user.id).order_by(Transaction.date.desc()).all()
-    return render_template('transactions.html', transactions=transactions)
+    q = request.args.get('q', '').strip()
+    user_id = current_user.id
+    
+    if not q:
+        def load_all():
+            transactions = Transaction.query.filter_by(user_id=user_id).order_by(Transaction.date.desc()).all()
+            return {'transactions': transactions, 'total': len(transactions)}
+        
+        return render_template('transactions.html', results=Deferred(load_all), q='')
+    
+    try:
+        conditions = get_filter_conditions(request.args, user_id)
+    except ValueError as e:
+        flash(str(e), 'danger')
+        conditions = []
+    
+    page, per_page = parse_page(request.args)
+    
+    def load_page():
+        statement = search_statement(user_id, q, [Transaction], conditions)
+        if statement is None:
+            return {'transactions': [], 'total': 0}
+        rows, total = paginate(statement, page, per_page)
+        return {'transactions': [row[0] for row in rows], 'total': total}
+    
+    return render_template('transactions.html',
+                         results=Deferred(load_page),
+                         q=q,
+                         page=page,
+                         per_page=per_page)
 
 
 @dashboard_bp.route('/edit-transaction/<int:transaction_id>', methods=['GET', 'POST'])
@@ -178,6 +213,8 @@ def edit_transaction(transaction_id):
         flash('You do not have permission to edit this transaction.', 'danger')
         return redirect(url_for('dashboard.all_transactions'))
     
+    tags = tags_by_transaction([transaction.id]).get(transaction.id, [])
+    
     if request.method == 'POST':
         transaction_type = request.form.get('transaction_type')
         category = request.form.get('category')
@@ -187,35 +224,49 @@ def edit_transaction(transaction_id):
         
         if not transaction_type or not category or not amount or not date_str:
             flash('All fields except description are required.', 'danger')
-            return render_template('edit_transaction.html', transaction=transaction)
+            return render_template('edit_transaction.html', transaction=transaction, tags=tags)
         
         try:
             amount = float(amount)
             if amount <= 0:
                 flash('Amount must be greater than zero.', 'danger')
-                return render_template('edit_transaction.html', transaction=transaction)
+                return render_template('edit_transaction.html', transaction=transaction, tags=tags)
         except ValueError:
             flash('Invalid amount format.', 'danger')
-            return render_template('edit_transaction.html', transaction=transaction)
+            return render_template('edit_transaction.html', transaction=transaction, tags=tags)
+        
+        try:
+            currency = parse_currency(request.form.get('currency'), transaction.currency)
+        except CurrencyError as e:
+            flash(str(e), 'danger')
+            return render_template('edit_transaction.html', transaction=transaction, tags=tags)
         
         try:
             date_obj = datetime.strptime(date_str, '%Y-%m-%d').date()
         except ValueError:
             flash('Invalid date format.', 'danger')
-            return render_template('edit_transaction.html', transaction=transaction)
+            return render_template('edit_transaction.html', transaction=transaction, tags=tags)
+        
+        try:
+            new_tags = parse_tag_list(request.form.get('tags'))
+        except TagError as e:
+            flash(str(e), 'danger')
+            return render_template('edit_transaction.html', transaction=transaction, tags=tags)
         
         transaction.transaction_type = transaction_type
         transaction.category = category
         transaction.amount = amount
+        transaction.currency = currency
         transaction.description = description
         transaction.date = date_obj
+        set_transaction_tags(current_user.id, transaction.id, new_tags)
         
         db.session.commit()
         
         flash('Transaction updated successfully!', 'success')
         return redirect(url_for('dashboard.all_transactions'))
     
-    return render_template('edit_transaction.html', transaction=transaction)
+    return render_template('edit_transaction.html', transaction=transaction, tags=tags)
 
 
 @dashboard_bp.route('/delete-transaction/<int:transaction_id>', methods=['POST'])
@@ -227,6 +278,8 @@ def delete_transaction(transaction_id):
         flash('You do not have permission to delete this transaction.', 'danger')
         return redirect(url_for('dashboard.all_transactions'))
     
+    # See services.bulk_deletes.enable_sqlite_foreign_keys
+    IdempotencyKey.query.filter_by(transaction_id=transaction.id).delete()
     db.session.delete(transaction)
     db.session.commit()
     
@@ -0,0 +1,194 @@
+import json
+import time
+
+from flask import Blueprint, Response, abort, current_app, jsonify, request, session, stream_with_context
+from flask_login import login_required, current_user
+
+from models import db
+from models.transaction import Transaction
+from services.anomaly_detection import flags_by_transaction
+from services.budget_status import get_budget_data
+from services.dashboard_summary import get_dashboard_totals, get_recent_transactions
+from services.events import get_broker
+from services.http_cache import get_data_version
+
+events_bp = Blueprint('events', __name__)
+
+# Idle time between keep-alive comments (and change polls)
+HEARTBEAT_SECONDS = 15
+# Streams end after this long; EventSource reconnects with Last-Event-ID
+STREAM_SECONDS = 300
+# Upserted transactions sent in one delta; more than this sends the recent list
+MAX_DELTA_ROWS = 50
+
+
+def streaming_enabled():
+    """
+    Whether the dashboard holds an /events stream open. Each stream keeps a
+    worker busy for STREAM_SECONDS, so it needs a server that can hold
+    long requests (gunicorn -k gthread or gevent, or asgi.py); under sync
+    workers the dashboard polls /events/poll instead.
+    """
+    return current_app.config.get('LIVE_UPDATES') == 'stream'
+
+
+def _sse(name, data, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {name}')
+    lines.append(f'data: {json.dumps(data, separators=(",", ":"))}')
+    return '\n'.join(lines) + '\n\n'
+
+
+def _transaction_rows(transactions):
+    flags = flags_by_transaction([t.id for t in transactions])
+    return [dict(t.to_dict(), flags=flags.get(t.id, [])) for t in transactions]
+
+
+def _budget_statuses(user_id):
+    return {
+        item['budget'].id: {
+            'id': item['budget'].id,
+            'category': item['budget'].category,
+            'period': item['budget'].period,
+            'amount': item['budget'].amount,
+            'spent': item['spent'],
+            'percentage': round(item['percentage'], 1),
+            'status': item['status']
+        } for item in get_budget_data(user_id)
+    }
+
+
+def _updates(user_id, events, budgets):
+    """
+    SSE messages for a burst of broker events, coalesced: one transactions
+    delta, one totals snapshot and one message per budget whose status
+    changed. `budgets` (id -> last sent status) is updated in place.
+    """
+    resync = any(event.get('type') == 'resync' for event in events)
+    upserted, deleted = set(), set()
+    budgets_changed = resync
+
+    for event in events:
+        for entity, entity_id, operation in event.get('changes', ()):
+            if entity == 'transaction':
+                (deleted if operation == 'delete' else upserted).add(entity_id)
+            elif entity == 'budget':
+                budgets_changed = True
+
+    messages = []
+    if resync or upserted or deleted:
+        if resync or deleted or len(upserted) > MAX_DELTA_ROWS:
+            transactions = {'replace': True, 'upserted': _transaction_rows(get_recent_transactions(user_id))}
+        else:
+            rows = Transaction.query.filter(
+                Transaction.user_id == user_id, Transaction.id.in_(upserted)
+            ).all()
+            transactions = {'replace': False, 'upserted': _transaction_rows(rows)}
+        messages.append(('transactions', transactions))
+        messages.append(('totals', get_dashboard_totals(user_id)))
+        budgets_changed = True
+
+    if budgets_changed:
+        current = _budget_statuses(user_id)
+        for budget_id, status in current.items():
+            previous = budgets.get(budget_id)
+            if previous is None or previous['status'] != status['status']:
+                messages.append(('budget', dict(status, previous=previous['status'] if previous else None)))
+        for budget_id in set(budgets) - set(current):
+            messages.append(('budget', {'id': budget_id, 'deleted': True}))
+        budgets.clear()
+        budgets.update(current)
+
+    return messages
+
+
+@events_bp.route('/events')
+@login_required
+def stream():
+    """
+    Server-sent events with live changes to the current user's data:
+    "transactions" (new, edited or removed rows), "totals" (dashboard
+    figures) and "budget" (a budget whose status changed). Event ids are
+    change-log versions, so a reconnecting client that missed writes is
+    resynced.
+    """
+    if not streaming_enabled():
+        abort(404)
+    
+    user_id = current_user.id
+    try:
+        last_seen = int(request.headers.get('Last-Event-ID', ''))
+    except ValueError:
+        last_seen = None
+
+    def generate():
+        subscription = get_broker().subscribe(user_id)
+        try:
+            version, _ = get_data_version(user_id)
+            budgets = _budget_statuses(user_id)
+            db.session.close()
+
+            yield 'retry: 3000\n\n'
+            events = [{'type': 'resync'}] if last_seen is not None and last_seen != version else []
+            deadline = time.monotonic() + STREAM_SECONDS
+
+            while True:
+                if not events:
+                    if time.monotonic() >= deadline:
+                        break
+                    events = subscription.get(timeout=HEARTBEAT_SECONDS)
+                if not events:
+                    # Also catches writes made by workers the broker does not reach.
+                    latest, _ = get_data_version(user_id)
+                    db.session.close()
+                    if latest == version:
+                        yield ': keep-alive\n\n'
+                        continue
+                    events = [{'type': 'resync'}]
+
+                messages = _updates(user_id, events, budgets)
+                version, _ = get_data_version(user_id)
+                db.session.close()
+                events = []
+
+                for name, data in messages:
+                    yield _sse(name, data, version)
+        finally:
+            subscription.close()
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+
+@events_bp.route('/events/poll')
+@login_required
+def poll():
+    """
+    The stream's messages as one short request, for deployments that do
+    not hold streams open: empty while the data version equals `since`,
+    otherwise the same resync a reconnecting stream gets. The budget
+    statuses last sent live in the session, so status changes still alert.
+    """
+    user_id = current_user.id
+    since = request.args.get('since', type=int)
+    version, _ = get_data_version(user_id)
+    
+    if since is not None and since == version:
+        return jsonify({'version': version, 'messages': []}), 200
+    
+    budgets = {int(budget_id): {'status': status} for budget_id, status in session.get('live_budgets', {}).items()}
+    if since is None:
+        messages = []
+        budgets = _budget_statuses(user_id)
+    else:
+        messages = _updates(user_id, [{'type': 'resync'}], budgets)
+    session['live_budgets'] = {str(budget_id): status['status'] for budget_id, status in budgets.items()}
+    
+    return jsonify({
+        'version': version,
+        'messages': [{'event': name, 'data': data} for name, data in messages]
+    }), 200
@@ -2,6 +2,9 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import login_required, current_user
 from models import db
 from models.recurring_transaction import RecurringTransaction
+from services.categorization_rules import apply_rules_to_transaction
+from services.currency import CurrencyError, parse_currency
+from services.tags import set_transaction_tags
 from datetime import datetime, date
 
 recurring_bp = Blueprint('recurring', __name__)
@@ -48,6 +51,12 @@ def add_recurring():
             flash('Invalid amount format.', 'danger')
             return render_template('add_recurring.html')
         
+        try:
+            currency = parse_currency(request.form.get('currency'), current_user.base_currency)
+        except CurrencyError as e:
+            flash(str(e), 'danger')
+            return render_template('add_recurring.html')
+        
         try:
             start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
         except ValueError:
@@ -70,6 +79,7 @@ def add_recurring():
             transaction_type=transaction_type,
             category=category,
             amount=amount,
+            currency=currency,
             description=description,
             frequency=frequency,
             start_date=start_date,
@@ -115,6 +125,12 @@ def edit_recurring(recurring_id):
             flash('Invalid amount format.', 'danger')
             return render_template('edit_recurring.html', recurring=recurring)
         
+        try:
+            currency = parse_currency(request.form.get('currency'), recurring.currency)
+        except CurrencyError as e:
+            flash(str(e), 'danger')
+            return render_template('edit_recurring.html', recurring=recurring)
+        
         end_date = None
         if end_date_str:
             try:
@@ -127,6 +143,7 @@ def edit_recurring(recurring_id):
                 return render_template('edit_recurring.html', recurring=recurring)
         
         recurring.amount = amount
+        recurring.currency = currency
         recurring.description = description
         recurring.frequency = frequency
         recurring.end_date = end_date
@@ -177,8 +194,12 @@ def generate_now(recurring_id):
     
     transaction = recurring.generate_transaction(target_date)
     if transaction:
+        tags = apply_rules_to_transaction(transaction)
         db.session.add(transaction)
         recurring.last_generated = target_date
+        if tags:
+            db.session.flush()
+            set_transaction_tags(current_user.id, transaction.id, tags)
         db.session.commit()
         flash(f'Transaction generated successfully for {target_date}!', 'success')
     else:
@@ -1,7 +1,17 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, make_response
+from flask import Blueprint, render_template, request, redirect, url_for, flash, make_response, Response, stream_with_context
 from flask_login import login_required, current_user
 from models import db
 from models.transaction import Transaction
+from models.transaction_rollup import TransactionRollup
+from services.http_cache import conditional_get
+from services.archive import ArchivedTransaction, archived_transactions, archived_years, with_archived
+from services.currency import Conversion, convert
+from services.tags import TagError, parse_tag_expression, tag_condition, tags_by_transaction
+from services.transaction_filters import filter_conditions, parse_filters
+from services.fragment_cache import Deferred
+from services.period_reports import BASELINES, compare_periods, resolve_periods
+from services.periods import PERIOD_KINDS, PeriodError, parse_fiscal_start
+from services.exporters import EXPORT_FORMATS, format_available, export_statement, export_chunks
 from datetime import datetime, date
 from sqlalchemy import func
 import csv
@@ -10,20 +20,42 @@ import io
 reports_bp = Blueprint('reports', __name__)
 
 
+def _report_totals(query, transactions, currency):
+    """
+    (income, expense) of a report in `currency`. Live rows are converted
+    and summed in SQL under the report's filters; archived rows, already
+    decoded for the listing, are converted from the cached rates.
+    """
+    conversion = Conversion(Transaction.amount, Transaction.currency, Transaction.date, currency)
+    totals = dict(conversion.join(query.with_entities(Transaction.transaction_type, func.sum(conversion.amount)))
+                  .group_by(Transaction.transaction_type).all())
+    for row in transactions:
+        if isinstance(row, ArchivedTransaction):
+            totals[row.transaction_type] = (totals.get(row.transaction_type) or 0.0) + \
+                convert(row.amount, row.currency, currency, row.date)
+    return totals.get('income') or 0.0, totals.get('expense') or 0.0
+
+
 @reports_bp.route('/reports')
 @login_required
+@conditional_get()
 def index():
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
     category = request.args.get('category')
     transaction_type = request.args.get('transaction_type')
+    tags = request.args.get('tags', '').strip()
     
     query = Transaction.query.filter_by(user_id=current_user.id)
+    # The same filters for rows in the cold archive
+    archive_filters = {'start_date': None, 'end_date': None, 'category': None, 'transaction_type': None,
+                       'tags': None}
     
     if start_date:
         try:
             start_date_obj = datetime.strptime(start_date, '%Y-%m-%d').date()
             query = query.filter(Transaction.date >= start_date_obj)
+            archive_filters['start_date'] = start_date_obj
         except ValueError:
             flash('Invalid start date format.', 'danger')
     
@@ -31,80 +63,109 @@ def index():
         try:
             end_date_obj = datetime.strptime(end_date, '%Y-%m-%d').date()
             query = query.filter(Transaction.date <= end_date_obj)
+            archive_filters['end_date'] = end_date_obj
         except ValueError:
             flash('Invalid end date format.', 'danger')
     
     if category and category != 'all':
         query = query.filter(Transaction.category == category)
+        archive_filters['category'] = category
     
     if transaction_type and transaction_type != 'all':
         query = query.filter(Transaction.transaction_type == transaction_type)
+        archive_filters['transaction_type'] = transaction_type
     
-    transactions = query.order_by(Transaction.date.desc()).all()
-    
-    total_income = sum(t.amount for t in transactions if t.transaction_type == 'income')
-    total_expense = sum(t.amount for t in transactions if t.transaction_type == 'expense')
-    
-    all_categories = db.session.query(Transaction.category).filter(
-        Transaction.user_id == current_user.id
-    ).distinct().all()
-    categories_list = [cat[0] for cat in all_categories]
+    if tags:
+        try:
+            archive_filters['tags'] = parse_tag_expression(tags)
+        except TagError as e:
+            flash(str(e), 'danger')
+    
+    user_id = current_user.id
+    currency = current_user.base_currency
+    
+    # Deferred: sections served from the fragment cache skip their queries.
+    def load_report():
+        report_query = query
+        if archive_filters['tags'] is not None:
+            report_query = query.filter(tag_condition(user_id, archive_filters['tags'],
+                                                      archive_filters['start_date'], archive_filters['end_date']))
+        transactions = list(with_archived(
+            user_id, report_query.order_by(Transaction.date.desc(), Transaction.id.desc()).all(), archive_filters
+        ))
+        total_income, total_expense = _report_totals(report_query, transactions, currency)
+        return {
+            'transactions': transactions,
+            'tags': tags_by_transaction([row.id for row in transactions if not isinstance(row, ArchivedTransaction)]),
+            'currency': currency,
+            'total_income': total_income,
+            'total_expense': total_expense,
+            'balance': total_income - total_expense
+        }
+    
+    def load_categories():
+        all_categories = db.session.query(Transaction.category).filter(
+            Transaction.user_id == user_id
+        ).union(
+            db.session.query(TransactionRollup.category).filter(TransactionRollup.user_id == user_id)
+        ).all()
+        return [cat[0] for cat in all_categories]
     
     return render_template('reports.html',
-                         transactions=transactions,
-                         total_income=total_income,
-                         total_expense=total_expense,
-                         balance=total_income - total_expense,
-                         categories=categories_list,
+                         report=Deferred(load_report),
+                         categories=Deferred(load_categories),
                          filters={
                              'start_date': start_date,
                              'end_date': end_date,
                              'category': category,
-                             'transaction_type': transaction_type
+                             'transaction_type': transaction_type,
+                             'tags': tags
                          })
 
 
+@reports_bp.route('/reports/compare')
+@login_required
+@conditional_get()
+def compare():
+    form = {
+        'period': request.args.get('period', ''),
+        'against': request.args.get('against', 'last_year'),
+        'kind': request.args.get('kind', 'month'),
+        'fiscal_start': request.args.get('fiscal_start', '')
+    }
+    
+    try:
+        current, baseline = resolve_periods(form['period'], form['against'], form['kind'],
+                                            parse_fiscal_start(form['fiscal_start']))
+    except PeriodError as e:
+        flash(str(e), 'danger')
+        current, baseline = resolve_periods()
+    
+    return render_template('compare.html',
+                         comparison=compare_periods(current_user.id, current, baseline),
+                         form=form,
+                         kinds=PERIOD_KINDS,
+                         baselines=BASELINES)
+
+
 @reports_bp.route('/reports/export')
 @login_required
 def export_csv():
-    start_date = request.args.get('start_date')
-    end_date = request.args.get('end_date')
-    category = request.args.get('category')
-    transaction_type = request.args.get('transaction_type')
-    
-    query = Transaction.query.filter_by(user_id=current_user.id)
-    
-    start_date_obj = None
-    end_date_obj = None
-    
-    if start_date:
-        try:
-            start_date_obj = datetime.strptime(start_date, '%Y-%m-%d').date()
-            query = query.filter(Transaction.date >= start_date_obj)
-        except ValueError:
-            flash('Invalid start date format.', 'danger')
-            return redirect(url_for('reports.index'))
-    
-    if end_date:
-        try:
-            end_date_obj = datetime.strptime(end_date, '%Y-%m-%d').date()
-            query = query.filter(Transaction.date <= end_date_obj)
-        except ValueError:
-            flash('Invalid end date format.', 'danger')
-            return redirect(url_for('reports.index'))
-    
-    if category and category != 'all':
-        query = query.filter(Transaction.category == category)
-    
-    if transaction_type and transaction_type != 'all':
-        query = query.filter(Transaction.transaction_type == transaction_type)
+    try:
+        filters = parse_filters(request.args)
+    except ValueError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('reports.index'))
     
-    transactions = query.order_by(Transaction.date.desc()).all()
+    query = Transaction.query.filter_by(user_id=current_user.id).filter(*filter_conditions(filters, current_user.id))
+    transactions = list(with_archived(
+        current_user.id, query.order_by(Transaction.date.desc(), Transaction.id.desc()).all(), filters
+    ))
     
     output = io.StringIO()
     writer = csv.writer(output)
     
-    writer.writerow(['Date', 'Category', 'Description', 'Type', 'Amount'])
+    writer.writerow(['Date', 'Category', 'Description', 'Type', 'Amount', 'Currency'])
     
     for transaction in transactions:
         writer.writerow([
@@ -112,16 +173,17 @@ def export_csv():
             transaction.category,
             transaction.description or '',
             transaction.transaction_type.capitalize(),
-            f'{transaction.amount:.2f}'
+            f'{transaction.amount:.2f}',
+            transaction.currency
         ])
     
+    currency = current_user.base_currency
+    total_income, total_expense = _report_totals(query, transactions, currency)
     writer.writerow([])
     writer.writerow(['Summary'])
-    total_income = sum(t.amount for t in transactions if t.transaction_type == 'income')
-    total_expense = sum(t.amount for t in transactions if t.transaction_type == 'expense')
-    writer.writerow(['Total Income', f'{total_income:.2f}'])
-    writer.writerow(['Total Expenses', f'{total_expense:.2f}'])
-    writer.writerow(['Balance', f'{total_income - total_expense:.2f}'])
+    writer.writerow(['Total Income', f'{total_income:.2f}', currency])
+    writer.writerow(['Total Expenses', f'{total_expense:.2f}', currency])
+    writer.writerow(['Balance', f'{total_income - total_expense:.2f}', currency])
     
     output.seek(0)
     
@@ -130,3 +192,31 @@ def export_csv():
     response.headers['Content-Type'] = 'text/csv'
     
     return response
+
+
+@reports_bp.route('/reports/export/<fmt>')
+@login_required
+def export_data(fmt):
+    if fmt not in EXPORT_FORMATS:
+        flash(f'Unknown export format: {fmt}.', 'danger')
+        return redirect(url_for('reports.index'))
+    
+    if not format_available(fmt):
+        flash(f'{fmt.capitalize()} export requires pyarrow, which is not installed.', 'danger')
+        return redirect(url_for('reports.index'))
+    
+    try:
+        filters = parse_filters(request.args)
+    except ValueError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('reports.index'))
+    
+    mimetype, extension, _ = EXPORT_FORMATS[fmt]
+    statement = export_statement(current_user.id, filter_conditions(filters, current_user.id))
+    years = archived_years(current_user.id, filters)
+    archived = archived_transactions(current_user.id, filters, years) if years else None
+    
+    response = Response(stream_with_context(export_chunks(fmt, statement, archived=archived)), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=transactions_report.{extension}'
+    
+    return response
@@ -0,0 +1,74 @@
+from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask_login import login_required, current_user
+from models import db
+from models.category_rule import CategoryRule
+from services.categorization_rules import RuleError, create_rule, get_rules, reapply_rules
+
+rules_bp = Blueprint('rules', __name__)
+
+
+def _own_rule(rule_id):
+    rule = CategoryRule.query.get_or_404(rule_id)
+    
+    if rule.user_id != current_user.id:
+        flash('You do not have permission to change this rule.', 'danger')
+        return None
+    
+    return rule
+
+
+@rules_bp.route('/rules')
+@login_required
+def index():
+    return render_template('rules.html', rules=get_rules(current_user.id))
+
+
+@rules_bp.route('/rules/add', methods=['POST'])
+@login_required
+def add_rule():
+    try:
+        create_rule(current_user.id, request.form)
+    except RuleError as e:
+        flash(str(e), 'danger')
+        return render_template('rules.html', rules=get_rules(current_user.id))
+    
+    db.session.commit()
+    
+    flash('Rule added. It applies to new transactions from now on.', 'success')
+    return redirect(url_for('rules.index'))
+
+
+@rules_bp.route('/rules/toggle/<int:rule_id>', methods=['POST'])
+@login_required
+def toggle_rule(rule_id):
+    rule = _own_rule(rule_id)
+    
+    if rule is not None:
+        rule.is_active = not rule.is_active
+        db.session.commit()
+        flash(f"Rule {'enabled' if rule.is_active else 'disabled'}.", 'success')
+    
+    return redirect(url_for('rules.index'))
+
+
+@rules_bp.route('/rules/delete/<int:rule_id>', methods=['POST'])
+@login_required
+def delete_rule(rule_id):
+    rule = _own_rule(rule_id)
+    
+    if rule is not None:
+        db.session.delete(rule)
+        db.session.commit()
+        flash('Rule deleted successfully!', 'success')
+    
+    return redirect(url_for('rules.index'))
+
+
+@rules_bp.route('/rules/apply', methods=['POST'])
+@login_required
+def apply_rules_to_history():
+    counts = reapply_rules(current_user.id)
+    
+    flash(f"Checked {counts['checked']} transactions: {counts['matched']} matched a rule, "
+          f"{counts['recategorized']} recategorized.", 'success')
+    return redirect(url_for('rules.index'))
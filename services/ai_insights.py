@@ -1,36 +1,51 @@
-import os
+import asyncio
+import json
 from models import db
+from models.insight_snapshot import InsightSnapshot
 from models.transaction import Transaction
-
-from sqlalchemy import func, extract
+from services.anomaly_detection import recent_flags_statement
+from services.archive import history_subquery
+from services.async_db import fetch_all, gather_queries
+from services.currency import Conversion, base_currency, format_money, rates_version, rates_version_async
+from services.http_cache import get_data_version, get_data_version_async, mark_degraded
+from services.llm import fit_prompt, get_scheduler
+
+from sqlalchemy import func, extract, select
 from datetime import date, timedelta
 from calendar import month_name
 
-import google.generativeai as genai
+# Seconds a page view waits for its summary; a late answer is still kept
+# by the scheduler for the next view with the same prompt.
+SUMMARY_WAIT = 10
+TOP_CATEGORIES = 5
 
 
 # ---------------------------------------------
-# GEMINI API SETUP
+# GEMINI API (through the shared scheduler in services.llm)
 # ---------------------------------------------
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-
-
 def generate_gemini_summary(prompt):
     """Generate an AI summary using Gemini API"""
     try:
-        model = genai.GenerativeModel("gemini-1.5-flash")
-        response = model.generate_content(prompt)
-        return response.text.strip()
+        return get_scheduler().generate(prompt, timeout=SUMMARY_WAIT)
+    except Exception as e:
+        return f"AI Error: {str(e) or type(e).__name__}"
+
+
+async def generate_gemini_summary_async(prompt):
+    """generate_gemini_summary without blocking the event loop"""
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(get_scheduler().submit(prompt)), SUMMARY_WAIT)
     except Exception as e:
-        return f"AI Error: {str(e)}"
+        return f"AI Error: {str(e) or type(e).__name__}"
 
 
 # ---------------------------------------------
 # ANALYTICS HELPERS
 # ---------------------------------------------
-def get_spending_trend(user_id, months=3):
-    today = date.today()
-    monthly_spending = []
+def _trend_windows(months, today=None):
+    """(start_of_month, next_month) of the calendar month 30*i days ago, oldest first."""
+    today = today or date.today()
+    windows = []
 
     for i in range(months, 0, -1):
         month_ago = today - timedelta(days=30 * i)
@@ -42,15 +57,23 @@ def get_spending_trend(user_id, months=3):
         else:
             next_month = date(month_ago.year, month_ago.month + 1, 1)
 
-        spent = db.session.query(func.sum(Transaction.amount)).filter(
-            Transaction.user_id == user_id,
-            Transaction.transaction_type == "expense",
-            Transaction.date >= start_of_month,
-            Transaction.date < next_month
-        ).scalar() or 0.0
+        windows.append((start_of_month, next_month))
+
+    return windows
+
+
+def _trend_statements(user_id, months, currency=None):
+    currency = currency or base_currency(user_id)
+    conversion = Conversion(Transaction.amount, Transaction.currency, Transaction.date, currency)
+    return [conversion.join(select(func.sum(conversion.amount)).select_from(Transaction)).where(
+        Transaction.user_id == user_id,
+        Transaction.transaction_type == "expense",
+        Transaction.date >= start_of_month,
+        Transaction.date < next_month
+    ) for start_of_month, next_month in _trend_windows(months)]
 
-        monthly_spending.append(spent)
 
+def _trend_from_totals(monthly_spending):
     if len(monthly_spending) >= 2:
         trend = monthly_spending[-1] - monthly_spending[-2]
         return trend, monthly_spending[-1]
@@ -58,6 +81,12 @@ def get_spending_trend(user_id, months=3):
     return 0, monthly_spending[-1] if monthly_spending else 0
 
 
+def get_spending_trend(user_id, months=3):
+    monthly_spending = [db.session.execute(statement).scalar() or 0.0
+                        for statement in _trend_statements(user_id, months)]
+    return _trend_from_totals(monthly_spending)
+
+
 def get_savings_recommendation(user_id, total_income, total_expense):
     if total_income <= 0:
         return None
@@ -74,18 +103,15 @@ def get_savings_recommendation(user_id, total_income, total_expense):
         return f"Amazing! {savings_rate:.1f}% savings rate. Keep it up!"
 
 
-def analyze_seasonal_spending(user_id):
-    today = date.today()
-    current_month = today.month
+def _seasonal_statement(user_id, expenses=None):
+    expenses = expenses if expenses is not None else history_subquery(user_id, base_currency(user_id), "expense")
+    return select(
+        extract("month", expenses.c.date).label("month"),
+        func.sum(expenses.c.amount).label("total")
+    ).group_by(extract("month", expenses.c.date))
 
-    all_months = db.session.query(
-        extract("month", Transaction.date).label("month"),
-        func.sum(Transaction.amount).label("total")
-    ).filter(
-        Transaction.user_id == user_id,
-        Transaction.transaction_type == "expense"
-    ).group_by(extract("month", Transaction.date)).all()
 
+def _seasonal_from_rows(all_months):
     if not all_months or len(all_months) < 2:
         return None
 
@@ -102,22 +128,47 @@ def analyze_seasonal_spending(user_id):
     }
 
 
+def analyze_seasonal_spending(user_id):
+    return _seasonal_from_rows(db.session.execute(_seasonal_statement(user_id)).all())
+
+
 # ---------------------------------------------
 # MAIN INSIGHTS FUNCTION
 # ---------------------------------------------
-def get_ai_insights(user_id):
+def _insight_statements(user_id):
+    """
+    Every query the insights need, by name; none depends on another. The
+    all-time figures read archived rollups as well as live transactions,
+    and every amount is converted to the user's base currency.
+    """
+    currency = base_currency(user_id)
+    income = history_subquery(user_id, currency, "income")
+    expenses = history_subquery(user_id, currency, "expense")
+    history = history_subquery(user_id, currency)
+    statements = {
+        "total_income": select(func.sum(income.c.amount)),
+        "total_expense": select(func.sum(expenses.c.amount)),
+        "categories": select(
+            expenses.c.category,
+            func.sum(expenses.c.amount)
+        ).group_by(expenses.c.category).order_by(func.sum(expenses.c.amount).desc()),
+        "transaction_count": select(func.coalesce(func.sum(history.c.count), 0)),
+        "seasonal": _seasonal_statement(user_id, expenses),
+        "flags": recent_flags_statement(user_id, limit=3),
+    }
+    for i, statement in enumerate(_trend_statements(user_id, 3, currency)):
+        statements[f"trend_{i}"] = statement
+    return statements
+
+
+def _build_insights(user_id, results, currency=None):
+    """(insights, Gemini prompt) from the rows of each of _insight_statements."""
     insights = []
+    currency = currency or base_currency(user_id)
 
     # Income / Expense summary
-    total_income = db.session.query(func.sum(Transaction.amount)).filter(
-        Transaction.user_id == user_id,
-        Transaction.transaction_type == "income"
-    ).scalar() or 0.0
-
-    total_expense = db.session.query(func.sum(Transaction.amount)).filter(
-        Transaction.user_id == user_id,
-        Transaction.transaction_type == "expense"
-    ).scalar() or 0.0
+    total_income = results["total_income"][0][0] or 0.0
+    total_expense = results["total_expense"][0][0] or 0.0
 
     # High spending
     if total_expense > total_income:
@@ -131,29 +182,23 @@ def get_ai_insights(user_id):
         rate = (savings / total_income * 100) if total_income > 0 else 0
         insights.append({
             "type": "success",
-            "message": f"You saved ₹{savings:.2f} ({rate:.1f}% of income).",
+            "message": f"You saved {format_money(savings, currency)} ({rate:.1f}% of income).",
             "icon": "💰"
         })
 
     # Top category
-    category_data = db.session.query(
-        Transaction.category,
-        func.sum(Transaction.amount)
-    ).filter(
-        Transaction.user_id == user_id,
-        Transaction.transaction_type == "expense"
-    ).group_by(Transaction.category).order_by(func.sum(Transaction.amount).desc()).all()
+    category_data = results["categories"]
 
     if category_data:
         top_category = category_data[0]
         insights.append({
             "type": "info",
-            "message": f"Top spending category: {top_category[0]} (₹{top_category[1]:.2f}).",
+            "message": f"Top spending category: {top_category[0]} ({format_money(top_category[1], currency)}).",
             "icon": "📊"
         })
 
     # Few transactions → beginner user
-    transaction_count = Transaction.query.filter_by(user_id=user_id).count()
+    transaction_count = results["transaction_count"][0][0]
     if transaction_count < 5:
         insights.append({
             "type": "info",
@@ -178,18 +223,20 @@ def get_ai_insights(user_id):
             })
 
     # Trend analysis
-    trend, current_month_spending = get_spending_trend(user_id)
+    trend, current_month_spending = _trend_from_totals(
+        [results[f"trend_{i}"][0][0] or 0.0 for i in range(3)]
+    )
     if abs(trend) > 50:
         if trend > 0:
             insights.append({
                 "type": "warning",
-                "message": f"Your spending increased by ₹{trend:.2f} from last month.",
+                "message": f"Your spending increased by {format_money(trend, currency)} from last month.",
                 "icon": "📈"
             })
         else:
             insights.append({
                 "type": "success",
-                "message": f"You reduced spending by ₹{abs(trend):.2f} since last month!",
+                "message": f"You reduced spending by {format_money(abs(trend), currency)} since last month!",
                 "icon": "📉"
             })
 
@@ -203,32 +250,41 @@ def get_ai_insights(user_id):
         })
 
     # Seasonal pattern
-    seasonal_data = analyze_seasonal_spending(user_id)
+    seasonal_data = _seasonal_from_rows(results["seasonal"])
     if seasonal_data:
         insights.append({
             "type": "info",
-            "message": f"Highest spending: {seasonal_data['highest_month']} (₹{seasonal_data['highest_amount']:.2f}), lowest: {seasonal_data['lowest_month']} (₹{seasonal_data['lowest_amount']:.2f}).",
+            "message": f"Highest spending: {seasonal_data['highest_month']} ({format_money(seasonal_data['highest_amount'], currency)}), lowest: {seasonal_data['lowest_month']} ({format_money(seasonal_data['lowest_amount'], currency)}).",
             "icon": "📅"
         })
 
+    # Unusual transactions (flagged as they were recorded)
+    for flag in results["flags"]:
+        insights.append({
+            "type": "anomaly",
+            "message": f"Unusual transaction on {flag.date.strftime('%d %b')}: {flag.message}",
+            "icon": "🚨"
+        })
+
     # ---------------------------------------------
     # GEMINI AI SUMMARY (Main AI Assistant Output)
     # ---------------------------------------------
-    prompt = f"""
-You are SmartFinanceAI, an expert financial assistant.
-
-Based on this user's monthly data:
-
-Income: ₹{total_income}
-Expenses: ₹{total_expense}
-Top categories: {category_data}
-User insights: {', '.join([i['message'] for i in insights])}
-
-Create a short, helpful financial advice summary in 2–3 sentences.
-"""
-
-    ai_summary = generate_gemini_summary(prompt)
-
+    # Trimmed to LLM_PROMPT_TOKENS: the figures first, then as many insights as fit.
+    top_categories = '; '.join(f"{category} {format_money(amount, currency)}"
+                               for category, amount in category_data[:TOP_CATEGORIES])
+    prompt = fit_prompt(
+        "You are SmartFinanceAI, an expert financial assistant. "
+        "Create a short, helpful financial advice summary in 2–3 sentences from this user's data.",
+        [f"Income: {format_money(total_income, currency)}",
+         f"Expenses: {format_money(total_expense, currency)}",
+         f"Top categories: {top_categories or 'none'}"]
+        + [f"- {i['message']}" for i in insights]
+    )
+
+    return insights, prompt
+
+
+def _add_ai_summary(insights, ai_summary):
     if ai_summary and not ai_summary.startswith("AI Error"):
         insights.append({
             "type": "info",
@@ -241,5 +297,62 @@ Create a short, helpful financial advice summary in 2–3 sentences.
             "message": "AI assistant is temporarily unavailable.",
             "icon": "⚠️"
         })
+        # A later request may get a summary, so caches must not keep this one
+        mark_degraded()
+
+
+# ---------------------------------------------
+# PRECOMPUTED INSIGHTS (written by services.insight_batch)
+# ---------------------------------------------
+def _snapshot_statement(user_id):
+    return select(
+        InsightSnapshot.data_version, InsightSnapshot.computed_on, InsightSnapshot.currency,
+        InsightSnapshot.rates_version, InsightSnapshot.insights, InsightSnapshot.prompt, InsightSnapshot.summary
+    ).where(InsightSnapshot.user_id == user_id)
+
+
+def _fresh_snapshot(row, version, currency, rates):
+    """
+    (insights, prompt, AI summary or None) of a snapshot computed today from
+    the user's current data, base currency and rates; None when there is
+    none or it is stale.
+    """
+    if row is None:
+        return None
+    if (row.data_version, row.computed_on, row.currency, row.rates_version) != (version, date.today(), currency, rates):
+        return None
+    return json.loads(row.insights), row.prompt, row.summary
+
+
+def precomputed_insights(user_id):
+    version, _ = get_data_version(user_id)
+    row = db.session.execute(_snapshot_statement(user_id)).first()
+    return _fresh_snapshot(row, version, base_currency(user_id), rates_version())
+
+
+async def precomputed_insights_async(user_id):
+    version, _ = await get_data_version_async(user_id)
+    rows = await fetch_all(_snapshot_statement(user_id))
+    return _fresh_snapshot(rows[0] if rows else None, version, base_currency(user_id), await rates_version_async())
+
+
+def get_ai_insights(user_id):
+    """The dashboard insights: the nightly snapshot while it is current, else computed live."""
+    snapshot = precomputed_insights(user_id)
+    if snapshot is None:
+        results = {name: db.session.execute(statement).all()
+                   for name, statement in _insight_statements(user_id).items()}
+        snapshot = _build_insights(user_id, results) + (None,)
+    insights, prompt, summary = snapshot
+    _add_ai_summary(insights, summary or generate_gemini_summary(prompt))
+    return insights
+
 
+async def get_ai_insights_async(user_id):
+    """get_ai_insights with the queries run concurrently and the Gemini call awaited."""
+    snapshot = await precomputed_insights_async(user_id)
+    if snapshot is None:
+        snapshot = _build_insights(user_id, await gather_queries(_insight_statements(user_id))) + (None,)
+    insights, prompt, summary = snapshot
+    _add_ai_summary(insights, summary or await generate_gemini_summary_async(prompt))
     return insights
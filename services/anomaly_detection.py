@@ -0,0 +1,362 @@
+import math
+import re
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import bindparam, delete, func, select, update
+
+from models import db
+from models.transaction import Transaction
+from models.category_stat import CategoryStat
+from models.known_merchant import KnownMerchant
+from models.transaction_flag import TransactionFlag
+from services.async_db import fetch_all
+from services.batching import chunks
+from services.change_feed import changes_recorded, INSERT, DELETE
+from services.currency import convert, format_money
+from services.upserts import conflict_insert
+
+
+# Weight of the newest amount in the running mean / variance
+EW_ALPHA = 0.1
+# Flag an expense this many standard deviations above its category mean
+OUTLIER_SIGMA = 3.0
+# Expenses a category needs before anything in it is flagged
+MIN_HISTORY = 5
+# Floor for the standard deviation, as a fraction of the mean, so a
+# category of identical amounts (rent, subscriptions) is not all outliers
+MIN_SPREAD = 0.05
+# Flags on transactions dated within this many days are shown as insights
+RECENT_DAYS = 30
+
+AMOUNT_OUTLIER = 'amount_outlier'
+NEW_MERCHANT = 'new_merchant'
+
+_ExpenseRow = namedtuple('_ExpenseRow', 'id user_id category amount currency date description')
+
+# Payment-rail noise that often leads a bank description
+_NOISE_WORDS = {'upi', 'pos', 'neft', 'imps', 'rtgs', 'ach', 'nach', 'ecom', 'dr', 'cr',
+                'to', 'at', 'by', 'from', 'payment', 'purchase', 'txn', 'ref'}
+
+
+# ---------------------------------------------
+# STATISTICS
+# ---------------------------------------------
+def merchant_key(description):
+    """First meaningful word of a description ("UPI/Swiggy order #12" -> "swiggy"), or None."""
+    for word in re.findall(r'[a-z][a-z&\']+', (description or '').lower()):
+        if word not in _NOISE_WORDS:
+            return word[:100]
+    return None
+
+
+def ew_update(count, mean, variance, amount, alpha=EW_ALPHA):
+    """
+    Fold one amount into an exponentially weighted mean and variance.
+    The first few amounts are weighted 1/n, so early estimates are plain
+    averages rather than dominated by the first value.
+    """
+    if count == 0:
+        return 1, amount, 0.0
+    weight = max(alpha, 1.0 / (count + 1))
+    diff = amount - mean
+    increment = weight * diff
+    return count + 1, mean + increment, (1 - weight) * (variance + diff * increment)
+
+
+def outlier_score(count, mean, variance, amount):
+    """How many standard deviations `amount` is above the mean, or None without enough history."""
+    if count < MIN_HISTORY or mean <= 0:
+        return None
+    spread = max(math.sqrt(variance), MIN_SPREAD * mean)
+    return (amount - mean) / spread
+
+
+# ---------------------------------------------
+# SCORING (runs inside the writing transaction)
+# ---------------------------------------------
+def _expense_rows(session, transaction_ids):
+    """(id, user_id, category, amount, currency, date, description) of the expenses among `transaction_ids`."""
+    rows = []
+    missing = []
+    # Rows written through the ORM are still in the session; only Core inserts need a query.
+    for transaction_id in transaction_ids:
+        obj = session.identity_map.get(session.identity_key(Transaction, transaction_id))
+        if obj is None:
+            missing.append(transaction_id)
+        elif obj.transaction_type == 'expense':
+            rows.append((obj.id, obj.user_id, obj.category, obj.amount, obj.currency, obj.date, obj.description))
+
+    for chunk in chunks(missing):
+        rows.extend(session.connection().execute(
+            select(Transaction.id, Transaction.user_id, Transaction.category, Transaction.amount,
+                   Transaction.currency, Transaction.date, Transaction.description).where(
+                Transaction.id.in_(chunk),
+                Transaction.transaction_type == 'expense'
+            )
+        ).all())
+    rows.sort(key=lambda row: row[0])
+    return [_ExpenseRow(*row) for row in rows]
+
+
+def _load_state(connection, user_ids, categories, merchants):
+    stats = {
+        (row.user_id, row.category): (row.count, row.mean, row.variance)
+        for row in connection.execute(
+            select(CategoryStat.user_id, CategoryStat.category, CategoryStat.count,
+                   CategoryStat.mean, CategoryStat.variance).where(
+                CategoryStat.user_id.in_(user_ids),
+                CategoryStat.category.in_(categories)
+            )
+        )
+    }
+    known = set()
+    for chunk in chunks(merchants):
+        known.update(connection.execute(
+            select(KnownMerchant.user_id, KnownMerchant.merchant).where(
+                KnownMerchant.user_id.in_(user_ids),
+                KnownMerchant.merchant.in_(chunk)
+            )
+        ).all())
+    return stats, known
+
+
+def _base_currencies(connection, user_ids):
+    from models.user import User   # models.user imports the services package
+    return dict(connection.execute(select(User.id, User.base_currency).where(User.id.in_(user_ids))).all())
+
+
+def _warm_start(connection, user_ids, first_ids, stats, known, bases):
+    """
+    Replay the earlier expenses of users who have no statistics yet (users
+    from before the detector existed), so their history is not flagged
+    piecemeal as it recurs. Runs once per user.
+    """
+    started = {user_id for user_id, _ in stats}
+    unknown = [user_id for user_id in user_ids if user_id not in started]
+    if not unknown:
+        return set(), set()
+    started.update(connection.execute(
+        select(CategoryStat.user_id).where(CategoryStat.user_id.in_(unknown)).distinct()
+    ).scalars())
+
+    replayed_stats = {}
+    replayed_merchants = set()
+    for user_id in user_ids:
+        if user_id in started:
+            continue
+        history = connection.execute(
+            select(Transaction.category, Transaction.amount, Transaction.currency, Transaction.date,
+                   Transaction.description).where(
+                Transaction.user_id == user_id,
+                Transaction.transaction_type == 'expense',
+                Transaction.id < first_ids[user_id]
+            ).order_by(Transaction.date, Transaction.id)
+        )
+        for category, amount, currency, day, description in history:
+            key = (user_id, category)
+            amount = convert(amount, currency, bases.get(user_id, currency), day)
+            replayed_stats[key] = ew_update(*replayed_stats.get(key, (0, 0.0, 0.0)), amount)
+            merchant = merchant_key(description)
+            if merchant:
+                replayed_merchants.add((user_id, merchant))
+
+    stats.update(replayed_stats)
+    known.update(replayed_merchants)
+    return set(replayed_stats), replayed_merchants
+
+
+def score_transactions(session, transaction_ids):
+    """
+    Update the running per-category statistics with newly inserted
+    expenses and flag the unusual ones: amounts more than OUTLIER_SIGMA
+    standard deviations above the category mean, and first-ever merchants
+    in a category with an established history. Amounts are compared in
+    the user's base currency. Each expense costs O(1) work against state
+    loaded once per batch.
+    """
+    rows = _expense_rows(session, transaction_ids)
+    if not rows:
+        return []
+
+    connection = session.connection()
+
+    user_ids = sorted({row.user_id for row in rows})
+    first_ids = {}
+    for row in rows:
+        first_ids.setdefault(row.user_id, row.id)
+
+    merchants = {row.id: merchant_key(row.description) for row in rows}
+    stats, known = _load_state(
+        connection, user_ids, {row.category for row in rows}, {m for m in merchants.values() if m}
+    )
+    stored_stats = set(stats)
+    bases = _base_currencies(connection, user_ids)
+    new_stats, new_merchants = _warm_start(connection, user_ids, first_ids, stats, known, bases)
+
+    flags = []
+    now = datetime.utcnow()
+    for row in rows:
+        key = (row.user_id, row.category)
+        count, mean, variance = stats.get(key, (0, 0.0, 0.0))
+        base = bases.get(row.user_id, row.currency)
+        amount = convert(row.amount, row.currency, base, row.date)
+
+        score = outlier_score(count, mean, variance, amount)
+        if score is not None and score > OUTLIER_SIGMA:
+            flags.append({
+                'transaction_id': row.id,
+                'user_id': row.user_id,
+                'kind': AMOUNT_OUTLIER,
+                'score': round(score, 2),
+                'message': f"{format_money(row.amount, row.currency)} on {row.category}, "
+                           f"{amount / mean:.1f}× your usual {format_money(mean, base)}.",
+                'created_at': now
+            })
+
+        merchant = merchants[row.id]
+        if merchant and (row.user_id, merchant) not in known:
+            if count >= MIN_HISTORY:
+                flags.append({
+                    'transaction_id': row.id,
+                    'user_id': row.user_id,
+                    'kind': NEW_MERCHANT,
+                    'score': None,
+                    'message': f"First payment to {merchant.title()} "
+                               f"({format_money(row.amount, row.currency)}, {row.category}).",
+                    'created_at': now
+                })
+            known.add((row.user_id, merchant))
+            new_merchants.add((row.user_id, merchant))
+
+        stats[key] = ew_update(count, mean, variance, amount)
+        new_stats.add(key)
+
+    _store_state(connection, stats, new_stats, stored_stats, new_merchants, now)
+    if flags:
+        table = TransactionFlag.__table__
+        connection.execute(conflict_insert(connection, table).on_conflict_do_nothing(
+            index_elements=[table.c.transaction_id, table.c.kind]
+        ), flags)
+    return flags
+
+
+def _store_state(connection, stats, changed, stored, merchants, now):
+    """
+    Write back the statistics and merchants a batch changed. Another batch
+    for the same user may create the same rows first: its statistics are
+    replaced by this batch's, and known merchants are kept as they are.
+    """
+    updates = [{
+        'b_user_id': user_id, 'b_category': category,
+        'count': stats[(user_id, category)][0],
+        'mean': stats[(user_id, category)][1],
+        'variance': stats[(user_id, category)][2],
+        'updated_at': now
+    } for user_id, category in changed if (user_id, category) in stored]
+    inserts = [{
+        'user_id': user_id, 'category': category,
+        'count': stats[(user_id, category)][0],
+        'mean': stats[(user_id, category)][1],
+        'variance': stats[(user_id, category)][2],
+        'updated_at': now
+    } for user_id, category in changed if (user_id, category) not in stored]
+
+    table = CategoryStat.__table__
+    if updates:
+        connection.execute(
+            update(table).where(
+                table.c.user_id == bindparam('b_user_id'),
+                table.c.category == bindparam('b_category')
+            ),
+            updates
+        )
+    if inserts:
+        statement = conflict_insert(connection, table)
+        connection.execute(statement.on_conflict_do_update(
+            index_elements=[table.c.user_id, table.c.category],
+            set_={name: statement.excluded[name] for name in ('count', 'mean', 'variance', 'updated_at')}
+        ), inserts)
+    if merchants:
+        table = KnownMerchant.__table__
+        connection.execute(conflict_insert(connection, table).on_conflict_do_nothing(
+            index_elements=[table.c.user_id, table.c.merchant]
+        ), [{'user_id': user_id, 'merchant': merchant, 'first_seen': now} for user_id, merchant in merchants])
+
+
+@changes_recorded.connect
+def _on_changes_recorded(session, changes):
+    inserted = [entity_id for _, entity, entity_id, operation in changes
+                if entity == 'transaction' and operation == INSERT]
+    deleted = [entity_id for _, entity, entity_id, operation in changes
+               if entity == 'transaction' and operation == DELETE]
+
+    for chunk in chunks(deleted):
+        session.connection().execute(delete(TransactionFlag.__table__).where(TransactionFlag.transaction_id.in_(chunk)))
+    if inserted:
+        score_transactions(session, inserted)
+
+
+# ---------------------------------------------
+# READING
+# ---------------------------------------------
+def recent_flags_statement(user_id, days=RECENT_DAYS, limit=5):
+    since = date.today() - timedelta(days=days)
+    return select(TransactionFlag.transaction_id, TransactionFlag.kind, TransactionFlag.message, Transaction.date).join(
+        Transaction, Transaction.id == TransactionFlag.transaction_id
+    ).where(
+        TransactionFlag.user_id == user_id,
+        Transaction.date >= since
+    ).order_by(Transaction.date.desc(), TransactionFlag.id.desc()).limit(limit)
+
+
+def recent_flags_by_user_statement(first_id, end_id, days=RECENT_DAYS, limit=5):
+    """recent_flags_statement for every user with first_id <= id < end_id, with a user_id column."""
+    since = date.today() - timedelta(days=days)
+    ranked = select(
+        TransactionFlag.user_id, TransactionFlag.transaction_id, TransactionFlag.kind, TransactionFlag.message,
+        Transaction.date,
+        func.row_number().over(
+            partition_by=TransactionFlag.user_id, order_by=(Transaction.date.desc(), TransactionFlag.id.desc())
+        ).label('rank')
+    ).join(
+        Transaction, Transaction.id == TransactionFlag.transaction_id
+    ).where(
+        TransactionFlag.user_id >= first_id,
+        TransactionFlag.user_id < end_id,
+        Transaction.date >= since
+    ).subquery()
+    return select(ranked.c.user_id, ranked.c.transaction_id, ranked.c.kind, ranked.c.message, ranked.c.date).where(
+        ranked.c.rank <= limit
+    ).order_by(ranked.c.user_id, ranked.c.rank)
+
+
+def get_recent_flags(user_id, days=RECENT_DAYS, limit=5):
+    """Flags on the user's transactions dated in the last `days` days, newest first."""
+    return db.session.execute(recent_flags_statement(user_id, days, limit)).all()
+
+
+def _flags_statement(transaction_ids):
+    return select(TransactionFlag.transaction_id, TransactionFlag.message).where(
+        TransactionFlag.transaction_id.in_(transaction_ids)
+    ).order_by(TransactionFlag.id)
+
+
+def _group_flags(rows):
+    flags = {}
+    for transaction_id, message in rows:
+        flags.setdefault(transaction_id, []).append(message)
+    return flags
+
+
+def flags_by_transaction(transaction_ids):
+    """{transaction_id: [message, ...]} for the given transactions."""
+    if not transaction_ids:
+        return {}
+    return _group_flags(db.session.execute(_flags_statement(transaction_ids)))
+
+
+async def flags_by_transaction_async(transaction_ids):
+    if not transaction_ids:
+        return {}
+    return _group_flags(await fetch_all(_flags_statement(transaction_ids)))
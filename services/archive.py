@@ -0,0 +1,396 @@
+import heapq
+import json
+import zlib
+from collections import namedtuple
+from datetime import date, datetime
+
+from sqlalchemy import bindparam, delete, extract, insert, literal, select, union_all, update
+
+from models import db
+from models.idempotency_key import IdempotencyKey
+from models.imported_transaction import ImportedTransaction
+from models.transaction import Transaction
+from models.transaction_archive import TransactionArchive
+from models.transaction_flag import TransactionFlag
+from models.transaction_rollup import TransactionRollup
+from models.transaction_tag import TransactionTag
+from services.async_db import fetch_all
+from services.batching import chunks
+from services.currency import Conversion
+from services.tags import tags_by_transaction
+from services.transaction_filters import matches_filters
+
+
+# Transactions dated before 1 January of this many years ago are archived,
+# a whole calendar year at a time
+ARCHIVE_AFTER_YEARS = 2
+COMPRESSION_LEVEL = 6
+
+# `tags` is a tuple of tag names and `batch_id` the import batch that
+# created the row; archives written before tags have neither, and those
+# written before batches were kept have no batch ids
+ArchivedTransaction = namedtuple(
+    'ArchivedTransaction',
+    'id date category transaction_type amount currency description created_at fingerprint tags batch_id',
+    defaults=((), None)
+)
+
+
+# ---------------------------------------------
+# POLICY AND ENCODING
+# ---------------------------------------------
+def archive_cutoff(today=None, years=ARCHIVE_AFTER_YEARS):
+    """First date that stays in the transactions table."""
+    today = today or date.today()
+    return date(today.year - years, 1, 1)
+
+
+def encode_rows(rows):
+    """zlib-compressed JSON of ArchivedTransaction rows."""
+    data = [[row.id, row.date.isoformat(), row.category, row.transaction_type, row.amount, row.currency,
+             row.description, row.created_at.isoformat() if row.created_at else None, row.fingerprint,
+             list(row.tags), row.batch_id]
+            for row in rows]
+    return zlib.compress(json.dumps(data, separators=(',', ':')).encode('utf-8'), COMPRESSION_LEVEL)
+
+
+def decode_rows(payload):
+    return [ArchivedTransaction(id, date.fromisoformat(day), category, transaction_type, amount, currency,
+                                description, datetime.fromisoformat(created_at) if created_at else None,
+                                fingerprint, tuple(rest[0]) if rest else (), rest[1] if len(rest) > 1 else None)
+            for id, day, category, transaction_type, amount, currency, description, created_at, fingerprint, *rest
+            in json.loads(zlib.decompress(payload))]
+
+
+# ---------------------------------------------
+# ARCHIVING
+# ---------------------------------------------
+def _hot_rows(user_id, start, end):
+    rows = [ArchivedTransaction(*row[:-1], batch_id=row[-1]) for row in db.session.execute(
+        select(Transaction.id, Transaction.date, Transaction.category, Transaction.transaction_type,
+               Transaction.amount, Transaction.currency, Transaction.description, Transaction.created_at,
+               ImportedTransaction.fingerprint, ImportedTransaction.batch_id)
+        .outerjoin(ImportedTransaction, ImportedTransaction.transaction_id == Transaction.id)
+        .where(Transaction.user_id == user_id, Transaction.date >= start, Transaction.date < end)
+    )]
+    tags = tags_by_transaction([row.id for row in rows])
+    return [row._replace(tags=tuple(tags[row.id])) if row.id in tags else row for row in rows]
+
+
+def _add_rollups(connection, user_id, rows, sign=1):
+    """
+    Fold rows into the monthly (type, category, currency) totals that stand
+    in for them in aggregates; sign=-1 takes them out again, dropping the
+    totals left with no rows.
+    """
+    sums = {}
+    for row in rows:
+        key = (row.date.replace(day=1), row.transaction_type, row.category, row.currency)
+        amount, count = sums.get(key, (0.0, 0))
+        sums[key] = (amount + sign * row.amount, count + sign)
+
+    table = TransactionRollup.__table__
+    existing = {(row.month, row.transaction_type, row.category, row.currency): (row.amount, row.count)
+                for row in connection.execute(select(table).where(
+                    table.c.user_id == user_id, table.c.month.in_({key[0] for key in sums})))}
+
+    updates, inserts, removed = [], [], []
+    for key, (amount, count) in sums.items():
+        month, transaction_type, category, currency = key
+        values = {'b_month': month, 'b_type': transaction_type, 'b_category': category, 'b_currency': currency}
+        if key not in existing:
+            inserts.append({'user_id': user_id, 'month': month, 'transaction_type': transaction_type,
+                            'category': category, 'currency': currency, 'amount': amount, 'count': count})
+        elif existing[key][1] + count <= 0:
+            removed.append(values)
+        else:
+            updates.append(dict(values, amount=existing[key][0] + amount, count=existing[key][1] + count))
+
+    where = (table.c.user_id == user_id, table.c.month == bindparam('b_month'),
+             table.c.transaction_type == bindparam('b_type'), table.c.category == bindparam('b_category'),
+             table.c.currency == bindparam('b_currency'))
+    if updates:
+        connection.execute(update(table).where(*where), updates)
+    if removed:
+        connection.execute(delete(table).where(*where), removed)
+    if inserts:
+        connection.execute(insert(table), inserts)
+
+
+def _remove_hot(connection, transaction_ids):
+    """
+    Delete archived rows from the transactions table with what references
+    them. No change-log tombstones: the data is not gone, and synced
+    clients keep their copies. Tag names move into the archived rows.
+    """
+    for chunk in chunks(transaction_ids):
+        for table, column in ((TransactionFlag.__table__, TransactionFlag.transaction_id),
+                              (TransactionTag.__table__, TransactionTag.transaction_id),
+                              (IdempotencyKey.__table__, IdempotencyKey.transaction_id),
+                              (ImportedTransaction.__table__, ImportedTransaction.transaction_id)):
+            connection.execute(delete(table).where(column.in_(chunk)))
+        connection.execute(delete(Transaction.__table__).where(Transaction.id.in_(chunk)))
+
+
+def archive_year(user_id, year):
+    """
+    Move a user's transactions dated in `year` into that year's archive
+    (merging with what an earlier run archived) after rolling them up, in
+    one database transaction. Returns the number of rows moved.
+    """
+    rows = _hot_rows(user_id, date(year, 1, 1), date(year + 1, 1, 1))
+    if not rows:
+        return 0
+
+    archive = db.session.execute(
+        select(TransactionArchive).where(TransactionArchive.user_id == user_id, TransactionArchive.year == year)
+    ).scalar_one_or_none()
+    if archive is None:
+        archive = TransactionArchive(user_id=user_id, year=year)
+        db.session.add(archive)
+        merged = rows
+    else:
+        merged = decode_rows(archive.payload) + rows
+    merged.sort(key=lambda row: (row.date, row.id), reverse=True)
+
+    archive.payload = encode_rows(merged)
+    archive.row_count = len(merged)
+    archive.first_date = merged[-1].date
+    archive.last_date = merged[0].date
+    archive.updated_at = datetime.utcnow()
+    db.session.flush()
+
+    connection = db.session.connection()
+    _add_rollups(connection, user_id, rows)
+    _remove_hot(connection, [row.id for row in rows])
+    return len(rows)
+
+
+def archive_user(user_id, cutoff=None):
+    """Archive every year of a user's transactions before the cutoff, committing per year."""
+    cutoff = cutoff or archive_cutoff()
+    years = db.session.execute(
+        select(extract('year', Transaction.date)).where(
+            Transaction.user_id == user_id, Transaction.date < cutoff
+        ).distinct()
+    ).scalars().all()
+
+    moved = 0
+    for year in sorted(int(year) for year in years):
+        try:
+            moved += archive_year(user_id, year)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+    return moved
+
+
+def archive_transactions(cutoff=None, progress=None):
+    """
+    Archive the old transactions of every user who has any; the nightly
+    job behind `flask archive-transactions`. progress(user_id, moved) is
+    called per user. Returns the number of rows moved.
+    """
+    cutoff = cutoff or archive_cutoff()
+    user_ids = db.session.execute(
+        select(Transaction.user_id).where(Transaction.date < cutoff).distinct()
+    ).scalars().all()
+
+    moved = 0
+    for user_id in user_ids:
+        count = archive_user(user_id, cutoff)
+        moved += count
+        if progress:
+            progress(user_id, count)
+    return moved
+
+
+# ---------------------------------------------
+# READING
+# ---------------------------------------------
+def archived_years(user_id, filters=None):
+    """Years of a user's archive that overlap the filters' date range, newest first."""
+    filters = filters or {}
+    conditions = [TransactionArchive.user_id == user_id]
+    if filters.get('start_date'):
+        conditions.append(TransactionArchive.year >= filters['start_date'].year)
+    if filters.get('end_date'):
+        conditions.append(TransactionArchive.year <= filters['end_date'].year)
+    return db.session.execute(
+        select(TransactionArchive.year).where(*conditions).order_by(TransactionArchive.year.desc())
+    ).scalars().all()
+
+
+def _year_rows(user_id, year):
+    payload = db.session.execute(
+        select(TransactionArchive.payload).where(TransactionArchive.user_id == user_id, TransactionArchive.year == year)
+    ).scalar()
+    return decode_rows(payload) if payload else []
+
+
+def archived_transactions(user_id, filters=None, years=None):
+    """
+    A user's archived transactions matching parsed report filters (see
+    services.transaction_filters), newest first. Lazy: each year's archive
+    is only read and decompressed when iteration reaches it, and years
+    outside the date range are never read.
+    """
+    filters = filters or {}
+    for year in (archived_years(user_id, filters) if years is None else years):
+        for row in _year_rows(user_id, year):
+            if matches_filters(row, filters):
+                yield row
+
+
+def with_archived(user_id, rows, filters=None, key=lambda row: (row.date, row.id)):
+    """
+    Rows from the transactions table (newest first) with the matching
+    archived ones merged in by date and id; returns `rows` itself when the
+    range touches no archived year, so recent reports pay one small lookup.
+    """
+    years = archived_years(user_id, filters)
+    if not years:
+        return rows
+    return heapq.merge(rows, archived_transactions(user_id, filters, years), key=key, reverse=True)
+
+
+async def archived_transactions_async(user_id):
+    """A user's whole archive, newest first, read through the async engine."""
+    payloads = await fetch_all(select(TransactionArchive.payload).where(
+        TransactionArchive.user_id == user_id
+    ).order_by(TransactionArchive.year.desc()))
+    return [row for payload, in payloads for row in decode_rows(payload)]
+
+
+def archived_dict(user_id, row):
+    """An archived row in the shape of Transaction.to_dict()."""
+    return {
+        'id': row.id,
+        'user_id': user_id,
+        'amount': row.amount,
+        'currency': row.currency,
+        'category': row.category,
+        'transaction_type': row.transaction_type,
+        'date': row.date.isoformat(),
+        'description': row.description,
+        'created_at': row.created_at.isoformat() if row.created_at else None
+    }
+
+
+class ArchivedFingerprints:
+    """
+    Import fingerprints of a user's archived transactions, so re-importing
+    an old statement still skips rows already there. Each archived year is
+    decompressed on first use only.
+    """
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self._years = None
+        self._loaded = {}
+
+    def contains(self, fingerprint, year):
+        if self._years is None:
+            self._years = set(archived_years(self.user_id))
+        if year not in self._years:
+            return False
+        if year not in self._loaded:
+            self._loaded[year] = {row.fingerprint for row in _year_rows(self.user_id, year) if row.fingerprint}
+        return fingerprint in self._loaded[year]
+
+
+# ---------------------------------------------
+# DELETING
+# ---------------------------------------------
+def delete_archived(user_id, year, predicate):
+    """
+    Remove the rows of a user's `year` archive for which predicate(row) is
+    true, inside the caller's database transaction: the archive is
+    rewritten without them (or dropped once empty) and they are taken out
+    of the rollups. Returns the rows removed.
+    """
+    archive = db.session.execute(
+        select(TransactionArchive).where(TransactionArchive.user_id == user_id, TransactionArchive.year == year)
+        .with_for_update()
+    ).scalar_one_or_none()
+    if archive is None:
+        return []
+
+    kept, removed = [], []
+    for row in decode_rows(archive.payload):
+        (removed if predicate(row) else kept).append(row)
+    if not removed:
+        return []
+
+    if kept:
+        archive.payload = encode_rows(kept)
+        archive.row_count = len(kept)
+        archive.first_date = kept[-1].date
+        archive.last_date = kept[0].date
+        archive.updated_at = datetime.utcnow()
+    else:
+        db.session.delete(archive)
+    db.session.flush()
+
+    _add_rollups(db.session.connection(), user_id, removed, sign=-1)
+    return removed
+
+
+# ---------------------------------------------
+# AGGREGATES
+# ---------------------------------------------
+def _history_selects(currency, transaction_type, users=None):
+    """
+    The live and rolled-up halves of a history union. With `users` (the
+    User model), each row also carries its user_id and `currency` may be
+    User.base_currency.
+    """
+    live_from, rolled_from = Transaction.__table__, TransactionRollup.__table__
+    if users is not None:
+        live_from = live_from.join(users, users.id == Transaction.user_id)
+        rolled_from = rolled_from.join(users, users.id == TransactionRollup.user_id)
+
+    live = Conversion(Transaction.amount, Transaction.currency, Transaction.date, currency)
+    rolled = Conversion(TransactionRollup.amount, TransactionRollup.currency, TransactionRollup.month, currency)
+    hot = select(Transaction.transaction_type, Transaction.category, Transaction.date.label('date'),
+                 live.amount.label('amount'), literal(1).label('count'))
+    cold = select(TransactionRollup.transaction_type, TransactionRollup.category,
+                  TransactionRollup.month.label('date'), rolled.amount.label('amount'),
+                  TransactionRollup.count.label('count'))
+    if users is not None:
+        hot = hot.add_columns(Transaction.user_id.label('user_id'))
+        cold = cold.add_columns(TransactionRollup.user_id.label('user_id'))
+    hot, cold = live.join(hot.select_from(live_from)), rolled.join(cold.select_from(rolled_from))
+
+    if transaction_type is not None:
+        hot = hot.where(Transaction.transaction_type == transaction_type)
+        cold = cold.where(TransactionRollup.transaction_type == transaction_type)
+    return hot, cold
+
+
+def history_subquery(user_id, currency, transaction_type=None):
+    """
+    (transaction_type, category, date, amount, count) for a user's whole
+    history with amounts in `currency`: one row per transaction still in
+    the transactions table plus one per archived month, type, category and
+    currency (dated and converted on the 1st), so aggregates over it match
+    the full history while reading far fewer rows.
+    """
+    hot, cold = _history_selects(currency, transaction_type)
+    return union_all(
+        hot.where(Transaction.user_id == user_id), cold.where(TransactionRollup.user_id == user_id)
+    ).subquery('history')
+
+
+def users_history_subquery(first_id, end_id, transaction_type=None):
+    """
+    history_subquery for every user with first_id <= id < end_id at once,
+    with a user_id column and each user's amounts in their base currency.
+    """
+    from models.user import User   # models.user imports the services package
+    hot, cold = _history_selects(User.base_currency, transaction_type, users=User)
+    return union_all(
+        hot.where(Transaction.user_id >= first_id, Transaction.user_id < end_id),
+        cold.where(TransactionRollup.user_id >= first_id, TransactionRollup.user_id < end_id)
+    ).subquery('history')
@@ -0,0 +1,71 @@
+import asyncio
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from models import db
+
+
+# Database backend -> asyncio driver used when serving through asgi.py
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+}
+
+_engine = None
+
+
+def async_database_url(url):
+    """The same database URL with the backend's asyncio driver ("sqlite:///x.db" -> "sqlite+aiosqlite:///x.db")."""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise RuntimeError(f"No asyncio driver configured for '{backend}' databases")
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+
+def init_async_db(app):
+    """
+    Create the asyncio engine for the app's database. Its pooled
+    connections belong to the event loop that first uses them, so it is
+    only used by the async views, which all run on the server's loop.
+    """
+    global _engine
+
+    with app.app_context():
+        url = db.engine.url   # relative SQLite paths already resolved to the instance folder
+    _engine = create_async_engine(async_database_url(url))
+    return _engine
+
+
+def get_async_engine():
+    if _engine is None:
+        raise RuntimeError('The async database is not initialised (serve the app through asgi.py)')
+    return _engine
+
+
+async def dispose_async_db():
+    if _engine is not None:
+        await _engine.dispose()
+
+
+# ---------------------------------------------
+# QUERIES
+# ---------------------------------------------
+async def fetch_all(statement):
+    """Rows of a statement, on a pooled connection of its own."""
+    async with get_async_engine().connect() as connection:
+        return (await connection.execute(statement)).all()
+
+
+async def fetch_objects(statement):
+    """ORM objects of a select(Model) statement, detached with their columns loaded."""
+    async with AsyncSession(get_async_engine(), expire_on_commit=False) as session:
+        return (await session.scalars(statement)).all()
+
+
+async def gather_queries(statements):
+    """{name: rows} for independent statements ({name: statement}), run concurrently."""
+    names = list(statements)
+    results = await asyncio.gather(*(fetch_all(statements[name]) for name in names))
+    return dict(zip(names, results))
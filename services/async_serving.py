@@ -0,0 +1,177 @@
+import io
+import os
+from functools import wraps
+
+from flask import current_app, request, request_started, session
+from flask_login import current_user
+
+from services.async_db import dispose_async_db, init_async_db
+from services.user_cache import SESSION_VERSION_KEY, load_principal_async
+
+try:
+    from a2wsgi import WSGIMiddleware
+except ImportError:
+    WSGIMiddleware = None
+
+
+# Threads running the (sync) WSGI app for every route without an async variant
+DEFAULT_WSGI_THREADS = 8
+
+# endpoint -> async view used in place of the sync one when serving through asgi.py
+ASYNC_VIEWS = {}
+
+
+# ---------------------------------------------
+# ASYNC VIEWS
+# ---------------------------------------------
+def async_view(endpoint):
+    """Register an async variant of an existing endpoint (same URL rule, same template or JSON)."""
+    def decorator(view):
+        ASYNC_VIEWS[endpoint] = view
+        return view
+    return decorator
+
+
+def async_login_required(view):
+    """login_required for async views: the principal is loaded without blocking the event loop."""
+    @wraps(view)
+    async def wrapped(*args, **kwargs):
+        user_id = session.get('_user_id')
+        if user_id is not None:
+            await load_principal_async(int(user_id), session.get(SESSION_VERSION_KEY))
+        if request.method != 'OPTIONS' and not current_user.is_authenticated:
+            return current_app.login_manager.unauthorized()
+        return await view(*args, **kwargs)
+    return wrapped
+
+
+# ---------------------------------------------
+# ASGI APPLICATION
+# ---------------------------------------------
+def _environ(scope, body):
+    """WSGI environ for an ASGI HTTP scope, so Flask can build its request context."""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': io.StringIO(),
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', ()):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            environ[name] = value
+        else:
+            key = f'HTTP_{name}'
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+async def _read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] != 'http.request':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    return b''.join(chunks)
+
+
+class AsgiApp:
+    """
+    Serves the Flask app over ASGI. Endpoints with an async variant run on
+    the event loop, so a request waiting on the database or Gemini holds no
+    thread; every other route runs the WSGI app in a thread pool.
+    """
+
+    def __init__(self, app, threads=DEFAULT_WSGI_THREADS):
+        if WSGIMiddleware is None:
+            raise RuntimeError('Serving over ASGI needs the a2wsgi package (install the asgi extra)')
+        self.app = app
+        self.wsgi = WSGIMiddleware(app.wsgi_app, workers=threads)
+        self.views = dict(ASYNC_VIEWS)
+        init_async_db(app)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+
+        if scope['type'] == 'http':
+            endpoint = self._endpoint(scope)
+            if endpoint in self.views:
+                return await self._dispatch(self.views[endpoint], scope, receive, send)
+
+        await self.wsgi(scope, receive, send)
+
+    def _endpoint(self, scope):
+        adapter = self.app.url_map.bind(
+            scope.get('server', ('localhost',))[0] or 'localhost',
+            script_name=scope.get('root_path') or None
+        )
+        try:
+            endpoint, _ = adapter.match(scope['path'], method=scope['method'])
+        except Exception:
+            return None    # redirects, 404s and 405s are left to Flask
+        return endpoint
+
+    async def _dispatch(self, view, scope, receive, send):
+        """Flask's full_dispatch_request, awaiting the view on the event loop."""
+        app = self.app
+        environ = _environ(scope, await _read_body(receive))
+
+        # Flask's contexts live in context variables, which are per task.
+        with app.request_context(environ):
+            try:
+                try:
+                    request_started.send(app, _async_wrapper=app.ensure_sync)
+                    rv = app.preprocess_request()
+                    if rv is None:
+                        rv = await view(**request.view_args)
+                except Exception as e:
+                    rv = app.handle_user_exception(e)
+                response = app.finalize_request(rv)
+            except Exception as e:
+                response = app.handle_exception(e)
+
+            headers = response.get_wsgi_headers(environ)
+            body = b''.join(response.get_app_iter(environ))
+            response.close()
+
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers.items()]
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await dispose_async_db()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+def create_asgi_app(app):
+    """ASGI application for `app`; WSGI_THREADS sets the thread pool size for sync routes."""
+    threads = int(app.config.get('WSGI_THREADS') or os.environ.get('WSGI_THREADS') or DEFAULT_WSGI_THREADS)
+    return AsgiApp(app, threads)
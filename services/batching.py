@@ -0,0 +1,14 @@
+from itertools import islice
+
+
+# Items per IN (...) list, executemany or chunked delete: well under
+# SQLite's bound-parameter limit, and small enough that a committed chunk
+# never holds its write lock for long
+CHUNK_SIZE = 500
+
+
+def chunks(values, size=CHUNK_SIZE):
+    """Yield lists of up to `size` items of any iterable, in order."""
+    values = iter(values)
+    while chunk := list(islice(values, size)):
+        yield chunk
@@ -0,0 +1,207 @@
+from array import array
+from bisect import bisect_left
+
+try:
+    from pyroaring import BitMap as RoaringBitMap
+except ImportError:
+    RoaringBitMap = None
+
+
+# A container holding more values than this is stored as a 2^16-bit set
+# (8 KiB), fewer as a sorted array of 16-bit values, as in Roaring
+ARRAY_LIMIT = 4096
+_CONTAINER_BYTES = 1 << 13
+
+
+# ---------------------------------------------
+# CONTAINERS (the low 16 bits of values sharing their high bits)
+# ---------------------------------------------
+def _bits(values):
+    data = bytearray(_CONTAINER_BYTES)
+    for value in values:
+        data[value >> 3] |= 1 << (value & 7)
+    return int.from_bytes(data, 'little')
+
+
+def _values(bits):
+    data = bits.to_bytes(_CONTAINER_BYTES, 'little')
+    return array('H', (index << 3 | bit for index, byte in enumerate(data) if byte
+                       for bit in range(8) if byte >> bit & 1))
+
+
+def _normalized(container):
+    """The container in its cheaper form, or None when empty."""
+    if not container:
+        return None
+    if isinstance(container, int):
+        return _values(container) if container.bit_count() <= ARRAY_LIMIT else container
+    return _bits(container) if len(container) > ARRAY_LIMIT else container
+
+
+def _contains(bits_bytes, value):
+    return bits_bytes[value >> 3] >> (value & 7) & 1
+
+
+def _and(a, b):
+    if isinstance(a, int) and isinstance(b, int):
+        return _normalized(a & b)
+    if isinstance(a, int):
+        a, b = b, a
+    if isinstance(b, int):
+        data = b.to_bytes(_CONTAINER_BYTES, 'little')
+        return _normalized(array('H', (value for value in a if _contains(data, value))))
+    return _normalized(array('H', sorted(set(a).intersection(b))))
+
+
+def _or(a, b):
+    if isinstance(a, int) or isinstance(b, int):
+        return _normalized((a if isinstance(a, int) else _bits(a)) | (b if isinstance(b, int) else _bits(b)))
+    return _normalized(array('H', sorted(set(a).union(b))))
+
+
+def _union(containers):
+    if len(containers) == 1:
+        return containers[0]
+    if any(isinstance(container, int) for container in containers) or \
+            sum(len(container) for container in containers) > 4 * ARRAY_LIMIT:
+        bits = 0
+        for container in containers:
+            bits |= container if isinstance(container, int) else _bits(container)
+        return _normalized(bits)
+    values = set()
+    for container in containers:
+        values.update(container)
+    return _normalized(array('H', sorted(values)))
+
+
+def _andnot(a, b):
+    if isinstance(a, int):
+        return _normalized(a & ~(b if isinstance(b, int) else _bits(b)))
+    if isinstance(b, int):
+        data = b.to_bytes(_CONTAINER_BYTES, 'little')
+        return _normalized(array('H', (value for value in a if not _contains(data, value))))
+    return _normalized(array('H', sorted(set(a).difference(b))))
+
+
+# ---------------------------------------------
+# BITMAPS
+# ---------------------------------------------
+class ArrayBitmap:
+    """
+    A compressed set of non-negative integers in the layout of a Roaring
+    bitmap: values are grouped by their high bits, each group held as a
+    sorted array('H') while sparse and as a bit set (a Python int) once
+    dense. Set operations work group by group, so they cost in proportion
+    to the groups present in both operands rather than to the values.
+    Used when pyroaring is not installed; the same operators either way.
+    """
+    __slots__ = ('_containers',)
+
+    def __init__(self, values=()):
+        groups = {}
+        for value in values:
+            groups.setdefault(value >> 16, []).append(value & 0xFFFF)
+        self._containers = {}
+        for high, lows in groups.items():
+            lows = sorted(set(lows))
+            self._containers[high] = _bits(lows) if len(lows) > ARRAY_LIMIT else array('H', lows)
+
+    @classmethod
+    def _from(cls, containers):
+        bitmap = cls.__new__(cls)
+        bitmap._containers = {high: container for high, container in containers if container is not None}
+        return bitmap
+
+    @classmethod
+    def union(cls, *bitmaps):
+        """The union of any number of bitmaps, merged group by group in one pass."""
+        groups = {}
+        for bitmap in bitmaps:
+            for high, container in bitmap._containers.items():
+                groups.setdefault(high, []).append(container)
+        return cls._from((high, _union(containers)) for high, containers in groups.items())
+
+    def __and__(self, other):
+        return self._from((high, _and(container, other._containers[high]))
+                          for high, container in self._containers.items() if high in other._containers)
+
+    def __or__(self, other):
+        containers = dict(self._containers)
+        for high, container in other._containers.items():
+            containers[high] = _or(containers[high], container) if high in containers else container
+        return self._from(containers.items())
+
+    def __sub__(self, other):
+        return self._from((high, _andnot(container, other._containers[high]) if high in other._containers
+                           else container) for high, container in self._containers.items())
+
+    def __len__(self):
+        return sum(container.bit_count() if isinstance(container, int) else len(container)
+                   for container in self._containers.values())
+
+    def __bool__(self):
+        return bool(self._containers)
+
+    def __iter__(self):
+        for high in sorted(self._containers):
+            container = self._containers[high]
+            base = high << 16
+            for value in (_values(container) if isinstance(container, int) else container):
+                yield base | value
+
+    def __contains__(self, value):
+        container = self._containers.get(value >> 16)
+        if container is None:
+            return False
+        if isinstance(container, int):
+            return bool(container >> (value & 0xFFFF) & 1)
+        low = value & 0xFFFF
+        index = bisect_left(container, low)
+        return index < len(container) and container[index] == low
+
+    def __eq__(self, other):
+        return isinstance(other, ArrayBitmap) and list(self) == list(other)
+
+    # Containers are never changed in place, as results of set operations
+    # share the containers one operand alone contributes
+
+    def add(self, value):
+        high, low = value >> 16, value & 0xFFFF
+        container = self._containers.get(high)
+        if container is None:
+            self._containers[high] = array('H', [low])
+        elif isinstance(container, int):
+            self._containers[high] = container | 1 << low
+        else:
+            index = bisect_left(container, low)
+            if index == len(container) or container[index] != low:
+                container = container[:index] + array('H', [low]) + container[index:]
+                self._containers[high] = _bits(container) if len(container) > ARRAY_LIMIT else container
+
+    def discard(self, value):
+        high, low = value >> 16, value & 0xFFFF
+        container = self._containers.get(high)
+        if container is None:
+            return
+        if isinstance(container, int):
+            container = _normalized(container & ~(1 << low))
+        else:
+            index = bisect_left(container, low)
+            if index < len(container) and container[index] == low:
+                container = container[:index] + container[index + 1:]
+            container = container or None
+        if container is None:
+            del self._containers[high]
+        else:
+            self._containers[high] = container
+
+    def __repr__(self):
+        return f'<ArrayBitmap {len(self)} values in {len(self._containers)} containers>'
+
+
+# pyroaring's BitMap (32-bit values) when installed, otherwise ArrayBitmap
+Bitmap = RoaringBitMap or ArrayBitmap
+
+
+def bitmap_backend():
+    return 'pyroaring' if Bitmap is RoaringBitMap else 'array'
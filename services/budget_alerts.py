@@ -0,0 +1,357 @@
+import logging
+from collections import namedtuple
+from datetime import date, datetime
+
+from sqlalchemy import bindparam, delete, func, inspect, select, update
+
+from models import db
+from models.budget import Budget
+from models.budget_alert import BudgetAlert
+from models.budget_period_total import BudgetPeriodTotal
+from models.transaction import Transaction
+from services.batching import chunks
+from services.budget_status import budget_conditions, get_period_bounds
+from services.change_feed import changes_recorded, INSERT, DELETE
+from services.currency import Conversion, convert, format_money
+from services.upserts import conflict_insert
+
+
+logger = logging.getLogger(__name__)
+
+# Percent of a budget that triggers an alert; each fires once per budget period
+THRESHOLDS = (80, 100)
+
+_Delta = namedtuple('_Delta', 'user_id transaction_type category date amount currency count')
+
+
+# ---------------------------------------------
+# TRANSACTION DELTAS
+# ---------------------------------------------
+def _state(obj, old=False):
+    """(user_id, transaction_type, category, date, amount, currency) of a transaction, before or after the flush."""
+    values = []
+    attrs = inspect(obj).attrs
+    for name in ('user_id', 'transaction_type', 'category', 'date', 'amount', 'currency'):
+        history = attrs[name].history
+        values.append(history.deleted[0] if old and history.deleted else attrs[name].value)
+    return values
+
+
+def _delta(state, sign):
+    user_id, transaction_type, category, day, amount, currency = state
+    return _Delta(user_id, transaction_type, category, day, sign * amount, currency, sign)
+
+
+def transaction_deltas(session, changes):
+    """
+    Amount and count changes per (user, type, category, date) for a batch
+    of change log entries, plus the users whose changes cannot be
+    reconstructed (rows changed outside the ORM session), whose counters
+    must be rebuilt.
+    """
+    deltas = []
+    unknown_users = set()
+    missing = []
+    deleted = {obj.id: obj for obj in session.deleted if isinstance(obj, Transaction)}
+
+    for user_id, entity, entity_id, operation in changes:
+        if entity != 'transaction':
+            continue
+
+        if operation == DELETE:
+            obj = deleted.get(entity_id)
+            if obj is None:
+                unknown_users.add(user_id)
+            else:
+                deltas.append(_delta(_state(obj), -1))
+            continue
+
+        obj = session.identity_map.get(session.identity_key(Transaction, entity_id))
+        if obj is None:
+            if operation == INSERT:
+                missing.append(entity_id)
+            else:
+                unknown_users.add(user_id)
+        elif operation == INSERT:
+            deltas.append(_delta(_state(obj), 1))
+        else:
+            deltas.append(_delta(_state(obj, old=True), -1))
+            deltas.append(_delta(_state(obj), 1))
+
+    # Core inserts (bulk API, imports) are not in the session.
+    for chunk in chunks(missing):
+        for row in session.connection().execute(
+            select(Transaction.user_id, Transaction.transaction_type, Transaction.category, Transaction.date,
+                   Transaction.amount, Transaction.currency).where(Transaction.id.in_(chunk))
+        ):
+            deltas.append(_Delta(*row, 1))
+
+    return deltas, unknown_users
+
+
+# ---------------------------------------------
+# PERIOD COUNTERS
+# ---------------------------------------------
+def _period_spending(connection, budget, period_start):
+    start_date, end_date = get_period_bounds(budget.period, period_start)
+    conversion = Conversion(Transaction.amount, Transaction.currency, Transaction.date, budget.currency)
+    return connection.execute(
+        conversion.join(select(func.coalesce(func.sum(conversion.amount), 0.0)).select_from(Transaction)).where(
+            *budget_conditions(budget.user_id, budget.category, start_date, end_date, budget.tag_filter)
+        )
+    ).scalar()
+
+
+def _apply_counters(connection, budgets, changes, now):
+    """
+    Add coalesced deltas ({(budget_id, period_start): amount}) to the
+    counters and return {key: spent after}. Existing counters are
+    incremented in place (spent = spent + delta), so concurrent writers
+    never overwrite each other. A missing counter is seeded from the
+    transactions table, which already includes the flushed writes; if
+    another writer seeds it first, the delta is added to theirs instead.
+    """
+    table = BudgetPeriodTotal.__table__
+    existing = set()
+    for chunk in chunks(sorted({budget_id for budget_id, _ in changes})):
+        existing.update(connection.execute(
+            select(table.c.budget_id, table.c.period_start).where(
+                table.c.budget_id.in_(chunk),
+                table.c.period_start.in_({start for _, start in changes})
+            )
+        ).all())
+
+    updates = []
+    for (budget_id, period_start), amount in changes.items():
+        if (budget_id, period_start) in existing:
+            if amount:
+                updates.append({'b_budget_id': budget_id, 'b_period_start': period_start,
+                                'delta': amount, 'updated_at': now})
+            continue
+        seed = _period_spending(connection, budgets[budget_id], period_start)
+        connection.execute(
+            conflict_insert(connection, table)
+            .values(budget_id=budget_id, period_start=period_start, spent=seed, updated_at=now)
+            .on_conflict_do_update(index_elements=[table.c.budget_id, table.c.period_start],
+                                   set_={'spent': table.c.spent + amount, 'updated_at': now})
+        )
+
+    if updates:
+        connection.execute(
+            update(table).where(
+                table.c.budget_id == bindparam('b_budget_id'),
+                table.c.period_start == bindparam('b_period_start')
+            ).values(spent=table.c.spent + bindparam('delta')),
+            updates
+        )
+
+    totals = {}
+    for chunk in chunks(sorted({budget_id for budget_id, _ in changes})):
+        totals.update(((row.budget_id, row.period_start), row.spent) for row in connection.execute(
+            select(table.c.budget_id, table.c.period_start, table.c.spent).where(
+                table.c.budget_id.in_(chunk),
+                table.c.period_start.in_({start for _, start in changes})
+            )
+        ))
+    return {key: spent for key, spent in totals.items() if key in changes}
+
+
+def _load_budgets(connection, condition):
+    return {
+        row.id: row for row in connection.execute(
+            select(Budget.id, Budget.user_id, Budget.category, Budget.period, Budget.amount,
+                   Budget.currency, Budget.tag_filter).where(condition)
+        )
+    }
+
+
+# ---------------------------------------------
+# ALERTS
+# ---------------------------------------------
+def threshold_reached(threshold, spent, limit):
+    """Same boundaries as budget_status: over 80% is 'warning', over the limit is 'danger'."""
+    if limit <= 0:
+        return False
+    return spent / limit * 100 > threshold
+
+
+def _alert_message(budget, threshold, spent):
+    spent, limit = format_money(spent, budget.currency), format_money(budget.amount, budget.currency)
+    name = f'{budget.category} [{budget.tag_filter}]' if budget.tag_filter else budget.category
+    if threshold >= 100:
+        return f"{name} is over its {budget.period} budget: {spent} of {limit}."
+    return f"{name} has used over {threshold}% of its {budget.period} budget ({spent} of {limit})."
+
+
+def _emit_alerts(connection, budgets, totals, now):
+    """Queue an outbox alert for every threshold newly reached in a current period."""
+    today = date.today()
+    candidates = []
+    for (budget_id, period_start), spent in totals.items():
+        budget = budgets[budget_id]
+        if period_start != get_period_bounds(budget.period, today)[0]:
+            continue
+        for threshold in THRESHOLDS:
+            if threshold_reached(threshold, spent, budget.amount):
+                candidates.append((budget, period_start, threshold, spent))
+    if not candidates:
+        return []
+
+    sent = set(connection.execute(
+        select(BudgetAlert.budget_id, BudgetAlert.period_start, BudgetAlert.threshold).where(
+            BudgetAlert.budget_id.in_({budget.id for budget, _, _, _ in candidates})
+        )
+    ).all())
+
+    # Another writer may queue the same alert between the read above and
+    # the insert; the unique key keeps one, and only the rows this call
+    # inserted are returned
+    alerts = [{
+        'user_id': budget.user_id,
+        'budget_id': budget.id,
+        'period_start': period_start,
+        'threshold': threshold,
+        'spent': spent,
+        'limit_amount': budget.amount,
+        'message': _alert_message(budget, threshold, spent),
+        'created_at': now
+    } for budget, period_start, threshold, spent in candidates
+        if (budget.id, period_start, threshold) not in sent]
+
+    table = BudgetAlert.__table__
+    return [alert for alert in alerts if connection.execute(
+        conflict_insert(connection, table).values(alert).on_conflict_do_nothing(
+            index_elements=[table.c.budget_id, table.c.period_start, table.c.threshold])
+    ).rowcount]
+
+
+# ---------------------------------------------
+# ENGINE
+# ---------------------------------------------
+def apply_transaction_deltas(connection, deltas, unknown_users=()):
+    """
+    Fold expense deltas into the counters of the budgets they fall in
+    (same user and category, period window containing the date) and queue
+    alerts. Deltas are converted to each budget's currency (from cached
+    rates) and summed per budget period first, so a bulk import of
+    thousands of rows costs a handful of queries.
+    """
+    now = datetime.utcnow()
+    deltas = [d for d in deltas if d.transaction_type == 'expense' and d.amount]
+
+    if unknown_users:
+        table = BudgetPeriodTotal.__table__
+        connection.execute(delete(table).where(table.c.budget_id.in_(
+            select(Budget.id).where(Budget.user_id.in_(unknown_users))
+        )))
+
+    if not deltas:
+        return []
+
+    # Budgets with a tag filter are summed again instead (see _on_changes_recorded)
+    budgets = _load_budgets(connection, Budget.user_id.in_({d.user_id for d in deltas}) &
+                            Budget.category.in_({d.category for d in deltas}) & Budget.tag_filter.is_(None))
+    by_category = {}
+    for budget in budgets.values():
+        by_category.setdefault((budget.user_id, budget.category), []).append(budget)
+
+    changes = {}
+    starts = {}
+    for delta in deltas:
+        for budget in by_category.get((delta.user_id, delta.category), ()):
+            period = (budget.period, delta.date)
+            if period not in starts:
+                starts[period] = get_period_bounds(budget.period, delta.date)[0]
+            key = (budget.id, starts[period])
+            changes[key] = changes.get(key, 0.0) + convert(delta.amount, delta.currency, budget.currency, delta.date)
+    if not changes:
+        return []
+
+    totals = _apply_counters(connection, budgets, changes, now)
+    increased = {key: spent for key, spent in totals.items() if changes[key] > 0}
+    return _emit_alerts(connection, budgets, increased, now)
+
+
+def evaluate_budgets(connection, budget_ids):
+    """Re-seed the current-period counter of new or edited budgets and queue any alerts due."""
+    now = datetime.utcnow()
+    table = BudgetPeriodTotal.__table__
+    connection.execute(delete(table).where(table.c.budget_id.in_(budget_ids)))
+
+    budgets = _load_budgets(connection, Budget.id.in_(budget_ids))
+    today = date.today()
+    changes = {(budget.id, get_period_bounds(budget.period, today)[0]): 0.0 for budget in budgets.values()}
+    totals = _apply_counters(connection, budgets, changes, now)
+    return _emit_alerts(connection, budgets, totals, now)
+
+
+@changes_recorded.connect
+def _on_changes_recorded(session, changes):
+    deltas, unknown_users = transaction_deltas(session, changes)
+    if deltas or unknown_users:
+        apply_transaction_deltas(session.connection(), deltas, unknown_users)
+
+    changed_budgets = [entity_id for _, entity, entity_id, operation in changes
+                       if entity == 'budget' and operation != DELETE]
+    removed_budgets = [entity_id for _, entity, entity_id, operation in changes
+                       if entity == 'budget' and operation == DELETE]
+
+    if removed_budgets:
+        connection = session.connection()
+        connection.execute(delete(BudgetPeriodTotal.__table__).where(
+            BudgetPeriodTotal.budget_id.in_(removed_budgets)))
+        connection.execute(delete(BudgetAlert.__table__).where(
+            BudgetAlert.budget_id.in_(removed_budgets)))
+
+    # What a tag filter counts changes with tags as well as transactions, so
+    # those budgets are re-evaluated rather than adjusted by deltas
+    tagged_users = {user_id for user_id, entity, _, _ in changes if entity in ('transaction', 'tag')}
+    if tagged_users:
+        changed_budgets.extend(session.connection().execute(
+            select(Budget.id).where(Budget.user_id.in_(tagged_users), Budget.tag_filter.isnot(None),
+                                    Budget.id.not_in(changed_budgets + removed_budgets))
+        ).scalars())
+    if changed_budgets:
+        evaluate_budgets(session.connection(), changed_budgets)
+
+
+# ---------------------------------------------
+# OUTBOX DELIVERY
+# ---------------------------------------------
+def _log_sink(alerts):
+    for alert in alerts:
+        logger.info('Budget alert for user %s: %s', alert['user_id'], alert['message'])
+
+
+# callables(list of alert dicts); the log sink is used when none are registered
+_SINKS = []
+
+
+def register_alert_sink(sink):
+    """Add a delivery channel (email, push, webhook...) for outbox alerts."""
+    _SINKS.append(sink)
+
+
+def deliver_pending_alerts(limit=500):
+    """
+    Hand undelivered alerts to every sink and mark them delivered. A sink
+    that raises leaves the batch pending for the next run. Returns the
+    number of alerts delivered.
+    """
+    alerts = BudgetAlert.query.filter(BudgetAlert.delivered_at.is_(None)).order_by(BudgetAlert.id).limit(limit).all()
+    if not alerts:
+        return 0
+
+    payload = [dict(alert.to_dict(), user_id=alert.user_id) for alert in alerts]
+    for sink in _SINKS or [_log_sink]:
+        sink(payload)
+
+    now = datetime.utcnow()
+    for alert in alerts:
+        alert.delivered_at = now
+    db.session.commit()
+    return len(alerts)
+
+
+def get_recent_alerts(user_id, limit=20):
+    return BudgetAlert.query.filter_by(user_id=user_id).order_by(BudgetAlert.id.desc()).limit(limit).all()
@@ -0,0 +1,101 @@
+from calendar import monthrange
+from datetime import date, timedelta
+
+from sqlalchemy import func
+
+from models import db
+from models.budget import Budget
+from models.budget_period_total import BudgetPeriodTotal
+from models.transaction import Transaction
+from services.currency import DEFAULT_CURRENCY, Conversion
+from services.tags import parse_tag_expression, tag_clause
+
+
+def get_period_bounds(period, today=None):
+    """(start_date, end_date) of the current monthly, weekly or yearly budget period."""
+    today = today or date.today()
+
+    if period == 'monthly':
+        start_date = date(today.year, today.month, 1)
+        _, last_day = monthrange(today.year, today.month)
+        end_date = date(today.year, today.month, last_day)
+    elif period == 'weekly':
+        start_date = today - timedelta(days=today.weekday())
+        end_date = start_date + timedelta(days=6)
+    else:
+        start_date = date(today.year, 1, 1)
+        end_date = date(today.year, 12, 31)
+
+    return start_date, end_date
+
+
+def budget_conditions(user_id, category, start_date, end_date, tag_filter=None):
+    """SQL conditions on Transaction for the expenses a budget counts between two dates."""
+    conditions = [
+        Transaction.user_id == user_id,
+        Transaction.category == category,
+        Transaction.transaction_type == 'expense',
+        Transaction.date >= start_date,
+        Transaction.date <= end_date
+    ]
+    if tag_filter:
+        conditions.append(tag_clause(parse_tag_expression(tag_filter)))
+    return conditions
+
+
+def get_budget_spending(user_id, category, period='monthly', currency=DEFAULT_CURRENCY, tag_filter=None):
+    """Expenses in a category (and matching a tag expression) over the current period, in `currency`."""
+    start_date, end_date = get_period_bounds(period)
+    conversion = Conversion(Transaction.amount, Transaction.currency, Transaction.date, currency)
+
+    spent = conversion.join(db.session.query(func.sum(conversion.amount)).select_from(Transaction)).filter(
+        *budget_conditions(user_id, category, start_date, end_date, tag_filter)
+    ).scalar() or 0.0
+
+    return spent
+
+
+def budget_status(spent, limit):
+    """(percentage, status) where status is 'danger' (over), 'warning' (>80%) or 'success'."""
+    percentage = (spent / limit * 100) if limit > 0 else 0
+    status = 'danger' if spent > limit else 'warning' if percentage > 80 else 'success'
+    return percentage, status
+
+
+def get_budget_data(user_id):
+    """
+    Spending against every budget of a user, as rendered on the budgets
+    page. Uses the period counters kept by services.budget_alerts and only
+    sums transactions for a budget whose current period has no counter yet.
+    """
+    budgets = Budget.query.filter_by(user_id=user_id).all()
+    starts = {budget.id: get_period_bounds(budget.period)[0] for budget in budgets}
+
+    counters = {}
+    if budgets:
+        counters = {
+            (budget_id, period_start): spent
+            for budget_id, period_start, spent in db.session.query(
+                BudgetPeriodTotal.budget_id, BudgetPeriodTotal.period_start, BudgetPeriodTotal.spent
+            ).filter(
+                BudgetPeriodTotal.budget_id.in_(starts),
+                BudgetPeriodTotal.period_start.in_(set(starts.values()))
+            )
+        }
+
+    budget_data = []
+    for budget in budgets:
+        spent = counters.get((budget.id, starts[budget.id]))
+        if spent is None:
+            spent = get_budget_spending(user_id, budget.category, budget.period, budget.currency, budget.tag_filter)
+        percentage, status = budget_status(spent, budget.amount)
+
+        budget_data.append({
+            'budget': budget,
+            'spent': spent,
+            'remaining': budget.amount - spent,
+            'percentage': percentage,
+            'status': status
+        })
+
+    return budget_data
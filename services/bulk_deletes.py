@@ -0,0 +1,287 @@
+from datetime import datetime
+
+from sqlalchemy import delete, event, func, select
+
+from models import db
+from models.budget import Budget
+from models.budget_alert import BudgetAlert
+from models.budget_period_total import BudgetPeriodTotal
+from models.category_rule import CategoryRule
+from models.category_stat import CategoryStat
+from models.change_log import ChangeLog
+from models.idempotency_key import IdempotencyKey
+from models.import_batch import ImportBatch
+from models.imported_transaction import ImportedTransaction
+from models.insight_snapshot import InsightSnapshot
+from models.known_merchant import KnownMerchant
+from models.monthly_total import MonthlyTotal
+from models.recurring_transaction import RecurringTransaction
+from models.tag import Tag
+from models.transaction import Transaction
+from models.transaction_archive import TransactionArchive
+from models.transaction_flag import TransactionFlag
+from models.transaction_rollup import TransactionRollup
+from models.transaction_tag import TransactionTag
+from models.user import User
+from services.archive import archived_transactions, archived_years, delete_archived
+from services.batching import CHUNK_SIZE
+from services.change_feed import record_changes, DELETE
+from services.transaction_filters import matches_filters
+from services.user_cache import invalidate_user
+
+
+class UndoImportError(ValueError):
+    """Raised when an import batch cannot be undone in its current state."""
+
+
+# ---------------------------------------------
+# FOREIGN KEYS
+# ---------------------------------------------
+def enable_sqlite_foreign_keys(engine):
+    """
+    Make SQLite enforce foreign keys, including their ON DELETE CASCADE, on
+    every new connection (it ignores them unless asked). Call before the
+    engine opens its first connection.
+
+    Cascades still cannot be relied on: PostgreSQL applies them, but
+    databases created before a key cascaded (or SQLite files opened by
+    other tools) do not. Code that deletes transactions, budgets or users
+    therefore deletes the rows referencing them explicitly, first.
+    """
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def _foreign_keys(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys = ON')
+        cursor.close()
+
+
+# ---------------------------------------------
+# TRANSACTIONS
+# ---------------------------------------------
+# Rows that reference transactions (see enable_sqlite_foreign_keys). Anomaly
+# flags are removed by services.anomaly_detection when it sees the tombstones.
+_TRANSACTION_DEPENDENTS = (
+    (IdempotencyKey.__table__, IdempotencyKey.transaction_id),
+    (ImportedTransaction.__table__, ImportedTransaction.transaction_id),
+    (TransactionTag.__table__, TransactionTag.transaction_id),
+)
+
+
+def _transaction_conditions(user_id, conditions=(), batch_id=None):
+    conditions = [Transaction.user_id == user_id, *conditions]
+    if batch_id is not None:
+        conditions.append(Transaction.id.in_(
+            select(ImportedTransaction.transaction_id).where(ImportedTransaction.batch_id == batch_id)
+        ))
+    return conditions
+
+
+def count_transactions(user_id, conditions=(), batch_id=None):
+    return db.session.execute(
+        select(func.count()).select_from(Transaction).where(*_transaction_conditions(user_id, conditions, batch_id))
+    ).scalar()
+
+
+def delete_transaction_ids(user_id, transaction_ids):
+    """
+    Delete transactions by id with set-based statements and write their
+    change-log tombstones, inside the caller's database transaction. The
+    tombstones are what keep everything derived from transactions current:
+    sync clients, budget counters, anomaly flags, ETags and cached
+    fragments all follow the change log.
+    """
+    if not transaction_ids:
+        return
+    connection = db.session.connection()
+    for table, column in _TRANSACTION_DEPENDENTS:
+        connection.execute(delete(table).where(column.in_(transaction_ids)))
+    connection.execute(delete(Transaction.__table__).where(
+        Transaction.user_id == user_id,
+        Transaction.id.in_(transaction_ids)
+    ))
+    record_changes(db.session, [(user_id, 'transaction', transaction_id, DELETE)
+                                for transaction_id in transaction_ids])
+
+
+def _delete_archived(user_id, filters, batch_id):
+    """
+    Yield the number of archived transactions deleted per archived year
+    matching parsed filters and, optionally, an import batch, committing
+    each year with the tombstones of its rows.
+    """
+    filters = filters or {}
+    for year in archived_years(user_id, filters):
+        removed = delete_archived(user_id, year, lambda row: (
+            matches_filters(row, filters) and (batch_id is None or row.batch_id == batch_id)
+        ))
+        if removed:
+            record_changes(db.session, [(user_id, 'transaction', row.id, DELETE) for row in removed])
+        db.session.commit()
+        yield len(removed)
+
+
+def delete_transactions(user_id, conditions=(), batch_id=None, chunk_size=CHUNK_SIZE, progress=None,
+                        filters=None):
+    """
+    Delete a user's transactions matching SQL conditions (such as those from
+    services.transaction_filters) and, optionally, belonging to an import
+    batch. Runs as chunks of `chunk_size` rows, each committed on its own;
+    progress(deleted, total) is called after every chunk. Returns the
+    number of transactions deleted.
+
+    Archived years are covered when `filters` (the parsed filters the
+    conditions were built from) or a batch is given: their archives are
+    rewritten without the matching rows, one committed year at a time, and
+    the rows taken out of the rollups. Bare conditions reach the
+    transactions table only.
+    """
+    where = _transaction_conditions(user_id, conditions, batch_id)
+    total = count_transactions(user_id, conditions, batch_id)
+    deleted = 0
+
+    try:
+        while True:
+            ids = db.session.execute(
+                select(Transaction.id).where(*where).order_by(Transaction.id).limit(chunk_size)
+            ).scalars().all()
+            if not ids:
+                break
+            delete_transaction_ids(user_id, ids)
+            db.session.commit()
+            deleted += len(ids)
+            if progress:
+                progress(deleted, max(total, deleted))
+
+        if filters is not None or batch_id is not None:
+            for count in _delete_archived(user_id, filters, batch_id):
+                deleted += count
+                if count and progress:
+                    progress(deleted, max(total, deleted))
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return deleted
+
+
+def _untracked_archived(user_id, batch):
+    """
+    Whether the user's archive holds imported rows written during the
+    batch by an archiver that did not record batch ids yet, which undo
+    cannot attribute.
+    """
+    end = batch.completed_at or datetime.utcnow()
+    return any(row.fingerprint and row.batch_id is None and row.created_at
+               and batch.created_at <= row.created_at <= end
+               for row in archived_transactions(user_id))
+
+
+def undo_import(user_id, batch_id, chunk_size=CHUNK_SIZE, progress=None):
+    """
+    Delete the transactions an import batch created, archived ones
+    included, and mark it undone, so the same statement can be imported
+    again. Returns (batch, deleted), or (None, 0) if the user has no such
+    batch.
+    """
+    batch = db.session.execute(
+        select(ImportBatch).where(ImportBatch.id == batch_id, ImportBatch.user_id == user_id)
+    ).scalar_one_or_none()
+    if batch is None:
+        return None, 0
+    if batch.status == 'running':
+        raise UndoImportError('This import is still running.')
+    if batch.status == 'undone':
+        raise UndoImportError('This import was already undone.')
+    if _untracked_archived(user_id, batch):
+        raise UndoImportError('Some transactions from this import were archived before archives recorded '
+                              'their import; delete them by date range instead.')
+
+    deleted = delete_transactions(user_id, batch_id=batch_id, chunk_size=chunk_size, progress=progress)
+    batch.status = 'undone'
+    db.session.commit()
+    return batch, deleted
+
+
+# ---------------------------------------------
+# ACCOUNT PURGE
+# ---------------------------------------------
+def _purge_steps(user_id):
+    """
+    (name, table, key column or None, condition) in deletion order: rows
+    that reference others go first, so the purge also works where foreign
+    keys are enforced without cascades. Keyed tables are deleted in chunks.
+    """
+    budget_ids = select(Budget.id).where(Budget.user_id == user_id)
+    return (
+        ('transaction_flags', TransactionFlag.__table__, TransactionFlag.id, TransactionFlag.user_id == user_id),
+        ('imported_transactions', ImportedTransaction.__table__, ImportedTransaction.transaction_id,
+         ImportedTransaction.user_id == user_id),
+        ('idempotency_keys', IdempotencyKey.__table__, IdempotencyKey.id, IdempotencyKey.user_id == user_id),
+        ('transaction_tags', TransactionTag.__table__, None, TransactionTag.user_id == user_id),
+        ('transactions', Transaction.__table__, Transaction.id, Transaction.user_id == user_id),
+        ('transaction_archives', TransactionArchive.__table__, TransactionArchive.id,
+         TransactionArchive.user_id == user_id),
+        ('transaction_rollups', TransactionRollup.__table__, None, TransactionRollup.user_id == user_id),
+        ('monthly_totals', MonthlyTotal.__table__, None, MonthlyTotal.user_id == user_id),
+        ('import_batches', ImportBatch.__table__, ImportBatch.id, ImportBatch.user_id == user_id),
+        ('budget_alerts', BudgetAlert.__table__, BudgetAlert.id, BudgetAlert.user_id == user_id),
+        ('budget_period_totals', BudgetPeriodTotal.__table__, None, BudgetPeriodTotal.budget_id.in_(budget_ids)),
+        ('budgets', Budget.__table__, Budget.id, Budget.user_id == user_id),
+        ('recurring_transactions', RecurringTransaction.__table__, RecurringTransaction.id,
+         RecurringTransaction.user_id == user_id),
+        ('tags', Tag.__table__, Tag.id, Tag.user_id == user_id),
+        ('category_rules', CategoryRule.__table__, None, CategoryRule.user_id == user_id),
+        ('category_stats', CategoryStat.__table__, None, CategoryStat.user_id == user_id),
+        ('known_merchants', KnownMerchant.__table__, None, KnownMerchant.user_id == user_id),
+        ('insight_snapshots', InsightSnapshot.__table__, None, InsightSnapshot.user_id == user_id),
+        ('change_log', ChangeLog.__table__, ChangeLog.seq, ChangeLog.user_id == user_id),
+    )
+
+
+def _delete_chunked(table, key, condition, chunk_size):
+    deleted = 0
+    while True:
+        result = db.session.execute(delete(table).where(
+            key.in_(select(key).where(condition).limit(chunk_size))
+        ))
+        db.session.commit()
+        deleted += result.rowcount
+        if result.rowcount < chunk_size:
+            return deleted
+
+
+def purge_user(user_id, chunk_size=CHUNK_SIZE, progress=None):
+    """
+    Delete a user and everything they own without loading any of it, one
+    table at a time in committed chunks. No tombstones are written: the
+    change log goes too, and nobody is left to sync. progress(table,
+    deleted) is called after each table. Returns {table: rows deleted}, or
+    None if there is no such user.
+    """
+    if db.session.get(User, user_id) is None:
+        return None
+    db.session.expunge_all()
+
+    counts = {}
+    try:
+        for name, table, key, condition in _purge_steps(user_id):
+            if key is None:
+                counts[name] = db.session.execute(delete(table).where(condition)).rowcount
+                db.session.commit()
+            else:
+                counts[name] = _delete_chunked(table, key, condition, chunk_size)
+            if progress:
+                progress(name, counts[name])
+
+        counts['users'] = db.session.execute(delete(User.__table__).where(User.id == user_id)).rowcount
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        invalidate_user(user_id)
+
+    return counts
@@ -0,0 +1,247 @@
+import json
+from datetime import datetime
+
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+
+from models import db
+from models.transaction import Transaction
+from models.idempotency_key import IdempotencyKey
+from services.batching import CHUNK_SIZE, chunks
+from services.categorization_rules import apply_rules, tag_new_transactions
+from services.change_feed import record_changes, INSERT
+from services.currency import CurrencyError, DEFAULT_CURRENCY, base_currency, parse_currency
+
+
+MAX_BULK_ITEMS = 10000
+REQUIRED_FIELDS = ('transaction_type', 'category', 'amount', 'date')
+
+
+class BulkPayloadError(ValueError):
+    """Raised when a bulk request body cannot be read at all."""
+
+
+# ---------------------------------------------
+# PAYLOAD PARSING
+# ---------------------------------------------
+def parse_bulk_payload(request):
+    """
+    Read a bulk request body into a list of items.
+
+    Accepts a JSON array, a JSON object with a "transactions" array, or
+    NDJSON (one object per line). A malformed NDJSON line becomes an item
+    of None so it is reported at its index instead of failing the batch.
+    """
+    if 'ndjson' in (request.mimetype or ''):
+        items = []
+        for line in request.get_data(as_text=True).splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                items.append(json.loads(line))
+            except ValueError:
+                items.append(None)
+        return items
+
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get('transactions')
+    if not isinstance(data, list):
+        raise BulkPayloadError('Expected a JSON array of transactions or NDJSON')
+    return data
+
+
+# ---------------------------------------------
+# VALIDATION
+# ---------------------------------------------
+def validate_transactions(items, currency=DEFAULT_CURRENCY):
+    """
+    Validate every item in one pass. Items without a currency are in
+    `currency` (the user's base currency).
+
+    Returns (rows, errors): rows is a list of (index, row_dict) ready to be
+    inserted and errors maps index -> message. Date strings are parsed once
+    per distinct value, since offline queues usually repeat a few dates.
+    """
+    rows = []
+    errors = {}
+    parsed_dates = {}
+
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors[index] = 'Invalid transaction object'
+            continue
+
+        if not all(item.get(k) not in (None, '') for k in REQUIRED_FIELDS):
+            errors[index] = 'Missing required fields'
+            continue
+
+        try:
+            amount = float(item['amount'])
+        except (ValueError, TypeError):
+            errors[index] = 'Invalid amount format'
+            continue
+        if amount <= 0:
+            errors[index] = 'Amount must be greater than zero'
+            continue
+
+        date_str = item['date']
+        date_obj = parsed_dates.get(date_str)
+        if date_obj is None:
+            try:
+                date_obj = datetime.strptime(date_str, '%Y-%m-%d').date()
+            except (ValueError, TypeError):
+                errors[index] = 'Invalid date format. Use YYYY-MM-DD'
+                continue
+            parsed_dates[date_str] = date_obj
+
+        try:
+            item_currency = parse_currency(item.get('currency'), currency)
+        except CurrencyError as e:
+            errors[index] = str(e)
+            continue
+
+        rows.append((index, {
+            'transaction_type': item['transaction_type'],
+            'category': item['category'],
+            'amount': amount,
+            'currency': item_currency,
+            'description': item.get('description', ''),
+            'date': date_obj
+        }))
+
+    return rows, errors
+
+
+def _idempotency_key(item, index, request_key):
+    key = item.get('idempotency_key') if isinstance(item, dict) else None
+    if key:
+        return str(key)[:128]
+    if request_key:
+        return f"{request_key}:{index}"[:128]
+    return None
+
+
+# ---------------------------------------------
+# INSERTION
+# ---------------------------------------------
+def _existing_keys(user_id, keys):
+    existing = {}
+    for chunk in chunks(keys):
+        existing.update(db.session.execute(
+            select(IdempotencyKey.key, IdempotencyKey.transaction_id).where(
+                IdempotencyKey.user_id == user_id,
+                IdempotencyKey.key.in_(chunk)
+            )
+        ).all())
+    return existing
+
+
+def insert_transaction_rows(user_id, rows, chunk_size=CHUNK_SIZE):
+    """
+    Insert row dicts with multi-row INSERT statements and return their ids
+    in input order. The caller owns the surrounding transaction. Core
+    inserts bypass the ORM flush, so the change log is written here.
+    """
+    ids = []
+    dialect = db.session.get_bind().dialect
+    use_returning = getattr(dialect, 'insert_executemany_returning_sort_by_parameter_order', False)
+
+    for chunk in chunks(rows, chunk_size):
+        chunk = [dict(row, user_id=user_id) for row in chunk]
+        if use_returning:
+            result = db.session.execute(
+                insert(Transaction).returning(Transaction.id, sort_by_parameter_order=True),
+                chunk
+            )
+            ids.extend(result.scalars().all())
+        else:
+            for row in chunk:
+                result = db.session.execute(insert(Transaction), row)
+                ids.append(result.inserted_primary_key[0])
+
+    record_changes(db.session, [(user_id, 'transaction', transaction_id, INSERT) for transaction_id in ids])
+
+    return ids
+
+
+def _insert_items(user_id, rows, keys, results, currency):
+    """
+    Insert the validated rows whose idempotency keys are not stored yet and
+    commit, filling in `results`; rows with a stored key (or one repeated
+    earlier in the batch) are reported as duplicates.
+    """
+    existing = _existing_keys(user_id, [k for k in keys.values() if k])
+
+    to_insert = []
+    seen = {}
+    for index, row in rows:
+        key = keys[index]
+        if key and key in existing:
+            results[index] = {'index': index, 'status': 'duplicate', 'id': existing[key]}
+        elif key and key in seen:
+            results[index] = {'index': index, 'status': 'duplicate', 'duplicate_of': seen[key]}
+        else:
+            if key:
+                seen[key] = index
+            to_insert.append((index, row))
+
+    try:
+        rule_tags = apply_rules(user_id, [row for _, row in to_insert], currency)
+        ids = insert_transaction_rows(user_id, [row for _, row in to_insert])
+        tag_new_transactions(user_id, ids, rule_tags)
+
+        key_rows = []
+        for (index, _), transaction_id in zip(to_insert, ids):
+            results[index] = {'index': index, 'status': 'created', 'id': transaction_id}
+            if keys[index]:
+                key_rows.append({
+                    'user_id': user_id,
+                    'key': keys[index],
+                    'transaction_id': transaction_id
+                })
+
+        for chunk in chunks(key_rows):
+            db.session.execute(insert(IdempotencyKey), chunk)
+
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def bulk_create_transactions(user_id, items, request_key=None):
+    """
+    Validate and insert a batch of transactions inside one database
+    transaction. Returns per-item results in input order.
+
+    Items carrying an idempotency key (either their own "idempotency_key"
+    or one derived from the request's Idempotency-Key header) that was
+    already stored are reported as duplicates instead of inserted again,
+    so a client can safely retry a whole batch. A concurrent retry that
+    stores some of the keys first makes this batch's insert fail on them;
+    the batch is then rolled back and run once more, replaying the stored
+    results for those keys. The user's categorization rules run over the
+    rows that are inserted.
+    """
+    currency = base_currency(user_id)
+    rows, errors = validate_transactions(items, currency)
+    results = [None] * len(items)
+
+    for index, message in errors.items():
+        results[index] = {'index': index, 'status': 'error', 'error': message}
+
+    keys = {index: _idempotency_key(items[index], index, request_key) for index, _ in rows}
+    try:
+        _insert_items(user_id, rows, keys, results, currency)
+    except IntegrityError:
+        if not any(keys.values()):
+            raise
+        _insert_items(user_id, rows, keys, results, currency)
+
+    for result in results:
+        if result.get('duplicate_of') is not None:
+            result['id'] = results[result.pop('duplicate_of')].get('id')
+
+    return results
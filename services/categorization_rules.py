@@ -0,0 +1,408 @@
+from bisect import bisect_left, bisect_right
+from collections import deque, namedtuple
+from math import isfinite
+
+from sqlalchemy import func, select, update
+
+from models import db
+from models.category_rule import CategoryRule
+from models.transaction import Transaction
+from services.cache import TTLCache
+from services.change_feed import UPSERT, record_changes
+from services.currency import base_currency, convert
+from services.tags import TagError, normalize_tag, tag_transactions
+
+
+MAX_RULES = 2000
+MAX_KEYWORDS = 20
+MAX_KEYWORD_LENGTH = 50
+TRANSACTION_TYPES = ('income', 'expense')
+# Transactions read, matched and updated per committed step of a re-apply
+REAPPLY_CHUNK_SIZE = 2000
+
+# Compiled rules per user, checked against the rules' version on every use,
+# so the TTL only bounds memory for idle users
+_compiled = TTLCache(maxsize=256, ttl=1800)
+
+RuleMatch = namedtuple('RuleMatch', 'category transaction_type tags rule_ids')
+_Rule = namedtuple('_Rule', 'id keywords match_type min_amount max_amount category transaction_type tag')
+
+
+class RuleError(ValueError):
+    """Raised for an invalid categorization rule; the message is user-facing."""
+
+
+# ---------------------------------------------
+# VALIDATION
+# ---------------------------------------------
+def parse_keywords(value):
+    """Unique lowercased keywords, in order, from a list or a comma-separated string."""
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = value.split(',')
+    if not isinstance(value, (list, tuple)) or not all(isinstance(keyword, str) for keyword in value):
+        raise RuleError('Keywords must be a list or a comma-separated string.')
+
+    keywords = [keyword for keyword in dict.fromkeys(' '.join(k.lower().split()) for k in value) if keyword]
+    if len(keywords) > MAX_KEYWORDS:
+        raise RuleError(f'A rule takes at most {MAX_KEYWORDS} keywords.')
+    if any(len(keyword) > MAX_KEYWORD_LENGTH for keyword in keywords):
+        raise RuleError(f'Keywords are at most {MAX_KEYWORD_LENGTH} characters.')
+    return keywords
+
+
+def _text(value):
+    return value.strip() if isinstance(value, str) else ''
+
+
+def _transaction_type(value, label):
+    value = _text(value).lower()
+    if not value or value == 'any':
+        return None
+    if value not in TRANSACTION_TYPES:
+        raise RuleError(f'{label} must be income or expense.')
+    return value
+
+
+def _amount(value, label):
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    try:
+        amount = float(value)
+    except (TypeError, ValueError):
+        raise RuleError(f'Invalid {label}.')
+    if not isfinite(amount) or amount < 0:
+        raise RuleError(f'The {label} must be zero or more.')
+    return amount
+
+
+def parse_rule(data):
+    """Column values of a rule from form or JSON fields. Raises RuleError."""
+    keywords = parse_keywords(data.get('keywords'))
+    values = {
+        'keywords': ', '.join(keywords) or None,
+        'match_type': _transaction_type(data.get('match_type'), 'The type to match'),
+        'min_amount': _amount(data.get('min_amount'), 'minimum amount'),
+        'max_amount': _amount(data.get('max_amount'), 'maximum amount'),
+        'category': _text(data.get('category'))[:50] or None,
+        'transaction_type': _transaction_type(data.get('transaction_type'), 'The type to set'),
+        'tag': None,
+    }
+
+    if _text(data.get('tag')):
+        try:
+            values['tag'] = normalize_tag(data.get('tag'))
+        except TagError as e:
+            raise RuleError(str(e))
+
+    if values['min_amount'] is not None and values['max_amount'] is not None \
+            and values['min_amount'] > values['max_amount']:
+        raise RuleError('The minimum amount is above the maximum.')
+    if not (keywords or values['match_type'] or values['min_amount'] is not None
+            or values['max_amount'] is not None):
+        raise RuleError('Give the rule a condition: keywords, a type or an amount range.')
+    if not (values['category'] or values['transaction_type'] or values['tag']):
+        raise RuleError('Give the rule an action: a category, a type or a tag.')
+    return values
+
+
+def create_rule(user_id, data):
+    """Add a validated rule after the user's others, in the caller's transaction. Raises RuleError."""
+    values = parse_rule(data)
+    count, last = db.session.execute(
+        select(func.count(), func.max(CategoryRule.position)).where(CategoryRule.user_id == user_id)
+    ).one()
+    if count >= MAX_RULES:
+        raise RuleError(f'You can have at most {MAX_RULES} rules.')
+
+    rule = CategoryRule(user_id=user_id, position=(last or 0) + 1, **values)
+    db.session.add(rule)
+    return rule
+
+
+def get_rules(user_id):
+    return CategoryRule.query.filter_by(user_id=user_id).order_by(CategoryRule.position, CategoryRule.id).all()
+
+
+# ---------------------------------------------
+# COMPILED RULES
+# ---------------------------------------------
+class CompiledRules:
+    """
+    A user's active rules compiled for matching many transactions. Rule i
+    (in priority order) is bit i of a Python int, and each condition is a
+    table answering, for one transaction, the mask of rules it satisfies:
+
+      keywords     an Aho-Corasick automaton over every rule's keywords,
+                   so one pass over the description finds all of them
+      amounts      rule bounds sorted, with prefix (minimum <= amount) and
+                   suffix (maximum >= amount) masks found by bisection
+      types        one mask per transaction type
+
+    The AND of the masks holds the matching rules, read lowest bit first.
+    Matching costs one description scan and a few bisections however many
+    rules there are, instead of testing every rule in turn.
+    """
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [0]
+        self._any_keyword = 0
+        any_type = 0
+        types = dict.fromkeys(TRANSACTION_TYPES, 0)
+        lower, upper = [], []
+        self._no_min = self._no_max = 0
+
+        for bit, rule in enumerate(self.rules):
+            flag = 1 << bit
+            if rule.keywords:
+                for keyword in rule.keywords:
+                    self._add_keyword(keyword, flag)
+            else:
+                self._any_keyword |= flag
+            if rule.match_type:
+                types[rule.match_type] |= flag
+            else:
+                any_type |= flag
+            if rule.min_amount is None:
+                self._no_min |= flag
+            else:
+                lower.append((rule.min_amount, flag))
+            if rule.max_amount is None:
+                self._no_max |= flag
+            else:
+                upper.append((rule.max_amount, flag))
+
+        self._link()
+        self._any_type = any_type
+        self._types = {name: mask | any_type for name, mask in types.items()}
+
+        # _lower_masks[k]: rules whose minimum is among the k smallest
+        lower.sort(key=lambda bound: bound[0])
+        self._lower_bounds = [amount for amount, _ in lower]
+        self._lower_masks = [0]
+        for _, flag in lower:
+            self._lower_masks.append(self._lower_masks[-1] | flag)
+
+        # _upper_masks[k]: rules whose maximum is the k-th smallest or above
+        upper.sort(key=lambda bound: bound[0])
+        self._upper_bounds = [amount for amount, _ in upper]
+        self._upper_masks = [0] * (len(upper) + 1)
+        for index in range(len(upper) - 1, -1, -1):
+            self._upper_masks[index] = self._upper_masks[index + 1] | upper[index][1]
+
+    def __len__(self):
+        return len(self.rules)
+
+    def _add_keyword(self, keyword, flag):
+        state = 0
+        for char in keyword:
+            following = self._goto[state].get(char)
+            if following is None:
+                following = len(self._goto)
+                self._goto[state][char] = following
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(0)
+            state = following
+        self._output[state] |= flag
+
+    def _link(self):
+        """Failure links breadth first, each state inheriting the output of its longest proper suffix."""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, following in self._goto[state].items():
+                queue.append(following)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[following] = self._goto[fallback].get(char, 0)
+                self._output[following] |= self._output[self._fail[following]]
+
+    def keyword_mask(self, text):
+        """Rules with a keyword occurring in `text` (lowercased)."""
+        goto, fail, output = self._goto, self._fail, self._output
+        state = found = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            found |= output[state]
+        return found
+
+    def amount_mask(self, amount):
+        return ((self._no_min | self._lower_masks[bisect_right(self._lower_bounds, amount)])
+                & (self._no_max | self._upper_masks[bisect_left(self._upper_bounds, amount)]))
+
+    def match(self, description, amount, transaction_type):
+        """RuleMatch for one transaction (amount in the user's base currency), or None."""
+        candidates = self._types.get(transaction_type, self._any_type) & self.amount_mask(amount)
+        if not candidates:
+            return None
+        candidates &= self._any_keyword | self.keyword_mask((description or '').lower())
+        if not candidates:
+            return None
+
+        category = new_type = None
+        tags, rule_ids = [], []
+        while candidates:
+            lowest = candidates & -candidates
+            candidates ^= lowest
+            rule = self.rules[lowest.bit_length() - 1]
+            rule_ids.append(rule.id)
+            category = category or rule.category
+            new_type = new_type or rule.transaction_type
+            if rule.tag and rule.tag not in tags:
+                tags.append(rule.tag)
+        return RuleMatch(category, new_type, tuple(tags), tuple(rule_ids))
+
+
+def compile_rules(rules):
+    """CompiledRules from CategoryRule rows (inactive ones are left out), in priority order."""
+    return CompiledRules(
+        _Rule(rule.id, tuple(rule.keyword_list()), rule.match_type, rule.min_amount, rule.max_amount,
+              rule.category, rule.transaction_type, rule.tag)
+        for rule in sorted(rules, key=lambda rule: (rule.position, rule.id)) if rule.is_active
+    )
+
+
+def _version(user_id):
+    return tuple(db.session.execute(
+        select(func.count(), func.max(CategoryRule.updated_at)).where(CategoryRule.user_id == user_id)
+    ).one())
+
+
+def compiled_rules(user_id):
+    """A user's compiled rules, recompiled whenever a rule was added, changed or deleted."""
+    version = _version(user_id)
+    cached = _compiled.get(user_id)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    rules = compile_rules(CategoryRule.query.filter_by(user_id=user_id).all()) if version[0] else CompiledRules(())
+    _compiled.set(user_id, (version, rules))
+    return rules
+
+
+# ---------------------------------------------
+# APPLYING TO NEW TRANSACTIONS
+# ---------------------------------------------
+def apply_rules(user_id, rows, currency=None):
+    """
+    Run a user's rules over row dicts about to be inserted (description,
+    amount, currency, date, transaction_type, category), setting category
+    and type where a rule says so. Returns the tags to add to each row once
+    it has an id (see tag_new_transactions), in input order.
+    """
+    rules = compiled_rules(user_id)
+    if not rules:
+        return [()] * len(rows)
+
+    currency = currency or base_currency(user_id)
+    tags = []
+    for row in rows:
+        row_currency = row.get('currency') or currency
+        amount = row['amount'] if row_currency == currency else convert(row['amount'], row_currency, currency,
+                                                                         row['date'])
+        matched = rules.match(row.get('description'), amount, row['transaction_type'])
+        if matched is None:
+            tags.append(())
+            continue
+        if matched.category:
+            row['category'] = matched.category
+        if matched.transaction_type:
+            row['transaction_type'] = matched.transaction_type
+        tags.append(matched.tags)
+    return tags
+
+
+def apply_rules_to_transaction(transaction):
+    """apply_rules for one pending Transaction object. Returns its rule tags."""
+    row = {'description': transaction.description, 'amount': transaction.amount, 'currency': transaction.currency,
+           'date': transaction.date, 'transaction_type': transaction.transaction_type,
+           'category': transaction.category}
+    tags = apply_rules(transaction.user_id, [row])[0]
+    transaction.category = row['category']
+    transaction.transaction_type = row['transaction_type']
+    return list(tags)
+
+
+def tag_new_transactions(user_id, transaction_ids, tags):
+    """Add the tags apply_rules returned, one set-based statement per tag."""
+    by_tag = {}
+    for transaction_id, names in zip(transaction_ids, tags):
+        for name in names:
+            by_tag.setdefault(name, []).append(transaction_id)
+    for name, ids in by_tag.items():
+        tag_transactions(user_id, ids, add=[name])
+
+
+# ---------------------------------------------
+# RE-APPLYING TO HISTORY
+# ---------------------------------------------
+def reapply_rules(user_id, chunk_size=REAPPLY_CHUNK_SIZE, progress=None):
+    """
+    Run a user's current rules over all of their live transactions (the
+    archive is left as it was), a chunk of ids at a time: each chunk is
+    matched in memory, then updated with one UPDATE ... WHERE id IN (...)
+    per distinct (category, type) outcome and tagged with one statement per
+    tag, and committed with its change-log entries. Returns counts of the
+    transactions checked, matched by a rule and recategorized.
+    """
+    counts = {'checked': 0, 'matched': 0, 'recategorized': 0}
+    rules = compiled_rules(user_id)
+    if not rules:
+        return counts
+
+    currency = base_currency(user_id)
+    table = Transaction.__table__
+    last_id = 0
+    try:
+        while True:
+            rows = db.session.execute(
+                select(table.c.id, table.c.description, table.c.amount, table.c.currency, table.c.date,
+                       table.c.transaction_type, table.c.category).where(
+                    table.c.user_id == user_id, table.c.id > last_id
+                ).order_by(table.c.id).limit(chunk_size)
+            ).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            outcomes, by_tag = {}, {}
+            for row in rows:
+                amount = row.amount if row.currency == currency else convert(row.amount, row.currency, currency,
+                                                                             row.date)
+                matched = rules.match(row.description, amount, row.transaction_type)
+                if matched is None:
+                    continue
+                counts['matched'] += 1
+                outcome = (matched.category or row.category, matched.transaction_type or row.transaction_type)
+                if outcome != (row.category, row.transaction_type):
+                    outcomes.setdefault(outcome, []).append(row.id)
+                for name in matched.tags:
+                    by_tag.setdefault(name, []).append(row.id)
+
+            changed = []
+            for (category, transaction_type), ids in outcomes.items():
+                db.session.execute(update(table).where(table.c.id.in_(ids)).values(
+                    category=category, transaction_type=transaction_type))
+                changed.extend(ids)
+            record_changes(db.session, [(user_id, 'transaction', transaction_id, UPSERT)
+                                        for transaction_id in sorted(changed)])
+            for name, ids in by_tag.items():
+                tag_transactions(user_id, ids, add=[name])
+            db.session.commit()
+
+            counts['checked'] += len(rows)
+            counts['recategorized'] += len(changed)
+            if progress:
+                progress(counts)
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return counts
@@ -0,0 +1,226 @@
+from datetime import datetime, timedelta
+
+from blinker import Namespace
+from sqlalchemy import event, insert, select, func
+from sqlalchemy.orm import Session
+
+from models import db
+from models.change_log import ChangeLog
+from models.transaction import Transaction
+from models.budget import Budget
+from models.recurring_transaction import RecurringTransaction
+from models.tag import Tag
+
+
+# Entity name used in the change log -> (model, key in sync responses)
+TRACKED_ENTITIES = {
+    'transaction': (Transaction, 'transactions'),
+    'budget': (Budget, 'budgets'),
+    'recurring': (RecurringTransaction, 'recurring_transactions'),
+    # Also upserted whenever transactions are tagged or untagged
+    'tag': (Tag, 'tags'),
+}
+_ENTITY_NAMES = {model: name for name, (model, _) in TRACKED_ENTITIES.items()}
+
+# Operations; sync clients treat INSERT and UPSERT alike
+INSERT = 'insert'
+UPSERT = 'upsert'
+DELETE = 'delete'
+
+DEFAULT_BATCH_SIZE = 500
+MAX_BATCH_SIZE = 5000
+
+# PostgreSQL numbers entries when they are inserted, not when they commit,
+# so an entry can become visible after higher ones were already read.
+# Readers only move their position past entries older than this (every
+# transaction is assumed to commit within it) and read newer ones again.
+# SQLite runs one writer at a time, so its entries commit in order.
+SETTLE_SECONDS = 30
+
+_signals = Namespace()
+# Sent with (session, changes=[(user_id, entity, entity_id, operation), ...])
+# after the entries are written, inside the same database transaction.
+changes_recorded = _signals.signal('changes-recorded')
+
+
+# ---------------------------------------------
+# RECORDING
+# ---------------------------------------------
+def record_changes(session, changes):
+    """
+    Append (user_id, entity, entity_id, operation) tuples to the change log
+    on the session's current connection, so they commit or roll back with
+    the writes they describe, then notify changes_recorded receivers.
+
+    ORM flushes are captured automatically; code that writes with Core
+    statements (bulk inserts, set-based deletes) must call this itself.
+    """
+    if not changes:
+        return
+
+    now = datetime.utcnow()
+    session.connection().execute(insert(ChangeLog.__table__), [{
+        'user_id': user_id,
+        'entity': entity,
+        'entity_id': entity_id,
+        'operation': operation,
+        'created_at': now
+    } for user_id, entity, entity_id, operation in changes])
+
+    changes_recorded.send(session, changes=changes)
+
+
+@event.listens_for(Session, 'after_flush')
+def _record_flush(session, flush_context):
+    changes = []
+
+    for obj in session.new:
+        entity = _ENTITY_NAMES.get(type(obj))
+        if entity:
+            changes.append((obj.user_id, entity, obj.id, INSERT))
+
+    for obj in session.dirty:
+        entity = _ENTITY_NAMES.get(type(obj))
+        if entity and session.is_modified(obj, include_collections=False):
+            changes.append((obj.user_id, entity, obj.id, UPSERT))
+
+    deleted_users = set()
+    for obj in session.deleted:
+        entity = _ENTITY_NAMES.get(type(obj))
+        if entity:
+            changes.append((obj.user_id, entity, obj.id, DELETE))
+        elif obj.__tablename__ == 'users':
+            deleted_users.add(obj.id)
+
+    # A deleted user's log goes with them (and would violate its foreign key)
+    if deleted_users:
+        changes = [change for change in changes if change[0] not in deleted_users]
+
+    record_changes(session, changes)
+
+
+# ---------------------------------------------
+# READING
+# ---------------------------------------------
+def settled_before(connection):
+    """
+    Creation time before which every entry is committed or rolled back, or
+    None where entries commit in sequence order.
+    """
+    if connection.dialect.name == 'sqlite':
+        return None
+    return datetime.utcnow() - timedelta(seconds=SETTLE_SECONDS)
+
+
+def settled_position(connection, entries, since):
+    """
+    How far a reader of (seq, created_at, ...) entries in seq order can
+    safely move from `since`: the last entry before the first one that
+    could still have unseen lower neighbours.
+    """
+    cutoff = settled_before(connection)
+    position = since
+    for seq, created_at, *_ in entries:
+        if cutoff is not None and created_at is not None and created_at >= cutoff:
+            break
+        position = seq
+    return position
+
+
+def get_head_token(user_id, connection=None):
+    """
+    Latest change sequence number for a user that a reader can resume from
+    without missing entries still being committed (0 if nothing was
+    recorded).
+    """
+    connection = connection or db.session.connection()
+    conditions = [ChangeLog.user_id == user_id]
+    cutoff = settled_before(connection)
+    if cutoff is not None:
+        conditions.append(ChangeLog.created_at < cutoff)
+    return connection.execute(select(func.max(ChangeLog.seq)).where(*conditions)).scalar() or 0
+
+
+def _empty_payload():
+    return {key: {'upserted': [], 'deleted': []} for _, key in TRACKED_ENTITIES.values()}
+
+
+def get_snapshot(user_id):
+    """
+    Full state for a client that has no sync token yet, archived
+    transactions included. The head token is read first, so anything
+    written while the snapshot is being built (or recently enough to still
+    be settling) is sent again, harmlessly, on the next delta sync.
+    """
+    token = get_head_token(user_id)
+    payload = _empty_payload()
+
+    for model, key in TRACKED_ENTITIES.values():
+        rows = model.query.filter_by(user_id=user_id).order_by(model.id).all()
+        payload[key]['upserted'] = [row.to_dict() for row in rows]
+
+    # Archived years are no longer in the table but still part of the
+    # user's data. Read after the table, so rows archived in between are
+    # found (once) rather than missed (services.archive imports this
+    # module, hence the late import)
+    from services.archive import archived_dict, archived_transactions
+    transactions = payload[TRACKED_ENTITIES['transaction'][1]]['upserted']
+    hot = {row['id'] for row in transactions}
+    archived = [archived_dict(user_id, row) for row in archived_transactions(user_id) if row.id not in hot]
+    if archived:
+        transactions.extend(archived)
+        transactions.sort(key=lambda row: row['id'])
+
+    return {'reset': True, 'changes': payload, 'next_token': str(token), 'has_more': False}
+
+
+def get_changes(user_id, since, limit=DEFAULT_BATCH_SIZE):
+    """
+    Changes after sequence number `since`, at most `limit` log entries per
+    batch. Several entries for the same row collapse into its final state:
+    the current row for upserts, or just the id (a tombstone) for deletes.
+    The next token stops before entries that are still settling, so those
+    are sent again on the next sync rather than skipping any that commit
+    late.
+    """
+    entries = db.session.execute(
+        select(ChangeLog.seq, ChangeLog.created_at, ChangeLog.entity, ChangeLog.entity_id,
+               ChangeLog.operation).where(
+            ChangeLog.user_id == user_id,
+            ChangeLog.seq > since
+        ).order_by(ChangeLog.seq).limit(limit + 1)
+    ).all()
+
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    latest = {}
+    for seq, _, entity, entity_id, operation in entries:
+        latest.pop((entity, entity_id), None)
+        latest[(entity, entity_id)] = operation
+
+    payload = _empty_payload()
+    upserted_ids = {entity: [] for entity in TRACKED_ENTITIES}
+
+    for (entity, entity_id), operation in latest.items():
+        if entity not in TRACKED_ENTITIES:
+            continue
+        if operation == DELETE:
+            payload[TRACKED_ENTITIES[entity][1]]['deleted'].append(entity_id)
+        else:
+            upserted_ids[entity].append(entity_id)
+
+    for entity, ids in upserted_ids.items():
+        if not ids:
+            continue
+        model, key = TRACKED_ENTITIES[entity]
+        # Rows deleted after this batch are simply missing here; their
+        # tombstone arrives in a later batch.
+        rows = model.query.filter(model.user_id == user_id, model.id.in_(ids)).order_by(model.id).all()
+        payload[key]['upserted'] = [row.to_dict() for row in rows]
+
+    next_token = settled_position(db.session.connection(), entries, since)
+    # Unsettled entries are read again from the token once they settle
+    has_more = has_more and next_token == entries[-1][0]
+
+    return {'reset': False, 'changes': payload, 'next_token': str(next_token), 'has_more': has_more}
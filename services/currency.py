@@ -0,0 +1,305 @@
+import csv
+import io
+import os
+from bisect import bisect_right
+from datetime import date, datetime
+
+from sqlalchemy import and_, case, delete, extract, func, insert, literal, select
+from sqlalchemy.orm import aliased
+
+from models import db
+from models.budget_period_total import BudgetPeriodTotal
+from models.exchange_rate import DEFAULT_CURRENCY, ExchangeRate
+from models.monthly_rate import MonthlyRate
+from services.batching import chunks
+from services.cache import TTLCache
+
+
+# Rates are quoted as units of this currency per one unit of the other
+REFERENCE_CURRENCY = os.environ.get('RATES_REFERENCE', 'INR')
+
+# code -> display symbol
+CURRENCIES = {
+    'INR': '₹',
+    'USD': '$',
+    'EUR': '€',
+    'GBP': '£',
+    'JPY': '¥',
+    'AED': 'AED ',
+    'SGD': 'S$',
+    'AUD': 'A$',
+    'CAD': 'C$',
+}
+
+# Symbols seen in statement text; '$' alone is taken to be US dollars
+_SYMBOLS = (('S$', 'SGD'), ('A$', 'AUD'), ('C$', 'CAD'), ('₹', 'INR'), ('Rs.', 'INR'), ('INR', 'INR'),
+            ('€', 'EUR'), ('£', 'GBP'), ('¥', 'JPY'), ('$', 'USD'))
+
+# Span of monthly_rates: from this date (or the first rate, if earlier) to
+# this many years past the last rate (or today); other months fall back to
+# the nearest one
+MONTHLY_RATES_FROM = date(1970, 1, 1)
+MONTHLY_RATES_AHEAD = 10
+
+# currency -> (dates, rates), both ascending by date
+_series_cache = TTLCache(maxsize=256, ttl=300)
+_version_cache = TTLCache(maxsize=1, ttl=60)
+
+
+class CurrencyError(ValueError):
+    """Raised for an unknown currency code or a malformed rates file."""
+
+
+# ---------------------------------------------
+# CODES AND DISPLAY
+# ---------------------------------------------
+def parse_currency(value, default=None):
+    """Upper-cased known currency code, `default` when blank; raises CurrencyError otherwise."""
+    code = (value or '').strip().upper()
+    if not code:
+        return default
+    if code not in CURRENCIES:
+        raise CurrencyError(f'Unknown currency: {code}')
+    return code
+
+
+def currency_symbol(currency):
+    return CURRENCIES.get(currency, f'{currency} ')
+
+
+def format_money(amount, currency=DEFAULT_CURRENCY):
+    return f'{currency_symbol(currency)}{amount or 0:.2f}'
+
+
+def currency_from_text(text):
+    """Currency named by a symbol or code in statement text, or None."""
+    for symbol, currency in _SYMBOLS:
+        if symbol in text:
+            return currency
+    return None
+
+
+def init_currency(app):
+    """Install the `money` template filter and the list of currencies forms offer."""
+    app.add_template_filter(format_money, 'money')
+    app.context_processor(lambda: {'currencies': CURRENCIES})
+
+
+def base_currency(user_id):
+    """A user's base currency, from the cached principal."""
+    from services.user_cache import load_principal
+    principal = load_principal(user_id)
+    return principal.base_currency if principal is not None else DEFAULT_CURRENCY
+
+
+# ---------------------------------------------
+# RATE TABLE
+# ---------------------------------------------
+def _rate_rows(stream):
+    for line, row in enumerate(csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8-sig')), start=2):
+        try:
+            yield {
+                'currency': parse_currency(row.get('currency')),
+                'date': datetime.strptime((row.get('date') or '').strip(), '%Y-%m-%d').date(),
+                'rate': float(row.get('rate')),
+            }
+        except (TypeError, ValueError) as e:
+            raise CurrencyError(f'Line {line}: {e}') from None
+
+
+def load_rates(stream):
+    """
+    Load dated rates from a CSV file (binary stream) with date, currency and
+    rate columns, rate being units of REFERENCE_CURRENCY per unit. For each
+    currency the file replaces the stored rates over the dates it covers.
+    Budget period counters summed at the old rates are dropped, to be
+    re-seeded on next use. Returns the number of rates loaded.
+    """
+    rows = [row for row in _rate_rows(stream) if row['currency'] != REFERENCE_CURRENCY]
+    if any(row['rate'] <= 0 for row in rows):
+        raise CurrencyError('Rates must be greater than zero')
+
+    spans = {}
+    for row in rows:
+        first, last = spans.get(row['currency'], (row['date'], row['date']))
+        spans[row['currency']] = (min(first, row['date']), max(last, row['date']))
+
+    now = datetime.utcnow()
+    unique = {(row['currency'], row['date']): dict(row, updated_at=now) for row in rows}
+    try:
+        for currency, (first, last) in spans.items():
+            db.session.execute(delete(ExchangeRate).where(
+                ExchangeRate.currency == currency, ExchangeRate.date >= first, ExchangeRate.date <= last
+            ))
+        for chunk in chunks(unique.values()):
+            db.session.execute(insert(ExchangeRate), chunk)
+        rebuild_monthly_rates(db.session.connection())
+        db.session.execute(delete(BudgetPeriodTotal))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    _series_cache.clear()
+    _version_cache.clear()
+    return len(unique)
+
+
+def _rates_version_statement():
+    return select(func.count(), func.max(ExchangeRate.updated_at))
+
+
+def _version_from_row(count, updated_at):
+    return f'{count}:{updated_at.isoformat() if updated_at else ""}'
+
+
+def rates_version():
+    """Changes whenever rates are loaded; part of cache keys for converted figures."""
+    version = _version_cache.get('version')
+    if version is None:
+        version = _version_from_row(*db.session.execute(_rates_version_statement()).one())
+        _version_cache.set('version', version)
+    return version
+
+
+async def rates_version_async():
+    from services.async_db import fetch_all
+    version = _version_cache.get('version')
+    if version is None:
+        version = _version_from_row(*(await fetch_all(_rates_version_statement()))[0])
+        _version_cache.set('version', version)
+    return version
+
+
+# ---------------------------------------------
+# CONVERSION
+# ---------------------------------------------
+# An amount converts at its currency's rate in force on the 1st of the
+# amount's month, the rate monthly totals and archived rollups (which keep
+# a month per row) convert at too, so a period sums the same from buckets
+# as from rows. A currency's rate on a day is its latest rate on or before
+# that day, else its earliest one; a currency without rates converts at par.
+def month_index(day):
+    """year * 12 + month - 1, the key of monthly_rates."""
+    return day.year * 12 + day.month - 1
+
+
+def _rate_in(dates, rates, day):
+    if not dates:
+        return 1.0
+    index = bisect_right(dates, day)
+    return rates[index - 1] if index else rates[0]
+
+
+def _series(currency):
+    series = _series_cache.get(currency)
+    if series is None:
+        rows = db.session.execute(
+            select(ExchangeRate.date, ExchangeRate.rate).where(
+                ExchangeRate.currency == currency
+            ).order_by(ExchangeRate.date)
+        ).all()
+        series = ([day for day, _ in rows], [rate for _, rate in rows])
+        _series_cache.set(currency, series)
+    return series
+
+
+def rate_on(currency, day):
+    if currency == REFERENCE_CURRENCY:
+        return 1.0
+    return _rate_in(*_series(currency), day)
+
+
+def convert(amount, currency, to, day):
+    """Convert one amount in Python at its month's rates, from cached rate series."""
+    if currency == to or not amount:
+        return amount
+    first = date(day.year, day.month, 1)
+    return amount * rate_on(currency, first) / rate_on(to, first)
+
+
+def rebuild_monthly_rates(connection):
+    """
+    Derive monthly_rates from exchange_rates: every known currency (the
+    reference, and any without rates, at par) for each month from
+    MONTHLY_RATES_FROM, or the first rate, to MONTHLY_RATES_AHEAD years past
+    the last rate or today.
+    """
+    series = {}
+    for currency, day, rate in connection.execute(
+        select(ExchangeRate.currency, ExchangeRate.date, ExchangeRate.rate).order_by(
+            ExchangeRate.currency, ExchangeRate.date)
+    ):
+        dates, rates = series.setdefault(currency, ([], []))
+        dates.append(day)
+        rates.append(rate)
+
+    first = min([month_index(MONTHLY_RATES_FROM)] + [month_index(dates[0]) for dates, _ in series.values()])
+    last = max([month_index(date.today())] + [month_index(dates[-1]) for dates, _ in series.values()]) + \
+        12 * MONTHLY_RATES_AHEAD
+    currencies = set(CURRENCIES) | set(series) | {REFERENCE_CURRENCY}
+    rows = [{'currency': currency, 'month': month,
+             'rate': _rate_in(*series.get(currency, ([], [])), date(month // 12, month % 12 + 1, 1))}
+            for currency in sorted(currencies) for month in range(first, last + 1)]
+
+    connection.execute(delete(MonthlyRate.__table__))
+    for chunk in chunks(rows):
+        connection.execute(insert(MonthlyRate.__table__), chunk)
+    return len(rows)
+
+
+def ensure_monthly_rates():
+    """Derive the monthly rates of a database that has none yet."""
+    if db.session.execute(select(MonthlyRate.currency).limit(1)).first() is not None:
+        return
+    try:
+        rebuild_monthly_rates(db.session.connection())
+        db.session.commit()
+    except Exception:
+        # Another worker starting at the same time derived them first
+        db.session.rollback()
+        if db.session.execute(select(MonthlyRate.currency).limit(1)).first() is None:
+            raise
+
+
+def _nearest_rate(currency, month):
+    """
+    Rate of `currency` in the first or last month monthly_rates has, for a
+    month outside its span; only evaluated for rows the join missed.
+    """
+    first = select(func.min(MonthlyRate.month)).scalar_subquery()
+    last = select(func.max(MonthlyRate.month)).scalar_subquery()
+    return select(MonthlyRate.rate).where(
+        MonthlyRate.currency == currency, MonthlyRate.month == case((month < first, first), else_=last)
+    ).scalar_subquery()
+
+
+class Conversion:
+    """
+    `amount` (columns or expressions of a row, in `currency` on `day`) in
+    the currency `to` at month rates, as a SQL expression for SUM() and the
+    like. The rates come from monthly_rates, outer-joined once per side on
+    its primary key; pass the statement selecting `amount` through join().
+    Rows already in `to` skip the rates.
+    """
+
+    def __init__(self, amount, currency, day, to):
+        month = extract('year', day) * 12 + extract('month', day) - 1
+        # Rows already in `to` never need a rate
+        foreign = currency != to
+        self._joins = []
+        rates = []
+        for code in (currency, to):
+            if isinstance(code, str) and code == REFERENCE_CURRENCY:
+                rates.append(literal(1.0))
+                continue
+            alias = aliased(MonthlyRate)
+            self._joins.append((alias, and_(foreign, alias.currency == code, alias.month == month)))
+            rates.append(func.coalesce(alias.rate, _nearest_rate(code, month), 1.0))
+        self.amount = case((currency == to, amount), else_=amount * rates[0] / rates[1])
+
+    def join(self, statement):
+        """A select() or Query with the rate lookups `amount` reads joined in."""
+        for alias, onclause in self._joins:
+            statement = statement.outerjoin(alias, onclause)
+        return statement
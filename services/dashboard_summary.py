@@ -0,0 +1,80 @@
+from sqlalchemy import func, extract, select
+
+from models import db
+from models.transaction import Transaction
+from services.archive import history_subquery
+from services.async_db import fetch_all, fetch_objects
+from services.currency import base_currency
+
+
+RECENT_TRANSACTIONS = 10
+
+
+def _recent_statement(user_id, limit):
+    return select(Transaction).where(Transaction.user_id == user_id).order_by(
+        Transaction.date.desc(), Transaction.id.desc()
+    ).limit(limit)
+
+
+def get_recent_transactions(user_id, limit=RECENT_TRANSACTIONS):
+    return db.session.scalars(_recent_statement(user_id, limit)).all()
+
+
+async def get_recent_transactions_async(user_id, limit=RECENT_TRANSACTIONS):
+    return await fetch_objects(_recent_statement(user_id, limit))
+
+
+def _totals_statement(user_id, currency):
+    history = history_subquery(user_id, currency)
+    month = extract('month', history.c.date)
+    return select(
+        history.c.transaction_type,
+        history.c.category,
+        month,
+        func.sum(history.c.amount)
+    ).where(
+        history.c.transaction_type.in_(('income', 'expense'))
+    ).group_by(history.c.transaction_type, history.c.category, month)
+
+
+def get_dashboard_totals(user_id):
+    """
+    Totals and chart series shown on the dashboard, in the user's base
+    currency, from a single grouped scan of the user's transactions and
+    archived monthly rollups.
+    """
+    currency = base_currency(user_id)
+    return _totals_from_rows(db.session.execute(_totals_statement(user_id, currency)).all(), currency)
+
+
+async def get_dashboard_totals_async(user_id):
+    currency = base_currency(user_id)
+    return _totals_from_rows(await fetch_all(_totals_statement(user_id, currency)), currency)
+
+
+def _totals_from_rows(grouped, currency):
+    total_income = 0.0
+    total_expense = 0.0
+    by_category = {}
+    by_month = {}
+    for transaction_type, category, month_number, total in grouped:
+        if transaction_type == 'income':
+            total_income += total
+            continue
+        total_expense += total
+        by_category[category] = by_category.get(category, 0.0) + total
+        by_month[int(month_number)] = by_month.get(int(month_number), 0.0) + total
+
+    categories = sorted(by_category)
+    months = sorted(by_month)
+
+    return {
+        'currency': currency,
+        'total_income': total_income,
+        'total_expense': total_expense,
+        'balance': total_income - total_expense,
+        'categories': categories,
+        'amounts': [float(by_category[c]) for c in categories],
+        'months': [f"Month {m}" for m in months],
+        'monthly_amounts': [float(by_month[m]) for m in months]
+    }
@@ -0,0 +1,189 @@
+import json
+import logging
+import os
+import queue
+import threading
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from services.change_feed import changes_recorded
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+logger = logging.getLogger(__name__)
+
+# Events buffered per subscriber before it is told to resync instead
+MAX_QUEUED_EVENTS = 256
+# Changes per user and commit above which subscribers just get a resync
+MAX_CHANGES_PER_EVENT = 200
+
+RESYNC = {'type': 'resync'}
+
+
+# ---------------------------------------------
+# BROKERS
+# ---------------------------------------------
+class Subscription:
+    """One listener's queue of events for a single user."""
+
+    def __init__(self, broker, user_id):
+        self.broker = broker
+        self.user_id = user_id
+        self._queue = queue.Queue(MAX_QUEUED_EVENTS)
+
+    def put(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            # A slow client gets one resync in place of everything it missed.
+            self.drain()
+            self._queue.put_nowait(RESYNC)
+
+    def get(self, timeout=None):
+        """Every queued event, waiting up to `timeout` seconds for the first; [] on timeout."""
+        try:
+            events = [self._queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        return events + self.drain()
+
+    def drain(self):
+        events = []
+        while True:
+            try:
+                events.append(self._queue.get_nowait())
+            except queue.Empty:
+                return events
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    """Fan-out to subscribers in this process only."""
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        subscription = Subscription(self, user_id)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def publish(self, user_id, event):
+        self._deliver(user_id, event)
+
+    def _deliver(self, user_id, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for subscription in subscribers:
+            subscription.put(event)
+
+
+class RedisBroker(InProcessBroker):
+    """
+    Cross-worker fan-out over Redis pub/sub: events are published to Redis
+    and a listener thread in every worker hands them to local subscribers.
+    """
+
+    def __init__(self, url, prefix='smartfinance:events:'):
+        super().__init__()
+        self._redis = redis.Redis.from_url(url)
+        self._prefix = prefix
+        self._listener = threading.Thread(target=self._listen, name='event-broker', daemon=True)
+        self._listener.start()
+
+    def publish(self, user_id, event):
+        self._redis.publish(f'{self._prefix}{user_id}', json.dumps(event))
+
+    def _listen(self):
+        pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.psubscribe(f'{self._prefix}*')
+        for message in pubsub.listen():
+            try:
+                user_id = int(message['channel'].decode().rsplit(':', 1)[1])
+                self._deliver(user_id, json.loads(message['data']))
+            except (ValueError, IndexError):
+                logger.warning('Ignoring malformed event message on %s', message.get('channel'))
+
+
+# URL scheme -> factory(url); 'memory' needs no URL
+_BROKER_FACTORIES = {'memory': lambda url: InProcessBroker()}
+if redis is not None:
+    _BROKER_FACTORIES['redis'] = RedisBroker
+    _BROKER_FACTORIES['rediss'] = RedisBroker
+
+_broker = None
+
+
+def register_broker(scheme, factory):
+    """Make another cross-worker backend available as EVENT_BROKER_URL=<scheme>://..."""
+    _BROKER_FACTORIES[scheme] = factory
+
+
+def init_events(app):
+    """Create the broker named by EVENT_BROKER_URL (in-process by default)."""
+    global _broker
+
+    url = app.config.get('EVENT_BROKER_URL') or os.environ.get('EVENT_BROKER_URL') or 'memory'
+    scheme = url.split('://', 1)[0]
+    if scheme not in _BROKER_FACTORIES:
+        raise RuntimeError(f"No event broker for '{scheme}' (is its client library installed?)")
+    _broker = _BROKER_FACTORIES[scheme](url)
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        _broker = InProcessBroker()
+    return _broker
+
+
+# ---------------------------------------------
+# PUBLISHING (after commit, so listeners never see rolled-back writes)
+# ---------------------------------------------
+@changes_recorded.connect
+def _collect_changes(session, changes):
+    session.info.setdefault('pending_events', []).extend(changes)
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_changes(session):
+    changes = session.info.pop('pending_events', None)
+    if not changes or _broker is None:
+        return
+
+    by_user = {}
+    for user_id, entity, entity_id, operation in changes:
+        by_user.setdefault(user_id, []).append([entity, entity_id, operation])
+
+    for user_id, user_changes in by_user.items():
+        if len(user_changes) > MAX_CHANGES_PER_EVENT:
+            payload = RESYNC
+        else:
+            payload = {'type': 'changes', 'changes': user_changes}
+        try:
+            _broker.publish(user_id, payload)
+        except Exception:
+            # A broker outage must not fail the write; clients catch up on their next poll.
+            logger.exception('Could not publish change events for user %s', user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_changes(session):
+    session.info.pop('pending_events', None)
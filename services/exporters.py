@@ -0,0 +1,179 @@
+import heapq
+import zlib
+from itertools import islice
+from operator import itemgetter
+
+from sqlalchemy import select
+
+from models import db
+from models.transaction import Transaction
+from services.serialization import TRANSACTION_FIELDS, get_json_backend
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+
+EXPORT_FIELDS = ('date', 'category', 'description', 'transaction_type', 'amount', 'currency')
+# Rows per fetch, per Arrow record batch and per Parquet row group
+BATCH_ROWS = 65536
+
+EXPORT_FORMATS = {
+    # format -> (mimetype, file extension, needs pyarrow)
+    'ndjson': ('application/x-ndjson', 'ndjson.gz', False),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows', True),
+    'parquet': ('application/vnd.apache.parquet', 'parquet', True),
+}
+
+
+def format_available(fmt):
+    return fmt in EXPORT_FORMATS and (pa is not None or not EXPORT_FORMATS[fmt][2])
+
+
+def export_statement(user_id, conditions, fields=EXPORT_FIELDS):
+    """Column SELECT of a user's transactions matching the report filters, newest first."""
+    return select(*(TRANSACTION_FIELDS[name] for name in fields)).where(
+        Transaction.user_id == user_id, *conditions
+    ).order_by(Transaction.date.desc())
+
+
+def iter_row_batches(statement, batch_size=BATCH_ROWS):
+    """Stream a column SELECT as lists of tuples without loading the full result."""
+    result = db.session.execute(statement.execution_options(yield_per=batch_size))
+    for rows in result.partitions():
+        yield rows
+
+
+class _ChunkSink:
+    """Write-only file object that hands back whatever was written since the last drain."""
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+# ---------------------------------------------
+# WRITERS (each yields bytes chunks)
+# ---------------------------------------------
+def ndjson_gzip_chunks(batches, fields=EXPORT_FIELDS):
+    """Gzip-compressed NDJSON, one object per transaction."""
+    dumps = get_json_backend()
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+
+    for rows in batches:
+        data = b'\n'.join(dumps(dict(zip(fields, row))) for row in rows) + b'\n'
+        chunk = compressor.compress(data)
+        if chunk:
+            yield chunk
+
+    yield compressor.flush()
+
+
+def _arrow_schema(fields):
+    types = {
+        'id': pa.int64(),
+        'user_id': pa.int64(),
+        'amount': pa.float64(),
+        'currency': pa.string(),
+        'category': pa.string(),
+        'transaction_type': pa.string(),
+        'date': pa.date32(),
+        'description': pa.string(),
+        'created_at': pa.timestamp('us'),
+    }
+    return pa.schema([(name, types[name]) for name in fields])
+
+
+def _record_batch(schema, rows):
+    columns = list(zip(*rows)) if rows else [[] for _ in schema]
+    return pa.record_batch(
+        [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+        schema=schema
+    )
+
+
+def arrow_stream_chunks(batches, fields=EXPORT_FIELDS):
+    """Arrow IPC stream format, one record batch per fetched batch."""
+    schema = _arrow_schema(fields)
+    sink = _ChunkSink()
+
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for rows in batches:
+            writer.write_batch(_record_batch(schema, rows))
+            yield sink.drain()
+
+    yield sink.drain()
+
+
+def parquet_chunks(batches, fields=EXPORT_FIELDS, compression='zstd'):
+    """Parquet file, one row group per fetched batch."""
+    schema = _arrow_schema(fields)
+    sink = _ChunkSink()
+
+    writer = pq.ParquetWriter(sink, schema, compression=compression)
+    try:
+        for rows in batches:
+            writer.write_batch(_record_batch(schema, rows), row_group_size=BATCH_ROWS)
+            yield sink.drain()
+    finally:
+        writer.close()
+
+    yield sink.drain()
+
+
+WRITERS = {
+    'ndjson': ndjson_gzip_chunks,
+    'arrow': arrow_stream_chunks,
+    'parquet': parquet_chunks,
+}
+
+
+def merge_archived(batches, archived, fields=EXPORT_FIELDS, batch_size=BATCH_ROWS):
+    """
+    Row batches (newest first) with archived transactions (newest first, as
+    services.archive.archived_transactions yields them) merged in by date.
+    `fields` must include 'date'.
+    """
+    hot = (row for rows in batches for row in rows)
+    cold = (tuple(getattr(row, name) for name in fields) for row in archived)
+    merged = heapq.merge(hot, cold, key=itemgetter(fields.index('date')), reverse=True)
+    while True:
+        rows = list(islice(merged, batch_size))
+        if not rows:
+            return
+        yield rows
+
+
+def export_chunks(fmt, statement, fields=EXPORT_FIELDS, archived=None):
+    """
+    Bytes chunks of `statement` (a SELECT of `fields`) written in `fmt`,
+    with `archived` transactions merged in when given.
+    """
+    batches = iter_row_batches(statement)
+    if archived is not None:
+        batches = merge_archived(batches, archived, fields)
+    return WRITERS[fmt](batches, fields)
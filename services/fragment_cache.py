@@ -0,0 +1,230 @@
+import hashlib
+import json
+import logging
+import os
+from datetime import date
+
+from flask import g
+from flask_login import current_user
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+from services.cache import TTLCache
+from services.currency import rates_version, rates_version_async
+from services.http_cache import get_data_version, get_data_version_async, is_degraded
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 300
+DEFAULT_MAX_ENTRIES = 256
+
+
+# ---------------------------------------------
+# BACKENDS (get(key) -> str or None, set(key, value, ttl))
+# ---------------------------------------------
+class MemoryFragmentBackend:
+    """Per-process LRU; entries for old data versions simply age out."""
+
+    def __init__(self, maxsize=DEFAULT_MAX_ENTRIES):
+        self._cache = TTLCache(maxsize, DEFAULT_TTL)
+
+    def get(self, key):
+        return self._cache.get(key)
+
+    def set(self, key, value, ttl):
+        self._cache.set(key, value, ttl)
+
+
+class RedisFragmentBackend:
+    """Shared across workers; Redis expires the keys."""
+
+    def __init__(self, url):
+        self._redis = redis.Redis.from_url(url)
+
+    def get(self, key):
+        value = self._redis.get(key)
+        return value.decode('utf-8') if value is not None else None
+
+    def set(self, key, value, ttl):
+        self._redis.set(key, value.encode('utf-8'), ex=ttl)
+
+
+class NullFragmentBackend:
+    """Caching disabled: every fragment is rendered."""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl):
+        pass
+
+
+# URL scheme -> factory(url, app)
+_BACKEND_FACTORIES = {
+    'memory': lambda url, app: MemoryFragmentBackend(app.config.get('FRAGMENT_CACHE_SIZE', DEFAULT_MAX_ENTRIES)),
+    'none': lambda url, app: NullFragmentBackend(),
+}
+if redis is not None:
+    _BACKEND_FACTORIES['redis'] = lambda url, app: RedisFragmentBackend(url)
+    _BACKEND_FACTORIES['rediss'] = lambda url, app: RedisFragmentBackend(url)
+
+_backend = NullFragmentBackend()
+
+
+def register_fragment_backend(scheme, factory):
+    """Make another shared store available as FRAGMENT_CACHE_URL=<scheme>://..."""
+    _BACKEND_FACTORIES[scheme] = factory
+
+
+# ---------------------------------------------
+# KEYS
+# ---------------------------------------------
+def _scope():
+    """
+    User id, data version, date, base currency and rates version for this
+    request, looked up once. Any write to the user's data (or a new day, or
+    new rates) moves every key, so fragments never need explicit
+    invalidation.
+    """
+    if 'fragment_scope' not in g:
+        if current_user.is_authenticated:
+            version, _ = get_data_version(current_user.id)
+            g.fragment_scope = _user_scope(current_user.id, version, rates_version())
+        else:
+            g.fragment_scope = 'anonymous'
+    return g.fragment_scope
+
+
+def _user_scope(user_id, version, rates):
+    return f'{user_id}:{version}:{date.today().isoformat()}:{current_user.base_currency}:{rates}'
+
+
+def fragment_key(name, vary=()):
+    digest = hashlib.sha1(json.dumps(list(vary), sort_keys=True, default=str).encode()).hexdigest()[:16]
+    return f'fragment:{name}:{_scope()}:{digest}'
+
+
+async def fragment_cached_async(name, vary=()):
+    """
+    Whether a fragment would be served from the cache, so an async view can
+    skip prefetching its data. Looks up the data version without blocking.
+    """
+    if 'fragment_scope' not in g and current_user.is_authenticated:
+        version, _ = await get_data_version_async(current_user.id)
+        g.fragment_scope = _user_scope(current_user.id, version, await rates_version_async())
+    try:
+        return _backend.get(fragment_key(name, vary)) is not None
+    except Exception:
+        return False
+
+
+def cached_fragment(name, ttl, vary, render):
+    """
+    Return the cached markup for a fragment, calling render() on a miss.
+    A fragment whose rendering called mark_degraded() is not stored.
+    """
+    key = fragment_key(name, vary)
+    try:
+        value = _backend.get(key)
+    except Exception:
+        logger.exception('Fragment cache read failed for %s', name)
+        return render()
+    if value is not None:
+        return value
+
+    degraded = is_degraded()
+    value = render()
+    if is_degraded() and not degraded:
+        return value
+    try:
+        _backend.set(key, str(value), ttl or DEFAULT_TTL)
+    except Exception:
+        logger.exception('Fragment cache write failed for %s', name)
+    return value
+
+
+# ---------------------------------------------
+# TEMPLATE TAG
+# ---------------------------------------------
+class FragmentCacheExtension(Extension):
+    """
+    {% cache 'name', ttl, vary1, vary2 %} ... {% endcache %}
+
+    Caches the rendered body per user and data version; `ttl` (seconds)
+    and the vary values, which distinguish variants such as filters or
+    page numbers, are optional.
+    """
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+
+        name = args[0]
+        ttl = args[1] if len(args) > 1 else nodes.Const(None)
+        vary = nodes.List(args[2:])
+
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method('_render', [name, ttl, vary]), [], [], body
+        ).set_lineno(lineno)
+
+    def _render(self, name, ttl, vary, caller):
+        return Markup(cached_fragment(name, ttl, vary, caller))
+
+
+class Deferred:
+    """
+    A view value computed on first use, so a template section served from
+    the fragment cache never runs its query. Behaves like the loaded value
+    for iteration, length, truth, indexing and attribute access.
+    """
+
+    def __init__(self, load):
+        self._load = load
+        self._loaded = False
+        self._value = None
+
+    def resolve(self):
+        if not self._loaded:
+            self._value = self._load()
+            self._loaded = True
+        return self._value
+
+    def __iter__(self):
+        return iter(self.resolve())
+
+    def __len__(self):
+        return len(self.resolve())
+
+    def __bool__(self):
+        return bool(self.resolve())
+
+    def __getitem__(self, key):
+        return self.resolve()[key]
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.resolve(), name)
+
+
+def init_fragment_cache(app):
+    """Install the {% cache %} tag and the backend named by FRAGMENT_CACHE_URL (in-memory by default)."""
+    global _backend
+
+    url = app.config.get('FRAGMENT_CACHE_URL') or os.environ.get('FRAGMENT_CACHE_URL') or 'memory'
+    scheme = url.split('://', 1)[0]
+    if scheme not in _BACKEND_FACTORIES:
+        raise RuntimeError(f"No fragment cache backend for '{scheme}' (is its client library installed?)")
+    _backend = _BACKEND_FACTORIES[scheme](url, app)
+    app.jinja_env.add_extension(FragmentCacheExtension)
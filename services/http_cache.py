@@ -0,0 +1,168 @@
+import hashlib
+from datetime import datetime, date, time
+from functools import wraps
+
+from flask import current_app, g, make_response, request, session
+from flask_login import current_user
+from sqlalchemy import select
+
+from models import db
+from models.change_log import ChangeLog
+from services.async_db import fetch_all
+from services.currency import rates_version, rates_version_async
+
+
+# A degraded response (see mark_degraded) is revalidated as 304 for at most
+# this long before the view runs again to retry what failed
+DEGRADED_RETRY_SECONDS = 300
+
+
+def _data_version_statement(user_id):
+    return select(ChangeLog.seq, ChangeLog.created_at).where(
+        ChangeLog.user_id == user_id
+    ).order_by(ChangeLog.seq.desc()).limit(1)
+
+
+def _version_from_row(row):
+    if row is None:
+        return 0, None
+    return row.seq, row.created_at
+
+
+def get_data_version(user_id):
+    """
+    Return (version, last_modified) for a user's data.
+
+    The version is the user's latest change-log sequence number, so it
+    moves on every write to transactions, budgets or recurring rules and
+    costs a single index lookup on (user_id, seq).
+    """
+    return _version_from_row(db.session.execute(_data_version_statement(user_id)).first())
+
+
+async def get_data_version_async(user_id):
+    rows = await fetch_all(_data_version_statement(user_id))
+    return _version_from_row(rows[0] if rows else None)
+
+
+def mark_degraded():
+    """
+    Flag the current response as showing a passing failure (such as the AI
+    summary being unavailable) that a retry may not, while the data version
+    stays put: its fragment is not cached, and its ETag only holds for the
+    current retry window.
+    """
+    g.degraded = True
+
+
+def is_degraded():
+    return g.get('degraded', False)
+
+
+def _cache_control(max_age):
+    if max_age:
+        return f'private, max-age={max_age}'
+    return 'private, max-age=0, must-revalidate'
+
+
+def _validators(version, changed_at, rates):
+    """(etag, last_modified) of the current request's response at a data version."""
+    today = date.today()
+    # Amounts are shown converted to the base currency at the loaded rates.
+    etag = hashlib.sha1(
+        f'{request.endpoint}|{request.query_string.decode()}|{current_user.id}|{version}|{today}|'
+        f'{current_user.base_currency}|{rates}'.encode()
+    ).hexdigest()
+
+    # Output depends on the date too, so it cannot be older than midnight.
+    midnight = datetime.combine(today, time.min)
+    last_modified = max(changed_at, midnight) if changed_at else midnight
+    return etag, last_modified
+
+
+def _retry_etag(etag):
+    """ETag of a degraded response, valid until the end of the current retry window."""
+    window = int(datetime.now().timestamp() // DEGRADED_RETRY_SECONDS)
+    return hashlib.sha1(f'{etag}|retry|{window}'.encode()).hexdigest()
+
+
+def _matching_etag(etag):
+    """The current ETag the client sent (the full one, or the degraded one), if any."""
+    for candidate in (etag, _retry_etag(etag)):
+        if candidate in request.if_none_match:
+            return candidate
+    return None
+
+
+def _with_validators(response, etag, last_modified, max_age):
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.headers['Cache-Control'] = _cache_control(max_age)
+    response.vary.add('Cookie')
+    return response
+
+
+def conditional_get(max_age=0):
+    """
+    Serve a 304 Not Modified without running the view when the client's
+    If-None-Match matches the current ETag.
+
+    The ETag is derived from the endpoint, the query string, the user's data
+    version and today's date (budget periods, trends and insights all depend
+    on it). Pages with pending flash messages are always rendered, since a
+    304 would swallow the message. A degraded response (mark_degraded) gets
+    an ETag that matches for DEGRADED_RETRY_SECONDS at most, after which
+    the view runs again. Use below @login_required.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            if session.get('_flashes'):
+                return current_app.ensure_sync(view)(*args, **kwargs)
+
+            etag, last_modified = _validators(*get_data_version(current_user.id), rates_version())
+
+            matched = _matching_etag(etag)
+            if matched is not None:
+                etag = matched
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(current_app.ensure_sync(view)(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                if is_degraded():
+                    etag = _retry_etag(etag)
+
+            return _with_validators(response, etag, last_modified, max_age)
+
+        return wrapped
+    return decorator
+
+
+def async_conditional_get(max_age=0):
+    """conditional_get for async views served through asgi.py; the ETags are identical."""
+    def decorator(view):
+        @wraps(view)
+        async def wrapped(*args, **kwargs):
+            if session.get('_flashes'):
+                return await view(*args, **kwargs)
+
+            etag, last_modified = _validators(
+                *await get_data_version_async(current_user.id), await rates_version_async()
+            )
+
+            matched = _matching_etag(etag)
+            if matched is not None:
+                etag = matched
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(await view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                if is_degraded():
+                    etag = _retry_etag(etag)
+
+            return _with_validators(response, etag, last_modified, max_age)
+
+        return wrapped
+    return decorator
@@ -0,0 +1,546 @@
+import csv
+import hashlib
+import html
+import io
+import re
+from collections import OrderedDict
+from datetime import date, datetime
+
+from sqlalchemy import insert, select
+
+from models import db
+from models.import_batch import ImportBatch
+from models.imported_transaction import ImportedTransaction
+from services.archive import ArchivedFingerprints
+from services.batching import chunks
+from services.bulk_transactions import insert_transaction_rows
+from services.categorization_rules import apply_rules, tag_new_transactions
+from services.currency import CurrencyError, DEFAULT_CURRENCY, base_currency, parse_currency
+from services.pdf_parser import PdfParseError, categorize_transaction, iter_pdf_transactions
+
+
+# Bytes read from the start of a file to recognise its format
+SNIFF_BYTES = 8192
+# Records normalised, deduplicated, inserted and committed together
+IMPORT_CHUNK_SIZE = 1000
+# Characters read at a time by the OFX tokenizer
+READ_CHARS = 65536
+# Rows scanned for a CSV header (banks often put account details above it)
+MAX_PREAMBLE_ROWS = 30
+
+DESCRIPTION_LENGTH = 200
+CATEGORY_LENGTH = 50
+
+
+class ImportFormatError(ValueError):
+    """Raised when a statement file is in no known format or cannot be read."""
+
+
+# ---------------------------------------------
+# VALUE PARSING
+# ---------------------------------------------
+# Bank CSVs are read day-first (Indian banks); QIF, which comes from US software, month-first.
+DAY_FIRST_FORMATS = ('%Y-%m-%d', '%d-%m-%Y', '%d/%m/%Y', '%d.%m.%Y', '%d-%m-%y', '%d/%m/%y',
+                     '%d %b %Y', '%d-%b-%Y', '%d-%b-%y', '%d %B %Y', '%Y/%m/%d')
+MONTH_FIRST_FORMATS = ('%m/%d/%Y', '%m/%d/%y', '%Y-%m-%d', '%d.%m.%Y', '%d %b %Y')
+
+INCOME_WORDS = {'income', 'credit', 'cr', 'c', 'deposit', 'dep'}
+EXPENSE_WORDS = {'expense', 'debit', 'dr', 'd', 'withdrawal', 'wdl'}
+
+_AMOUNT_NOISE = re.compile(r'[^\d.\-]')
+
+
+class DateParser:
+    """Parses the date strings of one file, trying each distinct string once."""
+
+    def __init__(self, formats=DAY_FIRST_FORMATS, max_cached=4096):
+        self.formats = formats
+        self.max_cached = max_cached
+        self._parsed = {}
+
+    def __call__(self, value):
+        if isinstance(value, date):
+            return value
+        value = (value or '').strip()
+        if value in self._parsed:
+            return self._parsed[value]
+
+        parsed = None
+        for fmt in self.formats:
+            try:
+                parsed = datetime.strptime(value, fmt).date()
+                break
+            except ValueError:
+                continue
+
+        if len(self._parsed) >= self.max_cached:
+            self._parsed.clear()
+        self._parsed[value] = parsed
+        return parsed
+
+
+def parse_amount(value):
+    """
+    Signed amount from a statement cell: currency symbols and thousands
+    separators are dropped, "(12.00)" and a trailing "Dr" are negative,
+    a trailing "Cr" positive. Returns None for an empty or unreadable cell.
+    """
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = (value or '').strip()
+    if not text:
+        return None
+
+    sign = 1
+    lowered = text.lower()
+    if text.startswith('(') and text.endswith(')'):
+        sign = -1
+    elif lowered.endswith('dr'):
+        sign = -1
+    text = _AMOUNT_NOISE.sub('', text.replace(',', ''))
+    try:
+        return sign * float(text)
+    except ValueError:
+        return None
+
+
+def _type_from_word(value):
+    word = (value or '').strip().lower()
+    if word in INCOME_WORDS:
+        return 'income'
+    if word in EXPENSE_WORDS:
+        return 'expense'
+    return None
+
+
+# ---------------------------------------------
+# IMPORTERS (each yields raw records from a binary stream)
+# ---------------------------------------------
+# A raw record is a dict with some of: date (str or date), amount (signed),
+# debit, credit, transaction_type, description, memo, category and ref (an
+# id the bank guarantees unique, such as an OFX FITID, used for
+# deduplication in place of the row's content).
+
+def _text(stream, encoding='utf-8-sig'):
+    return io.TextIOWrapper(stream, encoding=encoding, errors='replace', newline='')
+
+
+# CSV ------------------------------------------
+CSV_COLUMNS = {
+    'date': ('date', 'transaction date', 'txn date', 'tran date', 'value date', 'posting date', 'posted date'),
+    'description': ('description', 'narration', 'details', 'particulars', 'transaction details', 'remarks',
+                    'memo', 'payee', 'name'),
+    'amount': ('amount', 'transaction amount', 'amount (inr)', 'amt'),
+    'debit': ('debit', 'withdrawal', 'withdrawal amt.', 'withdrawal amount', 'withdrawals', 'debit amount', 'dr'),
+    'credit': ('credit', 'deposit', 'deposit amt.', 'deposit amount', 'deposits', 'credit amount', 'cr'),
+    'transaction_type': ('type', 'transaction type', 'dr/cr', 'cr/dr', 'debit/credit'),
+    'category': ('category',),
+    'currency': ('currency', 'ccy', 'currency code'),
+}
+_CSV_ALIASES = {alias: field for field, aliases in CSV_COLUMNS.items() for alias in aliases}
+
+
+def csv_columns(row):
+    """Map a header row to {field: column index}, or None if it is not a usable header."""
+    columns = {}
+    for index, name in enumerate(row):
+        field = _CSV_ALIASES.get(' '.join(name.strip().lower().split()))
+        if field and field not in columns:
+            columns[field] = index
+    if 'date' in columns and ('amount' in columns or 'debit' in columns or 'credit' in columns):
+        return columns
+    return None
+
+
+def _csv_dialect(sample):
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=',;\t|')
+    except csv.Error:
+        return csv.excel
+
+
+def _find_header(rows):
+    for row in rows:
+        columns = csv_columns(row)
+        if columns:
+            return columns
+    return None
+
+
+def sniff_csv(head):
+    text = head.decode('utf-8-sig', errors='replace')
+    lines = text.splitlines()[:MAX_PREAMBLE_ROWS]
+    if not lines:
+        return False
+    reader = csv.reader(lines, _csv_dialect('\n'.join(lines)))
+    try:
+        return _find_header(reader) is not None
+    except csv.Error:
+        return False
+
+
+def csv_records(stream):
+    text = _text(stream)
+    try:
+        dialect = _csv_dialect(text.read(SNIFF_BYTES))
+        text.seek(0)
+        reader = csv.reader(text, dialect)
+
+        columns = _find_header(row for _, row in zip(range(MAX_PREAMBLE_ROWS), reader))
+        if columns is None:
+            raise ImportFormatError('No header row with a date and an amount column')
+
+        for row in reader:
+            if not any(cell.strip() for cell in row):
+                continue
+            yield {field: row[index] if index < len(row) else '' for field, index in columns.items()}
+    except csv.Error as e:
+        raise ImportFormatError(f'Malformed CSV: {e}')
+    finally:
+        text.detach()
+
+
+# OFX ------------------------------------------
+# Works for both OFX 1.x (SGML, leaf tags often unclosed) and 2.x (XML)
+_OFX_TAG = re.compile(r'<(/?)([A-Za-z0-9.]+)[^>]*>([^<]*)')
+
+
+def sniff_ofx(head):
+    upper = head[:SNIFF_BYTES].upper()
+    return b'OFXHEADER' in upper or b'<OFX>' in upper
+
+
+def _ofx_record(fields, account, currency):
+    name = fields.get('NAME', '')
+    memo = fields.get('MEMO', '')
+    description = f'{name} {memo}' if memo and memo != name else (name or memo)
+    return {
+        'date': fields.get('DTPOSTED', '')[:8],
+        'amount': fields.get('TRNAMT', ''),
+        'description': description,
+        'currency': fields.get('CURSYM') or currency,
+        'ref': f"{account}:{fields['FITID']}" if fields.get('FITID') else None,
+    }
+
+
+def ofx_records(stream):
+    text = _text(stream)
+    dates = DateParser(('%Y%m%d',))
+    account = ''
+    currency = None
+    current = None
+    buffer = ''
+    try:
+        while True:
+            chunk = text.read(READ_CHARS)
+            buffer += chunk
+            # Only complete tags are parsed: everything from the last '<' waits for the next chunk.
+            end = max(buffer.rfind('<'), 0) if chunk else len(buffer)
+
+            for closing, tag, value in (m.groups() for m in _OFX_TAG.finditer(buffer, 0, end)):
+                tag = tag.upper()
+                if tag == 'STMTTRN':
+                    if closing and current is not None:
+                        record = _ofx_record(current, account, currency)
+                        record['date'] = dates(record['date'])
+                        yield record
+                        current = None
+                    elif not closing:
+                        current = {}
+                elif not closing:
+                    value = html.unescape(value.strip())
+                    if current is not None:
+                        current[tag] = value
+                    elif tag == 'ACCTID':
+                        account = value
+                    elif tag == 'CURDEF':
+                        currency = value
+
+            buffer = buffer[end:]
+            if not chunk:
+                break
+    finally:
+        text.detach()
+
+
+# QIF ------------------------------------------
+def sniff_qif(head):
+    first = head.lstrip(b'\xef\xbb\xbf').lstrip()[:16].lower()
+    return first.startswith(b'!type:') or first.startswith(b'!account') or first.startswith(b'!option')
+
+
+def qif_records(stream):
+    text = _text(stream)
+    dates = DateParser(MONTH_FIRST_FORMATS)
+    record = {}
+    try:
+        for line in text:
+            line = line.rstrip('\r\n')
+            if not line:
+                continue
+            code, value = line[0], line[1:].strip()
+            if code == '^':
+                if record:
+                    yield record
+                record = {}
+            elif code == '!':
+                record = {}
+            elif code == 'D':
+                # Quicken writes 1/ 5'24 for 01/05/2024
+                record['date'] = dates(value.replace("'", '/').replace(' ', ''))
+            elif code == 'T' or (code == 'U' and 'amount' not in record):
+                record['amount'] = value
+            elif code == 'P':
+                record['description'] = value
+            elif code == 'M':
+                record['memo'] = value
+            elif code == 'N':
+                record['number'] = value
+        if record:
+            yield record
+    finally:
+        text.detach()
+
+
+# PDF ------------------------------------------
+def sniff_pdf(head):
+    return head.lstrip()[:5] == b'%PDF-'
+
+
+def pdf_records(stream):
+    try:
+        yield from iter_pdf_transactions(stream)
+    except PdfParseError as e:
+        raise ImportFormatError(str(e))
+
+
+# format -> (records(stream), sniff(head bytes), file extensions). Sniffers
+# are tried in order, then the extension; CSV needs a recognised header.
+_IMPORTERS = {
+    'pdf': (pdf_records, sniff_pdf, ('.pdf',)),
+    'ofx': (ofx_records, sniff_ofx, ('.ofx', '.qfx')),
+    'qif': (qif_records, sniff_qif, ('.qif',)),
+    'csv': (csv_records, sniff_csv, ('.csv', '.txt')),
+}
+
+
+def register_importer(fmt, records, sniff, extensions=()):
+    """Make another statement format importable; sniff(head) tells whether the first bytes are in it."""
+    _IMPORTERS[fmt] = (records, sniff, tuple(extensions))
+
+
+def import_formats():
+    return list(_IMPORTERS)
+
+
+def import_extensions():
+    return sorted({ext for _, _, extensions in _IMPORTERS.values() for ext in extensions})
+
+
+def sniff_format(head, filename=None):
+    """Format name for a file from its first bytes (and, failing that, its name), or None."""
+    for fmt, (_, sniff, _) in _IMPORTERS.items():
+        if sniff(head):
+            return fmt
+    name = (filename or '').lower()
+    for fmt, (_, _, extensions) in _IMPORTERS.items():
+        if name.endswith(extensions):
+            return fmt
+    return None
+
+
+# ---------------------------------------------
+# PIPELINE: normalize -> categorize -> dedupe -> rules -> bulk insert
+# ---------------------------------------------
+def normalize(record, dates, currency=DEFAULT_CURRENCY):
+    """
+    Row dict ready for insert_transaction_rows, or None when the record has
+    no usable date, a zero/unreadable amount or an unknown currency.
+    Records that do not name a currency are in `currency`.
+    """
+    day = dates(record.get('date'))
+    if day is None:
+        return None
+
+    try:
+        currency = parse_currency(record.get('currency'), currency)
+    except CurrencyError:
+        return None
+
+    transaction_type = record.get('transaction_type')
+    if transaction_type not in ('income', 'expense'):
+        transaction_type = _type_from_word(transaction_type)
+
+    debit = parse_amount(record.get('debit'))
+    credit = parse_amount(record.get('credit'))
+    if debit:
+        amount, transaction_type = debit, 'expense'
+    elif credit:
+        amount, transaction_type = credit, 'income'
+    else:
+        amount = parse_amount(record.get('amount'))
+        if amount is None:
+            return None
+        if transaction_type is None:
+            transaction_type = 'expense' if amount < 0 else 'income'
+
+    amount = round(abs(amount), 2)
+    if not amount:
+        return None
+
+    description = ' '.join(str(record.get('description') or '').split())
+    memo = ' '.join(str(record.get('memo') or '').split())
+    if memo and memo != description:
+        description = f'{description} {memo}'.strip()
+
+    return {
+        'transaction_type': transaction_type,
+        'category': (record.get('category') or '').strip()[:CATEGORY_LENGTH],
+        'amount': amount,
+        'currency': currency,
+        'date': day,
+        'description': description[:DESCRIPTION_LENGTH]
+    }
+
+
+def categorize(row):
+    """
+    Fill in a category when the statement did not carry one. The user's
+    own rules run after dedupe, on the rows actually inserted, and take
+    precedence over both.
+    """
+    if not row['category']:
+        row['category'] = categorize_transaction(row['description'], row['transaction_type'])
+    return row
+
+
+class _Occurrences:
+    """
+    Numbers identical rows within a file (two equal coffees on one day are
+    two transactions), remembering only the most recent dates so memory
+    stays bounded for date-ordered statements.
+    """
+
+    def __init__(self, max_dates=64):
+        self.max_dates = max_dates
+        self._dates = OrderedDict()
+
+    def next(self, day, key):
+        counts = self._dates.get(day)
+        if counts is None:
+            counts = self._dates[day] = {}
+            if len(self._dates) > self.max_dates:
+                self._dates.popitem(last=False)
+        else:
+            self._dates.move_to_end(day)
+        seen = counts.get(key, 0)
+        counts[key] = seen + 1
+        return seen
+
+
+def fingerprint(row, ref=None, occurrence=0):
+    """
+    Stable identity of an imported row: the bank's own id when the format
+    has one, otherwise its content plus how many identical rows came
+    before it in the file. Re-importing an overlapping statement therefore
+    skips what is already there.
+    """
+    if ref:
+        key = f'ref:{ref}'
+    else:
+        key = (f"{row['date'].isoformat()}|{row['transaction_type']}|{row['amount']:.2f}|"
+               f"{row['description'].lower()}#{occurrence}")
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def _prepared(records, batch, dates, currency):
+    occurrences = _Occurrences()
+    for record in records:
+        batch.rows_read += 1
+        row = normalize(record, dates, currency)
+        if row is None:
+            batch.rows_invalid += 1
+            continue
+        ref = record.get('ref')
+        occurrence = 0 if ref else occurrences.next(row['date'], (row['transaction_type'], row['amount'],
+                                                                  row['description'].lower()))
+        yield fingerprint(row, ref, occurrence), categorize(row)
+
+
+def _insert_chunk(user_id, batch, chunk, archived):
+    existing = set(db.session.execute(
+        select(ImportedTransaction.fingerprint).where(
+            ImportedTransaction.user_id == user_id,
+            ImportedTransaction.fingerprint.in_([fp for fp, _ in chunk])
+        )
+    ).scalars())
+
+    fresh = []
+    for fp, row in chunk:
+        if fp in existing or archived.contains(fp, row['date'].year):
+            batch.rows_duplicate += 1
+        else:
+            existing.add(fp)
+            fresh.append((fp, row))
+
+    rule_tags = apply_rules(user_id, [row for _, row in fresh])
+    ids = insert_transaction_rows(user_id, [row for _, row in fresh])
+    tag_new_transactions(user_id, ids, rule_tags)
+    links = [{'transaction_id': transaction_id, 'batch_id': batch.id, 'user_id': user_id, 'fingerprint': fp}
+             for (fp, _), transaction_id in zip(fresh, ids)]
+    for chunk in chunks(links):
+        db.session.execute(insert(ImportedTransaction), chunk)
+    batch.rows_imported += len(ids)
+
+
+def import_statement(user_id, stream, filename=None, fmt=None, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Stream a statement file (a seekable binary stream) into a user's
+    transactions and return its ImportBatch.
+
+    Records flow through normalize -> categorize -> dedupe -> rules ->
+    bulk insert one chunk at a time, and each chunk is committed on its
+    own, so memory stays constant however long the file is and the anomaly
+    scoring and budget counters keep up as it goes. If the file turns out to be
+    malformed part-way, the batch is marked failed (keeping the chunks
+    already imported) and ImportFormatError is raised.
+    """
+    head = stream.read(SNIFF_BYTES)
+    stream.seek(0)
+    fmt = fmt or sniff_format(head, filename)
+    if fmt not in _IMPORTERS:
+        raise ImportFormatError(
+            f"Unrecognised statement format. Supported: {', '.join(ext.lstrip('.').upper() for ext in import_extensions())}"
+        )
+
+    batch = ImportBatch(user_id=user_id, format=fmt, filename=(filename or '')[:255] or None,
+                        rows_read=0, rows_imported=0, rows_duplicate=0, rows_invalid=0)
+    db.session.add(batch)
+    db.session.commit()
+
+    records = _IMPORTERS[fmt][0](stream)
+    # Rows already moved to the cold archive are duplicates too
+    archived = ArchivedFingerprints(user_id)
+    try:
+        for chunk in chunks(_prepared(records, batch, DateParser(), base_currency(user_id)), chunk_size):
+            _insert_chunk(user_id, batch, chunk, archived)
+            db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        batch.status = 'failed'
+        batch.error = str(e)[:500]
+        batch.completed_at = datetime.utcnow()
+        db.session.commit()
+        raise
+
+    batch.status = 'completed'
+    batch.completed_at = datetime.utcnow()
+    db.session.commit()
+    return batch
+
+
+def recent_imports(user_id, limit=10):
+    """A user's latest import batches, newest first."""
+    return db.session.execute(
+        select(ImportBatch).where(ImportBatch.user_id == user_id).order_by(ImportBatch.id.desc()).limit(limit)
+    ).scalars().all()
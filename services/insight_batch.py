@@ -0,0 +1,229 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime
+
+from sqlalchemy import and_, bindparam, case, delete, extract, func, insert, select, update
+
+from models import db
+from models.change_log import ChangeLog
+from models.insight_snapshot import InsightSnapshot
+from models.transaction import Transaction
+from models.user import User
+from services.ai_insights import _build_insights, _trend_windows
+from services.anomaly_detection import recent_flags_by_user_statement
+from services.archive import users_history_subquery
+from services.batching import chunks
+from services.currency import Conversion, rates_version
+from services.llm import LLMError, get_scheduler
+
+
+# Users per job; each job answers every insight query for its users at once
+INSIGHT_BATCH_SIZE = int(os.environ.get('INSIGHT_BATCH_SIZE', '500'))
+# Worker processes for `flask precompute-insights`; 0 runs the jobs inline
+INSIGHT_BATCH_WORKERS = int(os.environ.get('INSIGHT_BATCH_WORKERS', str(os.cpu_count() or 1)))
+
+TREND_MONTHS = 3
+
+
+# ---------------------------------------------
+# PARTITIONING
+# ---------------------------------------------
+def user_ranges(size=INSIGHT_BATCH_SIZE):
+    """[first_id, end_id) ranges of `size` existing users each, in id order."""
+    ids = db.session.execute(select(User.id).order_by(User.id)).scalars().all()
+    return [(ids[start], ids[start + size] if start + size < len(ids) else ids[-1] + 1)
+            for start in range(0, len(ids), size)]
+
+
+# ---------------------------------------------
+# SET-BASED QUERIES (one of each per range, grouped by user)
+# ---------------------------------------------
+def _range_statements(first_id, end_id, today):
+    history = users_history_subquery(first_id, end_id)
+    expense = history.c.transaction_type == 'expense'
+    month = extract('month', history.c.date)
+
+    # Trend windows can repeat (30-day steps back from early in a month),
+    # so each distinct window is summed once and mapped back by position.
+    windows = sorted(set(_trend_windows(TREND_MONTHS, today)))
+    conversion = Conversion(Transaction.amount, Transaction.currency, Transaction.date, User.base_currency)
+    window = case(*((and_(Transaction.date >= start, Transaction.date < end), index)
+                    for index, (start, end) in enumerate(windows)))
+
+    return windows, {
+        'users': select(User.id, User.base_currency).where(User.id >= first_id, User.id < end_id),
+        'versions': select(ChangeLog.user_id, func.max(ChangeLog.seq)).where(
+            ChangeLog.user_id >= first_id, ChangeLog.user_id < end_id
+        ).group_by(ChangeLog.user_id),
+        'totals': select(history.c.user_id, history.c.transaction_type, func.sum(history.c.amount),
+                         func.sum(history.c.count)).group_by(history.c.user_id, history.c.transaction_type),
+        'categories': select(history.c.user_id, history.c.category, func.sum(history.c.amount)).where(
+            expense
+        ).group_by(history.c.user_id, history.c.category),
+        'seasonal': select(history.c.user_id, month, func.sum(history.c.amount)).where(
+            expense
+        ).group_by(history.c.user_id, month),
+        'trend': conversion.join(select(Transaction.user_id, window, func.sum(conversion.amount)).join(
+            User, User.id == Transaction.user_id
+        )).where(
+            Transaction.user_id >= first_id,
+            Transaction.user_id < end_id,
+            Transaction.transaction_type == 'expense',
+            Transaction.date >= windows[0][0],
+            Transaction.date < windows[-1][1]
+        ).group_by(Transaction.user_id, window),
+        'flags': recent_flags_by_user_statement(first_id, end_id, limit=3),
+    }
+
+
+def _per_user_results(rows, windows, today):
+    """Split the range's rows into the per-user results _build_insights expects."""
+    results = {user_id: {'total_income': [(None,)], 'total_expense': [(None,)], 'transaction_count': [(0,)],
+                         'categories': [], 'seasonal': [], 'flags': [], '_trend': {}}
+               for user_id, _ in rows['users']}
+
+    counts = {}
+    for user_id, transaction_type, total, count in rows['totals']:
+        if transaction_type in ('income', 'expense'):
+            results[user_id][f'total_{transaction_type}'] = [(total,)]
+        counts[user_id] = counts.get(user_id, 0) + count
+    for user_id, count in counts.items():
+        results[user_id]['transaction_count'] = [(count,)]
+
+    for user_id, category, total in rows['categories']:
+        results[user_id]['categories'].append((category, total))
+    for result in results.values():
+        result['categories'].sort(key=lambda row: row[1], reverse=True)
+
+    for user_id, month, total in rows['seasonal']:
+        results[user_id]['seasonal'].append((month, total))
+    for row in rows['flags']:
+        results[row.user_id]['flags'].append(row)
+
+    for user_id, index, total in rows['trend']:
+        results[user_id]['_trend'][windows[index]] = total
+    for result in results.values():
+        sums = result.pop('_trend')
+        for i, key in enumerate(_trend_windows(TREND_MONTHS, today)):
+            result[f'trend_{i}'] = [(sums.get(key),)]
+    return results
+
+
+def compute_range(first_id, end_id, today=None):
+    """
+    Compute and store the insight snapshots of every user with
+    first_id <= id < end_id, in one database transaction. Each snapshot is
+    stamped with the data version read before any figure, so a write that
+    lands meanwhile leaves it stale rather than wrong. Returns the number
+    of users.
+    """
+    today = today or date.today()
+    windows, statements = _range_statements(first_id, end_id, today)
+    rows = {name: db.session.execute(statement).all() for name, statement in statements.items()}
+    versions = dict(rows['versions'])
+    currencies = dict(rows['users'])
+    rates = rates_version()
+    now = datetime.utcnow()
+
+    snapshots = []
+    for user_id, results in _per_user_results(rows, windows, today).items():
+        insights, prompt = _build_insights(user_id, results, currencies[user_id])
+        snapshots.append({
+            'user_id': user_id, 'data_version': versions.get(user_id, 0), 'computed_on': today,
+            'currency': currencies[user_id], 'rates_version': rates,
+            'insights': json.dumps(insights), 'prompt': prompt, 'computed_at': now,
+        })
+
+    try:
+        db.session.execute(delete(InsightSnapshot).where(
+            InsightSnapshot.user_id >= first_id, InsightSnapshot.user_id < end_id))
+        if snapshots:
+            db.session.execute(insert(InsightSnapshot), snapshots)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return len(snapshots)
+
+
+# ---------------------------------------------
+# NIGHTLY JOB
+# ---------------------------------------------
+_worker_app = None
+
+
+def _init_worker():
+    global _worker_app
+    from app import create_app
+    _worker_app = create_app()   # its own engine; nothing is shared with the parent
+
+
+def _compute_range_job(first_id, end_id, today):
+    with _worker_app.app_context():
+        return compute_range(first_id, end_id, today)
+
+
+def precompute_insights(workers=INSIGHT_BATCH_WORKERS, size=INSIGHT_BATCH_SIZE, progress=None):
+    """
+    Refresh every user's insight snapshot; the nightly job behind
+    `flask precompute-insights`. Ranges of `size` users are spread over
+    `workers` processes (inline when 0). progress(first_id, end_id, users)
+    is called as each range finishes. Returns the number of users.
+    """
+    today = date.today()
+    ranges = user_ranges(size)
+    db.session.commit()   # end this read so the workers' writes are not blocked
+    if workers <= 0 or len(ranges) <= 1:
+        done = 0
+        for first_id, end_id in ranges:
+            count = compute_range(first_id, end_id, today)
+            done += count
+            if progress:
+                progress(first_id, end_id, count)
+        return done
+
+    done = 0
+    with ProcessPoolExecutor(max_workers=min(workers, len(ranges)), initializer=_init_worker) as executor:
+        futures = {executor.submit(_compute_range_job, first_id, end_id, today): (first_id, end_id)
+                   for first_id, end_id in ranges}
+        for future in as_completed(futures):
+            count = future.result()
+            done += count
+            if progress:
+                progress(*futures[future], count)
+    return done
+
+
+def summarize_snapshots(scheduler=None, progress=None):
+    """
+    Fill in the AI summary of today's snapshots that have none, through
+    the rate-limited scheduler (users with the same prompt share one
+    request). Failed summaries stay empty, to be generated at view time.
+    progress(done, total) is called per stored chunk. Returns the number
+    of summaries stored.
+    """
+    scheduler = scheduler or get_scheduler()
+    pending = db.session.execute(select(InsightSnapshot.user_id, InsightSnapshot.prompt).where(
+        InsightSnapshot.computed_on == date.today(), InsightSnapshot.summary.is_(None)
+    )).all()
+    db.session.commit()
+    futures = [(user_id, scheduler.submit(prompt)) for user_id, prompt in pending]
+
+    stored = done = 0
+    for chunk in chunks(futures):
+        values = []
+        for user_id, future in chunk:
+            try:
+                values.append({'b_user_id': user_id, 'summary': future.result()})
+            except LLMError:
+                continue
+        if values:
+            db.session.execute(update(InsightSnapshot.__table__).where(
+                InsightSnapshot.user_id == bindparam('b_user_id')), values)
+            db.session.commit()
+        stored += len(values)
+        done += len(chunk)
+        if progress:
+            progress(done, len(futures))
+    return stored
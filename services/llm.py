@@ -0,0 +1,349 @@
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import deque
+from concurrent.futures import Future
+
+from services.cache import TTLCache
+from services.rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+# Where completions come from: gemini://<model>, or http(s)://... for any
+# server speaking the small JSON protocol of HTTPClient (e.g. a local fake)
+LLM_URL = os.environ.get('LLM_URL', 'gemini://gemini-1.5-flash')
+# Provider quotas, shared by every request of this process
+LLM_REQUESTS_PER_MINUTE = int(os.environ.get('LLM_REQUESTS_PER_MINUTE', '15'))
+LLM_TOKENS_PER_MINUTE = int(os.environ.get('LLM_TOKENS_PER_MINUTE', '250000'))
+# Requests in flight at once
+LLM_CONCURRENCY = int(os.environ.get('LLM_CONCURRENCY', '4'))
+# Prompt size the insights summary is trimmed to (estimated tokens)
+LLM_PROMPT_TOKENS = int(os.environ.get('LLM_PROMPT_TOKENS', '300'))
+
+LLM_TIMEOUT = 30
+MAX_RETRIES = 3
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 8.0
+# Consecutive failures that open the circuit, and how long it stays open
+BREAKER_FAILURES = 5
+BREAKER_COOLDOWN = 60
+# Output tokens reserved per request against the tokens-per-minute quota
+OUTPUT_TOKENS = 150
+# Completed answers are reused for identical prompts this long
+RESULT_TTL = 3600
+WAIT_SAMPLES = 1000
+
+
+class LLMError(Exception):
+    """A failed completion; retryable for rate limits, timeouts and server errors."""
+
+    def __init__(self, message, retryable=False):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class CircuitOpen(LLMError):
+    """Raised without calling the provider while it is failing."""
+
+
+def estimate_tokens(text):
+    """Rough token count (about four characters per token) for budgeting."""
+    return max(1, (len(text) + 3) // 4)
+
+
+def fit_prompt(header, lines, budget=LLM_PROMPT_TOKENS):
+    """`header` plus as many of `lines`, in order, as fit in `budget` estimated tokens."""
+    prompt = header
+    for line in lines:
+        candidate = f'{prompt}\n{line}'
+        if estimate_tokens(candidate) > budget:
+            break
+        prompt = candidate
+    return prompt
+
+
+# ---------------------------------------------
+# CLIENTS (one completion per call)
+# ---------------------------------------------
+class LLMClient:
+    """generate(prompt) returns (text, tokens used) or raises LLMError."""
+
+    def generate(self, prompt):
+        raise NotImplementedError
+
+
+class GeminiClient(LLMClient):
+    # HTTP statuses of google.api_core errors worth another attempt
+    RETRYABLE = {408, 429, 500, 502, 503, 504}
+
+    def __init__(self, model):
+        import google.generativeai as genai
+        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+        self._model = genai.GenerativeModel(model)
+
+    def generate(self, prompt):
+        try:
+            response = self._model.generate_content(prompt, request_options={'timeout': LLM_TIMEOUT})
+            text = response.text.strip()
+        except Exception as e:
+            raise LLMError(str(e), retryable=getattr(e, 'code', None) in self.RETRYABLE) from e
+        usage = getattr(response, 'usage_metadata', None)
+        tokens = getattr(usage, 'total_token_count', None) or estimate_tokens(prompt) + estimate_tokens(text)
+        return text, tokens
+
+
+class HTTPClient(LLMClient):
+    """POSTs {"prompt": ...} as JSON and expects {"text": ..., "tokens": n} back."""
+
+    def __init__(self, url):
+        self.url = url
+
+    def generate(self, prompt):
+        request = urllib.request.Request(self.url, data=json.dumps({'prompt': prompt}).encode(),
+                                         headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request, timeout=LLM_TIMEOUT) as response:
+                data = json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            raise LLMError(f'HTTP {e.code}', retryable=e.code == 429 or e.code >= 500) from e
+        except OSError as e:   # refused, reset, timed out
+            raise LLMError(str(e), retryable=True) from e
+        text = data.get('text', '').strip()
+        return text, data.get('tokens') or estimate_tokens(prompt) + estimate_tokens(text)
+
+
+_CLIENT_FACTORIES = {
+    'gemini': lambda url: GeminiClient(url.split('://', 1)[1]),
+    'http': HTTPClient,
+    'https': HTTPClient,
+}
+
+
+def register_llm_client(scheme, factory):
+    """Make LLM_URL=<scheme>://... build a client with factory(url)."""
+    _CLIENT_FACTORIES[scheme] = factory
+
+
+def create_client(url=LLM_URL):
+    scheme = url.split('://', 1)[0]
+    if scheme not in _CLIENT_FACTORIES:
+        raise RuntimeError(f"No LLM client for '{scheme}'")
+    return _CLIENT_FACTORIES[scheme](url)
+
+
+# ---------------------------------------------
+# CIRCUIT BREAKER
+# ---------------------------------------------
+class CircuitBreaker:
+    """
+    Opens after `failures` consecutive failures; once `cooldown` seconds
+    have passed a single trial request is let through, and its outcome
+    closes the circuit or opens it again.
+    """
+
+    def __init__(self, failures=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN):
+        self.failures = failures
+        self.cooldown = cooldown
+        self._count = 0
+        self._opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if not self._trial and time.monotonic() - self._opened_at >= self.cooldown:
+                self._trial = True
+                return True
+            return False
+
+    def blocked(self):
+        """Whether allow() would refuse now; unlike allow() it never takes the trial."""
+        with self._lock:
+            return self._opened_at is not None and (
+                self._trial or time.monotonic() - self._opened_at < self.cooldown)
+
+    def record_success(self):
+        with self._lock:
+            self._count, self._opened_at, self._trial = 0, None, False
+
+    def record_failure(self):
+        with self._lock:
+            self._count += 1
+            if self._trial or self._count >= self.failures:
+                self._opened_at, self._trial = time.monotonic(), False
+
+    @property
+    def is_open(self):
+        return self._opened_at is not None
+
+
+# ---------------------------------------------
+# SCHEDULER
+# ---------------------------------------------
+class LLMScheduler:
+    """
+    Queues completions for a bounded pool of worker threads. Identical
+    prompts share one request (while in flight, then for RESULT_TTL), every
+    request first takes from request and token buckets sized to the
+    provider's quotas, retryable failures are retried with jittered
+    exponential backoff, and a circuit breaker fails requests fast while
+    the provider is down.
+    """
+
+    def __init__(self, client, requests_per_minute=LLM_REQUESTS_PER_MINUTE, tokens_per_minute=LLM_TOKENS_PER_MINUTE,
+                 concurrency=LLM_CONCURRENCY, max_retries=MAX_RETRIES, breaker=None):
+        self.client = client
+        self.max_retries = max_retries
+        self.breaker = breaker or CircuitBreaker()
+        self._requests = TokenBucket(max(requests_per_minute // 4, 1), requests_per_minute / 60)
+        self._tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60)
+        self._bucket_lock = threading.Lock()
+
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._inflight = {}
+        self._results = TTLCache(maxsize=10000, ttl=RESULT_TTL)
+        self._workers = [threading.Thread(target=self._work, daemon=True, name=f'llm-{i}')
+                         for i in range(max(concurrency, 1))]
+        for worker in self._workers:
+            worker.start()
+
+        self._metrics_lock = threading.Lock()
+        self._waits = deque(maxlen=WAIT_SAMPLES)
+        self._counts = dict.fromkeys(('submitted', 'deduplicated', 'completed', 'failed', 'rejected',
+                                      'retries', 'calls', 'prompt_tokens', 'tokens_spent'), 0)
+
+    def _count(self, name, amount=1):
+        with self._metrics_lock:
+            self._counts[name] += amount
+
+    def submit(self, prompt):
+        """A Future of the completion text; raises LLMError (or CircuitOpen) through the Future."""
+        key = hashlib.sha1(prompt.encode()).hexdigest()
+        self._count('submitted')
+
+        text = self._results.get(key)
+        if text is not None:
+            self._count('deduplicated')
+            future = Future()
+            future.set_result(text)
+            return future
+
+        with self._condition:
+            future = self._inflight.get(key)
+            if future is not None:
+                self._count('deduplicated')
+                return future
+            future = Future()
+            if self.breaker.blocked():
+                self._count('rejected')
+                future.set_exception(CircuitOpen('AI provider unavailable'))
+                return future
+            self._inflight[key] = future
+            self._queue.append((key, prompt, time.monotonic(), future))
+            self._condition.notify()
+        return future
+
+    def generate(self, prompt, timeout=None):
+        return self.submit(prompt).result(timeout)
+
+    def _take(self):
+        with self._condition:
+            while not self._queue:
+                self._condition.wait()
+            return self._queue.popleft()
+
+    def _acquire(self, tokens):
+        """Block until both buckets allow one request of `tokens` tokens."""
+        tokens = min(tokens, self._tokens.capacity)
+        while True:
+            with self._bucket_lock:
+                allowed, wait = self._requests.consume()
+                if allowed:
+                    allowed, wait = self._tokens.consume(tokens)
+                    if not allowed:
+                        self._requests.tokens += 1   # hand the request slot back
+            if allowed:
+                return
+            time.sleep(wait)
+
+    def _work(self):
+        while True:
+            key, prompt, queued_at, future = self._take()
+            with self._metrics_lock:
+                self._waits.append(time.monotonic() - queued_at)
+            try:
+                text = self._complete(prompt)
+            except LLMError as e:
+                self._count('failed')
+                logger.warning('LLM request failed: %s', e)
+                future.set_exception(e)
+            else:
+                self._results.set(key, text)
+                self._count('completed')
+                future.set_result(text)
+            finally:
+                with self._condition:
+                    self._inflight.pop(key, None)
+
+    def _complete(self, prompt):
+        prompt_tokens = estimate_tokens(prompt)
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                self._count('rejected')
+                raise CircuitOpen('AI provider unavailable')
+            self._acquire(prompt_tokens + OUTPUT_TOKENS)
+            self._count('calls')
+            self._count('prompt_tokens', prompt_tokens)
+            try:
+                text, tokens = self.client.generate(prompt)
+            except LLMError as e:
+                self.breaker.record_failure()
+                if not e.retryable or attempt == self.max_retries:
+                    raise
+                self._count('retries')
+                time.sleep(random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt)))
+                continue
+            self.breaker.record_success()
+            self._count('tokens_spent', tokens)
+            return text
+
+    def metrics(self):
+        """Counters plus queue-wait percentiles (seconds) over recent requests."""
+        with self._metrics_lock:
+            metrics = dict(self._counts)
+            waits = sorted(self._waits)
+        metrics['queued'] = len(self._queue)
+        metrics['circuit_open'] = self.breaker.is_open
+        for name, pct in (('queue_wait_p50', 50), ('queue_wait_p95', 95), ('queue_wait_max', 100)):
+            metrics[name] = waits[min(len(waits) - 1, int(len(waits) * pct / 100))] if waits else 0.0
+        return metrics
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """The process-wide scheduler, for the client named by LLM_URL."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = LLMScheduler(create_client())
+        return _scheduler
+
+
+def set_scheduler(scheduler):
+    """Replace the process-wide scheduler (another client, other limits)."""
+    global _scheduler
+    with _scheduler_lock:
+        _scheduler = scheduler
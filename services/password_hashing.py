@@ -0,0 +1,93 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+# Hash parameters for new hashes. Stored hashes with different parameters
+# are upgraded on the next successful login (see needs_rehash).
+PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+
+# Processes per app worker doing the hashing; 0 hashes inline in the caller.
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', '1'))
+# Jobs (running + queued) allowed per app worker before callers are turned away.
+PASSWORD_HASH_MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', '2'))
+PASSWORD_HASH_TIMEOUT = 10
+
+
+class HashingBusy(Exception):
+    """
+    Raised when the hashing queue is full, a job times out or the pool has
+    died; callers should answer 503.
+    """
+
+
+_executor = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(max(PASSWORD_HASH_MAX_PENDING, 1))
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=PASSWORD_HASH_WORKERS)
+        return _executor
+
+
+def _discard_executor(executor):
+    """Drop a broken pool (it fails every later job) so the next call starts a new one."""
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _run(func, *args):
+    """
+    Run a CPU-heavy hashing call in the process pool so it never holds the
+    app worker's CPU or GIL, failing fast with HashingBusy once
+    PASSWORD_HASH_MAX_PENDING jobs are already in flight.
+    """
+    if PASSWORD_HASH_WORKERS <= 0:
+        return func(*args)
+
+    if not _slots.acquire(blocking=False):
+        raise HashingBusy('Too many password operations in progress')
+
+    executor = _get_executor()
+    try:
+        future = executor.submit(func, *args)
+    except BrokenProcessPool:
+        _slots.release()
+        _discard_executor(executor)
+        raise HashingBusy('Password hashing is restarting') from None
+    except Exception:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda _: _slots.release())
+
+    # A timed-out job keeps its slot until it finishes
+    try:
+        return future.result(timeout=PASSWORD_HASH_TIMEOUT)
+    except FutureTimeoutError:
+        raise HashingBusy('Password hashing timed out') from None
+    except BrokenProcessPool:
+        _discard_executor(executor)
+        raise HashingBusy('Password hashing is restarting') from None
+
+
+def hash_password(password):
+    return _run(generate_password_hash, password, PASSWORD_HASH_METHOD)
+
+
+def verify_password(password_hash, password):
+    return _run(check_password_hash, password_hash, password)
+
+
+def needs_rehash(password_hash):
+    """True when a stored hash was made with other parameters than PASSWORD_HASH_METHOD."""
+    return password_hash.split('$', 1)[0] != PASSWORD_HASH_METHOD
@@ -2,6 +2,17 @@ import re
 from datetime import datetime
 from pypdf import PdfReader
 
+from services.currency import currency_from_text
+from services.statement_layouts import LAYOUT_PROFILES, layout_pages, layout_rows
+
+
+# A Dr/Cr column value, or the suffix some banks put after the amount
+_TYPE_MARK = re.compile(r'(?<![A-Za-z/])(cr|dr)\.?(?![\w/])', re.IGNORECASE)
+
+
+class PdfParseError(Exception):
+    """Raised when a PDF cannot be read."""
+
 
 def parse_transaction_pdf(pdf_file):
     """
@@ -12,30 +23,77 @@ def parse_transaction_pdf(pdf_file):
     - Each transaction should contain: date, description, amount, type (income/expense)
     - Supports common bank statement formats
     """
-    transactions = []
-    
+    return list(iter_pdf_transactions(pdf_file))
+
+
+def iter_pdf_transactions(pdf_file):
+    """
+    Yield the transactions of a PDF page by page, so a long statement is
+    never held as a single string. Statements in a known bank layout are
+    read column by column (see services.statement_layouts); any other PDF
+    goes through the line heuristic below.
+    """
     try:
         pdf_reader = PdfReader(pdf_file)
-        text = ""
-        
-        for page in pdf_reader.pages:
-            text += page.extract_text()
-        
-        lines = text.split('\n')
         
-        for line in lines:
-            line = line.strip()
-            if not line:
-                continue
-            
-            transaction = parse_transaction_line(line)
-            if transaction:
-                transactions.append(transaction)
+        layout, pages = layout_pages(pdf_reader)
+        if layout is not None:
+            currency = LAYOUT_PROFILES[layout].get('currency')
+            for row in layout_rows(layout, pages):
+                transaction = layout_transaction(row)
+                if transaction:
+                    transaction['currency'] = currency
+                    yield transaction
+            return
         
-        return transactions
+        for page in pdf_reader.pages:
+            for line in page.extract_text().split('\n'):
+                line = line.strip()
+                if not line:
+                    continue
+                
+                transaction = parse_transaction_line(line)
+                if transaction:
+                    yield transaction
     
     except Exception as e:
-        raise Exception(f"Error parsing PDF: {str(e)}")
+        raise PdfParseError(f"Error parsing PDF: {str(e)}")
+
+
+def layout_transaction(row):
+    """
+    Build a transaction from a row of a bank statement table, taking the
+    type from the column the amount is in (or the Dr/Cr column).
+    """
+    debit = _table_amount(row.get('debit'))
+    credit = _table_amount(row.get('credit'))
+    
+    if debit:
+        amount, transaction_type = debit, 'expense'
+    elif credit:
+        amount, transaction_type = credit, 'income'
+    else:
+        amount = _table_amount(row.get('amount'))
+        if not amount:
+            return None
+        transaction_type = 'income' if row.get('type', '').strip().lower().startswith('cr') else 'expense'
+    
+    description = ' '.join(row.get('description', '').split())
+    
+    return {
+        'date': row['date'],
+        'description': description[:100],
+        'amount': amount,
+        'transaction_type': transaction_type,
+        'category': categorize_transaction(description, transaction_type)
+    }
+
+
+def _table_amount(text):
+    try:
+        return abs(float((text or '').replace(',', '').replace('₹', '').strip() or 0))
+    except ValueError:
+        return None
 
 
 def parse_transaction_line(line):
@@ -66,18 +124,20 @@ def parse_transaction_line(line):
                     
                     description = line.replace(date_str, '').strip()
                     for amt in amount_matches:
-                        description = description.replace(amt, '').strip()
+                        description = description.replace(amt, ' ').strip()
                     
-                    description = ' '.join(description.split())
+                    transaction_type = line_transaction_type(line, amount_matches[-1])
+                    description = ' '.join(word for word in description.split() 
+                                           if word not in ('+', '-') and not _TYPE_MARK.fullmatch(word))
                     
                     if len(description) > 5:
-                        transaction_type = 'expense'
-                        category = categorize_transaction(description)
+                        category = categorize_transaction(description, transaction_type)
                         
                         return {
                             'date': date_obj,
                             'description': description[:100],
                             'amount': amount,
+                            'currency': currency_from_text(amount_matches[-1]),
                             'transaction_type': transaction_type,
                             'category': category
                         }
@@ -88,6 +148,22 @@ def parse_transaction_line(line):
     return None
 
 
+def line_transaction_type(line, amount_text):
+    """
+    Type of a statement line, read the way a Dr/Cr column is: a "Cr" or
+    "Dr" mark (the last one wins), else a "+" sign on the amount. Lines
+    with neither are debits, as most statement lines are.
+    """
+    marks = _TYPE_MARK.findall(line)
+    if marks:
+        return 'income' if marks[-1].lower().startswith('cr') else 'expense'
+    
+    before = line[:line.rfind(amount_text)].rstrip()
+    if before.endswith('+'):
+        return 'income'
+    return 'expense'
+
+
 def parse_date(date_str):
     """Parse various date formats."""
     date_formats = [
@@ -110,10 +186,13 @@ def parse_date(date_str):
     return datetime.now().date()
 
 
-def categorize_transaction(description):
+def categorize_transaction(description, transaction_type='expense'):
     """Automatically categorize transaction based on description."""
     description_lower = description.lower()
     
+    if transaction_type == 'income':
+        return 'Salary' if 'salary' in description_lower else 'Other Income'
+    
     categories = {
         'Food & Dining': ['restaurant', 'cafe', 'food', 'dining', 'swiggy', 'zomato', 'uber eats', 'dominos', 'pizza', 'mcdonald'],
         'Transportation': ['uber', 'ola', 'taxi', 'metro', 'bus', 'train', 'fuel', 'petrol', 'diesel', 'parking'],
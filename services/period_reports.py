@@ -0,0 +1,302 @@
+from datetime import date, timedelta
+
+from sqlalchemy import and_, bindparam, case, delete, extract, func, insert, or_, select, update
+
+from models import db
+from models.monthly_total import MonthlyTotal
+from models.transaction import Transaction
+from models.transaction_rollup import TransactionRollup
+from services.archive import archived_transactions, archived_years
+from services.batching import chunks
+from services.budget_alerts import transaction_deltas
+from services.change_feed import changes_recorded
+from services.currency import Conversion, base_currency, convert
+from services.periods import FISCAL_YEAR_START, parse_period, period_of
+from services.upserts import conflict_insert
+
+
+# What a period is compared against when the request names no other period
+BASELINES = ('last_year', 'previous')
+
+
+# ---------------------------------------------
+# MONTHLY BUCKETS
+# ---------------------------------------------
+def _history_buckets(connection, user_id):
+    """{(month, type, category, currency): [amount, count]} from live transactions and archived rollups."""
+    year, month = extract('year', Transaction.date), extract('month', Transaction.date)
+    buckets = {}
+    for row in connection.execute(
+        select(year, month, Transaction.transaction_type, Transaction.category, Transaction.currency,
+               func.sum(Transaction.amount), func.count()).where(
+            Transaction.user_id == user_id
+        ).group_by(year, month, Transaction.transaction_type, Transaction.category, Transaction.currency)
+    ):
+        buckets[(date(int(row[0]), int(row[1]), 1),) + tuple(row[2:5])] = [row[5], row[6]]
+
+    for row in connection.execute(
+        select(TransactionRollup.month, TransactionRollup.transaction_type, TransactionRollup.category,
+               TransactionRollup.currency, TransactionRollup.amount, TransactionRollup.count).where(
+            TransactionRollup.user_id == user_id)
+    ):
+        bucket = buckets.setdefault(tuple(row[:4]), [0.0, 0])
+        bucket[0] += row[4]
+        bucket[1] += row[5]
+    return buckets
+
+
+def seed_monthly_totals(connection, user_id):
+    """Rebuild a user's monthly totals from their whole history. Returns the number of buckets."""
+    table = MonthlyTotal.__table__
+    connection.execute(delete(table).where(table.c.user_id == user_id))
+    rows = [{'user_id': user_id, 'month': month, 'transaction_type': transaction_type, 'category': category,
+             'currency': currency, 'amount': amount, 'count': count}
+            for (month, transaction_type, category, currency), (amount, count)
+            in _history_buckets(connection, user_id).items()]
+    for chunk in chunks(rows):
+        connection.execute(insert(table), chunk)
+    return len(rows)
+
+
+def _seeded_users(connection, user_ids):
+    table = MonthlyTotal.__table__
+    return set(connection.execute(
+        select(table.c.user_id).where(table.c.user_id.in_(user_ids)).distinct()
+    ).scalars())
+
+
+def apply_monthly_deltas(connection, deltas, unknown_users=()):
+    """
+    Fold transaction deltas (see services.budget_alerts.transaction_deltas)
+    into the monthly totals, coalesced per bucket first. Users without
+    totals are skipped, as their first report seeds them from the table
+    (which already holds these writes); the totals of users whose changes
+    could not be reconstructed are dropped to be seeded again the same way.
+    Buckets are incremented in place (amount = amount + delta) and new ones
+    upserted, so concurrent writers for the same month add up instead of
+    overwriting or colliding; emptied buckets are deleted afterwards.
+    """
+    table = MonthlyTotal.__table__
+    if unknown_users:
+        connection.execute(delete(table).where(table.c.user_id.in_(unknown_users)))
+
+    seeded = _seeded_users(connection, {d.user_id for d in deltas} - set(unknown_users)) if deltas else set()
+    sums = {}
+    for delta in deltas:
+        if delta.user_id not in seeded:
+            continue
+        key = (delta.user_id, delta.date.replace(day=1), delta.transaction_type, delta.category, delta.currency)
+        amount, count = sums.get(key, (0.0, 0))
+        sums[key] = (amount + delta.amount, count + delta.count)
+    if not sums:
+        return
+
+    existing = set()
+    for chunk in chunks(sorted({key[0] for key in sums})):
+        existing.update(connection.execute(
+            select(table.c.user_id, table.c.month, table.c.transaction_type, table.c.category,
+                   table.c.currency).where(table.c.user_id.in_(chunk), table.c.month.in_({key[1] for key in sums}))
+        ).all())
+
+    keys, updates, inserts = [], [], []
+    for key, (amount, count) in sums.items():
+        user_id, month, transaction_type, category, currency = key
+        values = {'b_user_id': user_id, 'b_month': month, 'b_type': transaction_type, 'b_category': category,
+                  'b_currency': currency}
+        keys.append(values)
+        if key in existing:
+            updates.append(dict(values, d_amount=amount, d_count=count))
+        else:
+            inserts.append({'user_id': user_id, 'month': month, 'transaction_type': transaction_type,
+                            'category': category, 'currency': currency, 'amount': amount, 'count': count})
+
+    where = (table.c.user_id == bindparam('b_user_id'), table.c.month == bindparam('b_month'),
+             table.c.transaction_type == bindparam('b_type'), table.c.category == bindparam('b_category'),
+             table.c.currency == bindparam('b_currency'))
+    if updates:
+        connection.execute(update(table).where(*where).values(
+            amount=table.c.amount + bindparam('d_amount'), count=table.c.count + bindparam('d_count')
+        ), updates)
+    if inserts:
+        statement = conflict_insert(connection, table)
+        connection.execute(statement.on_conflict_do_update(
+            index_elements=[table.c.user_id, table.c.month, table.c.transaction_type, table.c.category,
+                            table.c.currency],
+            set_={'amount': table.c.amount + statement.excluded.amount,
+                  'count': table.c.count + statement.excluded.count}
+        ), inserts)
+    connection.execute(delete(table).where(*where, table.c.count <= 0), keys)
+
+
+@changes_recorded.connect
+def _on_changes_recorded(session, changes):
+    if not any(entity == 'transaction' for _, entity, _, _ in changes):
+        return
+    deltas, unknown_users = transaction_deltas(session, changes)
+    if deltas or unknown_users:
+        apply_monthly_deltas(session.connection(), deltas, unknown_users)
+
+
+def ensure_monthly_totals(user_id):
+    """Seed a user's monthly totals if they have none yet (new deployment, or dropped)."""
+    if _seeded_users(db.session.connection(), [user_id]):
+        return
+    try:
+        seed_monthly_totals(db.session.connection(), user_id)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+# ---------------------------------------------
+# PERIOD TOTALS
+# ---------------------------------------------
+def _add(totals, transaction_type, category, amount):
+    key = (transaction_type, category)
+    totals[key] = totals.get(key, 0.0) + amount
+
+
+def _bucket_totals(user_id, currency, spans):
+    """
+    {(first, end): {(type, category): amount}} for month spans, from the
+    monthly totals in one query. Amounts in other currencies are converted
+    at the rate of the month's first day, as archived rollups are.
+    """
+    spans = [span for span in spans if span[0] < span[1]]
+    results = {span: {} for span in spans}
+    if not spans:
+        return results
+    rows = db.session.execute(
+        select(MonthlyTotal.month, MonthlyTotal.transaction_type, MonthlyTotal.category, MonthlyTotal.currency,
+               MonthlyTotal.amount).where(
+            MonthlyTotal.user_id == user_id,
+            MonthlyTotal.month >= min(first for first, _ in spans),
+            MonthlyTotal.month < max(end for _, end in spans)
+        )
+    ).all()
+    for month, transaction_type, category, row_currency, amount in rows:
+        for first, end in spans:
+            if first <= month < end:
+                _add(results[(first, end)], transaction_type, category, convert(amount, row_currency, currency, month))
+    return results
+
+
+def _edge_totals(user_id, currency, edges):
+    """
+    {(start, end): {(type, category): amount}} for spans of days, from the
+    transactions dated in them in one grouped query, and from the archive
+    (each year decoded once) where a span falls in an archived year.
+    """
+    edges = sorted(set(edges))
+    results = {edge: {} for edge in edges}
+    if not edges:
+        return results
+
+    conversion = Conversion(Transaction.amount, Transaction.currency, Transaction.date, currency)
+    spans = [and_(Transaction.date >= start, Transaction.date < end) for start, end in edges]
+    edge = case(*((span, index) for index, span in enumerate(spans)))
+    for index, transaction_type, category, total in db.session.execute(
+        conversion.join(select(edge, Transaction.transaction_type, Transaction.category,
+                               func.sum(conversion.amount)).select_from(Transaction)).where(
+            Transaction.user_id == user_id, or_(*spans)
+        ).group_by(edge, Transaction.transaction_type, Transaction.category)
+    ):
+        _add(results[edges[index]], transaction_type, category, total)
+
+    filters = {'start_date': edges[0][0], 'end_date': max(end for _, end in edges) - timedelta(days=1)}
+    years = [year for year in archived_years(user_id, filters)
+             if any(start.year <= year <= (end - timedelta(days=1)).year for start, end in edges)]
+    for row in archived_transactions(user_id, filters, years) if years else ():
+        for start, end in edges:
+            if start <= row.date < end:
+                _add(results[(start, end)], row.transaction_type, row.category,
+                     convert(row.amount, row.currency, currency, row.date))
+    return results
+
+
+def period_totals(user_id, periods, currency=None):
+    """
+    {(type, category): amount} for each of `periods`, in the user's base
+    currency: whole months from the monthly totals, and only the days
+    outside whole months (day and week periods, ranges) from transactions.
+    """
+    currency = currency or base_currency(user_id)
+    ensure_monthly_totals(user_id)
+    splits = [period.split_months() for period in periods]
+    months = _bucket_totals(user_id, currency, [months for months, _ in splits])
+    days = _edge_totals(user_id, currency, [edge for _, edges in splits for edge in edges])
+
+    results = []
+    for months_span, edges in splits:
+        totals = dict(months.get(months_span, {}))
+        for edge in edges:
+            for (transaction_type, category), amount in days[edge].items():
+                _add(totals, transaction_type, category, amount)
+        results.append(totals)
+    return results
+
+
+# ---------------------------------------------
+# COMPARISON
+# ---------------------------------------------
+def change(current, baseline):
+    """Delta and percent change (None when the baseline is zero) of two amounts."""
+    return {
+        'current': current,
+        'baseline': baseline,
+        'delta': current - baseline,
+        'percent': (current - baseline) / abs(baseline) * 100 if baseline else None,
+    }
+
+
+def _period_dict(period):
+    return {'period': period.label, 'title': period.title, 'kind': period.kind,
+            'start': period.start.isoformat(), 'end': period.last_day.isoformat()}
+
+
+def compare_periods(user_id, current, baseline):
+    """
+    Income, expenses and balance of two periods, and spending per category
+    (largest current spending first), each with its delta and percent
+    change from `baseline` to `current`.
+    """
+    currency = base_currency(user_id)
+    now, then = period_totals(user_id, [current, baseline], currency)
+
+    def total(totals, transaction_type):
+        return sum(amount for (kind, _), amount in totals.items() if kind == transaction_type)
+
+    income = change(total(now, 'income'), total(then, 'income'))
+    expense = change(total(now, 'expense'), total(then, 'expense'))
+    categories = sorted({category for kind, category in list(now) + list(then) if kind == 'expense'})
+    rows = [dict(change(now.get(('expense', category), 0.0), then.get(('expense', category), 0.0)),
+                 category=category) for category in categories]
+    rows.sort(key=lambda row: (-row['current'], -row['baseline'], row['category']))
+
+    return {
+        'currency': currency,
+        'current': _period_dict(current),
+        'baseline': _period_dict(baseline),
+        'totals': {
+            'income': income,
+            'expense': expense,
+            'balance': change(income['current'] - expense['current'], income['baseline'] - expense['baseline']),
+        },
+        'categories': rows,
+    }
+
+
+def resolve_periods(period=None, against=None, kind='month', fiscal_start=FISCAL_YEAR_START, today=None):
+    """
+    (current, baseline) from request arguments: `period` is a label (see
+    services.periods.parse_period), by default the `kind` period containing
+    today; `against` is 'last_year' (the default), 'previous' or another
+    label. Raises PeriodError.
+    """
+    current = parse_period(period, fiscal_start) if period else period_of(kind, today or date.today(), fiscal_start)
+    if not against or against == 'last_year':
+        return current, current.year_earlier()
+    if against == 'previous':
+        return current, current.previous()
+    return current, parse_period(against, fiscal_start)
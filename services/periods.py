@@ -0,0 +1,214 @@
+import os
+import re
+from collections import namedtuple
+from datetime import date, timedelta
+
+
+# First month of the fiscal year: 1 for calendar years, 4 for April-March
+FISCAL_YEAR_START = int(os.environ.get('FISCAL_YEAR_START', '1'))
+
+PERIOD_KINDS = ('day', 'week', 'month', 'quarter', 'year')
+
+_RANGE = re.compile(r'^(\d{4}-\d{2}-\d{2})\.\.(\d{4}-\d{2}-\d{2})$')
+_DAY = re.compile(r'^(\d{4})-(\d{2})-(\d{2})$')
+_WEEK = re.compile(r'^(\d{4})-W(\d{1,2})$')
+_MONTH = re.compile(r'^(\d{4})-(\d{2})$')
+_QUARTER = re.compile(r'^(?:FY)?(\d{4})-Q([1-4])$')
+_YEAR = re.compile(r'^(?:FY)?(\d{4})(?:-\d{2})?$')
+
+
+class PeriodError(ValueError):
+    """Raised for a malformed period or an unknown period kind."""
+
+
+def add_months(day, months):
+    """First day of the month `months` after (negative: before) the month of `day`."""
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _year_earlier(day):
+    """The same date a year earlier; 29 February becomes the 28th."""
+    try:
+        return day.replace(year=day.year - 1)
+    except ValueError:
+        return day.replace(year=day.year - 1, day=28)
+
+
+# ---------------------------------------------
+# PERIODS
+# ---------------------------------------------
+class Period(namedtuple('Period', 'kind start end fiscal_start')):
+    """
+    The days start <= day < end. Quarters and years begin in month
+    `fiscal_start`; a 'range' is any span of whole days.
+    """
+    __slots__ = ()
+
+    @property
+    def last_day(self):
+        return self.end - timedelta(days=1)
+
+    @property
+    def fiscal_year(self):
+        """Calendar year in which the fiscal year containing `start` begins."""
+        return self.start.year if self.start.month >= self.fiscal_start else self.start.year - 1
+
+    @property
+    def label(self):
+        """Round-trips through parse_period with the same fiscal_start."""
+        prefix = 'FY' if self.fiscal_start != 1 else ''
+        if self.kind == 'day':
+            return self.start.isoformat()
+        if self.kind == 'week':
+            year, week, _ = self.start.isocalendar()
+            return f'{year:04d}-W{week:02d}'
+        if self.kind == 'month':
+            return f'{self.start.year:04d}-{self.start.month:02d}'
+        if self.kind == 'quarter':
+            quarter = (self.start.month - self.fiscal_start) % 12 // 3 + 1
+            return f'{prefix}{self.fiscal_year:04d}-Q{quarter}'
+        if self.kind == 'year':
+            return f'{prefix}{self.fiscal_year:04d}'
+        return f'{self.start.isoformat()}..{self.last_day.isoformat()}'
+
+    @property
+    def title(self):
+        """Human-readable name, for page headings."""
+        if self.kind == 'day':
+            return self.start.strftime('%d %b %Y')
+        if self.kind == 'week':
+            return f"Week of {self.start.strftime('%d %b %Y')}"
+        if self.kind == 'month':
+            return self.start.strftime('%B %Y')
+        if self.kind == 'quarter' and self.fiscal_start == 1:
+            return f"Q{(self.start.month - 1) // 3 + 1} {self.start.year}"
+        if self.kind == 'year' and self.fiscal_start == 1:
+            return str(self.start.year)
+        if self.kind in ('quarter', 'year'):
+            name = f'FY{self.fiscal_year}-{(self.fiscal_year + 1) % 100:02d}'
+            return f'{self.label.rsplit("-", 1)[1]} {name}' if self.kind == 'quarter' else name
+        return f"{self.start.strftime('%d %b %Y')} – {self.last_day.strftime('%d %b %Y')}"
+
+    def shift(self, count):
+        """
+        The period `count` periods of the same kind later (negative:
+        earlier). Raises PeriodError past either end of the calendar.
+        """
+        try:
+            return self._shifted(count)
+        except (ValueError, OverflowError) as e:
+            raise PeriodError(f'No {self.kind} {count:+d} from {self.label}: {e}') from None
+
+    def _shifted(self, count):
+        if self.kind == 'day':
+            return self._replace(start=self.start + timedelta(days=count), end=self.end + timedelta(days=count))
+        if self.kind == 'week':
+            return self._replace(start=self.start + timedelta(weeks=count), end=self.end + timedelta(weeks=count))
+        months = {'month': 1, 'quarter': 3, 'year': 12}.get(self.kind)
+        if months:
+            return self._replace(start=add_months(self.start, months * count),
+                                 end=add_months(self.start, months * (count + 1)))
+        length = self.end - self.start
+        return self._replace(start=self.start + length * count, end=self.end + length * count)
+
+    def previous(self):
+        return self.shift(-1)
+
+    def year_earlier(self):
+        """
+        The same period a year before: the same month, quarter or date, the
+        week 52 weeks earlier (so weekdays line up), a range with both ends
+        moved back a year.
+        """
+        if self.kind == 'week':
+            return self.shift(-52)
+        if self.kind in ('month', 'quarter', 'year'):
+            return self.shift(-{'month': 12, 'quarter': 4, 'year': 1}[self.kind])
+        try:
+            return self._replace(start=_year_earlier(self.start), end=_year_earlier(self.last_day) + timedelta(days=1))
+        except (ValueError, OverflowError) as e:
+            raise PeriodError(f'No year before {self.label}: {e}') from None
+
+    def split_months(self):
+        """
+        ((first, end), edges): the whole calendar months inside the period,
+        as first-of-month dates first <= month < end, and the [start, end)
+        spans of days left over on either side.
+        """
+        last = self.end.replace(day=1)
+        first = self.start if self.start.day == 1 or self.start >= last else add_months(self.start, 1)
+        if first >= last:
+            return (first, first), [(self.start, self.end)]
+        return (first, last), [(start, end) for start, end in ((self.start, first), (last, self.end)) if start < end]
+
+
+def period_of(kind, day, fiscal_start=FISCAL_YEAR_START):
+    """The period of `kind` containing `day`."""
+    if kind == 'day':
+        return Period(kind, day, day + timedelta(days=1), fiscal_start)
+    if kind == 'week':
+        start = day - timedelta(days=day.weekday())
+        return Period(kind, start, start + timedelta(days=7), fiscal_start)
+    month = day.replace(day=1)
+    offset = (day.month - fiscal_start) % 12
+    if kind == 'month':
+        return Period(kind, month, add_months(month, 1), fiscal_start)
+    if kind == 'quarter':
+        start = add_months(month, -(offset % 3))
+        return Period(kind, start, add_months(start, 3), fiscal_start)
+    if kind == 'year':
+        start = add_months(month, -offset)
+        return Period(kind, start, add_months(start, 12), fiscal_start)
+    raise PeriodError(f"Unknown period kind: {kind} (use {', '.join(PERIOD_KINDS)})")
+
+
+def date_range(start, last_day, fiscal_start=FISCAL_YEAR_START):
+    """The 'range' period from `start` to `last_day`, both included."""
+    if last_day < start:
+        raise PeriodError('The end of a period cannot be before its start')
+    return Period('range', start, last_day + timedelta(days=1), fiscal_start)
+
+
+# (pattern, build(match, fiscal_start)), tried in order
+_PARSERS = (
+    (_RANGE, lambda m, fiscal: date_range(date.fromisoformat(m[1]), date.fromisoformat(m[2]), fiscal)),
+    (_DAY, lambda m, fiscal: period_of('day', date(int(m[1]), int(m[2]), int(m[3])), fiscal)),
+    (_WEEK, lambda m, fiscal: period_of('week', date.fromisocalendar(int(m[1]), int(m[2]), 1), fiscal)),
+    (_MONTH, lambda m, fiscal: period_of('month', date(int(m[1]), int(m[2]), 1), fiscal)),
+    (_QUARTER, lambda m, fiscal: period_of('quarter', add_months(date(int(m[1]), fiscal, 1), 3 * (int(m[2]) - 1)),
+                                           fiscal)),
+    (_YEAR, lambda m, fiscal: period_of('year', date(int(m[1]), fiscal, 1), fiscal)),
+)
+
+
+def parse_period(text, fiscal_start=FISCAL_YEAR_START):
+    """
+    A period from its label: 2025-03-14 (day), 2025-W11 (ISO week), 2025-03
+    (month), 2025-Q1 (quarter), 2025 (year), or 2025-01-01..2025-03-31 (a
+    range, both ends included). Quarters and years are fiscal ones when
+    fiscal_start is not 1, numbered by the year they begin in, optionally
+    written FY2025-Q1 and FY2025 (or FY2025-26). Raises PeriodError.
+    """
+    value = (text or '').strip().upper()
+    for pattern, build in _PARSERS:
+        match = pattern.match(value)
+        if match:
+            try:
+                return build(match, fiscal_start)
+            except (ValueError, OverflowError) as e:
+                raise PeriodError(f'Invalid period {text!r}: {e}') from None
+    raise PeriodError(f'Invalid period {text!r} (e.g. 2025-03-14, 2025-W11, 2025-03, 2025-Q1, 2025)')
+
+
+def parse_fiscal_start(value, default=FISCAL_YEAR_START):
+    """A fiscal year's first month (1-12) from a query string value; raises PeriodError."""
+    if not value:
+        return default
+    try:
+        month = int(value)
+    except ValueError:
+        month = 0
+    if not 1 <= month <= 12:
+        raise PeriodError('The fiscal year start must be a month number from 1 to 12')
+    return month
@@ -0,0 +1,69 @@
+import os
+import threading
+import time
+
+from services.cache import TTLCache
+
+
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', '1') != '0'
+
+
+class TokenBucket:
+    """Holds up to `capacity` tokens, refilled continuously at `rate` tokens per second."""
+
+    def __init__(self, capacity, rate):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def consume(self, tokens=1):
+        """Take tokens if available. Returns (allowed, seconds until enough tokens)."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True, 0.0
+        return False, (tokens - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """
+    Token buckets keyed by an arbitrary string (an IP address, a username),
+    kept in a bounded in-process store. Idle buckets are evicted once they
+    would have refilled completely, so eviction never grants extra tokens.
+    """
+
+    def __init__(self, capacity, per_seconds, max_keys=100000):
+        self.capacity = capacity
+        self.rate = capacity / per_seconds
+        self._buckets = TTLCache(maxsize=max_keys, ttl=per_seconds)
+        self._lock = threading.Lock()
+
+    def hit(self, key):
+        if not RATE_LIMIT_ENABLED:
+            return True, 0.0
+
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = TokenBucket(self.capacity, self.rate)
+            allowed, retry_after = bucket.consume()
+            self._buckets.set(key, bucket)
+        return allowed, retry_after
+
+
+# 10 login or registration attempts per minute per client address,
+# 5 login attempts per minute per username.
+ip_limiter = RateLimiter(capacity=10, per_seconds=60)
+username_limiter = RateLimiter(capacity=5, per_seconds=60)
+
+
+def check_login_rate(remote_addr, username=None):
+    """Return 0 if the attempt may proceed, otherwise seconds to wait (rounded up)."""
+    allowed, retry_after = ip_limiter.hit(f'ip:{remote_addr}')
+    if allowed and username:
+        allowed, retry_after = username_limiter.hit(f'user:{username.lower()}')
+    return 0 if allowed else int(retry_after) + 1
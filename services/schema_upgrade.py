@@ -0,0 +1,72 @@
+from sqlalchemy import inspect, text
+
+from models.exchange_rate import DEFAULT_CURRENCY
+
+
+# Columns added to tables that databases created by earlier versions
+# already have (db.create_all() only creates missing tables):
+# table -> [(column, DDL)]. Defaults must be constants, so existing
+# rows are filled in by the ALTER itself.
+ADDED_COLUMNS = {
+    'users': [('base_currency', f"VARCHAR(3) NOT NULL DEFAULT '{DEFAULT_CURRENCY}'")],
+    'transactions': [('currency', f"VARCHAR(3) NOT NULL DEFAULT '{DEFAULT_CURRENCY}'")],
+    'budgets': [('currency', f"VARCHAR(3) NOT NULL DEFAULT '{DEFAULT_CURRENCY}'"), ('tag_filter', 'VARCHAR(200)')],
+    'recurring_transactions': [('currency', f"VARCHAR(3) NOT NULL DEFAULT '{DEFAULT_CURRENCY}'")],
+}
+
+# Unique indexes added to existing tables: table -> [(name, columns)]. New
+# databases get them as constraints from the models.
+ADDED_INDEXES = {
+    'transaction_flags': [('unique_transaction_flag_kind', ('transaction_id', 'kind'))],
+}
+
+
+def _columns(engine, table):
+    return {column['name'] for column in inspect(engine).get_columns(table)}
+
+
+def _unique_keys(engine, table):
+    """Column sets a unique constraint or index already covers."""
+    inspector = inspect(engine)
+    return ({frozenset(index['column_names']) for index in inspector.get_indexes(table) if index['unique']} |
+            {frozenset(constraint['column_names']) for constraint in inspector.get_unique_constraints(table)})
+
+
+def upgrade_schema(engine):
+    """
+    Add the columns of ADDED_COLUMNS that an existing database lacks, with
+    ALTER TABLE ... ADD COLUMN, then the indexes of ADDED_INDEXES.
+    Idempotent, and safe when several workers start at once: a column
+    another process added meanwhile is skipped. Returns the (table, column)
+    pairs added.
+    """
+    if not DEFAULT_CURRENCY.isalpha() or len(DEFAULT_CURRENCY) != 3:
+        raise ValueError(f'BASE_CURRENCY must be a three-letter code, not {DEFAULT_CURRENCY!r}')
+
+    tables = set(inspect(engine).get_table_names())
+    added = []
+    for table, columns in ADDED_COLUMNS.items():
+        if table not in tables:
+            continue
+        existing = _columns(engine, table)
+        for column, ddl in columns:
+            if column in existing:
+                continue
+            try:
+                with engine.begin() as connection:
+                    connection.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}'))
+            except Exception:
+                if column not in _columns(engine, table):
+                    raise
+                continue
+            added.append((table, column))
+
+    for table, indexes in ADDED_INDEXES.items():
+        if table not in tables:
+            continue
+        unique = _unique_keys(engine, table)
+        with engine.begin() as connection:
+            for name, columns in indexes:
+                if frozenset(columns) not in unique:
+                    connection.execute(text(f'CREATE UNIQUE INDEX IF NOT EXISTS {name} ON {table} ({", ".join(columns)})'))
+    return added
@@ -0,0 +1,148 @@
+import re
+
+from sqlalchemy import Float, Integer, and_, func, literal_column, or_, select, text
+from sqlalchemy.exc import OperationalError
+
+from models import db
+from models.transaction import Transaction
+from services.async_db import gather_queries
+
+
+FTS_TABLE = 'transactions_fts'
+DEFAULT_PER_PAGE = 50
+MAX_PER_PAGE = 200
+
+# SQLite: an FTS5 external-content index over transactions, kept in sync by
+# triggers so every write path (ORM, bulk Core inserts, raw SQL) is covered.
+_SQLITE_SETUP = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        description, category, content='transactions', content_rowid='id'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON transactions BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, description, category) VALUES (new.id, new.description, new.category);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON transactions BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, description, category) VALUES ('delete', old.id, old.description, old.category);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF description, category ON transactions BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, description, category) VALUES ('delete', old.id, old.description, old.category);
+        INSERT INTO {FTS_TABLE}(rowid, description, category) VALUES (new.id, new.description, new.category);
+    END""",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+
+# PostgreSQL: a GIN expression index; _pg_document() must match it exactly.
+_POSTGRES_SETUP = [
+    """CREATE INDEX IF NOT EXISTS ix_transactions_search ON transactions
+        USING GIN (to_tsvector('simple', coalesce(description, '') || ' ' || category))""",
+]
+
+_backend = None
+
+
+def init_search(engine):
+    """Create the search index for the engine's dialect (idempotent)."""
+    global _backend
+
+    if engine.dialect.name == 'sqlite':
+        with engine.begin() as connection:
+            exists = connection.execute(
+                text("SELECT 1 FROM sqlite_master WHERE name = :name"), {'name': FTS_TABLE}
+            ).first()
+            try:
+                statements = _SQLITE_SETUP if not exists else _SQLITE_SETUP[:-1]
+                for statement in statements:
+                    connection.execute(text(statement))
+                _backend = 'fts5'
+            except OperationalError as e:
+                if 'fts5' not in str(e):
+                    raise
+                # SQLite built without FTS5
+                _backend = 'like'
+    elif engine.dialect.name == 'postgresql':
+        with engine.begin() as connection:
+            for statement in _POSTGRES_SETUP:
+                connection.execute(text(statement))
+        _backend = 'tsvector'
+    else:
+        _backend = 'like'
+
+
+def search_terms(q):
+    """Words in a free-text query; punctuation and FTS operators are ignored."""
+    return re.findall(r'\w+', q or '')[:10]
+
+
+def _pg_document():
+    # Literals rather than bound parameters, so the planner can match the index expression.
+    return func.to_tsvector(
+        literal_column("'simple'"),
+        func.coalesce(Transaction.description, literal_column("''")).op('||')(literal_column("' '")).op('||')(Transaction.category)
+    )
+
+
+def search_statement(user_id, q, columns, conditions=()):
+    """
+    SELECT of `columns` for the user's transactions matching every word of
+    `q` (prefix match on description and category), best match first, then
+    newest first. Returns None when `q` has no searchable words.
+    """
+    terms = search_terms(q)
+    if not terms:
+        return None
+
+    statement = select(*columns).where(Transaction.user_id == user_id, *conditions)
+
+    if _backend == 'fts5':
+        match = ' '.join(f'"{term}"*' for term in terms)
+        # MATERIALIZED keeps SQLite from flattening the MATCH into the outer
+        # query and re-running it once per candidate transaction.
+        matches = text(
+            f"SELECT rowid, bm25({FTS_TABLE}) AS rank FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match"
+        ).bindparams(match=match).columns(rowid=Integer, rank=Float).cte('matches').prefix_with('MATERIALIZED')
+        return statement.join(matches, matches.c.rowid == Transaction.id).order_by(
+            matches.c.rank, Transaction.date.desc()
+        )
+
+    if _backend == 'tsvector':
+        document = _pg_document()
+        query = func.to_tsquery('simple', ' & '.join(f'{term}:*' for term in terms))
+        return statement.where(document.op('@@')(query)).order_by(
+            func.ts_rank(document, query).desc(), Transaction.date.desc()
+        )
+
+    like = [or_(Transaction.description.ilike(f'%{term}%'), Transaction.category.ilike(f'%{term}%')) for term in terms]
+    return statement.where(and_(*like)).order_by(Transaction.date.desc())
+
+
+def parse_page(args):
+    """(page, per_page) from a query string, clamped to sensible bounds."""
+    try:
+        page = max(int(args.get('page', 1)), 1)
+    except ValueError:
+        page = 1
+    try:
+        per_page = min(max(int(args.get('per_page', DEFAULT_PER_PAGE)), 1), MAX_PER_PAGE)
+    except ValueError:
+        per_page = DEFAULT_PER_PAGE
+    return page, per_page
+
+
+def _page_statements(statement, page, per_page):
+    count = select(func.count()).select_from(statement.order_by(None).subquery())
+    return count, statement.limit(per_page).offset((page - 1) * per_page)
+
+
+def paginate(statement, page, per_page):
+    """Return (rows, total) for one page of a search statement."""
+    count, rows = _page_statements(statement, page, per_page)
+    total = db.session.execute(count).scalar()
+    rows = db.session.execute(rows).all()
+    return rows, total
+
+
+async def paginate_async(statement, page, per_page):
+    """paginate with the count and the page fetched concurrently."""
+    count, rows = _page_statements(statement, page, per_page)
+    results = await gather_queries({'count': count, 'rows': rows})
+    return results['rows'], results['count'][0][0]
@@ -0,0 +1,142 @@
+import heapq
+import json
+from datetime import date
+
+from flask import current_app
+from sqlalchemy import select
+
+from models import db
+from models.transaction import Transaction
+from services.archive import archived_transactions, archived_transactions_async
+from services.async_db import fetch_all
+
+
+# Public field name -> column, in the same order as Transaction.to_dict
+TRANSACTION_FIELDS = {
+    'id': Transaction.id,
+    'user_id': Transaction.user_id,
+    'amount': Transaction.amount,
+    'currency': Transaction.currency,
+    'category': Transaction.category,
+    'transaction_type': Transaction.transaction_type,
+    'date': Transaction.date,
+    'description': Transaction.description,
+    'created_at': Transaction.created_at,
+}
+
+
+class FieldSelectionError(ValueError):
+    """Raised for an unknown name in a ?fields= selection."""
+
+
+# ---------------------------------------------
+# JSON BACKENDS
+# ---------------------------------------------
+def _json_default(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def _stdlib_dumps(obj):
+    return json.dumps(obj, default=_json_default, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+# name -> callable(obj) returning UTF-8 bytes; dates must come out as ISO strings
+_JSON_BACKENDS = {'stdlib': _stdlib_dumps}
+# Tried in order when JSON_BACKEND is not configured
+_PREFERRED_BACKENDS = ['orjson', 'stdlib']
+
+try:
+    import orjson
+    _JSON_BACKENDS['orjson'] = orjson.dumps
+except ImportError:
+    pass
+
+
+def register_json_backend(name, dumps, preferred=False):
+    """Make another encoder available, optionally ahead of the built-in ones."""
+    _JSON_BACKENDS[name] = dumps
+    if name not in _PREFERRED_BACKENDS:
+        if preferred:
+            _PREFERRED_BACKENDS.insert(0, name)
+        else:
+            _PREFERRED_BACKENDS.insert(len(_PREFERRED_BACKENDS) - 1, name)
+
+
+def get_json_backend():
+    """The configured backend if it is installed, else the fastest available one."""
+    name = current_app.config.get('JSON_BACKEND')
+    if name in _JSON_BACKENDS:
+        return _JSON_BACKENDS[name]
+    for name in _PREFERRED_BACKENDS:
+        if name in _JSON_BACKENDS:
+            return _JSON_BACKENDS[name]
+    return _stdlib_dumps
+
+
+# ---------------------------------------------
+# TRANSACTION ROWS
+# ---------------------------------------------
+def parse_fields(value, available=TRANSACTION_FIELDS):
+    """Turn "date,amount" into a tuple of known field names (all fields if empty)."""
+    if not value:
+        return tuple(available)
+
+    fields = []
+    for name in value.split(','):
+        name = name.strip()
+        if not name:
+            continue
+        if name not in available:
+            raise FieldSelectionError(f"Unknown field '{name}'. Available: {', '.join(available)}")
+        if name not in fields:
+            fields.append(name)
+
+    if not fields:
+        raise FieldSelectionError('No fields selected')
+    return tuple(fields)
+
+
+def transaction_rows_query(user_id, fields):
+    """SELECT of only the requested columns, newest first; yields plain tuples."""
+    return select(*(TRANSACTION_FIELDS[name] for name in fields)).where(
+        Transaction.user_id == user_id
+    ).order_by(Transaction.date.desc())
+
+
+def rows_to_dicts(fields, rows):
+    return [dict(zip(fields, row)) for row in rows]
+
+
+def _history_query(user_id, fields):
+    """transaction_rows_query with the (date, id) merge key in front of the fields."""
+    return select(Transaction.date, Transaction.id, *(TRANSACTION_FIELDS[name] for name in fields)).where(
+        Transaction.user_id == user_id
+    ).order_by(Transaction.date.desc(), Transaction.id.desc())
+
+
+def _with_archived(user_id, fields, rows, archived):
+    """
+    Rows of _history_query with the user's archived transactions (newest
+    first) merged in, as tuples of the fields.
+    """
+    archived = ((row.date, row.id) + tuple(user_id if name == 'user_id' else getattr(row, name) for name in fields)
+                for row in archived)
+    return [tuple(row[2:]) for row in heapq.merge(rows, archived, key=lambda row: (row[0], row[1]), reverse=True)]
+
+
+def serialize_transactions(user_id, fields):
+    """
+    Fetch and encode a user's transactions, archived years included, as
+    {"transactions": [...]} bytes without building ORM objects.
+    """
+    rows = db.session.execute(_history_query(user_id, fields))
+    rows = _with_archived(user_id, fields, rows, archived_transactions(user_id))
+    return get_json_backend()({'transactions': rows_to_dicts(fields, rows)})
+
+
+async def serialize_transactions_async(user_id, fields):
+    rows = _with_archived(user_id, fields, await fetch_all(_history_query(user_id, fields)),
+                          await archived_transactions_async(user_id))
+    return get_json_backend()({'transactions': rows_to_dicts(fields, rows)})
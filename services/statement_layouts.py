@@ -0,0 +1,273 @@
+import hashlib
+import re
+from datetime import datetime
+from itertools import chain, islice
+
+from services.cache import TTLCache
+
+
+# How long a document fingerprint remembers its detected layout
+LAYOUT_CACHE_TTL = 24 * 3600
+LAYOUT_CACHE_SIZE = 256
+
+# Cells are separated by two or more spaces in layout-mode text
+_CELL = re.compile(r'\S+(?: \S+)*')
+
+
+# ---------------------------------------------
+# PROFILES
+# ---------------------------------------------
+# name -> profile:
+#   bank:         display name
+#   markers:      regexes, one of which must appear on the first page
+#   columns:      (field, header label) in page order; fields are date,
+#                 description, debit, credit, amount, type (Dr/Cr), and
+#                 anything else (balance, references), which is ignored
+#   date_formats: strptime formats of the date column
+#   skip:         regexes for lines inside the table that are not rows
+#   end:          regex for the line where the transaction table stops
+#   currency:     currency of the amounts (optional; the user's base
+#                 currency when missing)
+LAYOUT_PROFILES = {
+    'hdfc': {
+        'bank': 'HDFC Bank',
+        'markers': (r'HDFC BANK',),
+        'columns': (('date', 'Date'), ('description', 'Narration'), ('ref', 'Chq./Ref.No.'),
+                    ('value_date', 'Value Dt'), ('debit', 'Withdrawal Amt.'), ('credit', 'Deposit Amt.'),
+                    ('balance', 'Closing Balance')),
+        'date_formats': ('%d/%m/%y', '%d/%m/%Y'),
+        'skip': (r'^Page No', r'^HDFC BANK LIMITED', r'^\*Closing balance includes'),
+        'end': r'^STATEMENT SUMMARY',
+        'currency': 'INR',
+    },
+    'sbi': {
+        'bank': 'State Bank of India',
+        'markers': (r'State Bank of India', r'\bSBI\b'),
+        'columns': (('date', 'Txn Date'), ('value_date', 'Value Date'), ('description', 'Description'),
+                    ('ref', 'Ref No./Cheque No.'), ('debit', 'Debit'), ('credit', 'Credit'), ('balance', 'Balance')),
+        'date_formats': ('%d %b %Y', '%d-%m-%Y'),
+        'skip': (r'^Page \d+ of \d+', r'^Please do not share'),
+        'end': r'^\*\*This is a computer generated statement',
+        'currency': 'INR',
+    },
+    'icici': {
+        'bank': 'ICICI Bank',
+        'markers': (r'ICICI Bank',),
+        'columns': (('serial', 'S No.'), ('value_date', 'Value Date'), ('date', 'Transaction Date'),
+                    ('ref', 'Cheque Number'), ('description', 'Transaction Remarks'),
+                    ('debit', 'Withdrawal Amount (INR )'), ('credit', 'Deposit Amount (INR )'),
+                    ('balance', 'Balance (INR )')),
+        'date_formats': ('%d/%m/%Y',),
+        'skip': (r'^Page \d+',),
+        'end': r'^Legends',
+        'currency': 'INR',
+    },
+    'axis': {
+        'bank': 'Axis Bank',
+        'markers': (r'AXIS BANK',),
+        'columns': (('date', 'Tran Date'), ('ref', 'Chq No'), ('description', 'Particulars'), ('debit', 'Debit'),
+                    ('credit', 'Credit'), ('balance', 'Balance'), ('branch', 'Init.Br')),
+        'date_formats': ('%d-%m-%Y',),
+        'skip': (r'^OPENING BALANCE', r'^TRANSACTION TOTAL', r'^CLOSING BALANCE'),
+        'end': r'^\+\+\+\+ End of Statement',
+        'currency': 'INR',
+    },
+    'kotak': {
+        'bank': 'Kotak Mahindra Bank',
+        'markers': (r'Kotak Mahindra',),
+        'columns': (('serial', '#'), ('date', 'Date'), ('description', 'Description'), ('ref', 'Chq/Ref No'),
+                    ('amount', 'Amount'), ('type', 'Dr / Cr'), ('balance', 'Balance')),
+        'date_formats': ('%d-%m-%Y', '%d %b %Y'),
+        'skip': (r'^Page \d+ of \d+', r'^Statement Summary'),
+        'end': r'^End of Statement',
+        'currency': 'INR',
+    },
+}
+
+
+def _compile(profile):
+    labels = [label for _, label in profile['columns']]
+    return {
+        'header': re.compile(r'\s+'.join(re.escape(label) for label in labels)),
+        'markers': [re.compile(pattern, re.IGNORECASE) for pattern in profile['markers']],
+        'skip': [re.compile(pattern, re.IGNORECASE) for pattern in profile['skip']],
+        'end': re.compile(profile['end'], re.IGNORECASE),
+    }
+
+
+_compiled = {}
+
+
+def _patterns(name):
+    patterns = _compiled.get(name)
+    if patterns is None:
+        patterns = _compiled[name] = _compile(LAYOUT_PROFILES[name])
+    return patterns
+
+
+def register_layout(name, profile):
+    """Add or replace a bank layout profile (same keys as LAYOUT_PROFILES)."""
+    LAYOUT_PROFILES[name] = profile
+    _compiled.pop(name, None)
+    _layout_cache.clear()
+
+
+# ---------------------------------------------
+# DETECTION (cached by document fingerprint)
+# ---------------------------------------------
+_layout_cache = TTLCache(maxsize=LAYOUT_CACHE_SIZE, ttl=LAYOUT_CACHE_TTL)
+
+
+def document_fingerprint(reader):
+    """
+    What statements from the same bank share without reading any text: the
+    producing software, page size and first-page fonts.
+    """
+    parts = []
+    try:
+        metadata = reader.metadata or {}
+        parts += [str(metadata.get('/Producer', '')), str(metadata.get('/Creator', ''))]
+        page = reader.pages[0]
+        parts.append(str([float(value) for value in page.mediabox]))
+        fonts = page.get('/Resources', {}).get_object().get('/Font', {}).get_object()
+        parts += sorted(str(font.get_object().get('/BaseFont', '')) for font in fonts.values())
+    except Exception:
+        # Damaged or unusual documents just get a weaker fingerprint
+        pass
+    return hashlib.sha1('|'.join(parts).encode('utf-8', 'replace')).hexdigest()
+
+
+def detect_layout(text):
+    """
+    Name of the profile whose table header appears in a page of layout-mode
+    text, preferring profiles whose bank markers appear too; None if none do.
+    """
+    found = [name for name in LAYOUT_PROFILES if _patterns(name)['header'].search(text)]
+    for name in found:
+        if any(marker.search(text) for marker in _patterns(name)['markers']):
+            return name
+    return found[0] if found else None
+
+
+def layout_pages(reader):
+    """
+    (profile name, layout-mode text of each page) for a statement in a known
+    layout, or (None, None) so the caller can fall back to its line
+    heuristic. The profile detected for a document fingerprint is cached,
+    so later statements from the same bank are only checked against that
+    profile's header instead of running detection again.
+    """
+    if not len(reader.pages):
+        return None, None
+
+    fingerprint = document_fingerprint(reader)
+    first = reader.pages[0].extract_text(extraction_mode='layout')
+
+    name = _layout_cache.get(fingerprint)
+    if name is None or not _patterns(name)['header'].search(first):
+        # Only hits are cached: fingerprints are too coarse to rule a layout out.
+        name = detect_layout(first)
+        if name is None:
+            return None, None
+        _layout_cache.set(fingerprint, name)
+
+    rest = (page.extract_text(extraction_mode='layout') for page in islice(reader.pages, 1, None))
+    return name, chain([first], rest)
+
+
+# ---------------------------------------------
+# TABLE PARSING
+# ---------------------------------------------
+def _column_spans(line, profile, header):
+    """(field, start, end) for each column, from where its label sits in the header line."""
+    spans = []
+    position = header.start()
+    for field, label in profile['columns']:
+        start = line.index(label, position)
+        spans.append((field, start, start + len(label)))
+        position = start + len(label)
+    return spans
+
+
+def _cells(line, spans):
+    """
+    Assign each cell of a table line to the column it overlaps most (or is
+    nearest to), which copes with right-aligned amounts starting left of
+    their header label.
+    """
+    cells = {}
+    for match in _CELL.finditer(line):
+        start, end = match.span()
+        best, best_score = None, None
+        for field, column_start, column_end in spans:
+            overlap = min(end, column_end) - max(start, column_start)
+            distance = abs((start + end) - (column_start + column_end))
+            score = (overlap, -distance) if overlap > 0 else (0, -distance)
+            if best_score is None or score > best_score:
+                best, best_score = field, score
+        cells[best] = f"{cells[best]} {match.group()}" if best in cells else match.group()
+    return cells
+
+
+def _parse_date(value, formats):
+    value = ' '.join(value.split())
+    for fmt in formats:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def layout_rows(name, pages):
+    """
+    Yield one dict per transaction row (date as a date; description,
+    debit, credit, amount and type as text) from layout-mode pages. Only
+    the table region is read: lines above each page's header row, skip
+    lines and everything after the end marker are never parsed, and a
+    line holding only a description continues the row above it.
+    """
+    profile = LAYOUT_PROFILES[name]
+    patterns = _patterns(name)
+    formats = profile['date_formats']
+    spans = None
+    row = None
+
+    for text in pages:
+        lines = text.splitlines()
+        start = 0
+        # On a page without a header, lines before its first dated row are page furniture.
+        continuing = False
+        for index, line in enumerate(lines):
+            header = patterns['header'].search(line)
+            if header:
+                spans = _column_spans(line, profile, header)
+                start = index + 1
+                continuing = True
+                break
+        if spans is None:
+            continue
+
+        for line in islice(lines, start, None):
+            stripped = line.strip()
+            if not stripped:
+                continue
+            if patterns['end'].search(stripped):
+                if row:
+                    yield row
+                return
+            if any(pattern.search(stripped) for pattern in patterns['skip']):
+                continue
+
+            cells = _cells(line, spans)
+            day = _parse_date(cells.get('date', ''), formats)
+            if day is not None:
+                if row:
+                    yield row
+                row = dict(cells, date=day)
+                continuing = True
+            elif continuing and row is not None and set(cells) == {'description'}:
+                row['description'] = f"{row.get('description', '')} {cells['description']}".strip()
+
+    if row:
+        yield row
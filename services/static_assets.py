@@ -0,0 +1,178 @@
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+
+from flask import current_app, request, send_from_directory
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+logger = logging.getLogger(__name__)
+
+# Fingerprinted files, their compressed variants and the manifest live here (under the static folder)
+BUILD_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+
+# A fingerprinted name changes whenever the content does, so browsers may keep it for a year
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Text formats worth compressing; images and fonts are already compressed
+COMPRESSIBLE = {'.css', '.js', '.mjs', '.json', '.map', '.svg', '.txt', '.html', '.xml', '.ico'}
+
+# Content-Encoding -> file suffix, in order of preference
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+# logical filename -> manifest entry; empty until assets are built
+_manifest = {}
+# fingerprinted filename -> manifest entry, for serving
+_built = {}
+
+
+# ---------------------------------------------
+# BUILD
+# ---------------------------------------------
+def fingerprinted_name(filename, data):
+    """'css/site.css' -> 'css/site.<hash>.css', hashing the file content."""
+    digest = hashlib.sha256(data).hexdigest()[:12]
+    root, ext = os.path.splitext(filename)
+    return f'{root}.{digest}{ext}'
+
+
+def _compress(data):
+    """{encoding: compressed bytes}, keeping only variants that are actually smaller."""
+    variants = {'gzip': gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['br'] = brotli.compress(data, quality=11)
+    return {encoding: body for encoding, body in variants.items() if len(body) < len(data)}
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def build_assets(static_folder):
+    """
+    Copy every static file to BUILD_DIR under a content-hashed name, write
+    .gz (and .br, with the optional `brotli` package) variants of text
+    assets, and record them in the manifest. Returns the manifest.
+
+    Earlier builds are left in place so pages rendered before a deploy can
+    still load the assets they reference.
+    """
+    build_root = os.path.join(static_folder, BUILD_DIR)
+    manifest = {}
+
+    for directory, dirnames, filenames in os.walk(static_folder):
+        if os.path.abspath(directory) == os.path.abspath(static_folder):
+            dirnames[:] = [name for name in dirnames if name != BUILD_DIR]
+        dirnames[:] = [name for name in dirnames if not name.startswith('.')]
+
+        for name in sorted(filenames):
+            if name.startswith('.'):
+                continue
+            source = os.path.join(directory, name)
+            filename = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            with open(source, 'rb') as f:
+                data = f.read()
+
+            target = f'{BUILD_DIR}/{fingerprinted_name(filename, data)}'
+            _write(os.path.join(static_folder, target), data)
+
+            variants = {}
+            if os.path.splitext(name)[1].lower() in COMPRESSIBLE:
+                variants = _compress(data)
+            for encoding, suffix in ENCODINGS:
+                if encoding in variants:
+                    _write(os.path.join(static_folder, target + suffix), variants[encoding])
+
+            manifest[filename] = {
+                'file': target,
+                'size': len(data),
+                'encodings': {encoding: len(body) for encoding, body in variants.items()}
+            }
+
+    _write(os.path.join(build_root, MANIFEST_NAME),
+           json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    return manifest
+
+
+# ---------------------------------------------
+# SERVING
+# ---------------------------------------------
+def load_manifest(app):
+    """(Re)load the manifest of the last build; without one, static files are served as-is."""
+    global _manifest, _built
+
+    path = os.path.join(app.static_folder, BUILD_DIR, MANIFEST_NAME)
+    try:
+        with open(path, encoding='utf-8') as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        manifest = {}
+
+    if manifest:
+        built_at = os.path.getmtime(path)
+        stale = [filename for filename in manifest
+                 if os.path.exists(os.path.join(app.static_folder, filename))
+                 and os.path.getmtime(os.path.join(app.static_folder, filename)) > built_at]
+        if stale:
+            logger.warning('Static files changed since the last asset build (run `flask build-assets`): %s',
+                           ', '.join(sorted(stale)))
+
+    _manifest = manifest
+    _built = {entry['file']: entry for entry in manifest.values()}
+    return manifest
+
+
+def asset_url_defaults(endpoint, values):
+    """Point url_for('static', filename=...) at the fingerprinted file when there is one."""
+    if endpoint == 'static' and _manifest:
+        entry = _manifest.get(values.get('filename'))
+        if entry is not None:
+            values['filename'] = entry['file']
+
+
+def _negotiate(available):
+    """The preferred Content-Encoding the client accepts among `available`, or None."""
+    accepted = request.accept_encodings
+    for encoding, suffix in ENCODINGS:
+        if encoding in available and accepted[encoding] > 0:
+            return encoding, suffix
+    return None, ''
+
+
+def serve_static(filename):
+    """
+    Fingerprinted files are served precompressed when the client accepts
+    it, with a year-long immutable Cache-Control; anything else falls back
+    to Flask's own static handling.
+    """
+    entry = _built.get(filename)
+    if entry is None:
+        return current_app.send_static_file(filename)
+
+    encoding, suffix = _negotiate(entry['encodings'])
+    response = send_from_directory(
+        current_app.static_folder, filename + suffix,
+        mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    )
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
+
+
+def init_static_assets(app):
+    """Serve built assets (see build_assets / `flask build-assets`) when a manifest exists."""
+    load_manifest(app)
+    app.url_defaults(asset_url_defaults)
+    app.view_functions['static'] = serve_static
@@ -0,0 +1,513 @@
+import re
+import threading
+from datetime import date
+
+from sqlalchemy import and_, delete, exists, false, insert, not_, or_, select, true
+
+from models import db
+from models.change_log import ChangeLog
+from models.tag import Tag
+from models.transaction import Transaction
+from models.transaction_tag import TransactionTag
+from services.batching import chunks
+from services.bitmaps import Bitmap
+from services.cache import TTLCache
+from services.change_feed import get_head_token, record_changes, settled_position, UPSERT
+
+
+MAX_TAG_LENGTH = 50
+MAX_TAGS_PER_TRANSACTION = 20
+MAX_EXPRESSION_LENGTH = 200
+
+# Indexes follow the change log, so the TTL only bounds memory for idle users
+INDEX_TTL = 1800
+INDEX_CACHE_SIZE = 128
+# More pending change-log entries than this and an index is rebuilt instead
+CATCH_UP_LIMIT = 2000
+# Largest id list a tag filter sends as IN (...); beyond it (and its
+# complement) the filter is left to SQL EXISTS subqueries
+IN_LIMIT = 2000
+
+_NAME = re.compile(r'^\w[\w\-:.]*$')
+_TOKEN = re.compile(r'\s*(?:([()&|!])|([^\s()&|!]+))')
+_OPERATORS = {'and': '&', 'or': '|', 'not': '!'}
+
+
+class TagError(ValueError):
+    """Raised for an invalid tag name or tag expression; the message is user-facing."""
+
+
+# ---------------------------------------------
+# NAMES
+# ---------------------------------------------
+def normalize_tag(name):
+    """A tag name as stored: trimmed, lowercased, without a leading '#'. Raises TagError."""
+    value = (name or '').strip().lstrip('#').lower()
+    if not value:
+        raise TagError('Tag names cannot be empty.')
+    if len(value) > MAX_TAG_LENGTH:
+        raise TagError(f'Tag names are at most {MAX_TAG_LENGTH} characters.')
+    if not _NAME.match(value) or value in _OPERATORS:
+        raise TagError(f'Invalid tag name {name!r}: use letters, digits and _ - : . (not and/or/not).')
+    return value
+
+
+def parse_tag_list(value):
+    """Unique normalized names, in order, from a list or a comma- or space-separated string."""
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = re.split(r'[,\s]+', value)
+    if not isinstance(value, (list, tuple)):
+        raise TagError('Tags must be a list of names or a comma-separated string.')
+
+    names = []
+    for name in value:
+        if not isinstance(name, str):
+            raise TagError('Tags must be a list of names or a comma-separated string.')
+        if name.strip():
+            name = normalize_tag(name)
+            if name not in names:
+                names.append(name)
+    if len(names) > MAX_TAGS_PER_TRANSACTION:
+        raise TagError(f'A transaction can have at most {MAX_TAGS_PER_TRANSACTION} tags.')
+    return names
+
+
+# ---------------------------------------------
+# EXPRESSIONS
+# ---------------------------------------------
+# Parsed expressions are tuples: ('tag', name), ('not', node),
+# ('and', (node, ...)) and ('or', (node, ...)).
+def _tokens(text):
+    position = 0
+    text = text.rstrip()
+    while position < len(text):
+        match = _TOKEN.match(text, position)
+        operator, word = match.groups()
+        if word is not None and word.lower() in _OPERATORS:
+            operator, word = _OPERATORS[word.lower()], None
+        yield operator or normalize_tag(word)
+        position = match.end()
+
+
+def parse_tag_expression(text):
+    """
+    A tag expression such as "trip & !reimbursable" or "(tax or work) and
+    not 2024": AND (also &, or just a space), OR (|) and NOT (!) with the
+    usual precedence, and parentheses. Raises TagError.
+    """
+    text = (text or '').strip()
+    if not text:
+        raise TagError('The tag filter is empty.')
+    if len(text) > MAX_EXPRESSION_LENGTH:
+        raise TagError(f'Tag filters are at most {MAX_EXPRESSION_LENGTH} characters.')
+    tokens = list(_tokens(text))
+    position = 0
+
+    def peek():
+        return tokens[position] if position < len(tokens) else None
+
+    def take():
+        nonlocal position
+        position += 1
+        return tokens[position - 1]
+
+    def expression():
+        terms = [term()]
+        while peek() == '|':
+            take()
+            terms.append(term())
+        return terms[0] if len(terms) == 1 else ('or', tuple(terms))
+
+    def term():
+        factors = [factor()]
+        while peek() not in (None, '|', ')'):
+            if peek() == '&':
+                take()
+            factors.append(factor())
+        return factors[0] if len(factors) == 1 else ('and', tuple(factors))
+
+    def factor():
+        token = take() if peek() is not None else None
+        if token == '!':
+            return ('not', factor())
+        if token == '(':
+            node = expression()
+            if peek() != ')':
+                raise TagError(f'Unbalanced parentheses in tag filter {text!r}.')
+            take()
+            return node
+        if token in (None, ')', '&', '|'):
+            raise TagError(f'Incomplete tag filter {text!r}: expected a tag name.')
+        return ('tag', token)
+
+    node = expression()
+    if peek() is not None:
+        raise TagError(f'Unbalanced parentheses in tag filter {text!r}.')
+    return node
+
+
+def format_tag_expression(node, parent=None):
+    """The canonical text of a parsed expression, which parses back to the same tree."""
+    kind = node[0]
+    if kind == 'tag':
+        return node[1]
+    if kind == 'not':
+        return '!' + format_tag_expression(node[1], kind)
+    text = f" {'&' if kind == 'and' else '|'} ".join(format_tag_expression(child, kind) for child in node[1])
+    return f'({text})' if parent is not None else text
+
+
+def tag_matches(node, names):
+    """Whether a set of tag names satisfies a parsed expression."""
+    kind = node[0]
+    if kind == 'tag':
+        return node[1] in names
+    if kind == 'not':
+        return not tag_matches(node[1], names)
+    if kind == 'and':
+        return all(tag_matches(child, names) for child in node[1])
+    return any(tag_matches(child, names) for child in node[1])
+
+
+def tag_clause(node):
+    """
+    The expression as a SQL condition on Transaction (EXISTS subqueries on
+    transaction_tags). Sees uncommitted writes, so the budget evaluator
+    uses it inside the write transactions where the index cannot.
+    """
+    kind = node[0]
+    if kind == 'tag':
+        return exists(select(TransactionTag.transaction_id).join(Tag, Tag.id == TransactionTag.tag_id).where(
+            TransactionTag.transaction_id == Transaction.id,
+            Tag.name == node[1]
+        ))
+    if kind == 'not':
+        return not_(tag_clause(node[1]))
+    clauses = [tag_clause(child) for child in node[1]]
+    return and_(*clauses) if kind == 'and' else or_(*clauses)
+
+
+# ---------------------------------------------
+# BITMAP INDEX
+# ---------------------------------------------
+def _month(day):
+    return day.year * 12 + day.month - 1
+
+
+def _grouped(pairs):
+    groups = {}
+    for key, value in pairs:
+        groups.setdefault(key, []).append(value)
+    return {key: Bitmap(values) for key, values in groups.items()}
+
+
+class TagIndex:
+    """
+    One user's transactions as compressed bitmaps of their ids: one per tag,
+    one per month and one per day with transactions, and one of them all.
+    Tag expressions become bitmap ANDs, ORs and differences, and a date
+    range the union of its whole months plus the days at either end. Kept
+    current by replaying the user's change log since the last read.
+    """
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.version = 0
+        self.lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.all = Bitmap()
+        self.tags = {}        # tag id -> Bitmap
+        self.names = {}       # name -> tag id
+        self.months = {}      # year * 12 + month - 1 -> Bitmap
+        self.days = {}        # date ordinal -> Bitmap
+
+    def rebuild(self, connection):
+        # The head is read first, so writes committed meanwhile are replayed again
+        self.version = get_head_token(self.user_id, connection)
+        self._reset()
+        rows = connection.execute(
+            select(Transaction.id, Transaction.date).where(Transaction.user_id == self.user_id)
+        ).all()
+        self.all = Bitmap(row[0] for row in rows)
+        self.months = _grouped((_month(day), transaction_id) for transaction_id, day in rows)
+        self.days = _grouped((day.toordinal(), transaction_id) for transaction_id, day in rows)
+        self.names = dict(connection.execute(select(Tag.name, Tag.id).where(Tag.user_id == self.user_id)).all())
+        self.tags = _grouped(connection.execute(
+            select(TransactionTag.tag_id, TransactionTag.transaction_id).where(
+                TransactionTag.user_id == self.user_id)
+        ).all())
+
+    def _remove(self, removed):
+        self.all = self.all - removed
+        for key, bitmap in list(self.months.items()):
+            if not bitmap & removed:
+                continue
+            self.months[key] = bitmap - removed
+            year, month = divmod(key, 12)
+            first = date(year, month + 1, 1).toordinal()
+            last = date(year + (month + 1) // 12, (month + 1) % 12 + 1, 1).toordinal()
+            for ordinal in range(first, last):
+                if ordinal in self.days:
+                    self.days[ordinal] = self.days[ordinal] - removed
+        for tag_id, bitmap in self.tags.items():
+            self.tags[tag_id] = bitmap - removed
+
+    def _add(self, attribute, key, values):
+        index = getattr(self, attribute)
+        index[key] = Bitmap.union(index[key], Bitmap(values)) if key in index else Bitmap(values)
+
+    def catch_up(self, connection):
+        """
+        Replay change-log entries since the last read; rebuild if there are
+        too many. Entries still settling are replayed again next time.
+        """
+        entries = connection.execute(
+            select(ChangeLog.seq, ChangeLog.created_at, ChangeLog.entity, ChangeLog.entity_id).where(
+                ChangeLog.user_id == self.user_id,
+                ChangeLog.seq > self.version
+            ).order_by(ChangeLog.seq).limit(CATCH_UP_LIMIT + 1)
+        ).all()
+        if not entries:
+            return
+        if len(entries) > CATCH_UP_LIMIT:
+            self.rebuild(connection)
+            return
+
+        transaction_ids = {entity_id for _, _, entity, entity_id in entries if entity == 'transaction'}
+        tag_ids = {entity_id for _, _, entity, entity_id in entries if entity == 'tag'}
+
+        # Changed transactions are dropped everywhere and read back as they are now
+        if transaction_ids:
+            self._remove(Bitmap(transaction_ids))
+            for chunk in chunks(transaction_ids):
+                rows = connection.execute(
+                    select(Transaction.id, Transaction.date).where(
+                        Transaction.user_id == self.user_id, Transaction.id.in_(chunk))
+                ).all()
+                self.all = Bitmap.union(self.all, Bitmap(row[0] for row in rows))
+                for key, ids in _grouped((_month(day), transaction_id) for transaction_id, day in rows).items():
+                    self._add('months', key, ids)
+                for key, ids in _grouped((day.toordinal(), transaction_id) for transaction_id, day in rows).items():
+                    self._add('days', key, ids)
+                for tag_id, ids in _grouped(connection.execute(
+                    select(TransactionTag.tag_id, TransactionTag.transaction_id).where(
+                        TransactionTag.transaction_id.in_(chunk))
+                ).all()).items():
+                    self._add('tags', tag_id, ids)
+
+        # Changed tags (renamed, deleted, or added to or removed from transactions) are read back whole
+        if tag_ids:
+            current = dict(connection.execute(
+                select(Tag.id, Tag.name).where(Tag.user_id == self.user_id, Tag.id.in_(tag_ids))
+            ).all())
+            self.names = {name: tag_id for name, tag_id in self.names.items() if tag_id not in tag_ids}
+            self.names.update((name, tag_id) for tag_id, name in current.items())
+            for tag_id in tag_ids:
+                self.tags.pop(tag_id, None)
+            self.tags.update(_grouped(connection.execute(
+                select(TransactionTag.tag_id, TransactionTag.transaction_id).where(
+                    TransactionTag.tag_id.in_(list(current)))
+            ).all()) if current else {})
+
+        self.version = settled_position(connection, entries, self.version)
+
+    def date_range(self, start=None, end=None):
+        """Transactions dated start <= date <= end (either end open)."""
+        if start is None and end is None:
+            return self.all
+        first = start.toordinal() if start else min(self.days, default=0)
+        last = end.toordinal() if end else max(self.days, default=0)
+        if first > last:
+            return Bitmap()
+
+        parts = []
+        first_month, last_month = _month(date.fromordinal(first)), _month(date.fromordinal(last))
+        for key in range(first_month, last_month + 1):
+            if key not in self.months:
+                continue
+            year, month = divmod(key, 12)
+            month_first = date(year, month + 1, 1).toordinal()
+            month_end = date(year + (month + 1) // 12, (month + 1) % 12 + 1, 1).toordinal()
+            if first <= month_first and month_end - 1 <= last:
+                parts.append(self.months[key])
+            else:
+                parts.extend(self.days[ordinal] for ordinal in range(max(first, month_first), min(last + 1, month_end))
+                             if ordinal in self.days)
+        return Bitmap.union(*parts) if parts else Bitmap()
+
+    def evaluate(self, node, universe):
+        """Ids in `universe` matching a parsed expression; an AND subtracts its NOT terms."""
+        kind = node[0]
+        if kind == 'tag':
+            tag_id = self.names.get(node[1])
+            return universe & self.tags[tag_id] if tag_id in self.tags else Bitmap()
+        if kind == 'not':
+            return universe - self.evaluate(node[1], universe)
+        if kind == 'or':
+            return Bitmap.union(*(self.evaluate(child, universe) for child in node[1]))
+
+        result = universe
+        negated = [child[1] for child in node[1] if child[0] == 'not']
+        for child in node[1]:
+            if child[0] != 'not':
+                result = self.evaluate(child, result)
+        for child in negated:
+            if not result:
+                break
+            result = result - self.evaluate(child, result)
+        return result
+
+    def counts(self):
+        return {name: len(self.tags[tag_id]) if tag_id in self.tags else 0 for name, tag_id in self.names.items()}
+
+
+_indexes = TTLCache(maxsize=INDEX_CACHE_SIZE, ttl=INDEX_TTL)
+
+
+def _index(user_id):
+    index = _indexes.get(user_id)
+    if index is None:
+        index = TagIndex(user_id)
+        with index.lock:
+            index.rebuild(db.session.connection())
+        _indexes.set(user_id, index)
+    return index
+
+
+def query_tags(user_id, node, start=None, end=None):
+    """
+    (matching, in_range): bitmaps of the ids of a user's committed
+    transactions dated in the range that match a parsed expression, and of
+    all those dated in the range.
+    """
+    index = _index(user_id)
+    with index.lock:
+        index.catch_up(db.session.connection())
+        in_range = index.date_range(start, end)
+        return index.evaluate(node, in_range), in_range
+
+
+def tag_condition(user_id, node, start=None, end=None):
+    """
+    A SQL condition on Transaction for a parsed expression, answered from
+    the user's bitmap index: the matching ids, or the non-matching ones
+    when those are fewer (combined with the caller's date conditions),
+    and EXISTS subqueries only when both lists would be long.
+    """
+    matching, in_range = query_tags(user_id, node, start, end)
+    if not matching:
+        return false()
+    if len(matching) <= IN_LIMIT:
+        return Transaction.id.in_(list(matching))
+    rest = in_range - matching
+    if not rest:
+        return true()
+    if len(rest) <= IN_LIMIT:
+        return Transaction.id.not_in(list(rest))
+    return tag_clause(node)
+
+
+def tag_counts(user_id):
+    """{name: number of transactions} for every tag in a user's dictionary."""
+    index = _index(user_id)
+    with index.lock:
+        index.catch_up(db.session.connection())
+        return index.counts()
+
+
+def drop_tag_index(user_id):
+    """Forget this process's index of a user (after writes the change log does not record)."""
+    _indexes.delete(user_id)
+
+
+# ---------------------------------------------
+# TAGGING
+# ---------------------------------------------
+def get_tags(user_id):
+    return Tag.query.filter_by(user_id=user_id).order_by(Tag.name).all()
+
+
+def ensure_tags(user_id, names):
+    """{name: tag id} for normalized names, adding the ones new to the user's dictionary."""
+    if not names:
+        return {}
+    ids = dict(db.session.execute(
+        select(Tag.name, Tag.id).where(Tag.user_id == user_id, Tag.name.in_(names))
+    ).all())
+    new = [Tag(user_id=user_id, name=name) for name in names if name not in ids]
+    if new:
+        db.session.add_all(new)
+        db.session.flush()
+        ids.update((tag.name, tag.id) for tag in new)
+    return ids
+
+
+def tag_transactions(user_id, transaction_ids, add=(), remove=()):
+    """
+    Add and remove tags (normalized names) on a user's transactions with
+    set-based statements, inside the caller's database transaction. Every
+    tag whose transactions changed gets a change-log entry, which is what
+    moves bitmap indexes, ETags and cached fragments along. Ids that are
+    not the user's are ignored. Returns the ids of the transactions tagged.
+    """
+    transaction_ids = list(dict.fromkeys(transaction_ids))
+    owned = []
+    for chunk in chunks(transaction_ids):
+        owned.extend(db.session.execute(
+            select(Transaction.id).where(Transaction.user_id == user_id, Transaction.id.in_(chunk))
+        ).scalars())
+    if not owned or not (add or remove):
+        return owned
+
+    connection = db.session.connection()
+    changed = set()
+    add_ids = ensure_tags(user_id, [name for name in add if name not in remove])
+    if add_ids:
+        existing = set()
+        for chunk in chunks(owned):
+            existing.update(connection.execute(
+                select(TransactionTag.transaction_id, TransactionTag.tag_id).where(
+                    TransactionTag.transaction_id.in_(chunk), TransactionTag.tag_id.in_(add_ids.values()))
+            ).all())
+        rows = [{'transaction_id': transaction_id, 'tag_id': tag_id, 'user_id': user_id}
+                for transaction_id in owned for tag_id in add_ids.values()
+                if (transaction_id, tag_id) not in existing]
+        for chunk in chunks(rows):
+            connection.execute(insert(TransactionTag.__table__), chunk)
+        changed.update(row['tag_id'] for row in rows)
+
+    remove_ids = list(db.session.execute(
+        select(Tag.id).where(Tag.user_id == user_id, Tag.name.in_(remove))
+    ).scalars()) if remove else []
+    if remove_ids:
+        for chunk in chunks(owned):
+            result = connection.execute(delete(TransactionTag.__table__).where(
+                TransactionTag.transaction_id.in_(chunk), TransactionTag.tag_id.in_(remove_ids)))
+            if result.rowcount:
+                changed.update(remove_ids)
+
+    record_changes(db.session, [(user_id, 'tag', tag_id, UPSERT) for tag_id in sorted(changed)])
+    return owned
+
+
+def set_transaction_tags(user_id, transaction_id, names):
+    """Make `names` (normalized) the exact tags of one transaction."""
+    current = set(tags_by_transaction([transaction_id]).get(transaction_id, ()))
+    return tag_transactions(user_id, [transaction_id], add=[name for name in names if name not in current],
+                            remove=sorted(current - set(names)))
+
+
+def tags_by_transaction(transaction_ids):
+    """{transaction id: sorted tag names} for the given transactions (only those with tags)."""
+    tags = {}
+    for chunk in chunks(transaction_ids):
+        for transaction_id, name in db.session.execute(
+            select(TransactionTag.transaction_id, Tag.name).join(Tag, Tag.id == TransactionTag.tag_id).where(
+                TransactionTag.transaction_id.in_(chunk))
+        ):
+            tags.setdefault(transaction_id, []).append(name)
+    return {transaction_id: sorted(names) for transaction_id, names in tags.items()}
@@ -0,0 +1,81 @@
+from datetime import datetime
+
+from models.transaction import Transaction
+from services.tags import parse_tag_expression, tag_clause, tag_condition, tag_matches
+
+
+def parse_filters(args):
+    """
+    The report filters in a request's query string, as a dict of
+    start_date, end_date (dates), category, transaction_type and tags (a
+    parsed tag expression; None when not filtered). Raises ValueError with
+    a user-facing message for a malformed date or tag expression.
+    """
+    filters = {'start_date': None, 'end_date': None, 'category': None, 'transaction_type': None, 'tags': None}
+
+    start_date = args.get('start_date')
+    if start_date:
+        try:
+            filters['start_date'] = datetime.strptime(start_date, '%Y-%m-%d').date()
+        except ValueError:
+            raise ValueError('Invalid start date format.')
+
+    end_date = args.get('end_date')
+    if end_date:
+        try:
+            filters['end_date'] = datetime.strptime(end_date, '%Y-%m-%d').date()
+        except ValueError:
+            raise ValueError('Invalid end date format.')
+
+    category = args.get('category')
+    if category and category != 'all':
+        filters['category'] = category
+
+    transaction_type = args.get('transaction_type')
+    if transaction_type and transaction_type != 'all':
+        filters['transaction_type'] = transaction_type
+
+    tags = args.get('tags')
+    if tags and tags.strip():
+        filters['tags'] = parse_tag_expression(tags)
+
+    return filters
+
+
+def filter_conditions(filters, user_id=None):
+    """
+    SQL conditions on Transaction for parsed filters. A tag expression is
+    answered from the user's bitmap index when `user_id` is given, and by
+    EXISTS subqueries otherwise.
+    """
+    conditions = []
+    if filters.get('start_date'):
+        conditions.append(Transaction.date >= filters['start_date'])
+    if filters.get('end_date'):
+        conditions.append(Transaction.date <= filters['end_date'])
+    if filters.get('category'):
+        conditions.append(Transaction.category == filters['category'])
+    if filters.get('transaction_type'):
+        conditions.append(Transaction.transaction_type == filters['transaction_type'])
+    if filters.get('tags') is not None:
+        conditions.append(tag_clause(filters['tags']) if user_id is None else
+                          tag_condition(user_id, filters['tags'], filters.get('start_date'), filters.get('end_date')))
+    return conditions
+
+
+def matches_filters(row, filters):
+    """Whether a row with date, category, transaction_type and tags attributes passes parsed filters."""
+    return ((not filters.get('start_date') or row.date >= filters['start_date']) and
+            (not filters.get('end_date') or row.date <= filters['end_date']) and
+            (not filters.get('category') or row.category == filters['category']) and
+            (not filters.get('transaction_type') or row.transaction_type == filters['transaction_type']) and
+            (filters.get('tags') is None or tag_matches(filters['tags'], row.tags)))
+
+
+def get_filter_conditions(args, user_id=None):
+    """
+    SQL conditions for the report filters in a request's query string.
+    Raises ValueError with a user-facing message for a malformed date or
+    tag expression.
+    """
+    return filter_conditions(parse_filters(args), user_id)
@@ -0,0 +1,15 @@
+from sqlalchemy.dialects import postgresql, sqlite
+
+
+# The databases the app runs on both have INSERT ... ON CONFLICT (SQLite
+# from 3.24); SQLAlchemy builds it from each dialect's own insert()
+_INSERTS = {'sqlite': sqlite.insert, 'postgresql': postgresql.insert}
+
+
+def conflict_insert(connection, table):
+    """
+    insert(table) for the connection's database, with on_conflict_do_update()
+    and on_conflict_do_nothing(), so concurrent first writes of the same key
+    merge instead of failing on the primary key.
+    """
+    return _INSERTS[connection.dialect.name](table)
@@ -0,0 +1,120 @@
+import hashlib
+
+from flask import has_request_context, session
+from flask_login import UserMixin
+from sqlalchemy import event, select
+
+from models import db
+from models.user import User
+from services.async_db import fetch_all
+from services.cache import TTLCache
+
+
+# A change made in the user's own session stamps that session with the new
+# version, so other workers reload on its next request. The short TTL
+# bounds how long they can serve a stale principal after changes made
+# anywhere else (another session, the API with other credentials, a CLI
+# purge).
+_principals = TTLCache(maxsize=10000, ttl=60)
+
+SESSION_VERSION_KEY = '_principal_version'
+
+
+class UserPrincipal(UserMixin):
+    """
+    Lightweight stand-in for the logged-in User: just enough for
+    Flask-Login and the views (id, username, email, base currency). Any
+    other attribute loads the full ORM User on first use within the request.
+    `version` stamps the row it was read from.
+    """
+
+    def __init__(self, id, username, email, base_currency, version):
+        self.id = id
+        self.username = username
+        self.email = email
+        self.base_currency = base_currency
+        self.version = version
+
+    def get_user(self):
+        return db.session.get(User, self.id)
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self.get_user(), name)
+
+    def __repr__(self):
+        return f'<UserPrincipal {self.username}>'
+
+
+def _version(username, email, base_currency, password_hash):
+    return hashlib.sha1(f'{username}|{email}|{base_currency}|{password_hash}'.encode()).hexdigest()[:12]
+
+
+def _principal_statement(user_id):
+    return select(User.id, User.username, User.email, User.base_currency, User.password_hash).where(User.id == user_id)
+
+
+def _cache_principal(user_id, row):
+    if row is None:
+        return None
+
+    principal = UserPrincipal(row.id, row.username, row.email, row.base_currency,
+                              _version(row.username, row.email, row.base_currency, row.password_hash))
+    _principals.set(user_id, principal)
+    return principal
+
+
+def _cached(user_id, version):
+    """The cached principal, unless the caller has seen a different version of the user."""
+    principal = _principals.get(user_id)
+    if principal is not None and version is not None and principal.version != version:
+        return None
+    return principal
+
+
+def load_principal(user_id, version=None):
+    """
+    Return the cached principal for user_id, loading it with one narrow
+    SELECT on a miss or when it is not at `version` (a stamp the caller
+    has seen, such as the session's).
+    """
+    principal = _cached(user_id, version)
+    if principal is not None:
+        return principal
+    return _cache_principal(user_id, db.session.execute(_principal_statement(user_id)).first())
+
+
+async def load_principal_async(user_id, version=None):
+    """load_principal for async views; afterwards Flask-Login's loader finds it in the cache."""
+    principal = _cached(user_id, version)
+    if principal is not None:
+        return principal
+    rows = await fetch_all(_principal_statement(user_id))
+    return _cache_principal(user_id, rows[0] if rows else None)
+
+
+def load_session_principal(user_id):
+    """
+    Flask-Login's loader: the principal at the version stamped in the
+    session, stamping the session on its first request.
+    """
+    principal = load_principal(user_id, session.get(SESSION_VERSION_KEY))
+    if principal is not None and session.get(SESSION_VERSION_KEY) != principal.version:
+        session[SESSION_VERSION_KEY] = principal.version
+    return principal
+
+
+def invalidate_user(user_id):
+    _principals.delete(user_id)
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _invalidate_on_change(mapper, connection, target):
+    invalidate_user(target.id)
+    # Restamp the changing user's own session, so workers still caching
+    # the old principal reload it on the next request
+    if has_request_context() and session.get('_user_id') == str(target.id):
+        session[SESSION_VERSION_KEY] = _version(target.username, target.email, target.base_currency,
+                                                target.password_hash)